@@ -4,6 +4,8 @@ from datetime import datetime, timezone, timedelta, date
 import uuid
 import logging
 
+from services import classroom_stats, wallet_sources
+
 logger = logging.getLogger(__name__)
 
 _db = None
@@ -91,8 +93,10 @@ async def claim_achievement(achievement_id: str, request: Request):
         "earned_at": datetime.now(timezone.utc).isoformat()
     }
     await db.user_achievements.insert_one(ua_doc)
+    classroom_stats.invalidate_student(user["user_id"])
     
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": user["user_id"], "account_type": "spending"},
         {"$inc": {"balance": achievement["points"]}}
     )
@@ -126,7 +130,8 @@ async def claim_streak_bonus(request: Request):
     
     for milestone, bonus in bonuses.items():
         if streak >= milestone and milestone not in claimed:
-            await db.wallet_accounts.update_one(
+            await wallet_sources.update_wallet(
+                db,
                 {"user_id": user["user_id"], "account_type": "spending"},
                 {"$inc": {"balance": bonus}}
             )
@@ -192,7 +197,8 @@ async def streak_checkin(request: Request):
     )
     
     # Add reward to spending wallet
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": user["user_id"], "account_type": "spending"},
         {"$inc": {"balance": reward_coins}}
     )
@@ -368,9 +374,11 @@ async def award_badge(db, user_id: str, trigger: str):
         "earned_at": datetime.now(timezone.utc).isoformat()
     }
     await db.user_achievements.insert_one(ua_doc)
+    classroom_stats.invalidate_student(user_id)
     
     # Award bonus points
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": user_id, "account_type": "spending"},
         {"$inc": {"balance": badge["points"]}}
     )
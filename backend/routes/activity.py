@@ -3,6 +3,8 @@ from fastapi import APIRouter, Request, HTTPException
 from datetime import datetime, timezone
 import uuid
 
+from services import activity_rollup
+
 router = APIRouter(prefix="/activity", tags=["activity"])
 
 def get_db():
@@ -40,22 +42,23 @@ async def save_activity_score(request: Request):
     
     existing = await db.activity_scores.find_one(
         {"child_id": child_id, "content_id": content_id, "created_at": {"$gte": session_cutoff}},
-        {"_id": 1, "percentage": 1, "correct_answers": 1}
+        {"_id": 1, "score_id": 1, "percentage": 1, "correct_answers": 1, "time_spent_seconds": 1, "rolled_up": 1}
     )
     
     if existing:
         # Update the existing record if the new score is better
         if new_percentage >= (existing.get("percentage") or 0):
-            await db.activity_scores.update_one(
-                {"_id": existing["_id"]},
-                {"$set": {
-                    "score": body.get("score", 0),
-                    "percentage": new_percentage,
-                    "correct_answers": new_correct,
-                    "total_questions": new_total,
-                    "time_spent_seconds": body.get("timeSpent", 0),
-                    "created_at": datetime.now(timezone.utc).isoformat()
-                }}
+            changes = {
+                "score": body.get("score", 0),
+                "percentage": new_percentage,
+                "correct_answers": new_correct,
+                "total_questions": new_total,
+                "time_spent_seconds": body.get("timeSpent", 0),
+                "created_at": datetime.now(timezone.utc).isoformat()
+            }
+            await db.activity_scores.update_one({"_id": existing["_id"]}, {"$set": changes})
+            await activity_rollup.record_score_update(
+                db, {**existing, "child_id": child_id, "content_id": content_id}, changes
             )
         return {"message": "Score updated", "score_id": "updated"}
     
@@ -76,10 +79,12 @@ async def save_activity_score(request: Request):
         "attempts": body.get("attempts", 1),
         "completed": body.get("completed", True),
         "extra_data": body.get("extraData", {}),
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "rolled_up": True,
     }
     
     await db.activity_scores.insert_one(score_record)
+    await activity_rollup.record_new_score(db, score_record)
     
     # Update child's activity completion count
     await db.users.update_one(
@@ -229,41 +234,18 @@ async def get_classroom_activity_analytics(request: Request, classroom_id: str):
     ).to_list(500)
     student_ids = [e["student_id"] for e in enrollments]
     
-    # Get all scores for students in this classroom
-    scores = await db.activity_scores.find(
+    # Exact per-student totals from the per-(child, content) rollup
+    student_stats = await activity_rollup.student_summaries(db, student_ids)
+    
+    recent_scores = await db.activity_scores.find(
         {"child_id": {"$in": student_ids}},
         {"_id": 0}
-    ).sort("created_at", -1).to_list(500)
-    
-    # Group by student
-    student_stats = {}
-    for score in scores:
-        child_id = score.get("child_id")
-        if child_id not in student_stats:
-            student_stats[child_id] = {
-                "child_id": child_id,
-                "child_name": score.get("child_name", "Unknown"),
-                "total_activities": 0,
-                "total_score": 0,
-                "total_time": 0
-            }
-        student_stats[child_id]["total_activities"] += 1
-        student_stats[child_id]["total_score"] += score.get("percentage", 0)
-        student_stats[child_id]["total_time"] += score.get("time_spent_seconds", 0)
-    
-    # Calculate averages
-    for child_id, stats in student_stats.items():
-        if stats["total_activities"] > 0:
-            stats["average_score"] = round(stats["total_score"] / stats["total_activities"], 1)
-            stats["average_time"] = round(stats["total_time"] / stats["total_activities"], 1)
-        else:
-            stats["average_score"] = 0
-            stats["average_time"] = 0
+    ).sort("created_at", -1).to_list(20)
     
     return {
         "classroom": classroom,
-        "student_stats": list(student_stats.values()),
-        "recent_scores": scores[:20]
+        "student_stats": student_stats,
+        "recent_scores": recent_scores
     }
 
 
@@ -307,20 +289,12 @@ async def get_teacher_content_overview(request: Request, content_id: str):
     ).to_list(200)
     student_map = {s["user_id"]: s for s in students}
     
-    # Get all scores for this content from these students
-    scores = await db.activity_scores.find(
-        {"content_id": content_id, "child_id": {"$in": all_student_ids}},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(500)
-    
-    # Group scores by student, keep last 2
-    student_scores = {}
-    for score in scores:
-        child_id = score.get("child_id")
-        if child_id not in student_scores:
-            student_scores[child_id] = []
-        if len(student_scores[child_id]) < 2:
-            student_scores[child_id].append(score)
+    # One rollup row per student who attempted this content (last 2 scores,
+    # best and attempt count over all attempts)
+    rollups = {
+        r["child_id"]: r
+        for r in await activity_rollup.rollups_for(db, all_student_ids, content_id=content_id)
+    }
     
     # Build response with attempted and not attempted
     attempted = []
@@ -333,15 +307,14 @@ async def get_teacher_content_overview(request: Request, content_id: str):
             "name": student.get("name") or student.get("username", "Unknown"),
             "grade": student.get("grade"),
             "picture": student.get("picture"),
-            "scores": student_scores.get(student_id, [])
+            "scores": rollups[student_id].get("recent", []) if student_id in rollups else []
         }
         
-        if student_id in student_scores:
-            # Calculate best and latest score
-            scores_list = student_scores[student_id]
-            student_data["latest_score"] = scores_list[0].get("percentage", 0) if scores_list else 0
-            student_data["best_score"] = max(s.get("percentage", 0) for s in scores_list) if scores_list else 0
-            student_data["attempts"] = len(scores_list)
+        if student_id in rollups:
+            rollup = rollups[student_id]
+            student_data["latest_score"] = rollup.get("latest_percentage", 0)
+            student_data["best_score"] = rollup.get("best_percentage", 0)
+            student_data["attempts"] = rollup.get("attempts", 0)
             attempted.append(student_data)
         else:
             not_attempted.append(student_data)
@@ -385,37 +358,19 @@ async def get_parent_children_scores(request: Request, topic_id: str = None):
         {"_id": 0, "user_id": 1, "name": 1, "username": 1, "grade": 1, "picture": 1}
     ).to_list(20)
     
-    # Build query for scores
-    score_query = {"child_id": {"$in": child_ids}}
-    if topic_id:
-        score_query["topic_id"] = topic_id
-    
-    # Get all scores
-    scores = await db.activity_scores.find(
-        score_query,
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(500)
+    # One rollup row per (child, content), most recently played content first
+    rollups = await activity_rollup.rollups_for(db, child_ids, topic_id=topic_id)
+    rollups.sort(key=lambda r: r.get("latest_at") or "", reverse=True)
     
-    # Group scores by content and child, keep last 2 per child per content
     content_scores = {}
-    for score in scores:
-        content_id = score.get("content_id")
-        child_id = score.get("child_id")
-        key = f"{content_id}_{child_id}"
-        
-        if content_id not in content_scores:
-            content_scores[content_id] = {
-                "content_id": content_id,
-                "content_title": score.get("content_title", "Activity"),
-                "topic_id": score.get("topic_id"),
-                "children": {}
-            }
-        
-        if child_id not in content_scores[content_id]["children"]:
-            content_scores[content_id]["children"][child_id] = []
-        
-        if len(content_scores[content_id]["children"][child_id]) < 2:
-            content_scores[content_id]["children"][child_id].append(score)
+    for rollup in rollups:
+        data = content_scores.setdefault(rollup["content_id"], {
+            "content_id": rollup["content_id"],
+            "content_title": rollup.get("content_title") or "Activity",
+            "topic_id": rollup.get("topic_id"),
+            "children": {}
+        })
+        data["children"][rollup["child_id"]] = rollup
     
     # Build response
     activities = []
@@ -429,17 +384,18 @@ async def get_parent_children_scores(request: Request, topic_id: str = None):
         
         for child in children:
             child_id = child["user_id"]
-            child_scores = data["children"].get(child_id, [])
+            rollup = data["children"].get(child_id)
             
-            if child_scores:
+            if rollup:
                 activity_data["children_scores"].append({
                     "child_id": child_id,
                     "child_name": child.get("name") or child.get("username", "Unknown"),
                     "grade": child.get("grade"),
                     "picture": child.get("picture"),
-                    "scores": child_scores,
-                    "latest_score": child_scores[0].get("percentage", 0) if child_scores else 0,
-                    "best_score": max(s.get("percentage", 0) for s in child_scores) if child_scores else 0
+                    "scores": rollup.get("recent", []),
+                    "latest_score": rollup.get("latest_percentage", 0),
+                    "best_score": rollup.get("best_percentage", 0),
+                    "attempts": rollup.get("attempts", 0)
                 })
         
         if activity_data["children_scores"]:
@@ -493,34 +449,25 @@ async def get_scores_by_content(request: Request, content_id: str):
     else:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    # Get scores for this content
-    scores = await db.activity_scores.find(
-        {"content_id": content_id, "child_id": {"$in": child_ids}},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(500)
-    
-    # Group by child, keep last 2
-    child_scores = {}
-    for score in scores:
-        child_id = score.get("child_id")
-        if child_id not in child_scores:
-            child_scores[child_id] = []
-        if len(child_scores[child_id]) < 2:
-            child_scores[child_id].append(score)
+    rollups = {
+        r["child_id"]: r
+        for r in await activity_rollup.rollups_for(db, child_ids, content_id=content_id)
+    }
     
     # Build response
     result = []
     for child in children:
         child_id = child["user_id"]
-        scores_list = child_scores.get(child_id, [])
+        rollup = rollups.get(child_id)
         result.append({
             "child_id": child_id,
             "child_name": child.get("name") or child.get("username", "Unknown"),
             "grade": child.get("grade"),
-            "scores": scores_list,
-            "attempted": len(scores_list) > 0,
-            "latest_score": scores_list[0].get("percentage", 0) if scores_list else None,
-            "best_score": max(s.get("percentage", 0) for s in scores_list) if scores_list else None
+            "scores": rollup.get("recent", []) if rollup else [],
+            "attempted": rollup is not None,
+            "latest_score": rollup.get("latest_percentage", 0) if rollup else None,
+            "best_score": rollup.get("best_percentage", 0) if rollup else None,
+            "attempts": rollup.get("attempts", 0) if rollup else 0
         })
     
     return {"children": result}
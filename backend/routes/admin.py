@@ -4,8 +4,10 @@ from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
+import asyncio
 import uuid
 import hashlib
+from services import media_pipeline, entitlements, user_directory, platform_stats, garden_state, market_snapshot, news_impact, order_book, price_model, stock_repository, trade_executor, trading_calendar, wallet_sources
 
 _db = None
 UPLOADS_DIR = Path("/app/backend/uploads")
@@ -58,65 +60,110 @@ class LessonCreate(BaseModel):
     reward_coins: int = 5
 
 # User Management
+def _directory_filters(role, school_id, grade, subscription_status, test_mode, search):
+    if subscription_status and subscription_status not in user_directory.SUBSCRIPTION_STATUSES:
+        raise HTTPException(status_code=400, detail="subscription_status must be active, expired or inactive")
+    return {
+        "role": role, "school_id": school_id, "grade": grade,
+        "subscription_status": subscription_status, "test_mode": test_mode, "search": search,
+    }
+
+
 @router.get("/users")
 async def get_users(request: Request):
-    """Get all users with school info and subscription status"""
+    """Get all users with school info and subscription status.
+    Prefer /admin/users/directory, which pages and filters server-side."""
     from services.auth import require_admin
     db = get_db()
     await require_admin(request)
-    users = await db.users.find({}, {"_id": 0}).to_list(1000)
-    
-    # Get all schools for lookup
-    schools = await db.schools.find({}, {"_id": 0, "school_id": 1, "name": 1}).to_list(100)
-    school_map = {s["school_id"]: s["name"] for s in schools}
     
-    # Get all completed subscriptions for lookup
-    now = datetime.now(timezone.utc).isoformat()
-    all_subs = await db.subscriptions.find({
-        "payment_status": "completed",
-        "is_active": True,
-    }, {"_id": 0, "parent_emails": 1, "child_user_ids": 1, "end_date": 1, "plan_type": 1, "duration": 1, "granted_by_admin": 1}).to_list(1000)
-    
-    # Build lookup maps for both parent_emails (adult accounts) and
-    # child_user_ids (used for email-less children granted a subscription).
-    sub_map = {}         # email -> sub summary
-    sub_map_child = {}   # user_id -> sub summary (email-less children only)
-
-    def _record(target_map, key, sub, is_active):
-        existing = target_map.get(key)
-        if not existing or (is_active and existing["subscription_status"] != "active"):
-            target_map[key] = {
-                "subscription_status": "active" if is_active else "expired",
-                "end_date": sub["end_date"],
-                "plan_type": sub.get("plan_type", ""),
-                "duration": sub.get("duration", ""),
-                "granted_by_admin": sub.get("granted_by_admin", False),
-            }
+    users = []
+    async for user in db.users.aggregate(user_directory.build_pipeline()):
+        user.pop("_id", None)
+        users.append(user)
+    return users
 
-    for sub in all_subs:
-        is_active = sub["end_date"] > now
-        for email in sub.get("parent_emails", []) or []:
-            _record(sub_map, email, sub, is_active)
-        for uid in sub.get("child_user_ids", []) or []:
-            _record(sub_map_child, uid, sub, is_active)
-    
-    # Add school_name and subscription_status to each user
-    for user in users:
-        school_id = user.get("school_id")
-        user["school_name"] = school_map.get(school_id) if school_id else None
-        # `user.get("email", "")` returns None if the field is stored as null
-        # (children created without email have `email: None`). Guard with `or ""`
-        # so `.lower()` never crashes and we simply treat them as email-less.
-        email = (user.get("email") or "").lower()
-        matched = sub_map.get(email) if email else sub_map_child.get(user.get("user_id"))
-        if matched:
-            user["subscription_status"] = matched["subscription_status"]
-            user["subscription_end_date"] = matched["end_date"]
-            user["subscription_granted_by_admin"] = matched.get("granted_by_admin", False)
-        else:
-            user["subscription_status"] = "inactive"
+
+@router.get("/users/directory")
+async def get_user_directory(
+    request: Request,
+    role: Optional[str] = None,
+    school_id: Optional[str] = None,
+    grade: Optional[int] = None,
+    subscription_status: Optional[str] = None,
+    test_mode: Optional[bool] = None,
+    search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50
+):
+    """Paginated user directory, newest first. Filters run server-side;
+    `search` is a prefix match on name, email or username. Pass the
+    returned `next_cursor` back as `cursor` for the next page."""
+    from services.auth import require_admin
+    db = get_db()
+    await require_admin(request)
     
-    return users
+    if not 1 <= limit <= 200:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 200")
+    try:
+        after = user_directory.parse_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filters = _directory_filters(role, school_id, grade, subscription_status, test_mode, search)
+    
+    # Fetch one extra row to know whether another page exists
+    pipeline = user_directory.build_pipeline(**filters, after=after, limit=limit + 1)
+    rows = await db.users.aggregate(pipeline).to_list(limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = str(rows[-1]["_id"]) if has_more else None
+    for row in rows:
+        row.pop("_id", None)
+    
+    return {"users": rows, "next_cursor": next_cursor, "has_more": has_more}
+
+
+@router.get("/users/export.csv")
+async def export_user_directory(
+    request: Request,
+    role: Optional[str] = None,
+    school_id: Optional[str] = None,
+    grade: Optional[int] = None,
+    subscription_status: Optional[str] = None,
+    test_mode: Optional[bool] = None,
+    search: Optional[str] = None
+):
+    """Stream the (filtered) user directory as CSV without loading it into memory"""
+    import csv
+    import io
+    from fastapi.responses import StreamingResponse
+    from services.auth import require_admin
+    db = get_db()
+    await require_admin(request)
+    
+    filters = _directory_filters(role, school_id, grade, subscription_status, test_mode, search)
+    pipeline = user_directory.build_pipeline(**filters)
+    
+    async def rows():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=user_directory.CSV_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        count = 0
+        async for user in db.users.aggregate(pipeline):
+            writer.writerow(user)
+            count += 1
+            if count % 500 == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    filename = f"users_{datetime.now(timezone.utc).strftime('%Y%m%d')}.csv"
+    return StreamingResponse(
+        rows(),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 @router.post("/users")
 async def create_user(data: UserCreateAdmin, request: Request):
@@ -359,6 +406,7 @@ async def update_user_subscription(user_id: str, request: Request):
                 "granted_by_admin": True,
                 "created_at": now.isoformat(),
             })
+        await entitlements.refresh(db, emails=[email] if email else [], user_ids=[] if email else [user_id])
         
         return {"message": f"Subscription activated for {dur['label']}", "end_date": end_date.isoformat()}
     
@@ -368,6 +416,7 @@ async def update_user_subscription(user_id: str, request: Request):
             {sub_query_key: sub_query_val, "granted_by_admin": True},
             {"$set": {"is_active": False}}
         )
+        await entitlements.refresh(db, emails=[email] if email else [], user_ids=[] if email else [user_id])
         return {"message": "Subscription deactivated", "modified": result.modified_count}
     
     raise HTTPException(status_code=400, detail="Status must be 'active' or 'inactive'")
@@ -564,41 +613,19 @@ async def get_admin_stats(request: Request):
     db = get_db()
     await require_admin(request)
     
-    stats = {
-        "users": {
-            "total": await db.users.count_documents({}),
-            "children": await db.users.count_documents({"role": "child"}),
-            "parents": await db.users.count_documents({"role": "parent"}),
-            "teachers": await db.users.count_documents({"role": "teacher"}),
-            "admins": await db.users.count_documents({"role": "admin"}),
-            "schools": await db.users.count_documents({"role": "school"})
-        },
-        "content": {
-            "topics": await db.content_topics.count_documents({"parent_id": None}),
-            "subtopics": await db.content_topics.count_documents({"parent_id": {"$ne": None}}),
-            "total_content": await db.content_items.count_documents({})
-        },
-        "legacy_content": {
-            "topics": await db.learning_topics.count_documents({}),
-            "lessons": await db.learning_lessons.count_documents({}),
-            "books": await db.books.count_documents({}),
-            "activities": await db.activities.count_documents({}),
-            "quizzes": await db.quizzes.count_documents({})
-        },
-        "store": {
-            "items": await db.store_items.count_documents({}),
-            "purchases": await db.purchases.count_documents({})
-        },
-        "investments": {
-            "plants": await db.investment_plants.count_documents({}),
-            "stocks": await db.investment_stocks.count_documents({}),
-            "farms": await db.farms.count_documents({})
-        },
-        "quests": await db.new_quests.count_documents({"creator_type": "admin"}),
-        "classrooms": await db.classrooms.count_documents({})
-    }
+    return await platform_stats.get_stats(db)
+
+
+@router.get("/stats/history")
+async def get_admin_stats_history(request: Request, days: int = 90):
+    """Daily platform stats snapshots (oldest first) for growth charts"""
+    from services.auth import require_admin
+    db = get_db()
+    await require_admin(request)
     
-    return stats
+    if not 1 <= days <= 730:
+        raise HTTPException(status_code=400, detail="days must be between 1 and 730")
+    return {"snapshots": await platform_stats.get_history(db, days)}
 
 # Topics Management
 @router.post("/topics")
@@ -725,7 +752,8 @@ async def trigger_allowances(request: Request):
         if last_paid == today:
             continue
         
-        await db.wallet_accounts.update_one(
+        await wallet_sources.update_wallet(
+            db,
             {"user_id": allowance["child_id"], "account_type": "spending"},
             {"$inc": {"balance": allowance["amount"]}}
         )
@@ -891,6 +919,7 @@ async def admin_create_garden_plant(request: Request):
         "max_grade": int(body.get("max_grade", 2)),
         "is_active": body.get("is_active", True)
     })
+    garden_state.invalidate()
     return {"message": "Plant created", "plant_id": plant_id}
 
 @router.put("/garden/plants/{plant_id}")
@@ -914,6 +943,7 @@ async def admin_update_garden_plant(plant_id: str, request: Request):
             else:
                 update[k] = v
     await db.investment_plants.update_one({"plant_id": plant_id}, {"$set": update})
+    garden_state.invalidate()
     return {"message": "Plant updated"}
 
 @router.delete("/garden/plants/{plant_id}")
@@ -923,6 +953,7 @@ async def admin_delete_garden_plant(plant_id: str, request: Request):
     db = get_db()
     await require_admin(request)
     await db.investment_plants.delete_one({"plant_id": plant_id})
+    garden_state.invalidate()
     return {"message": "Plant deleted"}
 
 # ============== ADMIN INVESTMENT MANAGEMENT ==============
@@ -957,6 +988,7 @@ async def admin_create_investment_plant(request: Request):
         "min_grade": body.get("min_grade", 0),
         "max_grade": body.get("max_grade", 2)
     })
+    garden_state.invalidate()
     return {"message": "Plant type created", "plant_id": plant_id}
 
 @router.put("/investments/plants/{plant_id}")
@@ -970,6 +1002,7 @@ async def admin_update_investment_plant(plant_id: str, request: Request):
     fields = ["name", "description", "seed_cost", "growth_days", "harvest_min", "harvest_max", "image_url", "growth_stages", "min_grade", "max_grade"]
     update = {k: v for k, v in body.items() if k in fields}
     await db.investment_plants.update_one({"plant_id": plant_id}, {"$set": update})
+    garden_state.invalidate()
     return {"message": "Plant type updated"}
 
 @router.delete("/investments/plants/{plant_id}")
@@ -979,6 +1012,7 @@ async def admin_delete_investment_plant(plant_id: str, request: Request):
     db = get_db()
     await require_admin(request)
     await db.investment_plants.delete_one({"plant_id": plant_id})
+    garden_state.invalidate()
     return {"message": "Plant type deleted"}
 
 @router.get("/investments/stocks")
@@ -987,7 +1021,7 @@ async def admin_get_investment_stocks(request: Request):
     from services.auth import require_admin
     db = get_db()
     await require_admin(request)
-    return await db.investment_stocks.find({}, {"_id": 0}).to_list(100)
+    return await stock_repository.list_stocks(db)
 
 @router.post("/investments/stocks")
 async def admin_create_investment_stock(request: Request):
@@ -998,7 +1032,7 @@ async def admin_create_investment_stock(request: Request):
     body = await request.json()
     
     stock_id = f"stock_{uuid.uuid4().hex[:12]}"
-    await db.investment_stocks.insert_one({
+    await stock_repository.create_stock(db, {
         "stock_id": stock_id,
         "name": body.get("name"),
         "symbol": body.get("symbol"),
@@ -1015,6 +1049,7 @@ async def admin_create_investment_stock(request: Request):
         "is_active": True,
         "created_at": datetime.now(timezone.utc).isoformat()
     })
+    await market_snapshot.publish_change(db, "admin:create")
     return {"message": "Stock created", "stock_id": stock_id}
 
 @router.put("/investments/stocks/{stock_id}")
@@ -1028,7 +1063,8 @@ async def admin_update_investment_stock(stock_id: str, request: Request):
     fields = ["name", "symbol", "description", "category_id", "current_price", "min_price", "max_price", 
               "volatility", "trend", "logo_url", "min_grade", "max_grade", "is_active"]
     update = {k: v for k, v in body.items() if k in fields}
-    await db.investment_stocks.update_one({"stock_id": stock_id}, {"$set": update})
+    await stock_repository.update_stock(db, stock_id, update)
+    await market_snapshot.publish_change(db, "admin:update")
     return {"message": "Stock updated"}
 
 @router.delete("/investments/stocks/{stock_id}")
@@ -1037,7 +1073,8 @@ async def admin_delete_investment_stock(stock_id: str, request: Request):
     from services.auth import require_admin
     db = get_db()
     await require_admin(request)
-    await db.investment_stocks.delete_one({"stock_id": stock_id})
+    await stock_repository.delete_stock(db, stock_id)
+    await market_snapshot.publish_change(db, "admin:delete")
     return {"message": "Stock deleted"}
 
 # ============== ADMIN STOCK CATEGORIES & NEWS ==============
@@ -1097,6 +1134,11 @@ async def admin_get_stock_news(request: Request):
     await require_admin(request)
     return await db.stock_news.find({}, {"_id": 0}).sort("created_at", -1).to_list(100)
 
+def _news_session(session: Optional[str]) -> Optional[str]:
+    if session and session not in news_impact.SESSIONS:
+        raise HTTPException(status_code=400, detail=f"scheduled_session must be one of: {', '.join(news_impact.SESSIONS)}")
+    return session or None
+
 @router.post("/stock-news")
 async def admin_create_stock_news(request: Request):
     """Create stock news"""
@@ -1114,6 +1156,9 @@ async def admin_create_stock_news(request: Request):
         "category_id": body.get("category_id"),
         "impact": body.get("impact", 0),
         "is_active": body.get("is_active", True),
+        "scheduled_session": _news_session(body.get("scheduled_session")),
+        "scheduled_date": body.get("scheduled_date"),
+        "applied": False,
         "created_at": datetime.now(timezone.utc).isoformat()
     })
     return {"message": "News created", "news_id": news_id}
@@ -1126,7 +1171,10 @@ async def admin_update_stock_news(news_id: str, request: Request):
     await require_admin(request)
     body = await request.json()
     
-    update = {k: v for k, v in body.items() if k in ["title", "content", "stock_id", "category_id", "impact", "is_active"]}
+    update = {k: v for k, v in body.items() if k in ["title", "content", "stock_id", "category_id", "impact", "is_active",
+                                                     "scheduled_session", "scheduled_date"]}
+    if "scheduled_session" in update:
+        update["scheduled_session"] = _news_session(update["scheduled_session"])
     await db.stock_news.update_one({"news_id": news_id}, {"$set": update})
     return {"message": "News updated"}
 
@@ -1147,28 +1195,85 @@ async def admin_apply_stock_news(news_id: str, request: Request):
     db = get_db()
     await require_admin(request)
     
-    news = await db.stock_news.find_one({"news_id": news_id})
+    try:
+        news = await news_impact.apply_news(db, news_id)
+    except news_impact.NewsAlreadyAppliedError:
+        raise HTTPException(status_code=409, detail="News has already been applied")
     if not news:
         raise HTTPException(status_code=404, detail="News not found")
     
-    impact = news.get("impact", 0)
-    stock_id = news.get("stock_id")
+    return {"message": "News impact applied", "price_changes": news["price_changes"]}
+
+@router.get("/stock-order-book")
+async def admin_get_order_book(request: Request):
+    """Order-book mode settings plus the current queue size"""
+    from services.auth import require_admin
+    db = get_db()
+    await require_admin(request)
     
-    if stock_id:
-        stock = await db.investment_stocks.find_one({"stock_id": stock_id})
-        if stock:
-            new_price = max(1, stock["current_price"] * (1 + impact / 100))
-            await db.investment_stocks.update_one(
-                {"stock_id": stock_id},
-                {"$set": {"current_price": round(new_price, 2)}}
-            )
+    settings = await order_book.get_settings(db)
+    pending = await db.stock_orders.count_documents({"status": "pending"})
+    last_batch = await db.stock_order_batches.find_one({}, {"_id": 0}, sort=[("settled_at", -1)])
+    return {**settings, "pending_orders": pending, "last_batch": last_batch}
+
+@router.put("/stock-order-book")
+async def admin_update_order_book(request: Request):
+    """Turn order-book mode on/off and set the settlement cadence"""
+    from services.auth import require_admin
+    db = get_db()
+    await require_admin(request)
+    body = await request.json()
     
-    await db.stock_news.update_one(
-        {"news_id": news_id},
-        {"$set": {"applied": True, "applied_at": datetime.now(timezone.utc).isoformat()}}
-    )
+    try:
+        settings = await order_book.update_settings(db, body)
+    except trade_executor.TradeError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return {"message": "Order book settings updated", **settings}
+
+@router.post("/stock-order-book/settle")
+async def admin_settle_orders(request: Request):
+    """Settle all pending orders now at current prices"""
+    from services.auth import require_admin
+    db = get_db()
+    await require_admin(request)
+    
+    totals = await order_book.settle(db, "admin")
+    if "error" in totals:
+        raise HTTPException(status_code=500, detail=f"Settlement failed: {totals['error']}")
+    return {"message": f"Settled {totals['orders']} orders", **totals}
+
+@router.get("/trading-calendar")
+async def admin_get_trading_calendar(request: Request):
+    """Market hours, session times and holidays"""
+    from services.auth import require_admin
+    db = get_db()
+    await require_admin(request)
+    
+    await trading_calendar.load(db)
+    return {
+        "open_time": trading_calendar.OPEN_TIME.strftime("%H:%M"),
+        "close_time": trading_calendar.CLOSE_TIME.strftime("%H:%M"),
+        "sessions": {name: at.strftime("%H:%M") for name, at in trading_calendar.SESSIONS.items()},
+        "holidays": trading_calendar.holidays(),
+        "status": trading_calendar.status()
+    }
+
+@router.put("/trading-calendar/holidays")
+async def admin_update_market_holidays(request: Request):
+    """Replace the market holiday list ([{date: YYYY-MM-DD, name}])"""
+    from services.auth import require_admin
+    db = get_db()
+    await require_admin(request)
+    body = await request.json()
     
-    return {"message": "News impact applied"}
+    holidays = body.get("holidays")
+    if not isinstance(holidays, list):
+        raise HTTPException(status_code=400, detail="holidays must be a list")
+    try:
+        holidays = await trading_calendar.set_holidays(db, holidays)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": f"{len(holidays)} market holidays saved", "holidays": holidays}
 
 # ============== ADMIN QUIZ, BOOK, ACTIVITY MANAGEMENT ==============
 
@@ -1279,64 +1384,19 @@ async def admin_simulate_fluctuation(request: Request):
     db = get_db()
     await require_admin(request)
     
-    import random
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     
-    stocks = await db.investment_stocks.find({"is_active": True}).to_list(100)
-    if not stocks:
-        stocks = await db.admin_stocks.find({"is_active": True}).to_list(100)
-    
-    for stock in stocks:
-        volatility = stock.get("volatility", 0.1)
-        trend = stock.get("trend", 0)
-        change_pct = random.gauss(trend, volatility)
-        current_price = stock.get("current_price", 10)
-        new_price = current_price * (1 + change_pct)
-        new_price = max(stock.get("min_price", 1), min(new_price, stock.get("max_price", 1000)))
-        new_price = round(new_price, 2)
-        
-        # Create price history entry
-        price_entry = {
-            "date": today,
-            "price": new_price,
-            "close_price": new_price,
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        }
-        
-        # Update investment_stocks
-        await db.investment_stocks.update_one(
-            {"stock_id": stock["stock_id"]},
-            {
-                "$set": {
-                    "current_price": new_price,
-                    "last_price_update": datetime.now(timezone.utc).isoformat()
-                },
-                "$push": {
-                    "price_history": {
-                        "$each": [price_entry],
-                        "$slice": -30
-                    }
-                }
-            }
-        )
-        
-        # Also update admin_stocks
-        await db.admin_stocks.update_one(
-            {"stock_id": stock["stock_id"]},
-            {
-                "$set": {
-                    "current_price": new_price,
-                    "last_price_update": datetime.now(timezone.utc).isoformat()
-                },
-                "$push": {
-                    "price_history": {
-                        "$each": [price_entry],
-                        "$slice": -30
-                    }
-                }
-            }
-        )
+    stocks = await stock_repository.list_stocks(db, {"is_active": True})
+    
+    new_prices = price_model.next_prices(stocks, "gauss")
+    old_prices = price_model.current_prices(stocks, "gauss")
+    ticks = [
+        stock_repository.price_tick(stock["stock_id"], new_price, today, float(current_price))
+        for stock, new_price, current_price in zip(stocks, new_prices, old_prices)
+    ]
+    await stock_repository.apply_ticks(db, ticks)
     
+    await market_snapshot.publish_change(db, "admin:simulate")
     return {"message": f"Simulated fluctuation for {len(stocks)} stocks"}
 
 @router.post("/investments/simulate-day")
@@ -1349,26 +1409,46 @@ async def admin_simulate_day(request: Request):
     import random
     from datetime import date
     
-    stocks = await db.investment_stocks.find({"is_active": True}).to_list(100)
+    stocks = await stock_repository.list_stocks(db, {"is_active": True})
     today = date.today().isoformat()
     
-    for stock in stocks:
-        # Record today's price in history
-        await db.stock_price_history.update_one(
-            {"stock_id": stock["stock_id"], "date": today},
-            {"$set": {
-                "stock_id": stock["stock_id"],
-                "date": today,
-                "open": stock["current_price"],
-                "close": stock["current_price"],
-                "high": stock["current_price"],
-                "low": stock["current_price"]
-            }},
-            upsert=True
-        )
+    # Record today's price in history (same daily row the fluctuation job keeps)
+    if stocks:
+        await db.stock_price_history.bulk_write([
+            stock_repository.price_tick(stock["stock_id"], stock["current_price"], today)["history"]
+            for stock in stocks
+        ], ordered=False)
     
     return {"message": f"Simulated day for {len(stocks)} stocks"}
 
+@router.post("/investments/backtest")
+async def admin_backtest_market(request: Request):
+    """Replay simulated days over the current stocks in memory (nothing is
+    written) to compare price models and tune volatility. Limited to short
+    runs; use `python -m services.market_backtest` for long ones"""
+    from services.auth import require_admin
+    from services import market_backtest
+    db = get_db()
+    await require_admin(request)
+    body = await request.json()
+    
+    stocks = await market_backtest.load_stocks(db)
+    try:
+        return await asyncio.to_thread(
+            market_backtest.run,
+            stocks,
+            days=int(body.get("days", 30)),
+            paths=int(body.get("paths", 200)),
+            users=int(body.get("users", 500)),
+            model=body.get("model", "session"),
+            seed=body.get("seed"),
+            max_days=market_backtest.API_MAX_DAYS,
+            max_paths=market_backtest.API_MAX_PATHS,
+            max_users=market_backtest.API_MAX_USERS
+        )
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/investments/scheduler-logs")
 async def admin_get_scheduler_logs(request: Request):
     """Get scheduler logs"""
@@ -1411,8 +1491,12 @@ async def get_walkthrough_video(request: Request):
     for user_type in ['child', 'parent', 'teacher']:
         setting = await db.site_settings.find_one({"key": f"walkthrough_video_{user_type}"}, {"_id": 0})
         if setting:
+            renditions = await media_pipeline.get_renditions(setting.get("value"))
             videos[user_type] = {
                 "url": setting.get("value"),
+                # Best transcoded rendition for this client (falls back to the original upload)
+                "playback_url": media_pipeline.best_video_url(setting.get("value"), renditions, request),
+                "poster_url": renditions.get("poster_url") if renditions else None,
                 "title": setting.get("title", ""),
                 "description": setting.get("description", "")
             }
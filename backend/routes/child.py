@@ -5,6 +5,8 @@ from typing import Optional, List
 from datetime import datetime, timezone
 import uuid
 
+from services import classroom_stats, wallet_sources
+
 _db = None
 
 def init_db(database):
@@ -228,7 +230,8 @@ async def contribute_to_goal(goal_id: str, request: Request):
     if not savings_acc or savings_acc.get("balance", 0) < amount:
         raise HTTPException(status_code=400, detail="Insufficient balance")
     
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": user["user_id"], "account_type": "savings"},
         {"$inc": {"balance": -amount}}
     )
@@ -440,146 +443,19 @@ async def get_classmates(request: Request):
     ).to_list(10)
     classroom_ids = [c["classroom_id"] for c in classroom_links]
     
-    classmate_links = await db.classroom_students.find(
-        {"classroom_id": {"$in": classroom_ids}, "student_id": {"$ne": user["user_id"]}},
-        {"_id": 0}
-    ).to_list(100)
-    
-    classmates = []
-    seen_ids = set()
+    # Per-classroom stats and leaderboards are cached (see services.classroom_stats)
+    all_stats = [await classroom_stats.get_classroom_stats(db, cid) for cid in classroom_ids]
     
-    for link in classmate_links:
-        student_id = link["student_id"]
-        if student_id in seen_ids:
-            continue
-        seen_ids.add(student_id)
-        
-        student = await db.users.find_one(
-            {"user_id": student_id},
-            {"_id": 0}
+    # Sorted by lessons completed
+    by_lessons = classroom_stats.merged_leaderboard(all_stats, "lessons")
+    classmates = [dict(entry) for entry in by_lessons if entry["user_id"] != user["user_id"]]
+    leaderboards = {
+        board: classroom_stats.leaderboard_rows(
+            by_lessons if board == "lessons" else classroom_stats.merged_leaderboard(all_stats, board),
+            board, me=user["user_id"]
         )
-        if not student:
-            continue
-        
-        # Get wallet balances by type
-        wallets = await db.wallet_accounts.find(
-            {"user_id": student_id},
-            {"_id": 0}
-        ).to_list(10)
-        
-        spending_balance = 0
-        investing_balance = 0
-        
-        for w in wallets:
-            acc_type = w.get("account_type")
-            balance = w.get("balance", 0)
-            if acc_type == "spending":
-                spending_balance = balance
-            elif acc_type == "investing":
-                investing_balance = balance
-        
-        # Classmates don't see a peer's My Wallet (real-world parent earnings) — only CoinQuest.
-        total_balance = sum(w.get("balance", 0) for w in wallets if w.get("account_type") != "my_wallet")
-        
-        # Get savings goals total
-        savings_goals = await db.savings_goals.find(
-            {"$or": [{"child_id": student_id}, {"user_id": student_id}]},
-            {"_id": 0, "current_amount": 1}
-        ).to_list(50)
-        total_saved_in_goals = sum(g.get("current_amount", 0) for g in savings_goals)
-        
-        # Get lessons completed
-        lessons = await db.user_content_progress.count_documents({
-            "user_id": student_id,
-            "completed": True
-        })
-        
-        # Get badges/achievements earned
-        badges = await db.user_achievements.find(
-            {"user_id": student_id},
-            {"_id": 0, "achievement_id": 1}
-        ).to_list(50)
-        badge_count = len(badges)
-        
-        # Get quests completed
-        quests_completed = await db.quest_completions.count_documents({
-            "user_id": student_id,
-            "status": "approved"
-        })
-        
-        # Get investment performance based on grade
-        grade = student.get("grade", 0) or 0
-        investment_value = 0
-        investment_profit = 0
-        
-        if 1 <= grade <= 2:
-            # Garden performance
-            garden_plots = await db.user_garden_plots.find(
-                {"user_id": student_id},
-                {"purchase_price": 1, "total_harvested": 1, "plant_value": 1}
-            ).to_list(50)
-            garden_invested = sum(p.get("purchase_price", 0) for p in garden_plots)
-            garden_current_value = sum(p.get("plant_value", 0) for p in garden_plots)
-            garden_earned = sum(p.get("total_harvested", 0) for p in garden_plots)
-            investment_value = garden_current_value + investing_balance
-            investment_profit = garden_earned - garden_invested
-        elif 3 <= grade <= 5:
-            # Stock performance
-            stock_holdings = await db.user_stock_holdings.find(
-                {"user_id": student_id},
-                {"_id": 0}
-            ).to_list(50)
-            portfolio_value = 0
-            total_cost = 0
-            for holding in stock_holdings:
-                stock = await db.investment_stocks.find_one({"stock_id": holding.get("stock_id")})
-                if stock:
-                    portfolio_value += holding.get("shares", 0) * stock.get("current_price", 0)
-                total_cost += holding.get("total_cost", 0)
-            investment_value = portfolio_value + investing_balance
-            investment_profit = portfolio_value - total_cost
-        
-        # Active jobs & chores this classmate is doing — titles only, no payment amounts
-        # (so kids can get ideas of what work they could do themselves without seeing
-        # how much another child is paid for it).
-        jobs_cursor = db.jobs.find(
-            {"child_id": student_id, "status": {"$in": ["active", "in_progress"]}},
-            {"_id": 0, "activity": 1, "title": 1}
-        )
-        peer_jobs = [
-            {"title": j.get("title") or j.get("activity") or "Job"}
-            async for j in jobs_cursor
-        ]
-        chores_cursor = db.new_quests.find(
-            {"child_id": student_id, "creator_type": "parent", "is_active": True},
-            {"_id": 0, "title": 1}
-        )
-        peer_chores = [
-            {"title": q.get("title", "Chore")}
-            async for q in chores_cursor
-        ]
-
-        classmates.append({
-            "user_id": student_id,
-            "name": student.get("name", "Unknown"),
-            "picture": student.get("picture"),
-            "avatar": student.get("avatar"),
-            "grade": grade,
-            "streak_count": student.get("streak_count", 0),
-            "spending_balance": round(spending_balance, 0),
-            "total_balance": round(total_balance, 0),
-            "total_saved": round(total_saved_in_goals, 0),
-            "investment_value": round(investment_value, 0),
-            "investment_profit": round(investment_profit, 0),
-            "lessons_completed": lessons,
-            "quests_completed": quests_completed,
-            "badges": badge_count,
-            "jobs": peer_jobs,
-            "chores": peer_chores,
-        })
-    
-    # Sort by lessons completed
-    classmates.sort(key=lambda x: x["lessons_completed"], reverse=True)
+        for board in classroom_stats.LEADERBOARDS
+    }
     
     # Get classroom info
     classroom_info = None
@@ -593,7 +469,8 @@ async def get_classmates(request: Request):
     
     return {
         "classmates": classmates,
-        "classroom": classroom_info
+        "classroom": classroom_info,
+        "leaderboards": leaderboards
     }
 
 @router.post("/gift-money")
@@ -679,12 +556,14 @@ async def gift_money(data: GiftRequest, request: Request):
     if not gifting_acc or gifting_acc.get("balance", 0) < amount:
         raise HTTPException(status_code=400, detail="Insufficient balance in gifting account")
     
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": user["user_id"], "account_type": "gifting"},
         {"$inc": {"balance": -amount}}
     )
     
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": data.to_user_id, "account_type": "gifting"},
         {"$inc": {"balance": amount}}
     )
@@ -847,6 +726,7 @@ async def create_charitable_giving(data: CharitableGivingCreate, request: Reques
             "description": "Made your first charitable contribution!",
             "earned_at": datetime.now(timezone.utc).isoformat()
         })
+        classroom_stats.invalidate_student(user["user_id"])
     
     return {"message": "Charitable giving recorded!", "record_id": record_id, "total_value": total_value}
 
@@ -987,12 +867,14 @@ async def respond_to_gift_request(request_id: str, request: Request):
             if not gifting_acc or gifting_acc.get("balance", 0) < gift_req["amount"]:
                 raise HTTPException(status_code=400, detail="Insufficient balance")
             
-            await db.wallet_accounts.update_one(
+            await wallet_sources.update_wallet(
+                db,
                 {"user_id": user["user_id"], "account_type": "gifting"},
                 {"$inc": {"balance": -gift_req["amount"]}}
             )
             
-            await db.wallet_accounts.update_one(
+            await wallet_sources.update_wallet(
+                db,
                 {"user_id": gift_req["from_user_id"], "account_type": "gifting"},
                 {"$inc": {"balance": gift_req["amount"]}}
             )
@@ -1266,7 +1148,8 @@ async def submit_quest(quest_id: str, request: Request):
     
     if status == "completed":
         reward = quest.get("reward_coins", 10)
-        await db.wallet_accounts.update_one(
+        await wallet_sources.update_wallet(
+            db,
             {"user_id": user["user_id"], "account_type": "spending"},
             {"$inc": {"balance": reward}}
         )
@@ -8,6 +8,7 @@ from services.curricula import (
     get_active_curricula, content_curricula_clause, normalize_curricula,
     CURRICULA, CURRICULUM_IDS, DEFAULT_CURRICULUM,
 )
+from services import media_pipeline, entitlements, classroom_stats, wallet_sources
 
 router = APIRouter(tags=["content"])
 
@@ -150,26 +151,7 @@ async def is_user_on_one_day_trial(user, db):
     their parent's, or one that lists their user_id). Distinct from
     is_test_user so download throttles can target paying trial users without
     penalising internal QA accounts."""
-    if not user:
-        return False
-    now_iso = datetime.now(timezone.utc).isoformat()
-    user_id = user.get("user_id")
-    email = (user.get("email") or "").lower()
-    candidates = []
-    if user_id:
-        candidates.append({"child_user_ids": user_id})
-    if email:
-        candidates.append({"parent_emails": email})
-    if not candidates:
-        return False
-    sub = await db.subscriptions.find_one({
-        "$or": candidates,
-        "payment_status": "completed",
-        "is_active": True,
-        "end_date": {"$gt": now_iso},
-        "duration": "1_day",
-    }, {"_id": 0, "subscription_id": 1})
-    return sub is not None
+    return await entitlements.is_on_trial(db, user)
 
 # ============== USER CONTENT ROUTES ==============
 
@@ -702,6 +684,10 @@ async def get_topic_detail(topic_id: str, request: Request, grade: Optional[int]
             hi["coins_earned"] = prog.get("coins_earned") if prog else None
             content_items.insert(0, hi)
     
+    if not is_admin:
+        for item in content_items:
+            media_pipeline.apply_best_video(item, request)
+    
     return {"topic": topic, "subtopics": subtopics, "content_items": content_items}
 
 @router.get("/content/items/{content_id}")
@@ -727,6 +713,9 @@ async def get_content_item(content_id: str, request: Request):
         if visible_to and "child" not in visible_to:
             raise HTTPException(status_code=404, detail="Content not found")
     
+    if not is_admin:
+        media_pipeline.apply_best_video(item, request)
+    
     return item
 
 @router.post("/content/items/{content_id}/complete")
@@ -789,9 +778,11 @@ async def complete_content_item(content_id: str, request: Request):
         }},
         upsert=True
     )
+    classroom_stats.invalidate_student(user_id)
     
     if user.get("role") == "child":
-        await db.wallet_accounts.update_one(
+        await wallet_sources.update_wallet(
+            db,
             {"user_id": user_id, "account_type": "spending"},
             {"$inc": {"balance": reward_coins}}
         )
@@ -966,6 +957,14 @@ async def admin_get_items(request: Request, topic_id: Optional[str] = None):
     items = await db.content_items.find(query, {"_id": 0}).sort("order", 1).to_list(length=None)
     return items
 
+async def _attach_video_renditions(content_data: dict):
+    """Copy ready transcoded renditions for `content_data.video_url` onto the
+    item (the form round-trips whatever it loaded, so always recompute)."""
+    content_data.pop("video_renditions", None)
+    renditions = await media_pipeline.get_renditions(content_data.get("video_url"))
+    if renditions:
+        content_data["video_renditions"] = renditions
+
 @router.post("/admin/content/items")
 async def admin_create_item(request: Request):
     """Create a content item"""
@@ -1003,6 +1002,8 @@ async def admin_create_item(request: Request):
         "is_mandatory": body.get("is_mandatory", True),
         "created_at": datetime.now(timezone.utc).isoformat()
     }
+    if isinstance(content_doc["content_data"], dict):
+        await _attach_video_renditions(content_doc["content_data"])
     await db.content_items.insert_one(content_doc)
     
     return {"message": "Content created", "content_id": content_id}
@@ -1057,6 +1058,8 @@ async def admin_update_item(content_id: str, request: Request):
             update_fields[field] = body[field]
     if "curricula" in body:
         update_fields["curricula"] = normalize_curricula(body.get("curricula"))
+    if isinstance(update_fields.get("content_data"), dict):
+        await _attach_video_renditions(update_fields["content_data"])
     
     if update_fields:
         await db.content_items.update_one({"content_id": content_id}, {"$set": update_fields})
@@ -4,7 +4,8 @@ from pydantic import BaseModel
 from datetime import datetime, timezone
 import uuid
 import random
-import pytz
+
+from services import garden_state, trading_calendar, wallet_sources
 
 # Database injection
 _db = None
@@ -26,12 +27,6 @@ class PlantSeedRequest(BaseModel):
     plot_id: str
     plant_id: str
 
-def is_market_open():
-    """Check if market is open (7 AM - 5 PM IST)"""
-    ist = pytz.timezone('Asia/Kolkata')
-    ist_now = datetime.now(ist)
-    return 7 <= ist_now.hour < 17
-
 @router.get("/garden/farm")
 async def get_farm(request: Request):
     """Get child's farm with all plots and their status"""
@@ -69,51 +64,24 @@ async def get_farm(request: Request):
         # Re-fetch to get clean documents without _id
         plots = await db.farm_plots.find({"user_id": user["user_id"]}, {"_id": 0}).to_list(50)
     
+    # Plot state is derived from timestamps; the garden sweeper job persists
+    # ready/dead transitions, so this read never writes.
+    catalogue = await garden_state.get_catalogue(db)
     now = datetime.now(timezone.utc)
     for plot in plots:
-        if plot.get("plant_id") and plot.get("status") not in ["empty", "dead", "ready"]:
-            plant = await db.investment_plants.find_one({"plant_id": plot["plant_id"]}, {"_id": 0})
-            if plant:
-                # Compute overall growth from time since planting FIRST — a fully
-                # grown plant is always harvestable, even if it's currently due
-                # for water. This prevents a "ready" flower from losing its
-                # harvest button just because watering is overdue.
-                planted_at = datetime.fromisoformat(plot["planted_at"].replace('Z', '+00:00'))
-                hours_growing = (now - planted_at).total_seconds() / 3600
-                total_growth_hours = plant["growth_days"] * 24
-                growth_progress = min(100, (hours_growing / total_growth_hours) * 100)
-                plot["growth_progress"] = round(growth_progress, 1)
-
-                if growth_progress >= 100:
-                    plot["status"] = "ready"
-                    await db.farm_plots.update_one(
-                        {"plot_id": plot["plot_id"]},
-                        {"$set": {"status": "ready", "growth_progress": 100}}
-                    )
-                else:
-                    # Still growing — apply watering state.
-                    last_watered = plot.get("last_watered")
-                    if last_watered:
-                        last_water_time = datetime.fromisoformat(last_watered.replace('Z', '+00:00'))
-                        hours_since_water = (now - last_water_time).total_seconds() / 3600
-                        water_freq = plant.get("water_frequency_hours", 24)
-
-                        if hours_since_water > water_freq * 2:
-                            plot["status"] = "dead"
-                            await db.farm_plots.update_one({"plot_id": plot["plot_id"]}, {"$set": {"status": "dead"}})
-                        elif hours_since_water > water_freq * 1.5:
-                            plot["status"] = "wilting"
-                        elif hours_since_water > water_freq:
-                            plot["status"] = "water_needed"
-                        else:
-                            plot["status"] = "growing"
-    
-    # Filter seeds by user's grade (min_grade <= user_grade <= max_grade)
-    all_seeds = await db.investment_plants.find({"is_active": True}, {"_id": 0}).to_list(50)
-    seeds = [
-        s for s in all_seeds 
-        if s.get("min_grade", 0) <= grade <= s.get("max_grade", 5)
-    ]
+        plot["status"], plot["growth_progress"] = garden_state.plot_state(
+            plot, catalogue.get(plot.get("plant_id")), now
+        )
+    
+    # Seeds for the user's grade (min_grade <= user_grade <= max_grade;
+    # a missing bound means K / grade 5)
+    seeds = await db.investment_plants.find({
+        "is_active": True,
+        "$and": [
+            {"$or": [{"min_grade": {"$lte": grade}}, {"min_grade": {"$exists": False}}]},
+            {"$or": [{"max_grade": {"$gte": grade}}, {"max_grade": {"$exists": False}}]},
+        ]
+    }, {"_id": 0}).to_list(50)
     inventory = await db.harvest_inventory.find({"user_id": user["user_id"]}, {"_id": 0}).to_list(100)
     
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
@@ -124,7 +92,7 @@ async def get_farm(request: Request):
         "seeds": seeds,
         "inventory": inventory,
         "market_prices": market_prices,
-        "is_market_open": is_market_open(),
+        "is_market_open": trading_calendar.within_hours(),
         "plot_cost": PLOT_COST
     }
 
@@ -145,7 +113,8 @@ async def buy_farm_plot(request: Request):
     
     plot_count = await db.farm_plots.count_documents({"user_id": user["user_id"]})
     
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": user["user_id"], "account_type": "spending"},
         {"$inc": {"balance": -PLOT_COST}}
     )
@@ -190,7 +159,7 @@ async def plant_seed(data: PlantSeedRequest, request: Request):
     plot = await db.farm_plots.find_one({"plot_id": data.plot_id, "user_id": user["user_id"]})
     if not plot:
         raise HTTPException(status_code=404, detail="Plot not found")
-    if plot.get("status") not in ["empty", "dead"]:
+    if await garden_state.current_status(db, plot) not in ["empty", "dead"]:
         raise HTTPException(status_code=400, detail="Plot is not available for planting")
     
     seed = await db.investment_plants.find_one({"plant_id": data.plant_id, "is_active": True})
@@ -202,7 +171,8 @@ async def plant_seed(data: PlantSeedRequest, request: Request):
     if not gardening_acc or gardening_acc.get("balance", 0) < seed["seed_cost"]:
         raise HTTPException(status_code=400, detail=f"Need ₹{seed['seed_cost']} in your Garden Money to buy this seed")
     
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": user["user_id"], "account_type": "investing"},
         {"$inc": {"balance": -seed["seed_cost"]}}
     )
@@ -260,12 +230,12 @@ async def water_plant(plot_id: str, request: Request):
     plot = await db.farm_plots.find_one({"plot_id": plot_id, "user_id": user["user_id"]})
     if not plot:
         raise HTTPException(status_code=404, detail="Plot not found")
-    if plot.get("status") in ["empty", "dead", "ready"]:
+    if await garden_state.current_status(db, plot) in ["empty", "dead", "ready"]:
         raise HTTPException(status_code=400, detail="Cannot water this plot")
     
     now = datetime.now(timezone.utc).isoformat()
     await db.farm_plots.update_one(
-        {"plot_id": plot_id},
+        {"plot_id": plot_id, "status": {"$in": list(garden_state.LIVE_STATUSES)}},
         {"$set": {"last_watered": now, "status": "growing"}}
     )
     
@@ -278,9 +248,22 @@ async def water_all_plants(request: Request):
     db = get_db()
     user = await get_current_user(request)
     
-    now = datetime.now(timezone.utc).isoformat()
+    # Only plants that are still alive and growing — a plot that has dried
+    # out or finished growing since the last sweep must not be revived
+    catalogue = await garden_state.get_catalogue(db)
+    now_dt = datetime.now(timezone.utc)
+    plots = await db.farm_plots.find(
+        {"user_id": user["user_id"], "status": {"$in": list(garden_state.LIVE_STATUSES)}},
+        {"_id": 0}
+    ).to_list(50)
+    plot_ids = [
+        p["plot_id"] for p in plots
+        if garden_state.plot_state(p, catalogue.get(p.get("plant_id")), now_dt)[0] in garden_state.LIVE_STATUSES
+    ]
+    
+    now = now_dt.isoformat()
     result = await db.farm_plots.update_many(
-        {"user_id": user["user_id"], "status": {"$in": ["growing", "water_needed", "wilting"]}},
+        {"plot_id": {"$in": plot_ids}, "status": {"$in": list(garden_state.LIVE_STATUSES)}},
         {"$set": {"last_watered": now, "status": "growing"}}
     )
     
@@ -296,10 +279,10 @@ async def harvest_plant(plot_id: str, request: Request):
     plot = await db.farm_plots.find_one({"plot_id": plot_id, "user_id": user["user_id"]})
     if not plot:
         raise HTTPException(status_code=404, detail="Plot not found")
-    if plot.get("status") != "ready":
+    if await garden_state.current_status(db, plot) != "ready":
         raise HTTPException(status_code=400, detail="Plant is not ready for harvest")
     
-    plant = await db.investment_plants.find_one({"plant_id": plot["plant_id"]})
+    plant = (await garden_state.get_catalogue(db)).get(plot["plant_id"])
     if not plant:
         raise HTTPException(status_code=404, detail="Plant info not found")
     
@@ -341,8 +324,12 @@ async def sell_produce(request: Request, plant_id: str, quantity: int):
     db = get_db()
     user = await get_current_user(request)
     
-    if not is_market_open():
-        raise HTTPException(status_code=400, detail="Market is closed! Open 7 AM - 5 PM IST")
+    # Produce market: stock-market hours, but open on stock-market holidays
+    if not trading_calendar.within_hours():
+        raise HTTPException(
+            status_code=400,
+            detail=f"Market is closed! Open {trading_calendar.OPEN_TIME:%H:%M} - {trading_calendar.CLOSE_TIME:%H:%M} IST"
+        )
     
     inventory = await db.harvest_inventory.find_one({
         "user_id": user["user_id"],
@@ -383,7 +370,8 @@ async def sell_produce(request: Request, plant_id: str, quantity: int):
         )
     
     # Add earnings to investing (gardening) account
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": user["user_id"], "account_type": "investing"},
         {"$inc": {"balance": total_earnings}}
     )
@@ -3,6 +3,8 @@ from fastapi import APIRouter, HTTPException, Request, UploadFile, File
 from typing import Optional
 from datetime import datetime, timezone
 import uuid
+from pymongo.errors import DuplicateKeyError
+from services import glossary_index, word_of_day
 
 router = APIRouter(tags=["glossary"])
 
@@ -16,6 +18,12 @@ def get_db():
     return _db
 
 
+def _glossary_changed():
+    """Drop in-memory glossary state after an admin write."""
+    glossary_index.invalidate()
+    word_of_day.invalidate()
+
+
 # Fields on a word doc that admins can override per-grade. Term is intentionally
 # excluded — the display term stays global. Every other field can vary per grade.
 OVERRIDABLE_WORD_FIELDS = (
@@ -71,44 +79,23 @@ async def get_glossary_words(
     db = get_db()
     user = await get_current_user(request)
     
-    # Build query
-    query = {}
-    
     # Non-admin viewers only see published words. Missing `is_published` is
     # treated as live (legacy words created before this flag existed).
     is_admin = user and user.get("role") == "admin"
-    if not is_admin:
-        query["is_published"] = {"$ne": False}
-    
-    # Search by term only (not meaning or description)
-    if search:
-        query["term"] = {"$regex": search, "$options": "i"}
-    
-    # Filter by starting letter
-    if letter and len(letter) == 1:
-        query["term"] = {"$regex": f"^{letter}", "$options": "i"}
-    
-    # Filter by category
-    if category:
-        query["category"] = category
     
     # Grade filter - show words appropriate for the user's grade
-    if grade is not None:
-        query["min_grade"] = {"$lte": grade}
-        query["max_grade"] = {"$gte": grade}
-    elif user and user.get("role") == "child" and user.get("grade") is not None:
-        user_grade = user["grade"]
-        query["min_grade"] = {"$lte": user_grade}
-        query["max_grade"] = {"$gte": user_grade}
-    
-    # Get total count
-    total = await db.glossary_words.count_documents(query)
-    
-    # Get words sorted alphabetically
-    words = await db.glossary_words.find(
-        query, 
-        {"_id": 0}
-    ).sort("term", 1).skip(skip).limit(limit).to_list(limit)
+    if grade is None and user and user.get("role") == "child" and user.get("grade") is not None:
+        grade = user["grade"]
+    
+    # Term search (prefix / substring / typo-tolerant) and letter / category /
+    # grade / publish filters all run against the in-memory index
+    index = await glossary_index.get_index(db)
+    matches = index.search(
+        search=search, letter=letter, category=category,
+        grade=grade, published_only=not is_admin,
+    )
+    total = len(matches)
+    words = [dict(w) for w in matches[skip:skip + limit]]
 
     # Merge per-grade overrides on display fields (term stays global)
     override_grade = resolve_user_grade(user, grade)
@@ -116,37 +103,17 @@ async def get_glossary_words(
         for w in words:
             apply_word_grade_override(w, override_grade)
     
-    # Base query used for computing available letters + categories. It respects
-    # grade + is_published (for non-admin users) but strips search/letter/category
-    # so the filter chips reflect what's actually available for this user, not
-    # what remains after the current filter selection.
-    base_query = {}
-    if not is_admin:
-        base_query["is_published"] = {"$ne": False}
-    if grade is not None:
-        base_query["min_grade"] = {"$lte": grade}
-        base_query["max_grade"] = {"$gte": grade}
-    elif user and user.get("role") == "child" and user.get("grade") is not None:
-        user_grade = user["grade"]
-        base_query["min_grade"] = {"$lte": user_grade}
-        base_query["max_grade"] = {"$gte": user_grade}
-
-    # Available starting letters — only letters that have at least one word
-    # visible to this user + grade.
-    all_letters = await db.glossary_words.distinct("first_letter", base_query)
-    all_letters = sorted([l for l in all_letters if l])
-
-    # Available categories — only categories that have at least one word
-    # visible to this user + grade. This prevents the UI from showing empty
-    # category chips like "Investing" for a Kindergarten child.
-    all_categories = await db.glossary_words.distinct("category", base_query)
-    all_categories = [c for c in all_categories if c]
+    # Available starting letters + categories respect grade + is_published
+    # (for non-admin users) but ignore search/letter/category so the filter
+    # chips reflect what's actually available for this user — e.g. no empty
+    # "Investing" chip for a Kindergarten child. Precomputed per grade.
+    facets = index.facets(grade, published_only=not is_admin)
     
     return {
         "words": words,
         "total": total,
-        "letters": all_letters,
-        "categories": all_categories
+        "letters": facets["letters"],
+        "categories": facets["categories"]
     }
 
 @router.get("/glossary/words/{word_id}")
@@ -173,34 +140,16 @@ async def get_glossary_word(word_id: str, request: Request, grade: Optional[int]
 
 @router.get("/glossary/word-of-day")
 async def get_word_of_day(request: Request, grade: Optional[int] = None):
-    """Get a random word of the day based on user's grade"""
+    """Get the word of the day for the user's grade (precomputed calendar)"""
     from services.auth import get_current_user
-    import random
     db = get_db()
     user = await get_current_user(request)
-    
-    query = {}
-    # Word of the Day never picks a draft word for non-admin users
-    is_admin = user and user.get("role") == "admin"
-    if not is_admin:
-        query["is_published"] = {"$ne": False}
 
     override_grade = resolve_user_grade(user, grade)
-    if override_grade is not None:
-        query["min_grade"] = {"$lte": override_grade}
-        query["max_grade"] = {"$gte": override_grade}
-    
-    # Use date as seed for consistent daily word
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    
-    words = await db.glossary_words.find(query, {"_id": 0}).to_list(1000)
-    if not words:
+    word = await word_of_day.get_word_of_day(db, override_grade)
+    if not word:
         return None
-    
-    # Use date string as seed for reproducible random selection
-    random.seed(today)
-    word = random.choice(words)
-    random.seed()  # Reset seed
+    word = dict(word)
 
     # Apply grade override to the Word of the Day meaning/example/image
     if override_grade is not None:
@@ -223,25 +172,13 @@ async def admin_get_all_words(
     db = get_db()
     await require_admin(request)
     
-    query = {}
-    if search:
-        query["term"] = {"$regex": search, "$options": "i"}
-    if category:
-        query["category"] = category
-    
-    total = await db.glossary_words.count_documents(query)
-    words = await db.glossary_words.find(
-        query, 
-        {"_id": 0}
-    ).sort("term", 1).skip(skip).limit(limit).to_list(limit)
-    
-    # Get all categories for filter dropdown
-    all_categories = await db.glossary_words.distinct("category")
+    index = await glossary_index.get_index(db)
+    matches = index.search(search=search, category=category, published_only=False)
     
     return {
-        "words": words,
-        "total": total,
-        "categories": [c for c in all_categories if c]
+        "words": [dict(w) for w in matches[skip:skip + limit]],
+        "total": len(matches),
+        "categories": index.facets(published_only=False)["categories"]
     }
 
 @router.post("/admin/glossary/words")
@@ -258,8 +195,8 @@ async def admin_create_word(request: Request):
         raise HTTPException(status_code=400, detail="Term is required")
     
     # Check for duplicate term
-    existing = await db.glossary_words.find_one({"term": {"$regex": f"^{term}$", "$options": "i"}})
-    if existing:
+    index = await glossary_index.get_index(db)
+    if index.find_term(term):
         raise HTTPException(status_code=400, detail="A word with this term already exists")
     
     word_id = f"word_{uuid.uuid4().hex[:12]}"
@@ -268,6 +205,7 @@ async def admin_create_word(request: Request):
     word_doc = {
         "word_id": word_id,
         "term": term,
+        "term_normalized": glossary_index.normalize_term(term),
         "first_letter": first_letter,
         "meaning": body.get("meaning", ""),
         "description": body.get("description", ""),
@@ -288,7 +226,11 @@ async def admin_create_word(request: Request):
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.glossary_words.insert_one(word_doc)
+    try:
+        await db.glossary_words.insert_one(word_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="A word with this term already exists")
+    _glossary_changed()
     
     return {"message": "Word created", "word_id": word_id}
 
@@ -316,13 +258,18 @@ async def admin_update_word(word_id: str, request: Request):
     if "term" in update_fields:
         term = update_fields["term"].strip()
         update_fields["first_letter"] = term[0].upper() if term else ""
+        update_fields["term_normalized"] = glossary_index.normalize_term(term)
     
     update_fields["updated_at"] = datetime.now(timezone.utc).isoformat()
     
-    await db.glossary_words.update_one(
-        {"word_id": word_id},
-        {"$set": update_fields}
-    )
+    try:
+        await db.glossary_words.update_one(
+            {"word_id": word_id},
+            {"$set": update_fields}
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="A word with this term already exists")
+    _glossary_changed()
     
     return {"message": "Word updated"}
 
@@ -346,6 +293,7 @@ async def admin_toggle_publish_word(word_id: str, request: Request):
         {"word_id": word_id},
         {"$set": {"is_published": new_status, "updated_at": datetime.now(timezone.utc).isoformat()}},
     )
+    _glossary_changed()
 
     return {
         "message": f"Word set to {'Live' if new_status else 'Draft'}",
@@ -363,56 +311,200 @@ async def admin_delete_word(word_id: str, request: Request):
     result = await db.glossary_words.delete_one({"word_id": word_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Word not found")
+    _glossary_changed()
     
     return {"message": "Word deleted"}
 
+BULK_IMPORT_BATCH_SIZE = 500
+# CSV columns for bulk import; `examples` holds several examples split by "|"
+BULK_IMPORT_CSV_FIELDS = ("term", "meaning", "description", "examples", "image_url",
+                          "category", "min_grade", "max_grade")
+
+
+def _build_import_doc(word_data: dict):
+    """Validate one imported row. Returns (word_doc, None) or (None, error)."""
+    if not isinstance(word_data, dict):
+        return None, "Row is not an object"
+    term = str(word_data.get("term") or "").strip()
+    if not term:
+        return None, "Term is required"
+    try:
+        min_grade = int(word_data.get("min_grade") if word_data.get("min_grade") not in (None, "") else 0)
+        max_grade = int(word_data.get("max_grade") if word_data.get("max_grade") not in (None, "") else 5)
+    except (TypeError, ValueError):
+        return None, "Grades must be whole numbers"
+    if not 0 <= min_grade <= max_grade <= 5:
+        return None, "Grades must satisfy 0 <= min_grade <= max_grade <= 5"
+    examples = word_data.get("examples") or []
+    if isinstance(examples, str):
+        examples = [e.strip() for e in examples.split("|") if e.strip()]
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        "word_id": f"word_{uuid.uuid4().hex[:12]}",
+        "term": term,
+        "term_normalized": glossary_index.normalize_term(term),
+        "first_letter": term[0].upper(),
+        "meaning": word_data.get("meaning") or "",
+        "description": word_data.get("description") or "",
+        "examples": examples,
+        "image_url": word_data.get("image_url") or None,
+        "category": word_data.get("category") or "general",
+        "min_grade": min_grade,
+        "max_grade": max_grade,
+        "created_at": now,
+        "updated_at": now
+    }, None
+
+
+async def _iter_body_lines(request: Request):
+    """Decoded lines of a streamed request body, without loading it whole."""
+    import codecs
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    async for chunk in request.stream():
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def _iter_import_rows(request: Request, fmt: str):
+    """Yield row dicts (or None for unparseable rows) from a JSON, NDJSON or
+    CSV request body."""
+    import csv
+    import json
+    if fmt == "json":
+        body = await request.json()
+        for word_data in body.get("words", []):
+            yield word_data
+    elif fmt == "ndjson":
+        async for line in _iter_body_lines(request):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+    else:
+        header = None
+        record = ""
+        async for line in _iter_body_lines(request):
+            # A quoted field may contain newlines: keep reading until quotes balance
+            record = f"{record}\n{line}" if record else line
+            if record.count('"') % 2:
+                continue
+            values = next(csv.reader([record]), [])
+            record = ""
+            if not any(v.strip() for v in values):
+                continue
+            if header is None:
+                header = [h.strip().lower() for h in values]
+                if "term" not in header:
+                    raise HTTPException(status_code=400, detail="CSV header must include a 'term' column")
+                continue
+            yield {k: v.strip() for k, v in zip(header, values) if k in BULK_IMPORT_CSV_FIELDS}
+        if record:
+            yield None  # unterminated quoted field
+
+
 @router.post("/admin/glossary/bulk-import")
-async def admin_bulk_import_words(request: Request):
-    """Admin: Bulk import words from JSON"""
+async def admin_bulk_import_words(request: Request, format: Optional[str] = None):
+    """Admin: Bulk import words from a JSON body ({"words": [...]}) or a
+    streamed NDJSON / CSV upload (Content-Type application/x-ndjson or
+    text/csv, or ?format=ndjson|csv).
+
+    Rows are inserted unordered in batches; the unique index on
+    `term_normalized` rejects duplicates, including ones racing in from a
+    concurrent import. Every row gets a result: imported, duplicate or
+    invalid."""
+    from pymongo.errors import BulkWriteError
     from services.auth import require_admin
     db = get_db()
     await require_admin(request)
     
-    body = await request.json()
-    words = body.get("words", [])
-    
-    if not words:
-        raise HTTPException(status_code=400, detail="No words provided")
-    
-    imported = 0
-    skipped = 0
-    
-    for word_data in words:
-        term = word_data.get("term", "").strip()
-        if not term:
-            skipped += 1
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fmt = (format or "").lower() or {
+        "application/x-ndjson": "ndjson",
+        "application/jsonl": "ndjson",
+        "text/csv": "csv",
+    }.get(content_type, "json")
+    if fmt not in ("json", "ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be json, ndjson or csv")
+    
+    results = []
+    seen = set()  # normalized terms earlier in this upload
+    batch = []    # (result, word_doc)
+
+    async def flush():
+        if not batch:
+            return
+        # Pre-check so duplicates are reported even if the unique index
+        # couldn't be built; the index still settles races between imports
+        norms = [doc["term_normalized"] for _, doc in batch]
+        existing = {d["term_normalized"] for d in await db.glossary_words.find(
+            {"term_normalized": {"$in": norms}}, {"_id": 0, "term_normalized": 1}
+        ).to_list(len(norms))}
+        pending = []
+        for result, doc in batch:
+            if doc["term_normalized"] in existing:
+                result["status"] = "duplicate"
+            else:
+                pending.append((result, doc))
+        batch.clear()
+        if not pending:
+            return
+        failed = {}
+        try:
+            await db.glossary_words.insert_many([doc for _, doc in pending], ordered=False)
+        except BulkWriteError as e:
+            failed = {err["index"]: err for err in e.details.get("writeErrors", [])}
+        for i, (result, _) in enumerate(pending):
+            err = failed.get(i)
+            if err is None:
+                result["status"] = "imported"
+            elif err.get("code") == 11000:
+                result["status"] = "duplicate"
+            else:
+                result["status"] = "invalid"
+                result["error"] = err.get("errmsg", "Insert failed")
+
+    row_number = 0
+    async for word_data in _iter_import_rows(request, fmt):
+        row_number += 1
+        if word_data is None:
+            results.append({"row": row_number, "term": None, "status": "invalid", "error": "Unparseable row"})
             continue
-        
-        # Check for duplicate
-        existing = await db.glossary_words.find_one({"term": {"$regex": f"^{term}$", "$options": "i"}})
-        if existing:
-            skipped += 1
+        doc, error = _build_import_doc(word_data)
+        term = str(word_data.get("term") or "").strip() if isinstance(word_data, dict) else None
+        result = {"row": row_number, "term": term}
+        results.append(result)
+        if error:
+            result.update(status="invalid", error=error)
             continue
-        
-        word_id = f"word_{uuid.uuid4().hex[:12]}"
-        first_letter = term[0].upper() if term else ""
-        
-        word_doc = {
-            "word_id": word_id,
-            "term": term,
-            "first_letter": first_letter,
-            "meaning": word_data.get("meaning", ""),
-            "description": word_data.get("description", ""),
-            "examples": word_data.get("examples", []),
-            "image_url": word_data.get("image_url"),
-            "category": word_data.get("category", "general"),
-            "min_grade": word_data.get("min_grade", 0),
-            "max_grade": word_data.get("max_grade", 5),
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }
-        
-        await db.glossary_words.insert_one(word_doc)
-        imported += 1
+        if doc["term_normalized"] in seen:
+            result["status"] = "duplicate"
+            continue
+        seen.add(doc["term_normalized"])
+        batch.append((result, doc))
+        if len(batch) >= BULK_IMPORT_BATCH_SIZE:
+            await flush()
+    await flush()
+    
+    if not results:
+        raise HTTPException(status_code=400, detail="No words provided")
     
-    return {"message": f"Imported {imported} words, skipped {skipped} duplicates"}
+    counts = {status: sum(1 for r in results if r["status"] == status)
+              for status in ("imported", "duplicate", "invalid")}
+    if counts["imported"]:
+        _glossary_changed()
+    return {
+        "message": f"Imported {counts['imported']} words, skipped {counts['duplicate']} duplicates"
+                   + (f" and {counts['invalid']} invalid rows" if counts["invalid"] else ""),
+        "imported": counts["imported"],
+        "duplicates": counts["duplicate"],
+        "invalid": counts["invalid"],
+        "results": results,
+    }
@@ -1,9 +1,12 @@
 """Stock Investment routes - Grade 3-5 investment simulation"""
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
+from typing import Optional
 from datetime import datetime, timezone
 import uuid
 
+from services import market_snapshot, price_candles, stock_repository, trade_executor, wallet_sources
+
 # Database injection
 _db = None
 
@@ -67,7 +70,8 @@ async def create_investment(investment: InvestmentCreate, request: Request):
     if not investing_acc or investing_acc.get("balance", 0) < investment.amount:
         raise HTTPException(status_code=400, detail="Insufficient balance in investing account")
     
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": user["user_id"], "account_type": "investing"},
         {"$inc": {"balance": -investment.amount}}
     )
@@ -121,7 +125,8 @@ async def sell_investment(investment_id: str, request: Request):
     growth = 1 + (inv.get("growth_rate", 0.05) * days_passed / 365)
     current_value = round(inv["amount_invested"] * growth, 2)
     
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": user["user_id"], "account_type": "investing"},
         {"$inc": {"balance": current_value}}
     )
@@ -167,25 +172,30 @@ async def get_investment_stocks(request: Request):
     user = await get_current_user(request)
     grade = user.get("grade", 3) or 3
     
-    stocks = await db.investment_stocks.find(
-        {"is_active": True, "min_grade": {"$lte": grade}, "max_grade": {"$gte": grade}},
-        {"_id": 0}
-    ).to_list(100)
-    return stocks
+    snapshot = await market_snapshot.get_snapshot(db)
+    return [
+        dict(stock) for stock in snapshot.by_id.values()
+        if stock.get("is_active") is True
+        and isinstance(stock.get("min_grade"), int) and isinstance(stock.get("max_grade"), int)
+        and stock["min_grade"] <= grade <= stock["max_grade"]
+    ]
 
 @router.get("/investments/stocks/{stock_id}/chart")
-async def get_stock_chart(stock_id: str, request: Request, days: int = 30):
-    """Get stock price history for chart"""
+async def get_stock_chart(stock_id: str, request: Request, period: Optional[str] = None,
+                          days: Optional[int] = None, points: int = price_candles.CHART_POINTS):
+    """Get downsampled OHLC chart data (`period` e.g. 7d, 90d, all; `days`
+    is accepted for older clients and rounded to the nearest period)"""
     from services.auth import get_current_user
     db = get_db()
     await get_current_user(request)
     
-    history = await db.stock_price_history.find(
-        {"stock_id": stock_id},
-        {"_id": 0}
-    ).sort("date", -1).limit(days).to_list(days)
-    
-    return list(reversed(history))
+    if period is None:
+        period = price_candles.nearest_period(days) if days else "30d"
+    if period not in price_candles.PERIODS:
+        raise HTTPException(status_code=400, detail=f"Unknown period. Use one of: {', '.join(price_candles.PERIODS)}")
+    if not (await market_snapshot.get_snapshot(db)).get(stock_id):
+        raise HTTPException(status_code=404, detail="Stock not found")
+    return await price_candles.chart(db, stock_id, period, points)
 
 @router.get("/investments/portfolio")
 async def get_investment_portfolio(request: Request):
@@ -199,13 +209,12 @@ async def get_investment_portfolio(request: Request):
         {"_id": 0}
     ).to_list(100)
     
+    snapshot = await market_snapshot.get_snapshot(db)
     portfolio_value = 0
     for holding in holdings:
-        stock = await db.investment_stocks.find_one(
-            {"stock_id": holding["stock_id"]},
-            {"current_price": 1, "name": 1, "symbol": 1}
-        )
+        stock = snapshot.get(holding["stock_id"])
         if stock:
+            stock = {k: stock.get(k) for k in ("current_price", "name", "symbol")}
             holding["stock"] = stock
             holding["current_value"] = holding["quantity"] * stock.get("current_price", 0)
             portfolio_value += holding["current_value"]
@@ -226,48 +235,18 @@ async def buy_investment(request: Request):
     stock_id = body.get("stock_id")
     quantity = body.get("quantity", 1)
     
-    stock = await db.investment_stocks.find_one({"stock_id": stock_id})
+    stock = await stock_repository.get_stock(db, stock_id)
     if not stock:
         raise HTTPException(status_code=404, detail="Stock not found")
     
-    total_cost = stock["current_price"] * quantity
-    
-    investing_acc = await db.wallet_accounts.find_one({
-        "user_id": user["user_id"],
-        "account_type": "investing"
-    })
-    
-    if not investing_acc or investing_acc.get("balance", 0) < total_cost:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
-    
-    await db.wallet_accounts.update_one(
-        {"user_id": user["user_id"], "account_type": "investing"},
-        {"$inc": {"balance": -total_cost}}
-    )
-    
-    # Update or create holding
-    existing = await db.stock_holdings.find_one({
-        "user_id": user["user_id"],
-        "stock_id": stock_id
-    })
-    
-    if existing:
-        await db.stock_holdings.update_one(
-            {"user_id": user["user_id"], "stock_id": stock_id},
-            {"$inc": {"quantity": quantity, "total_invested": total_cost}}
+    try:
+        trade = await trade_executor.execute(
+            db, user["user_id"], "buy", stock, quantity, trade_executor.idempotency_key(request, body)
         )
-    else:
-        await db.stock_holdings.insert_one({
-            "holding_id": f"hold_{uuid.uuid4().hex[:12]}",
-            "user_id": user["user_id"],
-            "stock_id": stock_id,
-            "quantity": quantity,
-            "total_invested": total_cost,
-            "avg_buy_price": stock["current_price"],
-            "created_at": datetime.now(timezone.utc).isoformat()
-        })
-    
-    return {"message": f"Bought {quantity} shares of {stock['name']}", "total_cost": total_cost}
+    except trade_executor.TradeError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    return {"message": f"Bought {trade['quantity']} shares of {trade['stock_name']}", "total_cost": trade["total"]}
 
 @router.post("/investments/sell")
 async def sell_investment_stock(request: Request):
@@ -280,35 +259,15 @@ async def sell_investment_stock(request: Request):
     stock_id = body.get("stock_id")
     quantity = body.get("quantity", 1)
     
-    holding = await db.stock_holdings.find_one({
-        "user_id": user["user_id"],
-        "stock_id": stock_id
-    })
-    
-    if not holding or holding.get("quantity", 0) < quantity:
-        raise HTTPException(status_code=400, detail="Insufficient shares")
-    
-    stock = await db.investment_stocks.find_one({"stock_id": stock_id})
+    stock = await stock_repository.get_stock(db, stock_id)
     if not stock:
         raise HTTPException(status_code=404, detail="Stock not found")
     
-    total_value = stock["current_price"] * quantity
-    
-    await db.wallet_accounts.update_one(
-        {"user_id": user["user_id"], "account_type": "investing"},
-        {"$inc": {"balance": total_value}}
-    )
-    
-    new_quantity = holding["quantity"] - quantity
-    if new_quantity <= 0:
-        await db.stock_holdings.delete_one({
-            "user_id": user["user_id"],
-            "stock_id": stock_id
-        })
-    else:
-        await db.stock_holdings.update_one(
-            {"user_id": user["user_id"], "stock_id": stock_id},
-            {"$inc": {"quantity": -quantity}}
+    try:
+        trade = await trade_executor.execute(
+            db, user["user_id"], "sell", stock, quantity, trade_executor.idempotency_key(request, body)
         )
+    except trade_executor.TradeError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     
-    return {"message": f"Sold {quantity} shares of {stock['name']}", "total_value": total_value}
\ No newline at end of file
+    return {"message": f"Sold {trade['quantity']} shares of {trade['stock_name']}", "total_value": trade["total"]}
\ No newline at end of file
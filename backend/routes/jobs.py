@@ -3,6 +3,8 @@ from fastapi import APIRouter, HTTPException, Request
 from datetime import datetime, timezone
 import uuid
 
+from services import wallet_sources
+
 router = APIRouter(tags=["jobs"])
 
 _db = None
@@ -254,7 +256,8 @@ async def pay_child_job(job_id: str, request: Request):
     
     if payment_type == "digital" and amount > 0:
         # Parent-assigned job pay → credit My Wallet balance + log pending entry
-        await db.wallet_accounts.update_one(
+        await wallet_sources.update_wallet(
+            db,
             {"user_id": job["child_id"], "account_type": "my_wallet"},
             {"$inc": {"balance": amount}, "$setOnInsert": {"account_id": f"acc_{uuid.uuid4().hex[:12]}", "user_id": job["child_id"], "account_type": "my_wallet"}},
             upsert=True
@@ -3,6 +3,8 @@ from fastapi import APIRouter, HTTPException, Request
 from datetime import datetime, timezone
 import uuid
 
+from services import wallet_sources
+
 _db = None
 
 def init_db(database):
@@ -170,7 +172,8 @@ async def complete_lesson(lesson_id: str, request: Request):
         upsert=True
     )
     
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": user["user_id"], "account_type": "spending"},
         {"$inc": {"balance": reward_coins}}
     )
@@ -225,7 +228,8 @@ async def submit_quiz(request: Request):
     
     coins = 10 if passed else 2
     
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": user["user_id"], "account_type": "spending"},
         {"$inc": {"balance": coins}}
     )
@@ -314,7 +318,8 @@ async def complete_activity(activity_id: str, request: Request):
             "completed_at": datetime.now(timezone.utc).isoformat()
         })
     
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": user["user_id"], "account_type": "spending"},
         {"$inc": {"balance": reward_coins}}
     )
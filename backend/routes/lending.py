@@ -3,6 +3,8 @@ from fastapi import APIRouter, HTTPException, Request
 from datetime import datetime, timezone, timedelta
 import uuid
 
+from services import wallet_sources
+
 _db = None
 
 def init_db(database):
@@ -379,11 +381,13 @@ async def respond_to_request(request_id: str, request: Request):
         }
         
         # Transfer money from lender to borrower
-        await db.wallet_accounts.update_one(
+        await wallet_sources.update_wallet(
+            db,
             {"user_id": user["user_id"], "account_type": "spending"},
             {"$inc": {"balance": -amount}}
         )
-        await db.wallet_accounts.update_one(
+        await wallet_sources.update_wallet(
+            db,
             {"user_id": loan_request["borrower_id"], "account_type": "spending"},
             {"$inc": {"balance": amount}}
         )
@@ -659,11 +663,13 @@ async def repay_loan(loan_id: str, request: Request):
     was_late = datetime.now(timezone.utc) > return_date
     
     # Transfer money
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": user["user_id"], "account_type": "spending"},
         {"$inc": {"balance": -total_repayment}}
     )
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": loan["lender_id"], "account_type": "spending"},
         {"$inc": {"balance": total_repayment}}
     )
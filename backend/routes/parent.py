@@ -5,7 +5,7 @@ from typing import Optional, List
 from datetime import datetime, timezone, timedelta
 import uuid
 
-from services.content_query import child_visible_content_query
+from services import learning_progress, portfolio_engine, wallet_sources
 
 _db = None
 
@@ -71,57 +71,65 @@ async def parent_dashboard(request: Request):
         {"_id": 0}
     ).to_list(20)
     
+    # Batch every per-child lookup with $in instead of querying per child
+    child_ids = [link["child_id"] for link in links]
+    child_docs = await db.users.find({"user_id": {"$in": child_ids}}, {"_id": 0}).to_list(len(child_ids) or 1)
+    child_map = {c["user_id"]: c for c in child_docs}
+    
+    wallets_by_child = {}
+    async for wallet in db.wallet_accounts.find({"user_id": {"$in": child_ids}}, {"_id": 0}):
+        wallets_by_child.setdefault(wallet["user_id"], []).append(wallet)
+    
+    active_chores = {}
+    async for row in db.new_quests.aggregate([
+        {"$match": {
+            "creator_type": "parent",
+            "creator_id": parent["user_id"],
+            "child_id": {"$in": child_ids},
+            "is_active": True
+        }},
+        {"$group": {"_id": "$child_id", "n": {"$sum": 1}}},
+    ]):
+        active_chores[row["_id"]] = row["n"]
+    
+    # Pending chores awaiting parent approval
+    pending_chores = {}
+    async for row in db.quest_completions.aggregate([
+        {"$match": {"user_id": {"$in": child_ids}, "status": "pending"}},
+        {"$group": {"_id": "$user_id", "n": {"$sum": 1}}},
+    ]):
+        pending_chores[row["_id"]] = row["n"]
+    
+    # Learning progress so the dashboard card can show "X / Y lessons"
+    lessons_completed = await learning_progress.completed_lesson_counts(db, child_ids)
+    
     children = []
-    for link in links:
-        child = await db.users.find_one(
-            {"user_id": link["child_id"]},
-            {"_id": 0}
-        )
-        if child:
-            wallets = await db.wallet_accounts.find(
-                {"user_id": child["user_id"]},
-                {"_id": 0}
-            ).to_list(10)
-            # Parents see both wallets — CoinQuest (play) and My Wallet (real earnings).
-            coinquest_balance = sum(w.get("balance", 0) for w in wallets if w.get("account_type") != "my_wallet")
-            my_wallet_balance = sum(w.get("balance", 0) for w in wallets if w.get("account_type") == "my_wallet")
-            total_balance = coinquest_balance + my_wallet_balance
-            
-            chores = await db.new_quests.count_documents({
-                "creator_type": "parent",
-                "creator_id": parent["user_id"],
-                "child_id": child["user_id"],
-                "is_active": True
-            })
-
-            # Learning progress so the dashboard card can show "X / Y lessons"
-            grade = child.get("grade", 3) or 0
-            lessons_completed = await db.user_content_progress.count_documents({
-                "user_id": child["user_id"],
-                "completed": True
-            })
-            # Total lessons available for this grade (content items active for
-            # this grade range and actually visible to the child).
-            total_lessons = await db.content_items.count_documents(
-                child_visible_content_query(grade)
-            )
-
-            # Pending chores awaiting parent approval
-            pending_chores = await db.quest_completions.count_documents({
-                "user_id": child["user_id"],
-                "status": "pending"
-            })
-
-            children.append({
-                **child,
-                "total_balance": total_balance,
-                "coinquest_balance": coinquest_balance,
-                "my_wallet_balance": my_wallet_balance,
-                "active_chores": chores,
-                "pending_chores": pending_chores,
-                "lessons_completed": lessons_completed,
-                "total_lessons": total_lessons,
-            })
+    for child_id in child_ids:
+        child = child_map.get(child_id)
+        if not child:
+            continue
+        wallets = wallets_by_child.get(child_id, [])
+        # Parents see both wallets — CoinQuest (play) and My Wallet (real earnings).
+        coinquest_balance = sum(w.get("balance", 0) for w in wallets if w.get("account_type") != "my_wallet")
+        my_wallet_balance = sum(w.get("balance", 0) for w in wallets if w.get("account_type") == "my_wallet")
+        total_balance = coinquest_balance + my_wallet_balance
+        
+        # Total lessons available for this grade (content items active for
+        # this grade range and actually visible to the child), memoized per
+        # grade so siblings share it.
+        grade = child.get("grade", 3) or 0
+        total_lessons = await learning_progress.visible_content_total(db, grade)
+        
+        children.append({
+            **child,
+            "total_balance": total_balance,
+            "coinquest_balance": coinquest_balance,
+            "my_wallet_balance": my_wallet_balance,
+            "active_chores": active_chores.get(child_id, 0),
+            "pending_chores": pending_chores.get(child_id, 0),
+            "lessons_completed": lessons_completed.get(child_id, 0),
+            "total_lessons": total_lessons,
+        })
     
     return {"children": children}
 
@@ -298,7 +306,8 @@ async def create_reward_penalty(data: RewardPenaltyCreate, request: Request):
     
     # Parent rewards/penalties are real-world earnings — credit child's My Wallet balance
     # AND log a transaction marked pending until parent settles (hands over real cash IRL).
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": data.child_id, "account_type": "my_wallet"},
         {"$inc": {"balance": amount}, "$setOnInsert": {"account_id": f"acc_{uuid.uuid4().hex[:12]}", "user_id": data.child_id, "account_type": "my_wallet"}},
         upsert=True
@@ -453,62 +462,9 @@ async def get_child_insights(child_id: str, request: Request):
     total_spent = sum(t.get("amount", 0) for t in transactions 
                      if t.get("transaction_type") in ["purchase", "gift_sent"])
     
-    # Get learning progress
-    lessons_completed = await db.user_content_progress.count_documents({
-        "user_id": child_id,
-        "completed": True
-    })
-    total_lessons = await db.content_items.count_documents(
-        child_visible_content_query(grade)
-    )
-
-    # Subtopics & topics completed (a subtopic is "completed" when all its content items
-    # have a completed progress row for this child; a topic is completed when all its
-    # subtopics are completed).
-    grade_topics = await db.content_topics.find(
-        {
-            "is_active": {"$ne": False},
-            "min_grade": {"$lte": grade},
-            "max_grade": {"$gte": grade},
-        },
-        {"_id": 0, "topic_id": 1}
-    ).to_list(200)
-    total_topics = len(grade_topics)
-    topics_completed = 0
-    subtopics_completed = 0
-    total_subtopics = 0
-    for t in grade_topics:
-        subtopics = await db.content_topics.find(
-            {"parent_id": t["topic_id"]},
-            {"_id": 0, "topic_id": 1}
-        ).to_list(200)
-        sub_ids = [s["topic_id"] for s in subtopics]
-        total_subtopics += len(sub_ids)
-        if not sub_ids:
-            continue
-        topic_all_done = True
-        any_subtopic_with_content = False
-        for sid in sub_ids:
-            items = await db.content_items.find(
-                {"topic_id": sid, "is_published": True},
-                {"_id": 0, "content_id": 1}
-            ).to_list(200)
-            if not items:
-                topic_all_done = False
-                continue
-            any_subtopic_with_content = True
-            item_ids = [i["content_id"] for i in items]
-            done = await db.user_content_progress.count_documents({
-                "user_id": child_id,
-                "content_id": {"$in": item_ids},
-                "completed": True
-            })
-            if done >= len(item_ids):
-                subtopics_completed += 1
-            else:
-                topic_all_done = False
-        if topic_all_done and any_subtopic_with_content:
-            topics_completed += 1
+    # Get learning progress. Lessons / topics / subtopics completed share the
+    # per-grade content structure with the teacher insights.
+    learning = await learning_progress.learning_summary(db, child_id, grade)
 
     # Streaks come from the user doc (set by the daily-streak claim flow)
     current_streak = child.get("streak_count", 0) or child.get("current_streak", 0) or 0
@@ -572,22 +528,10 @@ async def get_child_insights(child_id: str, request: Request):
     garden_invested = sum(p.get("purchase_price", 0) for p in garden_plots)
     garden_earned = sum(p.get("total_harvested", 0) for p in garden_plots)
     
-    # Get stock holdings (for grades 3-5)
-    stock_holdings = await db.user_stock_holdings.find(
-        {"user_id": child_id},
-        {"_id": 0}
-    ).to_list(50)
-    
-    # Calculate portfolio value and gains
-    portfolio_value = 0
-    total_cost_basis = 0
-    for holding in stock_holdings:
-        # Get current stock price
-        stock = await db.stocks.find_one({"stock_id": holding.get("stock_id")})
-        current_price = stock.get("current_price", 0) if stock else 0
-        shares = holding.get("shares", 0)
-        portfolio_value += shares * current_price
-        total_cost_basis += holding.get("total_cost", 0)
+    # Stock portfolio value and gains (for grades 3-5)
+    portfolio = (await portfolio_engine.valuate(db, [child_id])).get(child_id, portfolio_engine.EMPTY)
+    portfolio_value = portfolio["total_value"]
+    total_cost_basis = portfolio["total_invested"]
     
     # Get realized gains from stock sale transactions
     stock_sales = [t for t in transactions if t.get("transaction_type") == "stock_sale"]
@@ -606,12 +550,7 @@ async def get_child_insights(child_id: str, request: Request):
             "savings_goals_count": len(active_goals)
         },
         "learning": {
-            "lessons_completed": lessons_completed,
-            "total_lessons": total_lessons,
-            "topics_completed": topics_completed,
-            "total_topics": total_topics,
-            "subtopics_completed": subtopics_completed,
-            "total_subtopics": total_subtopics,
+            **learning,
             "current_streak": current_streak,
             "longest_streak": longest_streak,
         },
@@ -648,7 +587,7 @@ async def get_child_insights(child_id: str, request: Request):
             "profit_loss": garden_earned - garden_invested
         },
         "stocks": {
-            "holdings_count": len(stock_holdings),
+            "holdings_count": portfolio["holdings_count"],
             "portfolio_value": portfolio_value,
             "realized_gains": realized_gains,
             "unrealized_gains": unrealized_gains
@@ -1104,7 +1043,8 @@ async def validate_chore_request(request_id: str, request: Request):
         )
         
         # Parent chore reward → credit child's My Wallet balance + log pending entry.
-        await db.wallet_accounts.update_one(
+        await wallet_sources.update_wallet(
+            db,
             {"user_id": child_id, "account_type": "my_wallet"},
             {"$inc": {"balance": reward}, "$setOnInsert": {"account_id": f"acc_{uuid.uuid4().hex[:12]}", "user_id": child_id, "account_type": "my_wallet"}},
             upsert=True
@@ -1447,7 +1387,8 @@ async def approve_chore(chore_id: str, request: Request):
     reward = chore.get("reward_coins", 0)
     
     # Award coins
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": chore["child_id"], "account_type": "spending"},
         {"$inc": {"balance": reward}}
     )
@@ -1533,7 +1474,8 @@ async def give_money_to_child(request: Request):
         raise HTTPException(status_code=403, detail="Not authorized")
     
     # Parent gift → credit child's My Wallet balance + log pending entry
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": child_id, "account_type": "my_wallet"},
         {"$inc": {"balance": amount}, "$setOnInsert": {"account_id": f"acc_{uuid.uuid4().hex[:12]}", "user_id": child_id, "account_type": "my_wallet"}},
         upsert=True
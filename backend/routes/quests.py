@@ -6,6 +6,8 @@ from datetime import datetime, timezone
 from pathlib import Path
 import uuid
 
+from services import wallet_sources
+
 _db = None
 UPLOADS_DIR = Path("/app/backend/uploads")
 
@@ -446,7 +448,8 @@ async def submit_quest(quest_id: str, request: Request):
     
     # Award coins
     if earned_points > 0:
-        await db.wallet_accounts.update_one(
+        await wallet_sources.update_wallet(
+            db,
             {"user_id": user["user_id"], "account_type": "spending"},
             {"$inc": {"balance": earned_points}}
         )
@@ -661,7 +664,8 @@ async def approve_chore(chore_id: str, request: Request):
     )
     
     # Parent chore reward → credit My Wallet balance + log pending entry
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": child_id, "account_type": "my_wallet"},
         {"$inc": {"balance": reward}, "$setOnInsert": {"account_id": f"acc_{uuid.uuid4().hex[:12]}", "user_id": child_id, "account_type": "my_wallet"}},
         upsert=True
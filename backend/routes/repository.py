@@ -5,6 +5,8 @@ from datetime import datetime, timezone
 from pathlib import Path
 import uuid
 import shutil
+import time
+from services import repository_index
 
 router = APIRouter(tags=["repository"])
 
@@ -25,6 +27,34 @@ def get_db():
         raise HTTPException(status_code=500, detail="Database not initialized")
     return db
 
+# ============== CACHED LOOKUPS ==============
+
+# Access settings and the top-level topic list change rarely but were read
+# on every repository request. Cached per process; settings are invalidated
+# on write here, topics (edited from the content admin) just expire.
+LOOKUP_CACHE_TTL = 60  # seconds
+_lookup_cache = {}  # name -> (cached_at, value)
+
+
+async def _cached(name, loader):
+    hit = _lookup_cache.get(name)
+    if hit and time.monotonic() - hit[0] < LOOKUP_CACHE_TTL:
+        return hit[1]
+    value = await loader()
+    _lookup_cache[name] = (time.monotonic(), value)
+    return value
+
+
+async def get_access_settings(db):
+    return await _cached("access", lambda: db.repository_settings.find_one({"key": "access"}, {"_id": 0}))
+
+
+async def get_top_level_topics(db):
+    return await _cached("topics", lambda: db.content_topics.find(
+        {"parent_id": None}, {"_id": 0, "topic_id": 1, "title": 1}
+    ).to_list(length=None))
+
+
 # ============== REPOSITORY ACCESS SETTINGS ==============
 
 @router.get("/admin/repository/access-settings")
@@ -61,6 +91,7 @@ async def update_repository_access_settings(request: Request):
         }},
         upsert=True
     )
+    _lookup_cache.pop("access", None)
     return {"message": "Access settings updated"}
 
 
@@ -95,7 +126,7 @@ async def get_repository_items(
     items = await db.teacher_repository.find(query, {"_id": 0}).sort("created_at", -1).to_list(length=None)
     
     # Get topics for dropdown
-    topics = await db.content_topics.find({"parent_id": None}, {"_id": 0, "topic_id": 1, "title": 1}).to_list(length=None)
+    topics = await get_top_level_topics(db)
     
     return {
         "items": items,
@@ -169,6 +200,7 @@ async def create_repository_item(request: Request):
     }
     
     await db.teacher_repository.insert_one(item)
+    repository_index.invalidate()
     
     # Remove MongoDB _id before returning (it's not JSON serializable)
     item.pop("_id", None)
@@ -253,6 +285,7 @@ async def update_repository_item(request: Request, item_id: str):
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Item not found")
+    repository_index.invalidate()
     
     return {"message": "Item updated"}
 
@@ -267,6 +300,7 @@ async def delete_repository_item(request: Request, item_id: str):
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Item not found")
+    repository_index.invalidate()
     
     return {"message": "Item deleted"}
 
@@ -282,7 +316,7 @@ async def teacher_check_repository_access(request: Request):
     if user.get("role") == "admin":
         return {"has_access": True}
     
-    access_settings = await db.repository_settings.find_one({"key": "access"}, {"_id": 0})
+    access_settings = await get_access_settings(db)
     if not access_settings or access_settings.get("visibility", "all") == "all":
         return {"has_access": True}
     
@@ -298,9 +332,16 @@ async def teacher_get_repository(
     subtopic_id: Optional[str] = None,
     grade: Optional[int] = None,
     file_type: Optional[str] = None,
-    search: Optional[str] = None
+    search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None
 ):
-    """Get repository items for teachers to use in quests"""
+    """Get repository items for teachers to use in quests.
+
+    `search` matches title, tags and description (all words, last one as a
+    prefix) and ranks results by relevance; otherwise newest first. Pass
+    `limit` to page through results with the returned `next_cursor`.
+    `facets` holds counts per topic, grade and file type."""
     from services.auth import get_current_user
     db = get_db()
     user = await get_current_user(request)
@@ -310,59 +351,34 @@ async def teacher_get_repository(
     
     # Check global repository access settings
     if user.get("role") == "teacher":
-        access_settings = await db.repository_settings.find_one({"key": "access"}, {"_id": 0})
+        access_settings = await get_access_settings(db)
         if access_settings and access_settings.get("visibility") == "specific":
             teacher_school = user.get("school_id", "")
             if teacher_school not in access_settings.get("allowed_schools", []):
                 return {"items": [], "topics": [], "access_denied": True, "message": "Repository is not available for your school"}
     
-    query = {"is_active": True}
-    
-    # Filter by school visibility
-    teacher_school_id = user.get("school_id", "")
-    if teacher_school_id:
-        query["$or"] = [
-            {"school_visibility": "all"},
-            {"school_visibility": {"$exists": False}},
-            {"visible_to_schools": teacher_school_id}
-        ]
-    
-    if topic_id:
-        query["topic_id"] = topic_id
-    if subtopic_id:
-        query["subtopic_id"] = subtopic_id
-    if grade:
-        query["$and"] = [
-            {"min_grade": {"$lte": grade}},
-            {"max_grade": {"$gte": grade}}
-        ]
-    if file_type:
-        query["file_type"] = file_type
-    if search:
-        search_conditions = [
-            {"title": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}},
-            {"tags": {"$in": [search]}}
-        ]
-        if "$or" in query:
-            # Already have school visibility $or, wrap in $and
-            query = {"$and": [
-                {"$or": query["$or"]},
-                {"$or": search_conditions},
-                {k: v for k, v in query.items() if k != "$or"}
-            ]}
-        else:
-            query["$or"] = search_conditions
-    
-    items = await db.teacher_repository.find(query, {"_id": 0}).sort("created_at", -1).to_list(length=None)
-    
-    # Get topics for filtering
-    topics = await db.content_topics.find({"parent_id": None}, {"_id": 0, "topic_id": 1, "title": 1}).to_list(length=None)
+    if limit is not None and not 1 <= limit <= 200:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 200")
+    
+    index = await repository_index.get_index(db)
+    result = index.search(
+        search=search,
+        topic_id=topic_id,
+        subtopic_id=subtopic_id,
+        grade=grade,
+        file_type=file_type,
+        # Filter by school visibility
+        school_id=user.get("school_id", ""),
+        cursor=cursor,
+        limit=limit,
+    )
     
     return {
-        "items": items,
-        "total": len(items),
-        "topics": topics
+        "items": [dict(item) for item in result["items"]],
+        "total": result["total"],
+        "next_cursor": result["next_cursor"],
+        "facets": result["facets"],
+        "topics": await get_top_level_topics(db)
     }
 
 @router.get("/teacher/repository/subtopics/{topic_id}")
@@ -4,6 +4,7 @@ from datetime import datetime, timezone, timedelta
 import uuid
 import hashlib
 from services.curricula import normalize_curricula, DEFAULT_CURRICULUM, CURRICULA
+from services import entitlements
 
 # Database injection
 _db = None
@@ -67,6 +68,7 @@ async def _grant_subscription(db, email, name, duration):
             "granted_by_admin": True,
             "created_at": now.isoformat(),
         })
+    await entitlements.refresh(db, emails=[email])
     return True
 
 router = APIRouter(tags=["school"])
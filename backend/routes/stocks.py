@@ -1,8 +1,12 @@
 """Stock market routes - Grade 3-5 detailed trading"""
 from fastapi import APIRouter, HTTPException, Request
-from datetime import datetime, timezone
-import uuid
-import pytz
+import asyncio
+import json
+
+from services import (
+    market_snapshot, order_book, portfolio_engine, price_candles, price_feed, stock_repository, trade_executor,
+    trading_calendar
+)
 
 _db = None
 
@@ -17,11 +21,12 @@ def get_db():
 
 router = APIRouter(prefix="/stocks", tags=["stocks"])
 
-def is_market_open():
-    """Check if market is open (7 AM - 5 PM IST)"""
-    ist = pytz.timezone('Asia/Kolkata')
-    ist_now = datetime.now(ist)
-    return 7 <= ist_now.hour < 17
+def _closed_message():
+    holiday = trading_calendar.today().holiday
+    if holiday:
+        return f"Market is closed today for {holiday}!"
+    return (f"Market is closed! Trading hours: {trading_calendar.OPEN_TIME:%H:%M} - "
+            f"{trading_calendar.CLOSE_TIME:%H:%M} IST")
 
 @router.get("/market-status")
 async def get_market_status(request: Request):
@@ -29,16 +34,45 @@ async def get_market_status(request: Request):
     from services.auth import get_current_user
     await get_current_user(request)
     
-    ist = pytz.timezone('Asia/Kolkata')
-    ist_now = datetime.now(ist)
+    return trading_calendar.status()
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+@router.get("/stream")
+async def stream_prices(request: Request):
+    """Server-sent events: a `hello` with every price, then a `prices`
+    delta whenever prices change and `status` when the market opens or
+    closes (replaces polling list/portfolio/market-status)"""
+    from fastapi.responses import StreamingResponse
+    from services.auth import get_current_user
+    db = get_db()
+    await get_current_user(request)
     
-    return {
-        "is_open": is_market_open(),
-        "current_time": ist_now.strftime("%H:%M"),
-        "open_time": "07:00",
-        "close_time": "17:00",
-        "timezone": "IST"
-    }
+    async def events():
+        queue = price_feed.subscribe()
+        try:
+            market_open = trading_calendar.is_open()
+            yield _sse("hello", {**await price_feed.hello(db), "is_open": market_open})
+            while not await request.is_disconnected():
+                # Wake up right at the next open / close to push `status`
+                timeout = min(price_feed.HEARTBEAT_INTERVAL, trading_calendar.seconds_until_next_event() + 0.5)
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=timeout)
+                    yield _sse("prices", message)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                if trading_calendar.is_open() != market_open:
+                    market_open = not market_open
+                    yield _sse("status", {"is_open": market_open})
+        finally:
+            price_feed.unsubscribe(queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/categories")
 async def get_stock_categories(request: Request):
@@ -62,18 +96,14 @@ async def get_stocks_list(request: Request, category_id: str = None):
     user = await get_current_user(request)
     grade = user.get("grade", 3) or 3
     
-    query = {"is_active": True}
-    if category_id:
-        query["category_id"] = category_id
-    
-    # Try investment_stocks first, then admin_stocks
-    stocks = await db.investment_stocks.find(query, {"_id": 0}).to_list(100)
-    if not stocks:
-        stocks = await db.admin_stocks.find(query, {"_id": 0}).to_list(100)
+    # Active stocks with daily stats precomputed (see services.market_snapshot)
+    snapshot = await market_snapshot.get_snapshot(db)
     
-    # Filter by grade (only if min_grade/max_grade are set)
+    # Filter by category and grade (only if min_grade/max_grade are set)
     filtered_stocks = []
-    for stock in stocks:
+    for stock in snapshot.listed:
+        if category_id and stock.get("category_id") != category_id:
+            continue
         min_g = stock.get("min_grade")
         max_g = stock.get("max_grade")
         # Include stock if no grade restriction OR grade is in range
@@ -81,47 +111,7 @@ async def get_stocks_list(request: Request, category_id: str = None):
            (min_g is not None and max_g is not None and min_g <= grade <= max_g) or \
            (min_g is None and max_g is not None and grade <= max_g) or \
            (max_g is None and min_g is not None and grade >= min_g):
-            filtered_stocks.append(stock)
-    
-    # Get today's date in IST for daily tracking
-    ist = pytz.timezone('Asia/Kolkata')
-    today_ist = datetime.now(ist).strftime("%Y-%m-%d")
-    
-    for stock in filtered_stocks:
-        history = stock.get("price_history", [])[-10:]
-        stock["recent_history"] = history
-        
-        # Get today's opening price (first price of the day)
-        today_history = [h for h in history if h.get("date", "").startswith(today_ist)]
-        if today_history:
-            stock["opening_price"] = today_history[0].get("price", stock["current_price"])
-            stock["closing_price"] = stock["current_price"]  # Current price is the latest
-        else:
-            # If no history today, use previous close or current price
-            stock["opening_price"] = stock.get("previous_close", stock["current_price"])
-            stock["closing_price"] = stock["current_price"]
-        
-        # Daily change (from today's opening)
-        stock["daily_change"] = round(stock["current_price"] - stock["opening_price"], 2)
-        stock["daily_change_percent"] = round((stock["daily_change"] / stock["opening_price"] * 100), 2) if stock["opening_price"] > 0 else 0
-        
-        # Previous close for reference
-        if len(history) >= 2:
-            # Find the last entry from a previous day
-            prev_day_entries = [h for h in history if not h.get("date", "").startswith(today_ist)]
-            if prev_day_entries:
-                stock["previous_close"] = prev_day_entries[-1].get("close_price", prev_day_entries[-1].get("price", stock["current_price"]))
-            else:
-                stock["previous_close"] = history[-2].get("close_price", history[-2].get("price", stock["current_price"]))
-            
-            prev = history[-2].get("price", stock["current_price"])
-            curr = stock["current_price"]
-            stock["price_change"] = round(curr - prev, 2)
-            stock["price_change_percent"] = round((curr - prev) / prev * 100, 2) if prev > 0 else 0
-        else:
-            stock["previous_close"] = stock["current_price"]
-            stock["price_change"] = 0
-            stock["price_change_percent"] = 0
+            filtered_stocks.append(dict(stock))
     
     return filtered_stocks
 
@@ -140,21 +130,13 @@ async def get_portfolio(request: Request):
     total_invested = 0
     total_current = 0
     
-    # Get today's date in IST for daily tracking
-    ist = pytz.timezone('Asia/Kolkata')
-    today_ist = datetime.now(ist).strftime("%Y-%m-%d")
+    snapshot = await market_snapshot.get_snapshot(db)
     
     for holding in holdings:
-        # Try investment_stocks first, then admin_stocks
-        stock = await db.investment_stocks.find_one(
-            {"stock_id": holding["stock_id"]},
-            {"_id": 0}
-        )
-        if not stock:
-            stock = await db.admin_stocks.find_one(
-                {"stock_id": holding["stock_id"]},
-                {"_id": 0}
-            )
+        # Trades only $inc quantity / total_invested; the average is derived
+        if holding.get("quantity"):
+            holding["average_buy_price"] = round(holding.get("total_invested", 0) / holding["quantity"], 2)
+        stock = snapshot.get(holding["stock_id"])
         if stock:
             holding["stock_name"] = stock.get("name")
             holding["ticker"] = stock.get("ticker")
@@ -168,14 +150,8 @@ async def get_portfolio(request: Request):
             else:
                 holding["profit_loss_percent"] = 0
             
-            # Calculate daily change
-            history = stock.get("price_history", [])
-            today_history = [h for h in history if h.get("date", "").startswith(today_ist)]
-            if today_history:
-                opening_price = today_history[0].get("price", stock["current_price"])
-            else:
-                opening_price = stock.get("previous_close", stock["current_price"])
-            
+            # Daily change from today's opening price
+            opening_price = snapshot.stats[stock["stock_id"]]["opening_price"]
             holding["opening_price"] = opening_price
             holding["daily_change"] = round(stock["current_price"] - opening_price, 2)
             holding["daily_change_percent"] = round((holding["daily_change"] / opening_price * 100), 2) if opening_price > 0 else 0
@@ -210,18 +186,13 @@ async def get_portfolio(request: Request):
     }
 
 @router.get("/portfolio/history")
-async def get_portfolio_history(request: Request):
-    """Get portfolio value history"""
+async def get_portfolio_history(request: Request, days: int = 30):
+    """Get daily portfolio value snapshots (oldest first)"""
     from services.auth import get_current_user
     db = get_db()
     user = await get_current_user(request)
     
-    transactions = await db.stock_transactions.find(
-        {"user_id": user["user_id"]},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(100)
-    
-    return transactions
+    return await portfolio_engine.history(db, user["user_id"], min(max(days, 1), 366))
 
 @router.get("/transactions")
 async def get_stock_transactions(request: Request):
@@ -237,6 +208,22 @@ async def get_stock_transactions(request: Request):
     
     return transactions
 
+async def _queue_order(db, user, side, stock, quantity, request, body):
+    """Order-book mode: reserve and queue instead of trading immediately"""
+    try:
+        order = await order_book.place_order(
+            db, user["user_id"], side, stock, quantity, body.get("limit_price"),
+            trade_executor.idempotency_key(request, body)
+        )
+    except trade_executor.TradeError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    verb = "buy" if side == "buy" else "sell"
+    return {
+        "message": f"Order to {verb} {order['quantity']} shares of {order['stock_name']} placed - it settles at the next market update",
+        "queued": True,
+        "order": order
+    }
+
 @router.post("/buy")
 async def buy_stock(request: Request):
     """Buy stocks"""
@@ -244,94 +231,39 @@ async def buy_stock(request: Request):
     db = get_db()
     user = await get_current_user(request)
     
+    if not trading_calendar.is_open():
+        raise HTTPException(status_code=400, detail=_closed_message())
+    
     body = await request.json()
     stock_id = body.get("stock_id")
     quantity = body.get("quantity", 1)
     
-    if quantity <= 0:
-        raise HTTPException(status_code=400, detail="Quantity must be positive")
-    
-    # Try investment_stocks first, then admin_stocks
-    stock = await db.investment_stocks.find_one({"stock_id": stock_id, "is_active": True}, {"_id": 0})
-    if not stock:
-        stock = await db.admin_stocks.find_one({"stock_id": stock_id, "is_active": True}, {"_id": 0})
+    stock = await stock_repository.get_stock(db, stock_id, active_only=True)
     if not stock:
         raise HTTPException(status_code=404, detail="Stock not found")
     
-    total_cost = stock["current_price"] * quantity
-    
-    investing_acc = await db.wallet_accounts.find_one({
-        "user_id": user["user_id"],
-        "account_type": "investing"
-    })
-    
-    if not investing_acc or investing_acc.get("balance", 0) < total_cost:
-        raise HTTPException(status_code=400, detail="Insufficient balance in investing account")
-    
-    await db.wallet_accounts.update_one(
-        {"user_id": user["user_id"], "account_type": "investing"},
-        {"$inc": {"balance": -total_cost}}
-    )
+    if await order_book.is_enabled(db):
+        return await _queue_order(db, user, "buy", stock, quantity, request, body)
     
-    existing_holding = await db.stock_holdings.find_one({
-        "user_id": user["user_id"],
-        "stock_id": stock_id
-    })
-    
-    if existing_holding:
-        new_quantity = existing_holding["quantity"] + quantity
-        new_invested = existing_holding.get("total_invested", 0) + total_cost
-        new_avg = new_invested / new_quantity
-        
-        await db.stock_holdings.update_one(
-            {"holding_id": existing_holding["holding_id"]},
-            {"$set": {
-                "quantity": new_quantity,
-                "total_invested": new_invested,
-                "average_buy_price": new_avg
-            }}
+    try:
+        trade = await trade_executor.execute(
+            db, user["user_id"], "buy", stock, quantity, trade_executor.idempotency_key(request, body)
         )
-    else:
-        await db.stock_holdings.insert_one({
-            "holding_id": f"hold_{uuid.uuid4().hex[:12]}",
-            "user_id": user["user_id"],
-            "stock_id": stock_id,
-            "quantity": quantity,
-            "average_buy_price": stock["current_price"],
-            "total_invested": total_cost,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        })
-    
-    await db.stock_transactions.insert_one({
-        "transaction_id": f"stx_{uuid.uuid4().hex[:12]}",
-        "user_id": user["user_id"],
-        "stock_id": stock_id,
-        "stock_name": stock["name"],
-        "type": "buy",
-        "quantity": quantity,
-        "price": stock["current_price"],
-        "total": total_cost,
-        "created_at": datetime.now(timezone.utc).isoformat()
-    })
-    
-    # Record in transactions for wallet history
-    await db.transactions.insert_one({
-        "transaction_id": f"tx_{uuid.uuid4().hex[:12]}",
-        "user_id": user["user_id"],
-        "transaction_type": "stock_buy",
-        "amount": -total_cost,
-        "description": f"Bought {quantity} shares of {stock['name']}",
-        "created_at": datetime.now(timezone.utc).isoformat()
-    })
+    except trade_executor.TradeError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     
     # Award "Stock Star" badge for first stock investment
-    from routes.achievements import award_badge
-    badge = await award_badge(db, user["user_id"], "stock_buy")
+    badge = None
+    if not trade.get("replayed"):
+        from routes.achievements import award_badge
+        badge = await award_badge(db, user["user_id"], "stock_buy")
     
     return {
-        "message": f"Bought {quantity} shares of {stock['name']}",
-        "total_cost": total_cost,
-        "badge_earned": badge
+        "message": f"Bought {trade['quantity']} shares of {trade['stock_name']}",
+        "trade_id": trade["trade_id"],
+        "total_cost": trade["total"],
+        "badge_earned": badge,
+        "replayed": trade.get("replayed", False)
     }
 
 @router.post("/sell")
@@ -341,93 +273,80 @@ async def sell_stock(request: Request):
     db = get_db()
     user = await get_current_user(request)
     
-    if not is_market_open():
-        raise HTTPException(status_code=400, detail="Market is closed! Trading hours: 9 AM - 4 PM IST")
+    if not trading_calendar.is_open():
+        raise HTTPException(status_code=400, detail=_closed_message())
     
     body = await request.json()
     stock_id = body.get("stock_id")
     quantity = body.get("quantity", 1)
     
-    if quantity <= 0:
-        raise HTTPException(status_code=400, detail="Quantity must be positive")
-    
-    holding = await db.stock_holdings.find_one({
-        "user_id": user["user_id"],
-        "stock_id": stock_id
-    })
-    
-    if not holding or holding.get("quantity", 0) < quantity:
-        raise HTTPException(status_code=400, detail="Insufficient shares")
-    
-    # Try investment_stocks first, then admin_stocks
-    stock = await db.investment_stocks.find_one({"stock_id": stock_id}, {"_id": 0})
-    if not stock:
-        stock = await db.admin_stocks.find_one({"stock_id": stock_id}, {"_id": 0})
+    stock = await stock_repository.get_stock(db, stock_id)
     if not stock:
         raise HTTPException(status_code=404, detail="Stock not found")
     
-    total_value = stock["current_price"] * quantity
-    
-    await db.wallet_accounts.update_one(
-        {"user_id": user["user_id"], "account_type": "investing"},
-        {"$inc": {"balance": total_value}}
-    )
+    if await order_book.is_enabled(db):
+        return await _queue_order(db, user, "sell", stock, quantity, request, body)
     
-    new_quantity = holding["quantity"] - quantity
-    if new_quantity <= 0:
-        await db.stock_holdings.delete_one({"holding_id": holding["holding_id"]})
-    else:
-        sold_portion = quantity / holding["quantity"]
-        new_invested = holding.get("total_invested", 0) * (1 - sold_portion)
-        
-        await db.stock_holdings.update_one(
-            {"holding_id": holding["holding_id"]},
-            {"$set": {
-                "quantity": new_quantity,
-                "total_invested": new_invested
-            }}
+    try:
+        trade = await trade_executor.execute(
+            db, user["user_id"], "sell", stock, quantity, trade_executor.idempotency_key(request, body)
         )
-    
-    await db.stock_transactions.insert_one({
-        "transaction_id": f"stx_{uuid.uuid4().hex[:12]}",
-        "user_id": user["user_id"],
-        "stock_id": stock_id,
-        "stock_name": stock["name"],
-        "type": "sell",
-        "quantity": quantity,
-        "price": stock["current_price"],
-        "total": total_value,
-        "created_at": datetime.now(timezone.utc).isoformat()
-    })
-    
-    # Record in transactions for wallet history
-    await db.transactions.insert_one({
-        "transaction_id": f"tx_{uuid.uuid4().hex[:12]}",
-        "user_id": user["user_id"],
-        "transaction_type": "stock_sale",
-        "amount": total_value,
-        "description": f"Sold {quantity} shares of {stock['name']}",
-        "created_at": datetime.now(timezone.utc).isoformat()
-    })
-    
-    # Check if this sale resulted in profit
-    avg_buy_price = holding.get("average_buy_price", stock["current_price"])
-    cost_basis = avg_buy_price * quantity
-    profit = total_value - cost_basis
+    except trade_executor.TradeError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     
     badge = None
-    if profit > 0:
+    if trade["profit"] > 0 and not trade.get("replayed"):
         # Award "Profit Pro" badge for first stock profit
         from routes.achievements import award_badge
         badge = await award_badge(db, user["user_id"], "stock_profit")
     
     return {
-        "message": f"Sold {quantity} shares of {stock['name']}",
-        "total_received": total_value,
-        "profit": profit,
-        "badge_earned": badge
+        "message": f"Sold {trade['quantity']} shares of {trade['stock_name']}",
+        "trade_id": trade["trade_id"],
+        "total_received": trade["total"],
+        "profit": trade["profit"],
+        "badge_earned": badge,
+        "replayed": trade.get("replayed", False)
     }
 
+@router.get("/orders")
+async def get_orders(request: Request, status: str = None):
+    """My queued and settled orders (order-book mode), newest first"""
+    from services.auth import get_current_user
+    db = get_db()
+    user = await get_current_user(request)
+    
+    if status and status not in order_book.STATUSES:
+        raise HTTPException(status_code=400, detail=f"Unknown status. Use one of: {', '.join(order_book.STATUSES)}")
+    return await order_book.list_orders(db, user["user_id"], status)
+
+@router.get("/orders/{order_id}")
+async def get_order(order_id: str, request: Request):
+    """Status of one order"""
+    from services.auth import get_current_user
+    db = get_db()
+    user = await get_current_user(request)
+    
+    order = await order_book.get_order(db, user["user_id"], order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
+
+@router.delete("/orders/{order_id}")
+async def cancel_order(order_id: str, request: Request):
+    """Cancel a pending order and release the reserved money / shares"""
+    from services.auth import get_current_user
+    db = get_db()
+    user = await get_current_user(request)
+    
+    try:
+        order = await order_book.cancel_order(db, user["user_id"], order_id)
+    except trade_executor.TradeError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return {"message": "Order cancelled", "order": order}
+
 @router.get("/news")
 async def get_stock_news(request: Request):
     """Get market news"""
@@ -442,6 +361,21 @@ async def get_stock_news(request: Request):
     
     return news
 
+@router.get("/{stock_id}/chart")
+async def get_stock_chart(stock_id: str, request: Request, period: str = "30d",
+                          points: int = price_candles.CHART_POINTS):
+    """Get OHLC chart data for a period (1d, 5d, 7d, 30d, 90d, 1y, all),
+    downsampled to at most `points` entries"""
+    from services.auth import get_current_user
+    db = get_db()
+    await get_current_user(request)
+    
+    if period not in price_candles.PERIODS:
+        raise HTTPException(status_code=400, detail=f"Unknown period. Use one of: {', '.join(price_candles.PERIODS)}")
+    if not (await market_snapshot.get_snapshot(db)).get(stock_id):
+        raise HTTPException(status_code=404, detail="Stock not found")
+    return await price_candles.chart(db, stock_id, period, points)
+
 @router.get("/{stock_id}")
 async def get_stock_details(stock_id: str, request: Request):
     """Get single stock details"""
@@ -449,12 +383,10 @@ async def get_stock_details(stock_id: str, request: Request):
     db = get_db()
     await get_current_user(request)
     
-    # Try investment_stocks first, then admin_stocks
-    stock = await db.investment_stocks.find_one({"stock_id": stock_id}, {"_id": 0})
-    if not stock:
-        stock = await db.admin_stocks.find_one({"stock_id": stock_id}, {"_id": 0})
+    stock = (await market_snapshot.get_snapshot(db)).get(stock_id)
     if not stock:
         raise HTTPException(status_code=404, detail="Stock not found")
+    stock = dict(stock)
     
     # Add price history if available
     history = stock.get("price_history", [])
@@ -4,6 +4,8 @@ from pydantic import BaseModel
 from datetime import datetime, timezone
 import uuid
 
+from services import wallet_sources
+
 # Database injection
 _db = None
 
@@ -79,7 +81,8 @@ async def purchase_item(purchase: PurchaseCreate, request: Request):
         raise HTTPException(status_code=400, detail="Insufficient balance in spending account")
     
     # Deduct balance
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": user["user_id"], "account_type": "spending"},
         {"$inc": {"balance": -item["price"]}}
     )
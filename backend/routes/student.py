@@ -3,6 +3,8 @@ from fastapi import APIRouter, HTTPException, Request
 from datetime import datetime, timezone
 import uuid
 
+from services import classroom_stats
+
 _db = None
 
 def init_db(database):
@@ -68,6 +70,7 @@ async def join_classroom(request: Request):
         "status": "active",
         "enrolled_at": datetime.now(timezone.utc).isoformat()
     })
+    classroom_stats.invalidate_classroom(classroom["classroom_id"])
     
     # Update user's grade if classroom has one
     if classroom.get("grade") is not None:
@@ -4,10 +4,14 @@ from pydantic import BaseModel
 from datetime import datetime, timezone, timedelta
 from typing import Optional
 import uuid
-import os
-import razorpay
-import hmac
-import hashlib
+import json
+import logging
+from pymongo.collation import Collation
+from pymongo.errors import DuplicateKeyError
+from services.payments import get_gateway, PaymentGatewayError
+from services import entitlements
+
+logger = logging.getLogger(__name__)
 
 _db = None
 
@@ -20,15 +24,18 @@ def get_db():
         raise RuntimeError("Database not initialized")
     return _db
 
-router = APIRouter(prefix="/subscriptions", tags=["subscriptions"])
+async def ensure_indexes(db):
+    # Webhook dedupe upserts on event_id; without this two concurrent
+    # deliveries could both insert and both be processed
+    try:
+        await db.payment_webhook_events.create_index("event_id", unique=True)
+    except Exception as e:
+        logger.error(f"Unique event_id index on payment_webhook_events failed: {e}")
 
-# Razorpay client
-RAZORPAY_KEY_ID = os.environ.get("RAZORPAY_KEY_ID")
-RAZORPAY_KEY_SECRET = os.environ.get("RAZORPAY_KEY_SECRET")
+router = APIRouter(prefix="/subscriptions", tags=["subscriptions"])
 
-razorpay_client = None
-if RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET:
-    razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+# Payment gateway (async Razorpay adapter, or the fake gateway in dev/tests)
+# is resolved lazily via services.payments.get_gateway()
 
 
 # ============== MODELS ==============
@@ -213,7 +220,8 @@ async def capture_checkout_lead(request: Request):
 @router.post("/create-order")
 async def create_order(order: CreateOrderRequest):
     """Create a Razorpay order for subscription purchase"""
-    if not razorpay_client:
+    gateway = get_gateway()
+    if not gateway:
         raise HTTPException(status_code=500, detail="Payment gateway not configured")
     
     db = get_db()
@@ -236,22 +244,15 @@ async def create_order(order: CreateOrderRequest):
     receipt = subscription_id[:40]  # Receipt max 40 chars
     
     try:
-        razor_order = razorpay_client.order.create({
-            "amount": amount_paise,
-            "currency": "INR",
-            "receipt": receipt,
-            "payment_capture": 1,
-            "notes": {
-                "subscription_id": subscription_id,
-                "plan_type": order.plan_type,
-                "duration": order.duration,
-                "num_children": str(order.num_children),
-            }
+        razor_order = await gateway.create_order(amount_paise, receipt, {
+            "subscription_id": subscription_id,
+            "plan_type": order.plan_type,
+            "duration": order.duration,
+            "num_children": str(order.num_children),
         })
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Payment order creation failed: {str(e)}")
+    except PaymentGatewayError as e:
+        logger.error(f"Payment order creation failed: {e}")
+        raise HTTPException(status_code=502, detail=f"Payment order creation failed: {str(e)}")
     
     # Calculate dates
     duration_info = DURATION_MAP[order.duration]
@@ -288,60 +289,44 @@ async def create_order(order: CreateOrderRequest):
         "amount": amount_paise,
         "currency": "INR",
         "subscription_id": subscription_id,
-        "key_id": RAZORPAY_KEY_ID,
+        "key_id": gateway.key_id,
     }
 
 
-@router.post("/verify-payment")
-async def verify_payment(payment: VerifyPaymentRequest):
-    """Verify Razorpay payment and activate subscription"""
-    if not razorpay_client:
-        raise HTTPException(status_code=500, detail="Payment gateway not configured")
-    
+async def _activate_subscription(order_id: str, payment_id: str, source: str):
+    """Mark the subscription for `order_id` paid and active. Idempotent: the
+    conditional update only matches a not-yet-completed subscription, so the
+    browser callback and the webhook can race safely and side effects (lead
+    conversion, admin notification) run exactly once.
+
+    Returns (subscription, newly_activated) or (None, False) if unknown."""
     db = get_db()
-    
-    # Verify signature
-    try:
-        generated_signature = hmac.new(
-            RAZORPAY_KEY_SECRET.encode(),
-            f"{payment.razorpay_order_id}|{payment.razorpay_payment_id}".encode(),
-            hashlib.sha256
-        ).hexdigest()
-        
-        if generated_signature != payment.razorpay_signature:
-            raise HTTPException(status_code=400, detail="Payment verification failed")
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Signature verification error: {str(e)}")
-    
-    # Find and update subscription
-    subscription = await db.subscriptions.find_one(
-        {"razorpay_order_id": payment.razorpay_order_id}, {"_id": 0}
-    )
-    
+    subscription = await db.subscriptions.find_one({"razorpay_order_id": order_id}, {"_id": 0})
     if not subscription:
-        raise HTTPException(status_code=404, detail="Subscription not found")
-    
+        return None, False
     if subscription["payment_status"] == "completed":
-        return {"message": "Payment already verified", "subscription_id": subscription["subscription_id"]}
+        return subscription, False
     
-    # Activate subscription
     now = datetime.now(timezone.utc)
     duration_info = DURATION_MAP[subscription["duration"]]
     end_date = now + timedelta(days=duration_info["days"])
     
-    await db.subscriptions.update_one(
-        {"razorpay_order_id": payment.razorpay_order_id},
+    result = await db.subscriptions.update_one(
+        {"razorpay_order_id": order_id, "payment_status": {"$ne": "completed"}},
         {"$set": {
-            "razorpay_payment_id": payment.razorpay_payment_id,
+            "razorpay_payment_id": payment_id,
             "payment_status": "completed",
             "is_active": True,
             "start_date": now.isoformat(),
             "end_date": end_date.isoformat(),
             "activated_at": now.isoformat(),
+            "activated_via": source,
         }}
     )
+    if result.modified_count == 0:
+        # Lost the race to the other activation path
+        return subscription, False
+    await entitlements.refresh_for_subscription(db, subscription)
     
     # Mark lead as converted
     await db.checkout_leads.update_one(
@@ -363,6 +348,30 @@ async def verify_payment(payment: VerifyPaymentRequest):
     except Exception:
         pass
     
+    return subscription, True
+
+
+@router.post("/verify-payment")
+async def verify_payment(payment: VerifyPaymentRequest):
+    """Verify Razorpay payment and activate subscription"""
+    gateway = get_gateway()
+    if not gateway:
+        raise HTTPException(status_code=500, detail="Payment gateway not configured")
+    
+    if not gateway.verify_payment_signature(
+        payment.razorpay_order_id, payment.razorpay_payment_id, payment.razorpay_signature
+    ):
+        raise HTTPException(status_code=400, detail="Payment verification failed")
+    
+    subscription, activated = await _activate_subscription(
+        payment.razorpay_order_id, payment.razorpay_payment_id, "checkout"
+    )
+    if not subscription:
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    
+    if not activated:
+        return {"message": "Payment already verified", "subscription_id": subscription["subscription_id"]}
+    
     return {
         "message": "Payment verified successfully",
         "subscription_id": subscription["subscription_id"],
@@ -370,6 +379,70 @@ async def verify_payment(payment: VerifyPaymentRequest):
     }
 
 
+@router.post("/webhook")
+async def payment_webhook(request: Request):
+    """Razorpay webhook for `payment.captured` / `order.paid`.
+
+    Activates the subscription server-side so it doesn't depend on the
+    browser reaching /verify-payment. Deliveries are recorded by event id and
+    replays are acknowledged without reprocessing."""
+    gateway = get_gateway()
+    if not gateway:
+        raise HTTPException(status_code=500, detail="Payment gateway not configured")
+    
+    body = await request.body()
+    if not gateway.verify_webhook_signature(body, request.headers.get("X-Razorpay-Signature", "")):
+        raise HTTPException(status_code=400, detail="Invalid webhook signature")
+    
+    try:
+        event = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid webhook payload")
+    
+    event_type = event.get("event")
+    if event_type not in ("payment.captured", "order.paid"):
+        return {"status": "ignored", "event": event_type}
+    
+    payment_entity = (event.get("payload", {}).get("payment") or {}).get("entity") or {}
+    order_id = payment_entity.get("order_id")
+    payment_id = payment_entity.get("id")
+    if not order_id or not payment_id:
+        raise HTTPException(status_code=400, detail="Webhook missing order/payment id")
+    
+    db = get_db()
+    event_id = request.headers.get("X-Razorpay-Event-Id") or f"{event_type}:{payment_id}"
+    try:
+        previous = await db.payment_webhook_events.find_one_and_update(
+            {"event_id": event_id},
+            {"$setOnInsert": {
+                "event_id": event_id,
+                "event": event_type,
+                "order_id": order_id,
+                "payment_id": payment_id,
+                "status": "processing",
+                "received_at": datetime.now(timezone.utc).isoformat(),
+            }},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # A concurrent delivery of the same event inserted it first
+        return {"status": "duplicate"}
+    # Only a fully processed event is a duplicate; one left "processing" by a
+    # failed delivery is retried (activation itself is idempotent)
+    if previous is not None and previous.get("status") == "processed":
+        return {"status": "duplicate"}
+    
+    subscription, activated = await _activate_subscription(order_id, payment_id, "webhook")
+    await db.payment_webhook_events.update_one(
+        {"event_id": event_id},
+        {"$set": {"status": "processed", "processed_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    if not subscription:
+        # Not one of ours (e.g. a school invoice) — acknowledge so Razorpay stops retrying
+        return {"status": "unknown_order"}
+    return {"status": "activated" if activated else "already_active"}
+
+
 @router.get("/post-payment-context")
 async def post_payment_context(order_id: str):
     """Returns the info the frontend needs to render the post-payment
@@ -415,24 +488,16 @@ async def post_payment_context(order_id: str):
 async def check_subscription_access(email: str):
     """Check if an email has an active subscription (used during login)"""
     db = get_db()
-    email = email.strip().lower()
-    now = datetime.now(timezone.utc).isoformat()
-    
-    subscription = await db.subscriptions.find_one({
-        "parent_emails": email,
-        "payment_status": "completed",
-        "is_active": True,
-        "end_date": {"$gt": now}
-    }, {"_id": 0})
+    record = await entitlements.get_for_email(db, email)
     
-    if subscription:
+    if entitlements.is_active(record):
         return {
             "has_access": True,
-            "subscription_id": subscription["subscription_id"],
-            "plan_type": subscription["plan_type"],
-            "end_date": subscription["end_date"],
-            "num_children": subscription["num_children"],
-            "num_parents": subscription["num_parents"],
+            "subscription_id": record["subscription_id"],
+            "plan_type": record["plan_type"],
+            "end_date": record["end_date"],
+            "num_children": record["num_children"],
+            "num_parents": record["num_parents"],
         }
     
     return {"has_access": False}
@@ -503,6 +568,7 @@ async def add_second_parent(request: Request, body: AddParentRequest):
         {"subscription_id": sub["subscription_id"]},
         {"$addToSet": {"parent_emails": second_email}}
     )
+    await entitlements.refresh(db, emails=[second_email])
     
     return {"message": f"Second parent ({second_email}) added successfully"}
 
@@ -534,6 +600,7 @@ async def remove_second_parent(request: Request, email: str):
         {"subscription_id": sub["subscription_id"]},
         {"$pull": {"parent_emails": target_email}}
     )
+    await entitlements.refresh(db, emails=[target_email])
     
     return {"message": "Second parent removed"}
 
@@ -561,12 +628,20 @@ async def admin_list_subscriptions(request: Request):
             if email:
                 email_sub_count[email] = email_sub_count.get(email, 0) + 1
     
-    # Fetch all users and parent-child links for lookups
-    all_users = await db.users.find({}, {"_id": 0, "user_id": 1, "name": 1, "email": 1, "role": 1}).to_list(2000)
-    email_to_user = {u.get("email", "").lower(): u for u in all_users if u.get("email")}
-    userid_to_user = {u["user_id"]: u for u in all_users}
-    
-    all_links = await db.parent_child_links.find({"status": "active"}, {"_id": 0}).to_list(2000)
+    # Fetch only the users and parent-child links these subscriptions reference
+    sub_emails = {pe.lower() for sub in subscriptions for pe in sub.get("parent_emails", [])}
+    sub_child_ids = {cid for sub in subscriptions for cid in sub.get("child_user_ids", [])}
+    user_fields = {"_id": 0, "user_id": 1, "name": 1, "email": 1, "role": 1}
+    # Case-insensitive: older accounts may have stored mixed-case emails
+    parents = await db.users.find(
+        {"email": {"$in": list(sub_emails)}}, user_fields,
+        collation=Collation(locale="en", strength=2)
+    ).to_list(None)
+    email_to_user = {u.get("email", "").lower(): u for u in parents if u.get("email")}
+    
+    all_links = await db.parent_child_links.find(
+        {"status": "active", "parent_id": {"$in": [u["user_id"] for u in parents]}}, {"_id": 0}
+    ).to_list(None)
     parent_to_children = {}
     for link in all_links:
         pid = link.get("parent_id")
@@ -575,6 +650,12 @@ async def admin_list_subscriptions(request: Request):
             parent_to_children[pid] = []
         parent_to_children[pid].append(cid)
     
+    child_ids = sub_child_ids | {link.get("child_id") for link in all_links}
+    children_docs = await db.users.find(
+        {"user_id": {"$in": list(child_ids)}}, user_fields
+    ).to_list(len(child_ids) or 1)
+    userid_to_user = {u["user_id"]: u for u in parents + children_docs}
+    
     # Enrich each subscription
     for sub in subscriptions:
         email = sub.get("subscriber_email", "").lower()
@@ -744,6 +825,7 @@ async def admin_toggle_subscription(request: Request, subscription_id: str):
         {"subscription_id": subscription_id},
         {"$set": {"is_active": new_status}}
     )
+    await entitlements.refresh_for_subscription(db, sub)
     
     return {"message": f"Subscription {'activated' if new_status else 'deactivated'}", "is_active": new_status}
 
@@ -758,9 +840,13 @@ async def admin_delete_subscription(request: Request, subscription_id: str):
     if user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
 
+    sub = await db.subscriptions.find_one(
+        {"subscription_id": subscription_id}, {"_id": 0, "parent_emails": 1, "child_user_ids": 1}
+    )
     res = await db.subscriptions.delete_one({"subscription_id": subscription_id})
     if res.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Subscription not found")
+    await entitlements.refresh_for_subscription(db, sub)
     return {"message": "Subscription deleted"}
 
 
@@ -787,5 +873,13 @@ async def admin_delete_inactive_subscriptions(request: Request):
             {"end_date": {"$lt": now_iso}},
         ]
     }
+    holders = await db.subscriptions.find(
+        query, {"_id": 0, "parent_emails": 1, "child_user_ids": 1}
+    ).to_list(None)
     res = await db.subscriptions.delete_many(query)
+    await entitlements.refresh(
+        db,
+        emails={e for h in holders for e in h.get("parent_emails") or []},
+        user_ids={u for h in holders for u in h.get("child_user_ids") or []},
+    )
     return {"message": f"Deleted {res.deleted_count} inactive subscription(s)", "deleted": res.deleted_count}
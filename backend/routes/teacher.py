@@ -7,7 +7,7 @@ import uuid
 import random
 import string
 
-from services.content_query import child_visible_content_query
+from services import learning_progress, portfolio_engine, wallet_sources
 
 _db = None
 
@@ -533,7 +533,8 @@ async def reward_students(classroom_id: str, reward: ClassroomReward, request: R
     
     rewarded = []
     for student_id in reward.student_ids:
-        await db.wallet_accounts.update_one(
+        await wallet_sources.update_wallet(
+            db,
             {"user_id": student_id, "account_type": "spending"},
             {"$inc": {"balance": reward.amount}}
         )
@@ -577,7 +578,8 @@ async def create_teacher_reward_penalty(data: TeacherRewardPenalty, request: Req
     amount = data.amount if data.category == "reward" else -data.amount
     
     # Update student's wallet
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": data.student_id, "account_type": "spending"},
         {"$inc": {"balance": amount}}
     )
@@ -772,57 +774,9 @@ async def get_student_insights(classroom_id: str, student_id: str, request: Requ
     total_spent = sum(t.get("amount", 0) for t in transactions 
                      if t.get("transaction_type") in ["purchase", "gift_sent"])
     
-    # Get learning progress
-    lessons_completed = await db.user_content_progress.count_documents({
-        "user_id": student_id,
-        "completed": True
-})
+    # Get learning progress (shared with the parent insights)
     grade = student.get("grade", 3) or 0
-    total_lessons = await db.content_items.count_documents(
-        child_visible_content_query(grade)
-    )
-
-    # Topic / subtopic completion
-    grade_topics = await db.content_topics.find(
-        {"is_active": {"$ne": False}, "min_grade": {"$lte": grade}, "max_grade": {"$gte": grade}},
-        {"_id": 0, "topic_id": 1}
-    ).to_list(200)
-    total_topics = len(grade_topics)
-    topics_completed = 0
-    subtopics_completed = 0
-    total_subtopics = 0
-    for t in grade_topics:
-        subtopics = await db.content_topics.find(
-            {"parent_id": t["topic_id"]},
-            {"_id": 0, "topic_id": 1}
-        ).to_list(200)
-        sub_ids = [s["topic_id"] for s in subtopics]
-        total_subtopics += len(sub_ids)
-        if not sub_ids:
-            continue
-        topic_all_done = True
-        any_subtopic_with_content = False
-        for sid in sub_ids:
-            items = await db.content_items.find(
-                {"topic_id": sid, "is_published": True},
-                {"_id": 0, "content_id": 1}
-            ).to_list(200)
-            if not items:
-                topic_all_done = False
-                continue
-            any_subtopic_with_content = True
-            item_ids = [i["content_id"] for i in items]
-            done = await db.user_content_progress.count_documents({
-                "user_id": student_id,
-                "content_id": {"$in": item_ids},
-                "completed": True
-            })
-            if done >= len(item_ids):
-                subtopics_completed += 1
-            else:
-                topic_all_done = False
-        if topic_all_done and any_subtopic_with_content:
-            topics_completed += 1
+    learning = await learning_progress.learning_summary(db, student_id, grade)
 
     current_streak = student.get("streak_count", 0) or student.get("current_streak", 0) or 0
     longest_streak = student.get("longest_streak", current_streak) or 0
@@ -885,22 +839,10 @@ async def get_student_insights(classroom_id: str, student_id: str, request: Requ
     garden_invested = sum(p.get("purchase_price", 0) for p in garden_plots)
     garden_earned = sum(p.get("total_harvested", 0) for p in garden_plots)
     
-    # Get stock holdings (for grades 3-5)
-    stock_holdings = await db.user_stock_holdings.find(
-        {"user_id": student_id},
-        {"_id": 0}
-    ).to_list(50)
-    
-    # Calculate portfolio value and gains
-    portfolio_value = 0
-    total_cost_basis = 0
-    for holding in stock_holdings:
-        # Get current stock price
-        stock = await db.stocks.find_one({"stock_id": holding.get("stock_id")})
-        current_price = stock.get("current_price", 0) if stock else 0
-        shares = holding.get("shares", 0)
-        portfolio_value += shares * current_price
-        total_cost_basis += holding.get("total_cost", 0)
+    # Stock portfolio value and gains (for grades 3-5)
+    portfolio = (await portfolio_engine.valuate(db, [student_id])).get(student_id, portfolio_engine.EMPTY)
+    portfolio_value = portfolio["total_value"]
+    total_cost_basis = portfolio["total_invested"]
     
     # Get realized gains from stock sale transactions
     stock_sales = [t for t in transactions if t.get("transaction_type") == "stock_sale"]
@@ -917,12 +859,7 @@ async def get_student_insights(classroom_id: str, student_id: str, request: Requ
             "savings_goals_count": len(active_goals)
         },
         "learning": {
-            "lessons_completed": lessons_completed,
-            "total_lessons": total_lessons,
-            "topics_completed": topics_completed,
-            "total_topics": total_topics,
-            "subtopics_completed": subtopics_completed,
-            "total_subtopics": total_subtopics,
+            **learning,
             "current_streak": current_streak,
             "longest_streak": longest_streak,
         },
@@ -959,7 +896,7 @@ async def get_student_insights(classroom_id: str, student_id: str, request: Requ
             "profit_loss": garden_earned - garden_invested
         },
         "stocks": {
-            "holdings_count": len(stock_holdings),
+            "holdings_count": portfolio["holdings_count"],
             "portfolio_value": portfolio_value,
             "realized_gains": realized_gains,
             "unrealized_gains": unrealized_gains
@@ -985,6 +922,7 @@ async def get_classroom_comparison(classroom_id: str, request: Request):
         {"_id": 0}
     ).to_list(100)
     
+    portfolios = await portfolio_engine.valuate(db, [link["student_id"] for link in student_links])
     comparison_data = []
     for link in student_links:
         student = await db.users.find_one(
@@ -1054,20 +992,8 @@ async def get_classroom_comparison(classroom_id: str, request: Request):
         garden_pl = garden_earned - garden_invested
         
         # Get stock data
-        stock_holdings = await db.user_stock_holdings.find(
-            {"user_id": student_id},
-            {"_id": 0}
-        ).to_list(50)
-        
-        portfolio_value = 0
-        total_cost_basis = 0
-        for holding in stock_holdings:
-            stock = await db.stocks.find_one({"stock_id": holding.get("stock_id")})
-            current_price = stock.get("current_price", 0) if stock else 0
-            shares = holding.get("shares", 0)
-            portfolio_value += shares * current_price
-            total_cost_basis += holding.get("total_cost", 0)
-        stock_pl = portfolio_value - total_cost_basis
+        portfolio = portfolios.get(student_id, portfolio_engine.EMPTY)
+        stock_pl = portfolio["total_value"] - portfolio["total_invested"]
         
         # Get gift stats
         gifts_received = sum(1 for t in transactions if t.get("transaction_type") == "gift_received")
@@ -1591,7 +1517,8 @@ async def complete_challenge_for_student(challenge_id: str, student_id: str, req
     
     # Award coins
     reward = challenge.get("reward_coins", 10)
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": student_id, "account_type": "spending"},
         {"$inc": {"balance": reward}}
     )
@@ -5,6 +5,9 @@ import uuid
 import os
 import shutil
 import zipfile
+import asyncio
+from services.static_uploads import precompress_tree, invalidate as invalidate_static_cache
+from services import media_pipeline, image_derivatives
 
 # Upload directories
 ROOT_DIR = Path(__file__).parent.parent
@@ -24,6 +27,12 @@ for dir_path in [THUMBNAILS_DIR, PDFS_DIR, ACTIVITIES_DIR, VIDEOS_DIR, STORE_IMA
 
 router = APIRouter(prefix="/upload", tags=["uploads"])
 
+
+async def _derive_image(file_path):
+    """Write the fixed-width WebP derivatives served via `?size=` (see
+    services/image_derivatives.py). Runs off the event loop."""
+    await asyncio.to_thread(image_derivatives.generate_derivatives, file_path)
+
 @router.post("/image")
 async def upload_general_image(file: UploadFile = File(...)):
     """Upload a general image (for glossary, etc.) - Max recommended size: 500KB, 400x400px. Supports WebP for lighter files."""
@@ -48,6 +57,8 @@ async def upload_general_image(file: UploadFile = File(...)):
     with open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
     
+    await _derive_image(file_path)
+    
     return {"url": f"/api/uploads/glossary/{filename}"}
 
 @router.post("/glossary-video")
@@ -90,6 +101,8 @@ async def upload_badge_image(file: UploadFile = File(...)):
     with open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
     
+    await _derive_image(file_path)
+    
     return {"url": f"/api/uploads/badges/{filename}"}
 
 @router.post("/thumbnail")
@@ -105,6 +118,8 @@ async def upload_thumbnail(file: UploadFile = File(...)):
     with open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
     
+    await _derive_image(file_path)
+    
     return {"url": f"/api/uploads/thumbnails/{filename}"}
 
 @router.post("/pdf")
@@ -179,6 +194,9 @@ async def upload_activity_html(file: UploadFile = File(...)):
         shutil.rmtree(activity_folder)
         raise HTTPException(status_code=400, detail="Invalid ZIP file")
     
+    # Write .gz/.br siblings so the HTML/JS/CSS are served precompressed
+    await asyncio.to_thread(precompress_tree, activity_folder)
+    
     return {"url": f"/api/uploads/activities/{folder_name}/{html_file}", "folder": folder_name}
 
 @router.post("/html")
@@ -197,6 +215,8 @@ async def upload_html_file(file: UploadFile = File(...)):
     with open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
     
+    await asyncio.to_thread(precompress_tree, html_folder)
+    
     return {"url": f"/api/uploads/activities/{folder_name}/index.html", "folder": folder_name}
 
 @router.post("/video")
@@ -216,7 +236,11 @@ async def upload_video_file(file: UploadFile = File(...)):
     with open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
     
-    return {"url": f"/api/uploads/videos/{filename}"}
+    url = f"/api/uploads/videos/{filename}"
+    # Lower-bitrate renditions, HLS and a poster are produced in the background
+    transcode_status = await media_pipeline.enqueue_video(file_path, url)
+    
+    return {"url": url, "transcode_status": transcode_status}
 
 @router.post("/walkthrough-video")
 async def upload_walkthrough_video(file: UploadFile = File(...), user_type: str = "child"):
@@ -244,7 +268,14 @@ async def upload_walkthrough_video(file: UploadFile = File(...), user_type: str
     with open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
     
-    return {"url": f"/api/uploads/videos/{filename}"}
+    # Fixed filename is overwritten in place — drop any cached stat for it
+    invalidate_static_cache(VIDEOS_DIR / f"walkthrough_{user_type}")
+    invalidate_static_cache(media_pipeline.RENDITIONS_DIR / f"walkthrough_{user_type}")
+    
+    url = f"/api/uploads/videos/{filename}"
+    transcode_status = await media_pipeline.enqueue_video(file_path, url)
+    
+    return {"url": url, "transcode_status": transcode_status}
 
 @router.post("/goal-image")
 async def upload_goal_image(file: UploadFile = File(...)):
@@ -261,6 +292,8 @@ async def upload_goal_image(file: UploadFile = File(...)):
     with open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
     
+    await _derive_image(file_path)
+    
     return {"url": f"/api/uploads/thumbnails/{filename}"}
 
 @router.post("/store-image")
@@ -277,6 +310,8 @@ async def upload_store_image(file: UploadFile = File(...)):
     with open(file_path, "wb") as f:
         f.write(content)
     
+    await _derive_image(file_path)
+    
     return {"url": f"/api/uploads/store/{filename}"}
 
 @router.post("/investment-image")
@@ -293,6 +328,8 @@ async def upload_investment_image(file: UploadFile = File(...)):
     with open(file_path, "wb") as f:
         f.write(content)
     
+    await _derive_image(file_path)
+    
     return {"url": f"/api/uploads/investments/{filename}"}
 
 
@@ -401,6 +438,8 @@ async def chunked_upload_complete(
         # Cleanup
         shutil.rmtree(upload_dir, ignore_errors=True)
         
+        await asyncio.to_thread(precompress_tree, extract_dir)
+        
         if html_file:
             return {"url": f"/api/uploads/activities/{folder_name}/{html_file}", "folder": folder_name}
         return {"url": f"/api/uploads/activities/{folder_name}/index.html", "folder": folder_name}
@@ -435,5 +474,22 @@ async def chunked_upload_complete(
         "activity": "activities",
     }
     url_prefix = url_prefix_map.get(dest_type, "videos")
+    url = f"/api/uploads/{url_prefix}/{final_filename}"
     
-    return {"url": f"/api/uploads/{url_prefix}/{final_filename}"}
+    if image_derivatives.is_derivable(final_path):
+        await _derive_image(final_path)
+    
+    if url_prefix == "videos":
+        transcode_status = await media_pipeline.enqueue_video(final_path, url)
+        return {"url": url, "transcode_status": transcode_status}
+    
+    return {"url": url}
+
+
+@router.get("/video-renditions")
+async def get_video_renditions(url: str):
+    """Transcoding status and renditions for an uploaded video URL"""
+    job = await media_pipeline.get_job(url)
+    if not job:
+        raise HTTPException(status_code=404, detail="No transcoding job for this video")
+    return job
@@ -4,6 +4,8 @@ from pydantic import BaseModel
 from datetime import datetime, timezone
 import uuid
 
+from services import portfolio_engine, wallet_sources
+
 # Database injection
 _db = None
 
@@ -70,20 +72,8 @@ async def get_wallet(request: Request):
     savings_allocated = sum(g.get("current_amount", 0) for g in savings_goals)
     
     # Calculate allocated amounts for investing (money in stocks/plants)
-    # Stock holdings value
-    stock_holdings = await db.user_stock_holdings.find(
-        {"user_id": user_id},
-        {"_id": 0, "stock_id": 1, "shares": 1}
-    ).to_list(100)
-    
-    stocks_allocated = 0
-    for holding in stock_holdings:
-        stock = await db.investment_stocks.find_one(
-            {"stock_id": holding.get("stock_id")},
-            {"_id": 0, "current_price": 1}
-        )
-        if stock:
-            stocks_allocated += holding.get("shares", 0) * stock.get("current_price", 0)
+    portfolio = (await portfolio_engine.valuate(db, [user_id])).get(user_id, portfolio_engine.EMPTY)
+    stocks_allocated = portfolio["total_value"]
     
     # Garden plots value (for grades 1-2)
     garden_plots = await db.user_garden_plots.find(
@@ -206,13 +196,15 @@ async def transfer_money(transaction: TransactionCreate, request: Request):
             raise HTTPException(status_code=400, detail="Insufficient balance")
         
         # Deduct from source
-        await db.wallet_accounts.update_one(
+        await wallet_sources.update_wallet(
+            db,
             {"user_id": user["user_id"], "account_type": transaction.from_account},
             {"$inc": {"balance": -transaction.amount}}
         )
         
         # Add to destination
-        await db.wallet_accounts.update_one(
+        await wallet_sources.update_wallet(
+            db,
             {"user_id": user["user_id"], "account_type": transaction.to_account},
             {"$inc": {"balance": transaction.amount}}
         )
@@ -552,7 +544,8 @@ async def add_my_wallet_entry(body: MyWalletEntryCreate, request: Request):
     now = datetime.now(timezone.utc).isoformat()
 
     if body.entry_type == "income":
-        await db.wallet_accounts.update_one(
+        await wallet_sources.update_wallet(
+            db,
             {"user_id": user_id, "account_type": "my_wallet"},
             {"$inc": {"balance": amount},
              "$setOnInsert": {"account_id": f"acc_{uuid.uuid4().hex[:12]}", "user_id": user_id, "account_type": "my_wallet"}},
@@ -570,7 +563,8 @@ async def add_my_wallet_entry(body: MyWalletEntryCreate, request: Request):
         return {"message": "Entry added", "transaction_id": tx["transaction_id"], "balance": balance + amount}
 
     # Outflow: spend / save / give. Always leaves my_wallet.
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": user_id, "account_type": "my_wallet"}, {"$inc": {"balance": -amount}}
     )
 
@@ -595,7 +589,8 @@ async def add_my_wallet_entry(body: MyWalletEntryCreate, request: Request):
     else:
         dest = {"save": "savings", "give": "gifting"}.get(body.entry_type)
         if dest:
-            await db.wallet_accounts.update_one(
+            await wallet_sources.update_wallet(
+                db,
                 {"user_id": user_id, "account_type": dest},
                 {"$inc": {"balance": amount},
                  "$setOnInsert": {"account_id": f"acc_{uuid.uuid4().hex[:12]}", "user_id": user_id, "account_type": dest}},
@@ -626,7 +621,8 @@ async def _reverse_entry_effect(db, user_id: str, tx: dict, amount: float):
         acc = await db.wallet_accounts.find_one({"user_id": user_id, "account_type": "my_wallet"})
         if float((acc or {}).get("balance", 0) or 0) < amount:
             raise HTTPException(status_code=400, detail="You've already used this money, so it can't be undone")
-        await db.wallet_accounts.update_one(
+        await wallet_sources.update_wallet(
+            db,
             {"user_id": user_id, "account_type": "my_wallet"}, {"$inc": {"balance": -amount}})
         return
     # Outflows: return the money to my_wallet and take it back from where it went.
@@ -644,9 +640,11 @@ async def _reverse_entry_effect(db, user_id: str, tx: dict, amount: float):
             dacc = await db.wallet_accounts.find_one({"user_id": user_id, "account_type": dest})
             if float((dacc or {}).get("balance", 0) or 0) < amount:
                 raise HTTPException(status_code=400, detail="That money has already been used, so it can't be undone")
-            await db.wallet_accounts.update_one(
+            await wallet_sources.update_wallet(
+                db,
                 {"user_id": user_id, "account_type": dest}, {"$inc": {"balance": -amount}})
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": user_id, "account_type": "my_wallet"}, {"$inc": {"balance": amount}})
 
 
@@ -710,7 +708,8 @@ async def update_my_wallet_entry(transaction_id: str, body: MyWalletEntryUpdate,
             acc = await db.wallet_accounts.find_one({"user_id": user_id, "account_type": "my_wallet"})
             bal = float((acc or {}).get("balance", 0) or 0)
             if reapply.entry_type == "income":
-                await db.wallet_accounts.update_one(
+                await wallet_sources.update_wallet(
+                    db,
                     {"user_id": user_id, "account_type": "my_wallet"}, {"$inc": {"balance": new_amount}})
             else:
                 if new_amount > bal:
@@ -733,10 +732,12 @@ async def update_my_wallet_entry(transaction_id: str, body: MyWalletEntryUpdate,
 async def _apply_entry_effect_raw(db, user_id: str, tt: str, amount: float, goal_id: str | None):
     """Apply a manual entry's money movement (used when re-applying an edit)."""
     if tt == "manual_income":
-        await db.wallet_accounts.update_one(
+        await wallet_sources.update_wallet(
+            db,
             {"user_id": user_id, "account_type": "my_wallet"}, {"$inc": {"balance": amount}})
         return
-    await db.wallet_accounts.update_one(
+    await wallet_sources.update_wallet(
+        db,
         {"user_id": user_id, "account_type": "my_wallet"}, {"$inc": {"balance": -amount}})
     if tt == "wallet_save" and goal_id:
         goal = await db.savings_goals.find_one({"goal_id": goal_id, "child_id": user_id})
@@ -748,7 +749,8 @@ async def _apply_entry_effect_raw(db, user_id: str, tt: str, amount: float, goal
     else:
         dest = {"wallet_save": "savings", "wallet_give": "gifting"}.get(tt)
         if dest:
-            await db.wallet_accounts.update_one(
+            await wallet_sources.update_wallet(
+                db,
                 {"user_id": user_id, "account_type": dest},
                 {"$inc": {"balance": amount},
                  "$setOnInsert": {"account_id": f"acc_{uuid.uuid4().hex[:12]}", "user_id": user_id, "account_type": dest}},
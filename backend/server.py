@@ -1,6 +1,5 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Depends, UploadFile, File, Form
 from fastapi.responses import JSONResponse, FileResponse
-from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -49,15 +48,33 @@ app = FastAPI()
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-# Mount static files for uploads under /api/uploads so it's accessible through the proxy
-app.mount("/api/uploads", StaticFiles(directory=str(UPLOADS_DIR)), name="uploads")
-
 # ============== MODULAR ROUTES INITIALIZATION ==============
 # Initialize modular route modules with database
 import sys
 sys.path.insert(0, str(ROOT_DIR))
 
 from services import auth as auth_service
+from services.static_uploads import UploadsStaticFiles, precompress_tree
+from services import media_pipeline
+from services import entitlements
+from services import word_of_day
+from services import glossary_index
+from services import platform_stats
+from services import classroom_stats
+from services import activity_rollup
+from services import garden_state
+from services import market_snapshot
+from services import stock_repository
+from services import price_candles
+from services import price_feed
+from services import portfolio_engine
+from services import news_impact
+from services import trade_executor
+from services import order_book
+from services import trading_calendar
+from services import price_model
+from services import wallet_sources
+from services.payments import close_gateway as close_payment_gateway
 from routes import auth as auth_routes
 from routes import school as school_routes
 from routes import wallet as wallet_routes
@@ -83,8 +100,13 @@ from routes import activity as activity_routes
 from routes import jobs as jobs_routes
 from routes import subscriptions as subscription_routes
 
+# Mount static files for uploads under /api/uploads so it's accessible through the proxy.
+# UploadsStaticFiles adds immutable caching, precompressed siblings and range support.
+app.mount("/api/uploads", UploadsStaticFiles(directory=str(UPLOADS_DIR)), name="uploads")
+
 # Initialize database in modules
 auth_service.init_db(db)
+media_pipeline.init_db(db)
 auth_routes.init_db(db)
 school_routes.init_db(db)
 wallet_routes.init_db(db)
@@ -2235,6 +2257,7 @@ async def _legacy_claim_achievement(achievement_id: str, request: Request):
         "earned_at": datetime.now(timezone.utc).isoformat()
     }
     await db.user_achievements.insert_one(ua_doc)
+    classroom_stats.invalidate_student(user["user_id"])
     
     # Award points to spending account
     await db.wallet_accounts.update_one(
@@ -6674,6 +6697,7 @@ async def _legacy_complete_content_item(content_id: str, request: Request):
         },
         upsert=True
     )
+    classroom_stats.invalidate_student(user["user_id"])
     
     # Award coins
     reward = item.get("reward_coins", 5)
@@ -8614,20 +8638,10 @@ async def get_store_items_by_category(request: Request):
 
 # ============== STOCK MARKET SYSTEM (Grade 3-5) ==============
 
-STOCK_MARKET_OPEN_HOUR = 7   # 7 AM IST
-STOCK_MARKET_CLOSE_HOUR = 17  # 5 PM IST
-IST_OFFSET_HOURS = 5.5  # IST is UTC+5:30
-
-def get_ist_hour():
-    """Get current hour in IST (Indian Standard Time)"""
-    utc_now = datetime.now(timezone.utc)
-    ist_hour = (utc_now.hour + IST_OFFSET_HOURS) % 24
-    return ist_hour
-
-def is_market_open():
-    """Check if stock market is open (7 AM - 5 PM IST)"""
-    current_ist_hour = get_ist_hour()
-    return STOCK_MARKET_OPEN_HOUR <= current_ist_hour < STOCK_MARKET_CLOSE_HOUR
+# Market hours and holidays live in services/trading_calendar
+STOCK_MARKET_OPEN_HOUR = trading_calendar.OPEN_TIME.hour
+STOCK_MARKET_CLOSE_HOUR = trading_calendar.CLOSE_TIME.hour
+is_market_open = trading_calendar.is_open
 
 # --- Admin Stock Category Endpoints ---
 
@@ -8819,14 +8833,12 @@ async def _legacy_get_market_status(request: Request):
     """Get current market status and hours (IST)"""
     user = await get_current_user(request)
     
-    current_ist_hour = get_ist_hour()
     is_open = is_market_open()
     
     return {
         "is_open": is_open,
         "open_hour": STOCK_MARKET_OPEN_HOUR,
         "close_hour": STOCK_MARKET_CLOSE_HOUR,
-        "current_hour_ist": current_ist_hour,
         "timezone": "IST",
         "message": "Market is open for trading" if is_open else f"Market opens at {STOCK_MARKET_OPEN_HOUR}:00 AM IST"
     }
@@ -9271,10 +9283,12 @@ async def add_security_headers(request: Request, call_next):
     if "/api/uploads/" in str(request.url.path):
         # Prevent content from being downloaded directly
         response.headers["Content-Disposition"] = "inline"
-        # Prevent caching of sensitive content
-        response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, private"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
+        # Caching is decided by UploadsStaticFiles (private + immutable for
+        # hashed names); only fall back to no-store when it didn't set one
+        if "cache-control" not in response.headers:
+            response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, private"
+            response.headers["Pragma"] = "no-cache"
+            response.headers["Expires"] = "0"
         # Content Security Policy for HTML content
         if request.url.path.endswith('.html'):
             response.headers["Content-Security-Policy"] = "default-src 'self'; script-src 'self' 'unsafe-inline'; style-src 'self' 'unsafe-inline';"
@@ -9301,6 +9315,10 @@ async def stock_price_fluctuation(session_name: str):
     - 12:00 PM IST (midday)
     - 4:30 PM IST (near closing)
     """
+    if session_name in trading_calendar.SESSIONS and not trading_calendar.is_trading_day():
+        logger.info(f"Stock fluctuation ({session_name}) skipped: {trading_calendar.today().holiday}")
+        return
+    
     logger.info(f"Running stock price fluctuation ({session_name})...")
     
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
@@ -9314,85 +9332,26 @@ async def stock_price_fluctuation(session_name: str):
     
     try:
         # Update all active stocks
-        stocks = await db.investment_stocks.find(
-            {"$or": [{"is_active": True}, {"is_active": {"$exists": False}}]}
-        ).to_list(200)
-        updated_stocks = 0
-        
-        for stock in stocks:
-            # Random price change based on volatility
-            volatility = stock.get("volatility", 0.05)
-            # Divide volatility by 3 since we fluctuate 3 times a day
-            session_volatility = volatility / 3
-            change_percent = random.uniform(-session_volatility, session_volatility)
-            current_price = stock.get("current_price", stock.get("base_price", 10))
-            new_price = max(1.0, current_price * (1 + change_percent))  # Minimum price ₹1
-            new_price = round(new_price, 2)
-            
-            # Create price history entry for embedded array
-            price_entry = {
-                "date": today,
-                "price": new_price,
-                "close_price": new_price,
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            }
-            
-            # Update stock price and add to embedded price_history array
-            await db.investment_stocks.update_one(
-                {"stock_id": stock["stock_id"]},
-                {
-                    "$set": {
-                        "current_price": new_price,
-                        "last_price_update": datetime.now(timezone.utc).isoformat()
-                    },
-                    "$push": {
-                        "price_history": {
-                            "$each": [price_entry],
-                            "$slice": -30  # Keep last 30 entries
-                        }
-                    }
-                }
-            )
-            
-            # Also update admin_stocks if it exists there
-            await db.admin_stocks.update_one(
-                {"stock_id": stock["stock_id"]},
-                {
-                    "$set": {
-                        "current_price": new_price,
-                        "last_price_update": datetime.now(timezone.utc).isoformat()
-                    },
-                    "$push": {
-                        "price_history": {
-                            "$each": [price_entry],
-                            "$slice": -30
-                        }
-                    }
-                }
-            )
-            
-            # Record in detailed price history collection (for analytics)
-            await db.stock_price_history.update_one(
-                {"stock_id": stock["stock_id"], "date": today},
-                {
-                    "$set": {
-                        "close_price": new_price,
-                        "last_update": datetime.now(timezone.utc).isoformat()
-                    },
-                    "$max": {"high_price": new_price},
-                    "$min": {"low_price": new_price},
-                    "$setOnInsert": {
-                        "history_id": f"hist_{uuid.uuid4().hex[:12]}",
-                        "stock_id": stock["stock_id"],
-                        "open_price": current_price,
-                        "date": today,
-                        "created_at": datetime.now(timezone.utc).isoformat()
-                    }
-                },
-                upsert=True
-            )
-            
-            updated_stocks += 1
+        stocks = await stock_repository.list_stocks(
+            db, {"$or": [{"is_active": True}, {"is_active": {"$exists": False}}]}
+        )
+        
+        # One session's move for every stock: uniform(±volatility/3),
+        # minimum price ₹1
+        new_prices = price_model.next_prices(stocks, "session")
+        old_prices = price_model.current_prices(stocks, "session")
+        
+        # Stock price + embedded price_history, and the daily
+        # stock_price_history row (for analytics)
+        ticks = [
+            stock_repository.price_tick(stock["stock_id"], new_price, today, float(current_price))
+            for stock, new_price, current_price in zip(stocks, new_prices, old_prices)
+        ]
+        
+        updated_stocks = await stock_repository.apply_ticks(db, ticks)
+        
+        # News items an admin scheduled for this session
+        news_applied = await news_impact.apply_scheduled(db, session_name)
         
         # Log successful run
         await db.scheduler_logs.insert_one({
@@ -9402,12 +9361,17 @@ async def stock_price_fluctuation(session_name: str):
             "status": "success",
             "details": {
                 "session": session_name,
-                "stocks_updated": updated_stocks
+                "stocks_updated": updated_stocks,
+                "news_applied": news_applied
             },
             "created_at": datetime.now(timezone.utc).isoformat()
         })
         
         logger.info(f"Stock fluctuation ({session_name}) completed: {updated_stocks} stocks updated")
+        await market_snapshot.publish_change(db, f"fluctuation:{session_name}")
+        # Queued orders (order-book mode) fill at the new session price
+        await order_book.settle(db, f"session:{session_name}")
+        await portfolio_engine.snapshot_all(db, session_name)
         
     except Exception as e:
         logger.error(f"Stock fluctuation ({session_name}) failed: {str(e)}")
@@ -9552,7 +9516,8 @@ async def process_recurring_allowances():
                 child_name = child.get("name", "Child") if child else "Child"
                 
                 # Credit child's spending wallet
-                await db.wallet_accounts.update_one(
+                await wallet_sources.update_wallet(
+                    db,
                     {"user_id": child_id, "account_type": "spending"},
                     {"$inc": {"balance": amount}}
                 )
@@ -9616,6 +9581,18 @@ async def process_recurring_allowances():
             "created_at": today.isoformat()
         })
 
+async def record_platform_stats_snapshot():
+    """Daily admin-dashboard stats snapshot for growth charts"""
+    await platform_stats.record_daily_snapshot(db)
+
+async def sweep_garden_plots():
+    """Persist garden plots that have become ready or dead"""
+    await garden_state.sweep_plots(db)
+
+async def extend_word_of_day_calendars():
+    """Keep each grade's Word of the Day calendar filled a week ahead"""
+    await word_of_day.extend_calendars(db)
+
 @app.on_event("startup")
 async def startup_scheduler():
     """Start the scheduler when the app starts"""
@@ -9627,29 +9604,23 @@ async def startup_scheduler():
     if result.modified_count > 0:
         logger.info(f"Migrated {result.modified_count} 'giving' accounts to 'gifting'")
     
-    # Stock Price Fluctuations - 3 times daily in IST
-    # IST = UTC + 5:30
-    # 7:15 AM IST = 1:45 AM UTC
-    scheduler.add_job(
-        lambda: asyncio.create_task(stock_price_fluctuation("opening")),
-        CronTrigger(hour=1, minute=45),
-        id="stock_fluctuation_opening",
-        replace_existing=True
-    )
-    
-    # 12:00 PM IST = 6:30 AM UTC
-    scheduler.add_job(
-        lambda: asyncio.create_task(stock_price_fluctuation("midday")),
-        CronTrigger(hour=6, minute=30),
-        id="stock_fluctuation_midday",
-        replace_existing=True
-    )
+    # Stock Price Fluctuations - 3 times daily at the trading calendar's
+    # IST session times (opening 7:15 AM, midday 12:00 PM, closing 4:30 PM);
+    # holidays are skipped inside the job
+    await trading_calendar.load(db)
+    for session_name, trigger in trading_calendar.session_triggers().items():
+        scheduler.add_job(
+            lambda session_name=session_name: asyncio.create_task(stock_price_fluctuation(session_name)),
+            trigger,
+            id=f"stock_fluctuation_{session_name}",
+            replace_existing=True
+        )
     
-    # 4:30 PM IST = 11:00 AM UTC
+    # Pick up holiday edits made on other workers
     scheduler.add_job(
-        lambda: asyncio.create_task(stock_price_fluctuation("closing")),
-        CronTrigger(hour=11, minute=0),
-        id="stock_fluctuation_closing",
+        lambda: asyncio.create_task(trading_calendar.load(db)),
+        CronTrigger(minute=0),
+        id="trading_calendar_reload",
         replace_existing=True
     )
     
@@ -9693,15 +9664,88 @@ async def startup_scheduler():
         replace_existing=True
     )
     
+    # Extend the per-grade Word of the Day calendars just after UTC midnight
+    scheduler.add_job(
+        extend_word_of_day_calendars,
+        CronTrigger(hour=0, minute=5),
+        id="word_of_day_calendar",
+        replace_existing=True
+    )
+    
+    # Money Garden: persist ready/dead plot transitions every 10 minutes
+    # (the farm view computes state on read without writing)
+    scheduler.add_job(
+        sweep_garden_plots,
+        CronTrigger(minute="*/10"),
+        id="garden_plot_sweep",
+        replace_existing=True
+    )
+    
+    # Order-book mode: settle queued stock orders at the admin-set cadence
+    # (the job is a no-op unless cadence_minutes is set)
+    scheduler.add_job(
+        lambda: asyncio.create_task(order_book.settle_due(db)),
+        CronTrigger(minute="*"),
+        id="stock_order_settlement",
+        replace_existing=True
+    )
+    
+    # Platform stats snapshot for the admin growth charts (23:50 UTC)
+    scheduler.add_job(
+        record_platform_stats_snapshot,
+        CronTrigger(hour=23, minute=50),
+        id="platform_stats_snapshot",
+        replace_existing=True
+    )
+    
     scheduler.start()
+
+    # Backfill precompressed siblings for activity bundles uploaded before
+    # upload-time compression existed (fresh siblings are skipped)
+    asyncio.create_task(asyncio.to_thread(precompress_tree, ACTIVITIES_DIR))
+    
+    # Background ffmpeg workers for uploaded video renditions
+    await media_pipeline.start_workers()
+
+    # Rebuild subscription entitlement records (backfills subscriptions that
+    # predate the entitlements collection and repairs any missed refresh)
+    asyncio.create_task(entitlements.rebuild_all(db))
+    asyncio.create_task(extend_word_of_day_calendars())
+    
+    # Unique normalized-term index that bulk glossary imports rely on
+    asyncio.create_task(glossary_index.ensure_term_index(db))
+    
+    # Per-(child, content) activity score rollup used by the analytics views
+    asyncio.create_task(activity_rollup.ensure_rollup(db))
+
+    # Fold legacy stock collections into investment_stocks (one-shot)
+    asyncio.create_task(stock_repository.migrate(db))
+
+    # Tick time-series + OHLC candles behind the stock charts
+    asyncio.create_task(price_candles.ensure_candle_store(db))
+
+    # Live price deltas for /stocks/stream (change stream or version polling)
+    price_feed.start(db)
+
+    # Daily portfolio snapshots written after each fluctuation session
+    asyncio.create_task(portfolio_engine.ensure_indexes(db))
+
+    # Unique holding key + idempotency keys for stock trades
+    asyncio.create_task(trade_executor.ensure_indexes(db))
+    asyncio.create_task(order_book.ensure_indexes(db))
+
+    # Unique event ids for payment webhook dedupe
+    asyncio.create_task(subscription_routes.ensure_indexes(db))
+
     logger.info("Schedulers started: stock fluctuations (7:15 AM, 12:00 PM, 4:30 PM IST), plant update (6 AM UTC), quest reminders (7 PM UTC), chore reset (00:30 UTC), allowances (00:30 UTC), loan checks (8 AM IST)")
     
     # Run opening fluctuation on startup if market just opened
-    current_ist_hour = get_ist_hour()
+    trading_day = trading_calendar.today()
+    now_ts = datetime.now(timezone.utc).timestamp()
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     
-    # If between 7 AM and 8 AM IST and opening hasn't run
-    if 7 <= current_ist_hour < 8:
+    # Within the first hour of a trading day and opening hasn't run
+    if trading_day.is_trading_day and trading_day.open_at <= now_ts < trading_day.open_at + 3600:
         last_opening = await db.scheduler_logs.find_one({"task": "stock_fluctuation_opening", "date": today})
         if not last_opening:
             logger.info("Running opening stock fluctuation on startup...")
@@ -9810,6 +9854,9 @@ async def reset_daily_chores():
 async def shutdown_scheduler():
     """Shutdown the scheduler gracefully"""
     scheduler.shutdown()
+    await media_pipeline.stop_workers()
+    await price_feed.stop()
+    await close_payment_gateway()
     logger.info("Daily price fluctuation scheduler stopped")
 
 @app.on_event("shutdown")
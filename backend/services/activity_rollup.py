@@ -0,0 +1,217 @@
+"""Per-(child, content) activity score rollup.
+
+Teacher and parent analytics used to read the latest 500 `activity_scores`
+and aggregate in Python, which truncated (and skewed) the numbers once a
+class had more attempts than that. `save_activity_score` now also maintains
+one `activity_best_scores` document per child and content:
+
+    {"child_id", "content_id", "child_name", "content_title", "topic_id",
+     "attempts", "best_percentage", "latest_percentage", "latest_at",
+     "total_percentage", "total_time_seconds",
+     "recent": [<the 2 most recent score records, newest first>]}
+
+so analytics are exact and cost O(children x contents), not O(attempts).
+Score records counted in the rollup carry `rolled_up: True`.
+`ensure_rollup()` creates the unique index and, once (recorded in
+`migrations`), merges every score record not yet rolled up into it
+(startup).
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+RECENT_KEEP = 2
+BACKFILL_BATCH = 500
+MIGRATION_ID = "activity_best_scores_backfill"
+
+
+def _recent_copy(record: dict) -> dict:
+    return {k: v for k, v in record.items() if k not in ("_id", "rolled_up")}
+
+
+async def record_new_score(db, record: dict):
+    """Fold a freshly inserted score record (saved with `rolled_up: True`)
+    into the rollup."""
+    percentage = record.get("percentage") or 0
+    recent = _recent_copy(record)
+    await db.activity_best_scores.update_one(
+        {"child_id": record["child_id"], "content_id": record["content_id"]},
+        {
+            "$inc": {
+                "attempts": 1,
+                "total_percentage": percentage,
+                "total_time_seconds": record.get("time_spent_seconds") or 0,
+            },
+            "$max": {"best_percentage": percentage},
+            "$set": {
+                "child_name": record.get("child_name"),
+                "content_title": record.get("content_title"),
+                "topic_id": record.get("topic_id"),
+                "latest_percentage": percentage,
+                "latest_at": record["created_at"],
+            },
+            "$push": {"recent": {"$each": [recent], "$position": 0, "$slice": RECENT_KEEP}},
+        },
+        upsert=True,
+    )
+
+
+async def record_score_update(db, previous: dict, changes: dict):
+    """Fold an in-session improvement of an existing score record (which
+    stays the newest attempt) into the rollup. A record that isn't rolled
+    up yet is folded in whole, as a new attempt."""
+    if not previous.get("rolled_up"):
+        claimed = await db.activity_scores.find_one_and_update(
+            {"_id": previous["_id"], "rolled_up": {"$ne": True}},
+            {"$set": {"rolled_up": True}},
+            projection={"_id": 0},
+        )
+        if claimed:
+            await record_new_score(db, claimed)
+        return
+    percentage = changes.get("percentage") or 0
+    inc = {
+        "total_percentage": percentage - (previous.get("percentage") or 0),
+        "total_time_seconds": (changes.get("time_spent_seconds") or 0) - (previous.get("time_spent_seconds") or 0),
+    }
+    key = {"child_id": previous["child_id"], "content_id": previous["content_id"]}
+    update = {
+        "$inc": inc,
+        "$max": {"best_percentage": percentage},
+        "$set": {"latest_percentage": percentage, "latest_at": changes["created_at"]},
+    }
+    await db.activity_best_scores.update_one(key, update)
+    # Refresh the copy in `recent` if it is still there
+    await db.activity_best_scores.update_one(
+        {**key, "recent.0.score_id": previous.get("score_id")},
+        {"$set": {f"recent.0.{field}": value for field, value in changes.items()}},
+    )
+
+
+async def rollups_for(db, child_ids: Iterable[str], content_id: Optional[str] = None,
+                      topic_id: Optional[str] = None) -> List[dict]:
+    query = {"child_id": {"$in": list(child_ids)}}
+    if content_id:
+        query["content_id"] = content_id
+    if topic_id:
+        query["topic_id"] = topic_id
+    return await db.activity_best_scores.find(query, {"_id": 0}).to_list(None)
+
+
+async def student_summaries(db, child_ids: Iterable[str]) -> List[dict]:
+    """Exact per-child totals across all activities, from the rollup."""
+    pipeline = [
+        {"$match": {"child_id": {"$in": list(child_ids)}}},
+        {"$group": {
+            "_id": "$child_id",
+            "child_name": {"$first": "$child_name"},
+            "total_activities": {"$sum": "$attempts"},
+            "total_score": {"$sum": "$total_percentage"},
+            "total_time": {"$sum": "$total_time_seconds"},
+            "contents_attempted": {"$sum": 1},
+            "best_score_sum": {"$sum": "$best_percentage"},
+        }},
+    ]
+    summaries = []
+    async for row in db.activity_best_scores.aggregate(pipeline):
+        n = row["total_activities"]
+        summaries.append({
+            "child_id": row["_id"],
+            "child_name": row.get("child_name") or "Unknown",
+            "total_activities": n,
+            "total_score": row["total_score"],
+            "total_time": row["total_time"],
+            "average_score": round(row["total_score"] / n, 1) if n else 0,
+            "average_time": round(row["total_time"] / n, 1) if n else 0,
+            "contents_attempted": row["contents_attempted"],
+            "average_best_score": round(row["best_score_sum"] / row["contents_attempted"], 1),
+        })
+    return summaries
+
+
+async def ensure_rollup(db):
+    """Unique (child_id, content_id) index, plus a one-off backfill that
+    merges the score records not yet rolled up into the rollup."""
+    await db.activity_best_scores.create_index([("child_id", 1), ("content_id", 1)], unique=True)
+    await db.activity_best_scores.create_index([("content_id", 1)])
+    try:
+        # The marker is claimed atomically, so one worker runs the backfill
+        await db.migrations.insert_one({
+            "_id": MIGRATION_ID, "status": "running",
+            "started_at": datetime.now(timezone.utc).isoformat(),
+        })
+    except DuplicateKeyError:
+        return
+    pipeline = [
+        {"$match": {"rolled_up": {"$ne": True}}},
+        {"$sort": {"created_at": -1}},
+        {"$group": {
+            "_id": {"child_id": "$child_id", "content_id": "$content_id"},
+            "child_name": {"$first": "$child_name"},
+            "content_title": {"$first": "$content_title"},
+            "topic_id": {"$first": "$topic_id"},
+            "attempts": {"$sum": 1},
+            "best_percentage": {"$max": {"$ifNull": ["$percentage", 0]}},
+            "latest_percentage": {"$first": {"$ifNull": ["$percentage", 0]}},
+            "latest_at": {"$first": "$created_at"},
+            "total_percentage": {"$sum": {"$ifNull": ["$percentage", 0]}},
+            "total_time_seconds": {"$sum": {"$ifNull": ["$time_spent_seconds", 0]}},
+            "recent": {"$push": "$$ROOT"},
+            "score_ids": {"$push": "$_id"},
+        }},
+        {"$addFields": {"recent": {"$slice": ["$recent", RECENT_KEEP]}}},
+    ]
+    ops, score_ids = [], []
+    written = 0
+
+    async def flush():
+        await db.activity_best_scores.bulk_write(ops, ordered=False)
+        await db.activity_scores.update_many({"_id": {"$in": score_ids}}, {"$set": {"rolled_up": True}})
+
+    try:
+        async for row in db.activity_scores.aggregate(pipeline, allowDiskUse=True):
+            key = row.pop("_id")
+            if not key.get("child_id") or not key.get("content_id"):
+                continue
+            score_ids.extend(row.pop("score_ids"))
+            # Merge with a rollup doc that live writes may already have
+            # started; those attempts are newer than anything backfilled
+            ops.append(UpdateOne(key, {
+                "$inc": {
+                    "attempts": row["attempts"],
+                    "total_percentage": row["total_percentage"],
+                    "total_time_seconds": row["total_time_seconds"],
+                },
+                "$max": {"best_percentage": row["best_percentage"]},
+                "$setOnInsert": {
+                    **key,
+                    **{f: row[f] for f in ("child_name", "content_title", "topic_id", "latest_percentage", "latest_at")},
+                },
+                "$push": {"recent": {
+                    "$each": [_recent_copy(r) for r in row["recent"]],
+                    "$sort": {"created_at": -1},
+                    "$slice": RECENT_KEEP,
+                }},
+            }, upsert=True))
+            if len(ops) >= BACKFILL_BATCH:
+                await flush()
+                written += len(ops)
+                ops, score_ids = [], []
+        if ops:
+            await flush()
+            written += len(ops)
+        await db.migrations.update_one(
+            {"_id": MIGRATION_ID},
+            {"$set": {"status": "done", "completed_at": datetime.now(timezone.utc).isoformat(), "pairs": written}}
+        )
+        if written:
+            logger.info(f"Activity score rollup backfilled: {written} child/content pairs")
+    except Exception as e:
+        # Records already merged are flagged; the next startup picks up the rest
+        await db.migrations.delete_one({"_id": MIGRATION_ID})
+        logger.error(f"Activity score rollup backfill failed: {e}")
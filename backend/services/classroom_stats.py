@@ -0,0 +1,247 @@
+"""Per-classroom student stats for the child classmates view.
+
+The classmates page used to issue ~8 queries per classmate (user, wallets,
+goals, lessons, badges, quests, garden plots, one stock lookup per holding,
+jobs, chores). Kids refresh it constantly, so the stats for a whole
+classroom are now built with one batched query / `$group` per source
+(run concurrently) and cached for CACHE_TTL seconds, together with the
+leaderboard orderings (balance, lessons, badges).
+
+Every wallet balance write (`wallet_sources.update_wallet()`), stock
+trade, order settlement, lesson-progress and badge write for a child calls
+`invalidate_student()` so their classrooms rebuild on the next view; other
+changes (profile edits, roster changes) show up when the TTL expires.
+Every invalidation bumps the classroom's version, and a build that started
+before the bump is returned to its caller but not cached.
+"""
+import asyncio
+import heapq
+import logging
+import time
+from typing import Dict, List, Optional
+
+from services import portfolio_engine
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL = 30  # seconds
+LEADERBOARDS = {
+    "balance": "total_balance",
+    "lessons": "lessons_completed",
+    "badges": "badges",
+}
+
+
+class ClassroomStats:
+    """Snapshot of one classroom: classmate entries in roster order plus
+    precomputed leaderboard orderings (lists of user_ids, best first)."""
+
+    def __init__(self, classroom_id: str, students: Dict[str, dict]):
+        self.classroom_id = classroom_id
+        self.students = students
+        self.leaderboards = {
+            board: sorted(students, key=lambda sid, f=field: students[sid][f], reverse=True)
+            for board, field in LEADERBOARDS.items()
+        }
+        self.built_at = time.monotonic()
+
+
+_cache: Dict[str, ClassroomStats] = {}
+_student_classrooms: Dict[str, set] = {}
+_locks: Dict[str, asyncio.Lock] = {}
+_versions: Dict[str, int] = {}
+# Classrooms with a build in flight (their roster isn't mapped yet)
+_building: set = set()
+
+
+def invalidate_student(*user_ids: str):
+    """Drop cached stats for every classroom these children are in."""
+    classroom_ids = set(_building)
+    for user_id in user_ids:
+        classroom_ids.update(_student_classrooms.get(user_id, ()))
+    for classroom_id in classroom_ids:
+        invalidate_classroom(classroom_id)
+
+
+def invalidate_classroom(classroom_id: str):
+    _versions[classroom_id] = _versions.get(classroom_id, 0) + 1
+    _cache.pop(classroom_id, None)
+
+
+async def _count_by_user(collection, match: dict, field: str = "user_id") -> Dict[str, int]:
+    counts = {}
+    async for row in collection.aggregate([
+        {"$match": match},
+        {"$group": {"_id": f"${field}", "n": {"$sum": 1}}},
+    ]):
+        counts[row["_id"]] = row["n"]
+    return counts
+
+
+async def _garden_totals(db, ids: List[str]) -> Dict[str, dict]:
+    totals = {}
+    async for row in db.user_garden_plots.aggregate([
+        {"$match": {"user_id": {"$in": ids}}},
+        {"$group": {
+            "_id": "$user_id",
+            "invested": {"$sum": {"$ifNull": ["$purchase_price", 0]}},
+            "value": {"$sum": {"$ifNull": ["$plant_value", 0]}},
+            "harvested": {"$sum": {"$ifNull": ["$total_harvested", 0]}},
+        }},
+    ]):
+        totals[row["_id"]] = row
+    return totals
+
+
+async def _build(db, classroom_id: str) -> ClassroomStats:
+    links = await db.classroom_students.find(
+        {"classroom_id": classroom_id}, {"_id": 0, "student_id": 1}
+    ).to_list(None)
+    ids = list(dict.fromkeys(link["student_id"] for link in links))
+
+    (users, wallets, goals, lessons, badges, quests,
+     garden, stocks, jobs, chores) = await asyncio.gather(
+        db.users.find({"user_id": {"$in": ids}}, {"_id": 0}).to_list(None),
+        db.wallet_accounts.find(
+            {"user_id": {"$in": ids}}, {"_id": 0, "user_id": 1, "account_type": 1, "balance": 1}
+        ).to_list(None),
+        db.savings_goals.find(
+            {"$or": [{"child_id": {"$in": ids}}, {"user_id": {"$in": ids}}]},
+            {"_id": 0, "child_id": 1, "user_id": 1, "current_amount": 1}
+        ).to_list(None),
+        _count_by_user(db.user_content_progress, {"user_id": {"$in": ids}, "completed": True}),
+        _count_by_user(db.user_achievements, {"user_id": {"$in": ids}}),
+        _count_by_user(db.quest_completions, {"user_id": {"$in": ids}, "status": "approved"}),
+        _garden_totals(db, ids),
+        portfolio_engine.valuate(db, ids),
+        db.jobs.find(
+            {"child_id": {"$in": ids}, "status": {"$in": ["active", "in_progress"]}},
+            {"_id": 0, "child_id": 1, "activity": 1, "title": 1}
+        ).to_list(None),
+        db.new_quests.find(
+            {"child_id": {"$in": ids}, "creator_type": "parent", "is_active": True},
+            {"_id": 0, "child_id": 1, "title": 1}
+        ).to_list(None),
+    )
+
+    user_map = {u["user_id"]: u for u in users}
+    wallets_by_user: Dict[str, list] = {}
+    for w in wallets:
+        wallets_by_user.setdefault(w["user_id"], []).append(w)
+    saved: Dict[str, float] = {}
+    for g in goals:
+        for owner in {g.get("child_id"), g.get("user_id")}:
+            if owner in user_map:
+                saved[owner] = saved.get(owner, 0) + g.get("current_amount", 0)
+    # Titles only, no payment amounts (kids get ideas for work without
+    # seeing how much another child is paid for it)
+    jobs_by_user: Dict[str, list] = {}
+    for j in jobs:
+        jobs_by_user.setdefault(j["child_id"], []).append({"title": j.get("title") or j.get("activity") or "Job"})
+    chores_by_user: Dict[str, list] = {}
+    for q in chores:
+        chores_by_user.setdefault(q["child_id"], []).append({"title": q.get("title", "Chore")})
+
+    students = {}
+    for student_id in ids:
+        student = user_map.get(student_id)
+        if not student:
+            continue
+        spending_balance = investing_balance = 0
+        for w in wallets_by_user.get(student_id, []):
+            if w.get("account_type") == "spending":
+                spending_balance = w.get("balance", 0)
+            elif w.get("account_type") == "investing":
+                investing_balance = w.get("balance", 0)
+        # Classmates don't see a peer's My Wallet (real-world parent earnings) — only CoinQuest.
+        total_balance = sum(w.get("balance", 0) for w in wallets_by_user.get(student_id, [])
+                            if w.get("account_type") != "my_wallet")
+
+        # Investment performance based on grade: garden for 1-2, stocks for 3-5
+        grade = student.get("grade", 0) or 0
+        investment_value = investment_profit = 0
+        if 1 <= grade <= 2:
+            g = garden.get(student_id, {})
+            investment_value = g.get("value", 0) + investing_balance
+            investment_profit = g.get("harvested", 0) - g.get("invested", 0)
+        elif 3 <= grade <= 5:
+            s = stocks.get(student_id, portfolio_engine.EMPTY)
+            investment_value = s["total_value"] + investing_balance
+            investment_profit = s["profit_loss"]
+
+        students[student_id] = {
+            "user_id": student_id,
+            "name": student.get("name", "Unknown"),
+            "picture": student.get("picture"),
+            "avatar": student.get("avatar"),
+            "grade": grade,
+            "streak_count": student.get("streak_count", 0),
+            "spending_balance": round(spending_balance, 0),
+            "total_balance": round(total_balance, 0),
+            "total_saved": round(saved.get(student_id, 0), 0),
+            "investment_value": round(investment_value, 0),
+            "investment_profit": round(investment_profit, 0),
+            "lessons_completed": lessons.get(student_id, 0),
+            "quests_completed": quests.get(student_id, 0),
+            "badges": badges.get(student_id, 0),
+            "jobs": jobs_by_user.get(student_id, []),
+            "chores": chores_by_user.get(student_id, []),
+        }
+    return ClassroomStats(classroom_id, students)
+
+
+async def get_classroom_stats(db, classroom_id: str) -> ClassroomStats:
+    """Cached stats for one classroom. Entries are shared — copy before
+    mutating."""
+    stats = _cache.get(classroom_id)
+    if stats and time.monotonic() - stats.built_at < CACHE_TTL:
+        return stats
+    lock = _locks.setdefault(classroom_id, asyncio.Lock())
+    async with lock:
+        stats = _cache.get(classroom_id)
+        if not stats or time.monotonic() - stats.built_at >= CACHE_TTL:
+            version = _versions.get(classroom_id, 0)
+            _building.add(classroom_id)
+            try:
+                stats = await _build(db, classroom_id)
+            finally:
+                _building.discard(classroom_id)
+            for student_id in stats.students:
+                _student_classrooms.setdefault(student_id, set()).add(classroom_id)
+            # A write landed mid-build: serve this result once, don't cache it
+            if _versions.get(classroom_id, 0) == version:
+                _cache[classroom_id] = stats
+    return stats
+
+
+def merged_leaderboard(all_stats: List[ClassroomStats], board: str) -> List[dict]:
+    """One leaderboard across the child's classrooms (merging the
+    precomputed orderings; a child in two classrooms is listed once)."""
+    field = LEADERBOARDS[board]
+    streams = [
+        [stats.students[sid] for sid in stats.leaderboards[board]]
+        for stats in all_stats
+    ]
+    seen = set()
+    merged = []
+    for entry in heapq.merge(*streams, key=lambda e: -e[field]):
+        if entry["user_id"] not in seen:
+            seen.add(entry["user_id"])
+            merged.append(entry)
+    return merged
+
+
+def leaderboard_rows(entries: List[dict], board: str, me: Optional[str] = None) -> List[dict]:
+    field = LEADERBOARDS[board]
+    return [
+        {
+            "rank": rank,
+            "user_id": e["user_id"],
+            "name": e["name"],
+            "avatar": e.get("avatar"),
+            "picture": e.get("picture"),
+            "value": e[field],
+            "is_me": e["user_id"] == me,
+        }
+        for rank, e in enumerate(entries, 1)
+    ]
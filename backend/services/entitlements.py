@@ -0,0 +1,188 @@
+"""Subscription entitlements.
+
+Subscriptions are keyed two ways: adult accounts by email (`parent_emails`)
+and email-less children by user id (`child_user_ids`). Rather than every
+route re-deriving access with its own `$or` / date-string query, this module
+keeps one record per key in `entitlements`:
+
+    {"key": "email:ana@x.com" | "user:user_abc", "subscription_id", "plan_type",
+     "duration", "end_date", "is_trial", "trial_end_date", "granted_by_admin",
+     "num_children", "num_parents", "updated_at"}
+
+The record describes the completed, is_active subscription with the latest
+end_date for that key (expired ones included, so admin views can still say
+"expired"). Access is `end_date > now`, so expiry needs no write.
+`trial_end_date` is the latest end_date of any 1-day plan for the key, so a
+trial still counts while a longer plan coexists with it. Whoever
+writes to `subscriptions` calls `refresh_for_subscription()` (or `refresh()`)
+afterwards; reads go through a small in-process cache.
+"""
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+CACHE_TTL = 30  # seconds — bounds staleness across workers
+_cache: Dict[str, tuple] = {}  # key -> (cached_at, record | None)
+
+_RECORD_FIELDS = ("subscription_id", "plan_type", "duration", "end_date", "granted_by_admin",
+                  "num_children", "num_parents")
+
+
+def email_key(email: str) -> str:
+    return f"email:{email.strip().lower()}"
+
+
+def user_key(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+def keys_for_user(user: dict) -> List[str]:
+    """Lookup keys for a user doc, in priority order (email first)."""
+    keys = []
+    email = (user.get("email") or "").strip().lower()
+    if email:
+        keys.append(email_key(email))
+    if user.get("user_id"):
+        keys.append(user_key(user["user_id"]))
+    return keys
+
+
+def is_active(record: Optional[dict], now_iso: Optional[str] = None) -> bool:
+    if not record:
+        return False
+    now_iso = now_iso or datetime.now(timezone.utc).isoformat()
+    return record.get("end_date", "") > now_iso
+
+
+def status_of(record: Optional[dict], now_iso: Optional[str] = None) -> str:
+    """'active' | 'expired' | 'inactive' — the admin user-list vocabulary."""
+    if not record:
+        return "inactive"
+    return "active" if is_active(record, now_iso) else "expired"
+
+
+def _best(records: Iterable[Optional[dict]]) -> Optional[dict]:
+    """Prefer a currently-active record, then the latest end_date."""
+    now_iso = datetime.now(timezone.utc).isoformat()
+    candidates = [r for r in records if r]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda r: (is_active(r, now_iso), r.get("end_date", "")))
+
+
+# ============== READS ==============
+
+async def get_for_keys(db, keys: List[str]) -> Dict[str, Optional[dict]]:
+    """Entitlement records for many keys at once (one query for the misses)."""
+    now = time.monotonic()
+    result, misses = {}, []
+    for key in keys:
+        hit = _cache.get(key)
+        if hit and now - hit[0] < CACHE_TTL:
+            result[key] = hit[1]
+        else:
+            misses.append(key)
+    if misses:
+        docs = await db.entitlements.find({"key": {"$in": misses}}, {"_id": 0}).to_list(len(misses))
+        found = {d["key"]: d for d in docs}
+        for key in misses:
+            result[key] = found.get(key)
+            _cache[key] = (now, found.get(key))
+    return result
+
+
+async def get_for_user(db, user: dict) -> Optional[dict]:
+    """Best entitlement for a user across their email and user_id keys."""
+    if not user:
+        return None
+    keys = keys_for_user(user)
+    if not keys:
+        return None
+    records = await get_for_keys(db, keys)
+    return _best(records.values())
+
+
+async def get_for_email(db, email: str) -> Optional[dict]:
+    if not email:
+        return None
+    key = email_key(email)
+    return (await get_for_keys(db, [key]))[key]
+
+
+async def has_access(db, user: dict) -> bool:
+    return is_active(await get_for_user(db, user))
+
+
+async def is_on_trial(db, user: dict) -> bool:
+    """True iff any active 1-day plan covers the user, even when a longer
+    plan is their best entitlement."""
+    if not user:
+        return False
+    now_iso = datetime.now(timezone.utc).isoformat()
+    records = await get_for_keys(db, keys_for_user(user))
+    return any(
+        (r.get("trial_end_date") or "") > now_iso or (r.get("is_trial") and is_active(r, now_iso))
+        for r in records.values() if r
+    )
+
+
+# ============== WRITES ==============
+
+async def refresh(db, emails: Iterable[str] = (), user_ids: Iterable[str] = ()):
+    """Recompute the entitlement records for the given emails / user ids from
+    `subscriptions`. Call after any subscription insert/update/delete."""
+    targets = [(email_key(e), "parent_emails", e.strip().lower()) for e in emails if e]
+    targets += [(user_key(u), "child_user_ids", u) for u in user_ids if u]
+    now_iso = datetime.now(timezone.utc).isoformat()
+    for key, field, value in targets:
+        subs = await db.subscriptions.find(
+            {field: value, "payment_status": "completed", "is_active": True},
+            {"_id": 0, **{f: 1 for f in _RECORD_FIELDS}},
+        ).sort("end_date", -1).to_list(20)
+        best = _best([{f: s.get(f) for f in _RECORD_FIELDS} for s in subs])
+        if best:
+            best["end_date"] = best.get("end_date") or ""
+            best["is_trial"] = best.get("duration") == "1_day"
+            best["trial_end_date"] = max(
+                (s.get("end_date") or "" for s in subs if s.get("duration") == "1_day"), default=""
+            )
+            best["granted_by_admin"] = bool(best.get("granted_by_admin"))
+            await db.entitlements.update_one(
+                {"key": key},
+                {"$set": {**best, "key": key, "updated_at": now_iso}},
+                upsert=True,
+            )
+            best["key"] = key
+            best["updated_at"] = now_iso
+        else:
+            await db.entitlements.delete_one({"key": key})
+        _cache.pop(key, None)
+
+
+async def refresh_for_subscription(db, subscription: Optional[dict]):
+    """Refresh every key a subscription grants (call with the document as it
+    was *before* a delete or a $pull too, so removed holders lose access)."""
+    if not subscription:
+        return
+    await refresh(db, subscription.get("parent_emails") or [], subscription.get("child_user_ids") or [])
+
+
+async def rebuild_all(db):
+    """Rebuild every entitlement record from `subscriptions` (startup
+    backfill / repair). Streams subscriptions instead of loading them all."""
+    emails, user_ids = set(), set()
+    cursor = db.subscriptions.find(
+        {"payment_status": "completed"}, {"_id": 0, "parent_emails": 1, "child_user_ids": 1}
+    )
+    async for sub in cursor:
+        emails.update(e.strip().lower() for e in (sub.get("parent_emails") or []) if e)
+        user_ids.update(u for u in (sub.get("child_user_ids") or []) if u)
+    existing = await db.entitlements.distinct("key")
+    stale_emails = {k[len("email:"):] for k in existing if k.startswith("email:")} - emails
+    stale_users = {k[len("user:"):] for k in existing if k.startswith("user:")} - user_ids
+    await refresh(db, emails | stale_emails, user_ids | stale_users)
+    return len(emails) + len(user_ids)
+
+
+def clear_cache():
+    _cache.clear()
@@ -0,0 +1,129 @@
+"""Money Garden plot state.
+
+A planted plot's state is a pure function of its timestamps and the plant's
+catalogue entry (`plot_state`), so reads never write: the farm screen polls
+frequently and used to issue a `find_one` per plot plus `update_one`s to
+persist "ready"/"dead", which doubled its cost and raced with watering.
+
+  * `get_catalogue()` keeps every plant (active or not — a retired plant can
+    still be growing in someone's plot) in memory for CATALOGUE_TTL seconds;
+    admin plant edits call `invalidate()`.
+  * `sweep_plots()` is a scheduler job that persists the terminal
+    transitions (ready / dead) in batched, conditional bulk writes. The
+    condition on `last_watered` means a plot watered since it was read is
+    left alone.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+CATALOGUE_TTL = 300  # seconds
+SWEEP_BATCH = 500
+LIVE_STATUSES = ("growing", "water_needed", "wilting")
+
+_catalogue: Optional[Dict[str, dict]] = None
+_loaded_at = 0.0
+_lock = asyncio.Lock()
+
+
+def invalidate():
+    """Drop the cached catalogue; call after any investment_plants write."""
+    global _catalogue
+    _catalogue = None
+
+
+async def get_catalogue(db) -> Dict[str, dict]:
+    """plant_id -> plant document (shared — don't mutate)."""
+    global _catalogue, _loaded_at
+    if _catalogue is not None and time.monotonic() - _loaded_at < CATALOGUE_TTL:
+        return _catalogue
+    async with _lock:
+        if _catalogue is None or time.monotonic() - _loaded_at >= CATALOGUE_TTL:
+            plants = await db.investment_plants.find({}, {"_id": 0}).to_list(None)
+            _catalogue = {p["plant_id"]: p for p in plants}
+            _loaded_at = time.monotonic()
+    return _catalogue
+
+
+def _parse(ts: str) -> datetime:
+    return datetime.fromisoformat(ts.replace('Z', '+00:00'))
+
+
+def plot_state(plot: dict, plant: Optional[dict], now: datetime) -> Tuple[str, float]:
+    """(status, growth_progress) of a plot at `now`.
+
+    Growth is computed from time since planting first — a fully grown plant
+    is always harvestable, even if it's currently due for water. Only a plant
+    that is still growing can dry out (water_needed, wilting, then dead).
+    Empty, dead and ready plots, and plots whose plant is unknown, keep
+    their stored state.
+    """
+    status = plot.get("status")
+    progress = plot.get("growth_progress", 0)
+    if not plot.get("plant_id") or status in ("empty", "dead", "ready") or not plant:
+        return status, progress
+    if not plot.get("planted_at"):
+        return status, progress
+
+    hours_growing = (now - _parse(plot["planted_at"])).total_seconds() / 3600
+    total_growth_hours = plant["growth_days"] * 24
+    growth_progress = round(min(100, (hours_growing / total_growth_hours) * 100), 1)
+    if growth_progress >= 100:
+        return "ready", 100
+
+    last_watered = plot.get("last_watered")
+    if not last_watered:
+        return status, growth_progress
+    hours_since_water = (now - _parse(last_watered)).total_seconds() / 3600
+    water_freq = plant.get("water_frequency_hours", 24)
+    if hours_since_water > water_freq * 2:
+        return "dead", growth_progress
+    if hours_since_water > water_freq * 1.5:
+        return "wilting", growth_progress
+    if hours_since_water > water_freq:
+        return "water_needed", growth_progress
+    return "growing", growth_progress
+
+
+async def current_status(db, plot: dict) -> str:
+    """Effective status of one stored plot right now."""
+    catalogue = await get_catalogue(db)
+    return plot_state(plot, catalogue.get(plot.get("plant_id")), datetime.now(timezone.utc))[0]
+
+
+async def sweep_plots(db):
+    """Scheduler job: persist plots that have become ready or dead."""
+    try:
+        catalogue = await get_catalogue(db)
+        now = datetime.now(timezone.utc)
+        ops = []
+        swept = 0
+        cursor = db.farm_plots.find(
+            {"status": {"$in": list(LIVE_STATUSES)}, "plant_id": {"$ne": None}},
+            {"_id": 0, "plot_id": 1, "plant_id": 1, "planted_at": 1, "last_watered": 1,
+             "status": 1, "growth_progress": 1}
+        )
+        async for plot in cursor:
+            status, progress = plot_state(plot, catalogue.get(plot["plant_id"]), now)
+            if status not in ("ready", "dead"):
+                continue
+            ops.append(UpdateOne(
+                {"plot_id": plot["plot_id"], "status": {"$in": list(LIVE_STATUSES)},
+                 "last_watered": plot.get("last_watered")},
+                {"$set": {"status": status, "growth_progress": progress}}
+            ))
+            if len(ops) >= SWEEP_BATCH:
+                swept += (await db.farm_plots.bulk_write(ops, ordered=False)).modified_count
+                ops = []
+        if ops:
+            swept += (await db.farm_plots.bulk_write(ops, ordered=False)).modified_count
+        if swept:
+            logger.info(f"Garden sweep: {swept} plots became ready or dead")
+    except Exception as e:
+        logger.error(f"Garden sweep failed: {e}")
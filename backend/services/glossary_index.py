@@ -0,0 +1,249 @@
+"""In-memory glossary search index.
+
+The glossary search box fires a request per keystroke, and the Mongo path
+(an unanchored `$regex` on `term` plus `count_documents` and two `distinct`
+calls) can't use an index. The whole glossary is a few thousand short docs,
+so this module keeps it in memory instead:
+
+  * terms are normalized (casefold, accents stripped, whitespace collapsed)
+    and kept sorted, so prefix lookups are a bisect — a flattened trie;
+  * a trigram posting list narrows substring and fuzzy (edit-distance)
+    candidates before they are verified;
+  * letter / category facets are precomputed per (grade, published-only).
+
+Glossary writes call `invalidate()`; see `services.snapshot_cache` for
+how the index is rebuilt across workers (REBUILD_TTL).
+"""
+import bisect
+import logging
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from services.snapshot_cache import SnapshotCache
+
+logger = logging.getLogger(__name__)
+
+REBUILD_TTL = 300  # seconds
+MIN_FUZZY_LENGTH = 4  # shorter queries would fuzzy-match half the glossary
+
+# Match ranks, best first
+EXACT, PREFIX, WORD_PREFIX, SUBSTRING, FUZZY = range(5)
+
+
+def normalize_term(term: str) -> str:
+    """Casefolded, accent-stripped, single-spaced form used for matching and
+    duplicate detection ("  Compound  Intérest" -> "compound interest")."""
+    decomposed = unicodedata.normalize("NFKD", term or "")
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _within_distance(a: str, b: str, max_dist: int) -> bool:
+    """Edit distance(a, b) <= max_dist, counting an adjacent transposition
+    ("bugdet") as one edit. Exits early once every cell exceeds the bound."""
+    if abs(len(a) - len(b)) > max_dist:
+        return False
+    before, prev = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if before is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before[j - 2] + 1)
+            cur.append(cost)
+        if min(cur) > max_dist:
+            return False
+        before, prev = prev, cur
+    return prev[-1] <= max_dist
+
+
+def _fits_grade(word: dict, grade: Optional[int]) -> bool:
+    # Same semantics as the old {"min_grade": {"$lte": g}, "max_grade": {"$gte": g}}
+    # query: words missing either bound don't match a grade filter.
+    if grade is None:
+        return True
+    lo, hi = word.get("min_grade"), word.get("max_grade")
+    try:
+        return lo is not None and hi is not None and lo <= grade <= hi
+    except TypeError:
+        return False
+
+
+def _is_live(word: dict) -> bool:
+    # Missing `is_published` is treated as live (legacy words)
+    return word.get("is_published") is not False
+
+
+class GlossaryIndex:
+    """Immutable snapshot of the glossary; build a new one to refresh."""
+
+    def __init__(self, words: List[dict]):
+        words = sorted(words, key=lambda w: w.get("term") or "")
+        self.words = words
+        self.norms = [normalize_term(w.get("term")) for w in words]
+        self.by_norm: Dict[str, int] = {}
+        for pos, norm in enumerate(self.norms):
+            self.by_norm.setdefault(norm, pos)
+        # Sorted (normalized term, position) pairs for prefix bisects
+        self.sorted_norms: List[Tuple[str, int]] = sorted((n, i) for i, n in enumerate(self.norms))
+        self._sorted_keys = [n for n, _ in self.sorted_norms]
+        self.grams = defaultdict(set)
+        for pos, norm in enumerate(self.norms):
+            for gram in _trigrams(norm):
+                self.grams[gram].add(pos)
+        self.grades = sorted({g for w in words for g in (w.get("min_grade"), w.get("max_grade"))
+                              if isinstance(g, int)})
+        self._facets: Dict[Tuple[Optional[int], bool], dict] = {}
+        for grade in [None] + list(range(self.grades[0], self.grades[-1] + 1) if self.grades else []):
+            for published_only in (True, False):
+                self._facets[(grade, published_only)] = self._compute_facets(grade, published_only)
+
+    # ---------- lookups ----------
+
+    def find_term(self, term: str) -> Optional[dict]:
+        """Word whose normalized term equals `term`'s, if any."""
+        pos = self.by_norm.get(normalize_term(term))
+        return self.words[pos] if pos is not None else None
+
+    def _prefix_positions(self, prefix: str) -> List[int]:
+        start = bisect.bisect_left(self._sorted_keys, prefix)
+        out = []
+        for norm, pos in self.sorted_norms[start:]:
+            if not norm.startswith(prefix):
+                break
+            out.append(pos)
+        return out
+
+    def _match(self, query: str) -> Dict[int, int]:
+        """position -> best rank for a free-text query."""
+        ranks: Dict[int, int] = {}
+        for pos in self._prefix_positions(query):
+            ranks[pos] = EXACT if self.norms[pos] == query else PREFIX
+        fuzzy_dist = 0 if len(query) < MIN_FUZZY_LENGTH else (1 if len(query) < 8 else 2)
+        if len(query) < 3:
+            # Too short for trigrams; a linear scan over a few thousand
+            # short strings is still sub-millisecond
+            candidates = range(len(self.norms))
+        else:
+            grams = _trigrams(query)
+            counts = defaultdict(int)
+            for gram in grams:
+                for pos in self.grams.get(gram, ()):
+                    counts[pos] += 1
+            # A mid-term substring misses the 3 padded edge trigrams and each
+            # edit breaks up to 3 more; the checks below do the real filtering
+            threshold = max(1, len(grams) - 3 - 3 * fuzzy_dist)
+            candidates = [pos for pos, n in counts.items() if n >= threshold]
+        for pos in candidates:
+            if pos in ranks:
+                continue
+            norm = self.norms[pos]
+            if query in norm:
+                words = norm.split(" ")
+                ranks[pos] = WORD_PREFIX if any(w.startswith(query) for w in words) else SUBSTRING
+            elif fuzzy_dist and (
+                _within_distance(query, norm, fuzzy_dist)
+                or any(_within_distance(query, w, fuzzy_dist) for w in norm.split(" "))
+            ):
+                ranks[pos] = FUZZY
+        return ranks
+
+    def search(
+        self,
+        search: Optional[str] = None,
+        letter: Optional[str] = None,
+        category: Optional[str] = None,
+        grade: Optional[int] = None,
+        published_only: bool = True,
+    ) -> List[dict]:
+        """Matching words (shared dicts — copy before mutating). Free-text
+        results are ranked exact > prefix > word prefix > substring > fuzzy,
+        then alphabetically; everything else is alphabetical."""
+        query = normalize_term(search) if search else ""
+        if letter and len(letter) == 1:
+            # Letter chips replace the free-text search, as before
+            query = ""
+            positions = self._prefix_positions(normalize_term(letter))
+            ranks = dict.fromkeys(positions, 0)
+        elif query:
+            ranks = self._match(query)
+        else:
+            ranks = dict.fromkeys(range(len(self.words)), 0)
+
+        out = []
+        for pos in sorted(ranks, key=lambda p: (ranks[p], p)):
+            word = self.words[pos]
+            if published_only and not _is_live(word):
+                continue
+            if category and word.get("category") != category:
+                continue
+            if not _fits_grade(word, grade):
+                continue
+            out.append(word)
+        return out
+
+    # ---------- facets ----------
+
+    def _compute_facets(self, grade: Optional[int], published_only: bool) -> dict:
+        letters, categories = set(), []
+        for word in self.words:
+            if published_only and not _is_live(word):
+                continue
+            if not _fits_grade(word, grade):
+                continue
+            if word.get("first_letter"):
+                letters.add(word["first_letter"])
+            category = word.get("category")
+            if category and category not in categories:
+                categories.append(category)
+        return {"letters": sorted(letters), "categories": categories}
+
+    def facets(self, grade: Optional[int] = None, published_only: bool = True) -> dict:
+        """Letters and categories that have at least one visible word."""
+        key = (grade, published_only)
+        if key not in self._facets:
+            self._facets[key] = self._compute_facets(grade, published_only)
+        return self._facets[key]
+
+
+async def _build(db) -> GlossaryIndex:
+    words = await db.glossary_words.find({}, {"_id": 0}).to_list(None)
+    return GlossaryIndex(words)
+
+
+_cache = SnapshotCache(_build, REBUILD_TTL)
+
+
+def invalidate():
+    """Mark the index stale; call after any glossary_words write."""
+    _cache.invalidate()
+
+
+async def get_index(db) -> GlossaryIndex:
+    """Current index, rebuilt from `glossary_words` when stale."""
+    return await _cache.get(db)
+
+
+async def ensure_term_index(db):
+    """Backfill `term_normalized` on older words and create the unique index
+    that makes duplicate terms impossible (startup). If existing duplicates
+    block the index, log them and carry on — the import path still checks."""
+    from pymongo.errors import OperationFailure
+
+    async for word in db.glossary_words.find(
+        {"term_normalized": {"$exists": False}}, {"_id": 0, "word_id": 1, "term": 1}
+    ):
+        await db.glossary_words.update_one(
+            {"word_id": word["word_id"]},
+            {"$set": {"term_normalized": normalize_term(word.get("term"))}},
+        )
+    try:
+        await db.glossary_words.create_index("term_normalized", unique=True, name="term_normalized_unique")
+    except OperationFailure as e:
+        logger.warning(f"Glossary term index not created (duplicate terms?): {e}")
@@ -0,0 +1,141 @@
+"""Fixed-width WebP/AVIF derivatives for uploaded images.
+
+Store, badge, goal, glossary, investment and thumbnail images are uploaded at
+whatever resolution the admin had on disk, while most screens render them as
+64-256px tiles. Derivatives are written at upload time (and lazily for older
+files on first request) under `uploads/derived/`, mirroring the original's
+path:
+
+    uploads/store/<hex>.png  ->  uploads/derived/store/<hex>/w256.webp
+
+`UploadsStaticFiles` serves them when a request carries `?size=<width>`; the
+width is snapped up to the nearest entry in WIDTHS so arbitrary sizes can't
+be used to fill the disk.
+"""
+import logging
+import mimetypes
+import os
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).parent.parent
+UPLOADS_DIR = ROOT_DIR / "uploads"
+DERIVED_DIR = UPLOADS_DIR / "derived"
+
+WIDTHS = (128, 256, 512)
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp"}
+# Output formats by preference; AVIF only if this Pillow build can encode it.
+FORMATS = (["avif"] if features.check("avif") else []) + ["webp"]
+_QUALITY = {"webp": 80, "avif": 55}
+# Formats generated eagerly at upload time (AVIF encodes are slow — lazy only)
+EAGER_FORMATS = ("webp",)
+
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+
+# Refuse to decode absurdly large images (decompression bombs)
+Image.MAX_IMAGE_PIXELS = 40_000_000
+
+
+def snap_width(requested: int) -> int:
+    """Smallest configured width >= requested (largest if above all)."""
+    for w in WIDTHS:
+        if requested <= w:
+            return w
+    return WIDTHS[-1]
+
+
+def pick_format(accept_header: str) -> Optional[str]:
+    """Best derivative format the client accepts, or None to keep the original."""
+    accept = (accept_header or "").lower()
+    for fmt in FORMATS:
+        if f"image/{fmt}" in accept:
+            return fmt
+    return None
+
+
+def is_derivable(path) -> bool:
+    """True for an uploaded raster image (absolute, or relative to UPLOADS_DIR)
+    that isn't itself a derivative."""
+    path = Path(path)
+    if not path.is_absolute():
+        path = UPLOADS_DIR / path
+    try:
+        path.relative_to(DERIVED_DIR)
+        return False
+    except ValueError:
+        pass
+    return path.suffix.lower() in IMAGE_EXTENSIONS
+
+
+def derivative_path(original: Path, width: int, fmt: str) -> Path:
+    rel = Path(original).resolve().relative_to(UPLOADS_DIR.resolve())
+    return DERIVED_DIR / rel.parent / rel.stem / f"w{width}.{fmt}"
+
+
+def _write(img: Image.Image, original: Path, width: int, fmt: str) -> Path:
+    out = derivative_path(original, width, fmt)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    resized = img
+    if img.width > width:
+        height = max(1, round(img.height * width / img.width))
+        resized = img.resize((width, height), Image.LANCZOS)
+    tmp = out.with_name(out.name + ".tmp")
+    resized.save(tmp, format=fmt.upper(), quality=_QUALITY[fmt])
+    os.replace(tmp, out)
+    return out
+
+
+def _open(original: Path) -> Optional[Image.Image]:
+    img = Image.open(original)
+    if getattr(img, "is_animated", False):
+        # Animated GIF/WebP badges keep their original file
+        return None
+    img = ImageOps.exif_transpose(img)
+    return img.convert("RGBA") if img.mode not in ("RGB", "RGBA") else img
+
+
+def generate_derivatives(original, formats=EAGER_FORMATS) -> int:
+    """Write every configured width for `original`. Called (in a thread) right
+    after an image upload. Returns how many files were written."""
+    original = Path(original)
+    if not is_derivable(original):
+        return 0
+    try:
+        img = _open(original)
+    except Exception as e:
+        logger.warning(f"Cannot derive {original}: {e}")
+        return 0
+    if img is None:
+        return 0
+    written = 0
+    for fmt in formats:
+        for width in WIDTHS:
+            _write(img, original, width, fmt)
+            written += 1
+    return written
+
+
+def ensure_derivative(original, width: int, fmt: str) -> Optional[Path]:
+    """Path of the (width, fmt) derivative, generating it on first use for
+    files uploaded before derivatives existed. None when the original can't
+    be derived (animated, corrupt, unsupported)."""
+    original = Path(original)
+    out = derivative_path(original, width, fmt)
+    try:
+        if out.stat().st_mtime >= original.stat().st_mtime:
+            return out
+    except FileNotFoundError:
+        pass
+    try:
+        img = _open(original)
+        if img is None:
+            return None
+        return _write(img, original, width, fmt)
+    except Exception as e:
+        logger.warning(f"Cannot derive {original} at w{width}.{fmt}: {e}")
+        return None
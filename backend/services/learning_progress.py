@@ -0,0 +1,129 @@
+"""Shared learning-progress calculations for parent and teacher insights.
+
+Both insights screens need, per child: lessons completed, lessons available
+for the child's grade, and topics / subtopics completed. They used to
+compute this with one `count_documents` per child plus a nested
+topic -> subtopic -> content walk issuing a query per subtopic.
+
+Here the grade-dependent parts (visible-content total and the
+topic/subtopic/content structure) are built with a few `$in` queries and
+memoized per grade for GRADE_CACHE_TTL seconds, so siblings in the same grade
+and repeat visits share them. Per-child work is then one query for the
+child's completed content ids.
+"""
+import time
+from typing import Dict, Iterable, List, Tuple
+
+from services.content_query import child_visible_content_query
+
+GRADE_CACHE_TTL = 60  # seconds — content edits show up within a minute
+
+_grade_cache: Dict[Tuple[str, int], tuple] = {}  # (kind, grade) -> (cached_at, value)
+
+
+async def _memo(kind: str, grade: int, loader):
+    key = (kind, grade)
+    hit = _grade_cache.get(key)
+    if hit and time.monotonic() - hit[0] < GRADE_CACHE_TTL:
+        return hit[1]
+    value = await loader()
+    _grade_cache[key] = (time.monotonic(), value)
+    return value
+
+
+async def visible_content_total(db, grade: int) -> int:
+    """Content items a child of `grade` can see (memoized per grade)."""
+    return await _memo("total", grade, lambda: db.content_items.count_documents(
+        child_visible_content_query(grade)
+    ))
+
+
+async def _load_topic_structure(db, grade: int) -> List[Tuple[str, List[Tuple[str, List[str]]]]]:
+    topics = await db.content_topics.find(
+        {"is_active": {"$ne": False}, "min_grade": {"$lte": grade}, "max_grade": {"$gte": grade}},
+        {"_id": 0, "topic_id": 1}
+    ).to_list(200)
+    topic_ids = [t["topic_id"] for t in topics]
+    subtopics = await db.content_topics.find(
+        {"parent_id": {"$in": topic_ids}}, {"_id": 0, "topic_id": 1, "parent_id": 1}
+    ).to_list(None)
+    sub_ids = [s["topic_id"] for s in subtopics]
+    items = await db.content_items.find(
+        {"topic_id": {"$in": sub_ids}, "is_published": True}, {"_id": 0, "content_id": 1, "topic_id": 1}
+    ).to_list(None)
+
+    items_by_sub: Dict[str, List[str]] = {}
+    for item in items:
+        items_by_sub.setdefault(item["topic_id"], []).append(item["content_id"])
+    subs_by_topic: Dict[str, List[Tuple[str, List[str]]]] = {}
+    for sub in subtopics:
+        subs_by_topic.setdefault(sub["parent_id"], []).append(
+            (sub["topic_id"], items_by_sub.get(sub["topic_id"], []))
+        )
+    return [(tid, subs_by_topic.get(tid, [])) for tid in topic_ids]
+
+
+async def topic_structure(db, grade: int):
+    """[(topic_id, [(subtopic_id, [published content_ids])])] for the grade's
+    active topics (memoized per grade)."""
+    return await _memo("structure", grade, lambda: _load_topic_structure(db, grade))
+
+
+def completion_counts(structure, completed_ids: set) -> dict:
+    """Topic/subtopic completion for one child. A subtopic is completed when
+    every published item in it is completed; a topic when every subtopic is
+    completed and at least one has content (empty subtopics block it)."""
+    topics_completed = subtopics_completed = total_subtopics = 0
+    for _, subtopics in structure:
+        total_subtopics += len(subtopics)
+        if not subtopics:
+            continue
+        topic_all_done = True
+        any_subtopic_with_content = False
+        for _, item_ids in subtopics:
+            if not item_ids:
+                topic_all_done = False
+                continue
+            any_subtopic_with_content = True
+            if all(i in completed_ids for i in item_ids):
+                subtopics_completed += 1
+            else:
+                topic_all_done = False
+        if topic_all_done and any_subtopic_with_content:
+            topics_completed += 1
+    return {
+        "topics_completed": topics_completed,
+        "total_topics": len(structure),
+        "subtopics_completed": subtopics_completed,
+        "total_subtopics": total_subtopics,
+    }
+
+
+async def completed_content_ids(db, user_id: str) -> set:
+    return set(await db.user_content_progress.distinct(
+        "content_id", {"user_id": user_id, "completed": True}
+    ))
+
+
+async def completed_lesson_counts(db, user_ids: Iterable[str]) -> Dict[str, int]:
+    """Completed progress rows per child, for many children in one query."""
+    user_ids = list(user_ids)
+    counts = dict.fromkeys(user_ids, 0)
+    pipeline = [
+        {"$match": {"user_id": {"$in": user_ids}, "completed": True}},
+        {"$group": {"_id": "$user_id", "n": {"$sum": 1}}},
+    ]
+    async for row in db.user_content_progress.aggregate(pipeline):
+        counts[row["_id"]] = row["n"]
+    return counts
+
+
+async def learning_summary(db, user_id: str, grade: int) -> dict:
+    """Lessons and topic/subtopic completion for one child."""
+    completed = await completed_content_ids(db, user_id)
+    lessons_completed = (await completed_lesson_counts(db, [user_id]))[user_id]
+    return {
+        "lessons_completed": lessons_completed,
+        "total_lessons": await visible_content_total(db, grade),
+        **completion_counts(await topic_structure(db, grade), completed),
+    }
@@ -0,0 +1,235 @@
+"""Offline market backtest and tick-path benchmark.
+
+Replays N simulated trading days entirely in memory — nothing is written
+to MongoDB — over a snapshot of `investment_stocks` (or a built-in demo
+market) and synthetic student holdings:
+
+  * `paths` independent price paths advance together as one NumPy array
+    per tick, using `price_model.step()` with one of its models (the live
+    session rule, the live admin rule or the `session_band` candidate);
+  * synthetic holdings are valued at the end of every day, giving the
+    drift of portfolio values across paths;
+  * one path is also pushed through the CPU side of the live tick —
+    building the `stock_repository.price_tick()` bulk-write operations and
+    `portfolio_engine.valuate_holdings()` — and timed per tick.
+
+The report covers the final price distribution per stock (including how
+often the price band clamps bite), portfolio value drift per day and
+per-tick timings. Typical use, to tune volatility or compare the models:
+
+    python -m services.market_backtest --days 30 --paths 500 --users 2000
+    python -m services.market_backtest --model session_band --source db --json
+
+`run()` is also what the admin backtest endpoint calls, with the much
+smaller API_MAX_* limits: the per-tick Python work holds the GIL, so a long
+run in a worker thread would still stall every other request.
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from services import portfolio_engine, price_model, stock_repository
+
+# CLI limits
+MAX_DAYS = 365
+MAX_PATHS = 1000
+MAX_USERS = 5000
+# Admin endpoint limits (about a second of CPU for a typical market)
+API_MAX_DAYS = 60
+API_MAX_PATHS = 200
+API_MAX_USERS = 500
+POSITIONS_PER_USER = 5
+STOCK_FIELDS = {
+    "_id": 0, "stock_id": 1, "name": 1, "current_price": 1, "base_price": 1,
+    "volatility": 1, "trend": 1, "min_price": 1, "max_price": 1,
+}
+
+
+def demo_stocks(n: int = 12, seed: int = 7) -> List[dict]:
+    """A small made-up market for runs without a database."""
+    rng = np.random.default_rng(seed)
+    stocks = []
+    for i in range(n):
+        price = round(float(rng.uniform(20, 400)), 2)
+        stocks.append({
+            "stock_id": f"demo_{i:02d}",
+            "name": f"Demo Stock {i + 1}",
+            "current_price": price,
+            "volatility": round(float(rng.uniform(0.02, 0.15)), 3),
+            "trend": round(float(rng.uniform(-0.01, 0.01)), 4),
+            "min_price": round(price / 4, 2),
+            "max_price": round(price * 4, 2),
+        })
+    return stocks
+
+
+async def load_stocks(db) -> List[dict]:
+    return await db.investment_stocks.find(
+        {"is_active": {"$ne": False}}, STOCK_FIELDS
+    ).to_list(None)
+
+
+def synthetic_holdings(prices: np.ndarray, users: int, rng: np.random.Generator) -> np.ndarray:
+    """(users, stocks) share counts: a few positions per user, each worth
+    roughly ₹50-500 at today's prices."""
+    n = len(prices)
+    holdings = np.zeros((users, n))
+    positions = min(POSITIONS_PER_USER, n)
+    for user in range(users):
+        picks = rng.choice(n, size=rng.integers(1, positions + 1), replace=False)
+        holdings[user, picks] = np.maximum(1, np.round(rng.uniform(50, 500, len(picks)) / prices[picks]))
+    return holdings
+
+
+def _percentiles(values: np.ndarray) -> Dict[str, float]:
+    p5, p50, p95 = np.percentile(values, [5, 50, 95])
+    return {"mean": round(float(values.mean()), 2), "p5": round(float(p5), 2),
+            "p50": round(float(p50), 2), "p95": round(float(p95), 2)}
+
+
+def _timing(samples: List[float]) -> Dict[str, float]:
+    ms = np.array(samples) * 1000
+    return {"mean_ms": round(float(ms.mean()), 3), "p95_ms": round(float(np.percentile(ms, 95)), 3),
+            "max_ms": round(float(ms.max()), 3)}
+
+
+def run(stocks: List[dict], days: int = 30, paths: int = 200, users: int = 500,
+        model: str = "session", seed: Optional[int] = None, max_days: int = MAX_DAYS,
+        max_paths: int = MAX_PATHS, max_users: int = MAX_USERS) -> dict:
+    """Simulate `days` trading days; returns the report dict."""
+    if model not in price_model.MODELS:
+        raise ValueError(f"Unknown price model {model!r} (use one of {', '.join(price_model.MODELS)})")
+    if not stocks:
+        raise ValueError("No stocks to simulate")
+    if not (1 <= days <= max_days and 1 <= paths <= max_paths and 1 <= users <= max_users):
+        raise ValueError(f"Limits: days 1-{max_days}, paths 1-{max_paths}, users 1-{max_users}")
+
+    rng = np.random.default_rng(seed)
+    p = price_model.params(stocks, model)
+    start = price_model.current_prices(stocks, model)
+    ids = [s["stock_id"] for s in stocks]
+    prices = np.tile(start, (paths, 1))
+
+    holdings = synthetic_holdings(start, users, rng)
+    holding_docs = [
+        {"user_id": f"user_{u}", "stock_id": ids[s], "quantity": holdings[u, s], "total_invested": holdings[u, s] * start[s]}
+        for u, s in zip(*np.nonzero(holdings))
+    ]
+    start_values = holdings @ start
+    drift = []
+    step_times, ops_times, valuation_times = [], [], []
+    ticks_per_day = price_model.SESSIONS_PER_DAY if model in price_model.SESSION_MODELS else 1
+    day0 = date.today()
+
+    for day in range(days):
+        day_str = (day0 + timedelta(days=day)).isoformat()
+        for _ in range(ticks_per_day):
+            before = prices[0]
+            t0 = time.perf_counter()
+            prices = price_model.step(prices, p, model, rng)
+            step_times.append(time.perf_counter() - t0)
+
+            # The live tick for one path: bulk-write ops + portfolio valuation
+            t0 = time.perf_counter()
+            [stock_repository.price_tick(sid, float(new), day_str, float(old))
+             for sid, new, old in zip(ids, prices[0], before)]
+            ops_times.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            portfolio_engine.valuate_holdings(holding_docs, dict(zip(ids, prices[0].tolist())))
+            valuation_times.append(time.perf_counter() - t0)
+
+        # (paths, users) portfolio values relative to day 0
+        values = prices @ holdings.T
+        change = (values / start_values - 1) * 100
+        drift.append({"day": day + 1, **_percentiles(change.ravel())})
+
+    final = prices
+    report_stocks = []
+    for i, stock in enumerate(stocks):
+        column = final[:, i]
+        report_stocks.append({
+            "stock_id": ids[i],
+            "name": stock.get("name", ids[i]),
+            "start": round(float(start[i]), 2),
+            **_percentiles(column),
+            "at_floor_pct": round(float(np.mean(column <= p["floor"][i])) * 100, 1),
+            "at_cap_pct": round(float(np.mean(column >= p["cap"][i])) * 100, 1),
+        })
+
+    return {
+        "model": model,
+        "days": days,
+        "ticks": days * ticks_per_day,
+        "paths": paths,
+        "users": users,
+        "holdings": len(holding_docs),
+        "seed": seed,
+        "stocks": report_stocks,
+        "portfolio_drift_pct": drift,
+        "timing": {
+            "price_step": _timing(step_times),
+            "tick_ops": _timing(ops_times),
+            "valuation": _timing(valuation_times),
+        },
+    }
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"Model {report['model']}: {report['days']} days, {report['ticks']} ticks, "
+        f"{report['paths']} paths, {report['users']} users ({report['holdings']} holdings)",
+        "",
+        f"{'stock':<24}{'start':>10}{'mean':>10}{'p5':>10}{'p50':>10}{'p95':>10}{'floor%':>8}{'cap%':>8}",
+    ]
+    for s in report["stocks"]:
+        lines.append(
+            f"{s['name'][:23]:<24}{s['start']:>10.2f}{s['mean']:>10.2f}{s['p5']:>10.2f}"
+            f"{s['p50']:>10.2f}{s['p95']:>10.2f}{s['at_floor_pct']:>8.1f}{s['at_cap_pct']:>8.1f}"
+        )
+    lines += ["", "Portfolio value drift (% vs day 0, across paths x users)",
+              f"{'day':>5}{'mean':>10}{'p5':>10}{'p50':>10}{'p95':>10}"]
+    drift = report["portfolio_drift_pct"]
+    shown = drift if len(drift) <= 10 else drift[:: max(1, len(drift) // 10)] + [drift[-1]]
+    for d in shown:
+        lines.append(f"{d['day']:>5}{d['mean']:>10.2f}{d['p5']:>10.2f}{d['p50']:>10.2f}{d['p95']:>10.2f}")
+    lines += ["", "Per-tick timing (ms)          mean       p95       max"]
+    labels = {"price_step": "price step (all paths)", "tick_ops": "bulk-write ops (1 path)",
+              "valuation": "portfolio valuation"}
+    for key, label in labels.items():
+        t = report["timing"][key]
+        lines.append(f"{label:<26}{t['mean_ms']:>10.3f}{t['p95_ms']:>10.3f}{t['max_ms']:>10.3f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay simulated trading days in memory.")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--paths", type=int, default=200)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--model", choices=price_model.MODELS, default="session")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--source", choices=("demo", "db"), default="demo",
+                        help="demo market, or a read-only snapshot of investment_stocks (MONGO_URL / DB_NAME)")
+    parser.add_argument("--json", action="store_true", help="print the raw report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.source == "db":
+        from core.database import db
+        stocks = asyncio.run(load_stocks(db))
+    else:
+        stocks = demo_stocks()
+
+    try:
+        report = run(stocks, args.days, args.paths, args.users, args.model, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""In-memory market snapshot for the stock screens.
+
+The stock list, portfolio, wallet allocation and classmates views all need
+every stock's current price and daily stats (opening price, previous close,
+daily change), and used to re-read the stocks and rescan `price_history`
+on every request — right after each price tick is exactly when those pages
+are hammered.
+
+`get_snapshot()` returns an immutable `MarketSnapshot` holding all stocks
+with the stats precomputed. Anything that changes prices (the fluctuation
+job, admin stock edits, news application) calls `publish_change()`, which
+bumps a version stamp in `market_state` and rebuilds the local snapshot.
+Other workers notice the new version within VERSION_CHECK_INTERVAL seconds
+(one tiny read), and the snapshot is also rebuilt when the IST trading date
+rolls over, since "today's opening price" depends on it.
+
+`add_listener()` registers a callback `(old, new)` run whenever this worker
+swaps in a newer snapshot (the live price feed uses it), and `refresh()`
+checks the version immediately instead of waiting out the interval.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from services import stock_repository, trading_calendar
+
+logger = logging.getLogger(__name__)
+
+VERSION_CHECK_INTERVAL = 5  # seconds
+IST = trading_calendar.IST
+STATE_ID = "prices"
+
+
+def today_ist() -> str:
+    return trading_calendar.today_ist()
+
+
+def daily_stats(stock: dict, today: str) -> dict:
+    """Opening price, previous close and changes for one stock, from its
+    embedded price_history (last 10 entries)."""
+    current = stock.get("current_price", 0)
+    history = stock.get("price_history", [])[-10:]
+    stats = {"recent_history": history}
+
+    # Today's opening price is the first price of the day; without a tick
+    # today fall back to the previous close
+    today_history = [h for h in history if h.get("date", "").startswith(today)]
+    if today_history:
+        stats["opening_price"] = today_history[0].get("price", current)
+    else:
+        stats["opening_price"] = stock.get("previous_close", current)
+    stats["closing_price"] = current
+
+    stats["daily_change"] = round(current - stats["opening_price"], 2)
+    stats["daily_change_percent"] = (
+        round(stats["daily_change"] / stats["opening_price"] * 100, 2) if stats["opening_price"] > 0 else 0
+    )
+
+    if len(history) >= 2:
+        # Previous close: last entry from an earlier day
+        prev_day_entries = [h for h in history if not h.get("date", "").startswith(today)]
+        last = prev_day_entries[-1] if prev_day_entries else history[-2]
+        stats["previous_close"] = last.get("close_price", last.get("price", current))
+
+        prev = history[-2].get("price", current)
+        stats["price_change"] = round(current - prev, 2)
+        stats["price_change_percent"] = round((current - prev) / prev * 100, 2) if prev > 0 else 0
+    else:
+        stats["previous_close"] = current
+        stats["price_change"] = 0
+        stats["price_change_percent"] = 0
+    return stats
+
+
+class MarketSnapshot:
+    """All stocks at one price version. `listed` is the active stocks shown
+    on the market screen (with daily stats merged in); `by_id` covers every
+    known stock, including inactive ones still held in portfolios."""
+
+    def __init__(self, stocks: List[dict], version: int, trading_date: str):
+        self.version = version
+        self.trading_date = trading_date
+        self.built_at = time.monotonic()
+        self.as_of = datetime.now(timezone.utc).isoformat()
+
+        by_id: Dict[str, dict] = {stock["stock_id"]: stock for stock in stocks}
+        self.stats = {sid: daily_stats(stock, trading_date) for sid, stock in by_id.items()}
+        self.by_id = by_id
+
+        self.listed = [{**s, **self.stats[s["stock_id"]]} for s in stocks if s.get("is_active")]
+
+    def get(self, stock_id: str) -> Optional[dict]:
+        return self.by_id.get(stock_id)
+
+    def price(self, stock_id: str, default: float = 0) -> float:
+        stock = self.by_id.get(stock_id)
+        return stock.get("current_price", default) if stock else default
+
+
+_snapshot: Optional[MarketSnapshot] = None
+_checked_at = 0.0
+_lock = asyncio.Lock()
+_listeners: List[Callable[[Optional[MarketSnapshot], MarketSnapshot], None]] = []
+
+
+def add_listener(callback: Callable[[Optional[MarketSnapshot], MarketSnapshot], None]):
+    _listeners.append(callback)
+
+
+def _swap(snapshot: MarketSnapshot):
+    global _snapshot
+    old, _snapshot = _snapshot, snapshot
+    for callback in _listeners:
+        try:
+            callback(old, snapshot)
+        except Exception as e:
+            logger.error(f"Market snapshot listener failed: {e}")
+
+
+async def _current_version(db) -> int:
+    state = await db.market_state.find_one({"_id": STATE_ID}, {"version": 1})
+    return (state or {}).get("version", 0)
+
+
+async def _build(db, version: int) -> MarketSnapshot:
+    stocks = await stock_repository.list_stocks(db)
+    return MarketSnapshot(stocks, version, today_ist())
+
+
+async def get_snapshot(db) -> MarketSnapshot:
+    """Current snapshot (shared — copy stock dicts before mutating)."""
+    snapshot = _snapshot
+    if snapshot and time.monotonic() - _checked_at < VERSION_CHECK_INTERVAL \
+            and snapshot.trading_date == today_ist():
+        return snapshot
+    async with _lock:
+        if _snapshot and time.monotonic() - _checked_at < VERSION_CHECK_INTERVAL \
+                and _snapshot.trading_date == today_ist():
+            return _snapshot
+        return await _check(db)
+
+
+async def _check(db) -> MarketSnapshot:
+    global _checked_at
+    version = await _current_version(db)
+    if _snapshot is None or _snapshot.version != version or _snapshot.trading_date != today_ist():
+        _swap(await _build(db, version))
+    _checked_at = time.monotonic()
+    return _snapshot
+
+
+async def refresh(db) -> MarketSnapshot:
+    """Check the shared version now (e.g. on a change notification)."""
+    async with _lock:
+        return await _check(db)
+
+
+async def publish_change(db, reason: str = "") -> MarketSnapshot:
+    """Call after any stock price or catalogue write: bumps the shared
+    version stamp and rebuilds this worker's snapshot."""
+    global _checked_at
+    state = await db.market_state.find_one_and_update(
+        {"_id": STATE_ID},
+        {"$inc": {"version": 1}, "$set": {"updated_at": datetime.now(timezone.utc).isoformat(), "reason": reason}},
+        upsert=True,
+        return_document=True,
+    )
+    async with _lock:
+        if _snapshot is None or _snapshot.version < state["version"]:
+            _swap(await _build(db, state["version"]))
+        _checked_at = time.monotonic()
+    logger.info(f"Market snapshot v{state['version']} built ({reason or 'update'})")
+    return _snapshot
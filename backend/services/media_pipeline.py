@@ -0,0 +1,322 @@
+"""Background video transcoding.
+
+Uploaded videos are served as-is (often 1080p phone recordings), which stalls
+playback on school networks. Every uploaded video is queued here and an
+in-process worker shells out to ffmpeg to produce:
+
+  * lower-bitrate MP4 renditions (only those smaller than the source; a
+    source that is already small, or can't be probed, gets none and keeps
+    being served as uploaded),
+  * an HLS master playlist whose variants are remuxed from those renditions,
+  * a poster thumbnail.
+
+Results live in `video_renditions` (keyed by the original upload URL) and are
+copied onto every content item whose `content_data.video_url` points at that
+upload. `best_video_url()` picks the URL to hand a given client.
+
+When ffmpeg isn't installed the queue is a no-op and the original file keeps
+being served.
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).parent.parent
+UPLOADS_DIR = ROOT_DIR / "uploads"
+RENDITIONS_DIR = UPLOADS_DIR / "videos" / "renditions"
+
+# Ordered low -> high. Bitrates are tuned for classroom Wi-Fi, not fidelity.
+RENDITIONS = [
+    {"name": "360p", "height": 360, "video_bitrate": 600, "audio_bitrate": 64},
+    {"name": "540p", "height": 540, "video_bitrate": 1200, "audio_bitrate": 96},
+    {"name": "720p", "height": 720, "video_bitrate": 2000, "audio_bitrate": 128},
+]
+HLS_SEGMENT_SECONDS = 6
+MEDIA_WORKERS = int(os.environ.get("MEDIA_WORKERS", "1"))
+
+# Database will be injected
+_db = None
+_queue: Optional[asyncio.Queue] = None
+_workers = []
+
+
+def init_db(database):
+    """Initialize database reference"""
+    global _db
+    _db = database
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+
+def _url_for(path: Path) -> str:
+    return "/api/uploads/" + path.relative_to(UPLOADS_DIR).as_posix()
+
+
+async def enqueue_video(file_path: Path, source_url: str) -> str:
+    """Queue an uploaded video for transcoding. Returns the job status that
+    the upload endpoint should report back."""
+    if not ffmpeg_available() or _queue is None:
+        return "unavailable"
+    now = datetime.now(timezone.utc).isoformat()
+    await _db.video_renditions.update_one(
+        {"source_url": source_url},
+        {"$set": {
+            "source_url": source_url,
+            "source_path": str(file_path),
+            "status": "queued",
+            "error": None,
+            "updated_at": now,
+        }, "$setOnInsert": {"created_at": now}},
+        upsert=True,
+    )
+    await _queue.put((Path(file_path), source_url))
+    return "queued"
+
+
+async def start_workers():
+    """Start the worker tasks and re-queue jobs interrupted by a restart."""
+    global _queue
+    if not ffmpeg_available():
+        logger.info("ffmpeg not found - video transcoding disabled")
+        return
+    _queue = asyncio.Queue()
+    for i in range(max(1, MEDIA_WORKERS)):
+        _workers.append(asyncio.create_task(_worker(i)))
+    pending = await _db.video_renditions.find(
+        {"status": {"$in": ["queued", "processing"]}}, {"_id": 0, "source_url": 1, "source_path": 1}
+    ).to_list(500)
+    for job in pending:
+        await _queue.put((Path(job["source_path"]), job["source_url"]))
+    logger.info(f"Media pipeline started: {len(_workers)} worker(s), {len(pending)} job(s) resumed")
+
+
+async def stop_workers():
+    for task in _workers:
+        task.cancel()
+    _workers.clear()
+
+
+async def _worker(worker_id: int):
+    while True:
+        file_path, source_url = await _queue.get()
+        try:
+            await _transcode(file_path, source_url)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Transcode failed for {source_url}: {e}")
+            await _db.video_renditions.update_one(
+                {"source_url": source_url},
+                {"$set": {"status": "failed", "error": str(e)[:500],
+                          "updated_at": datetime.now(timezone.utc).isoformat()}}
+            )
+        finally:
+            _queue.task_done()
+
+
+async def _run(*args: str) -> bytes:
+    proc = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"{args[0]} exited {proc.returncode}: {stderr.decode(errors='ignore')[-300:]}")
+    return stdout
+
+
+async def _probe_video(file_path: Path) -> Optional[dict]:
+    """width / height / H.264 level of the first video stream, or None."""
+    try:
+        out = await _run(
+            "ffprobe", "-v", "error", "-select_streams", "v:0",
+            "-show_entries", "stream=width,height,level", "-of", "json", str(file_path)
+        )
+        streams = json.loads(out or b"{}").get("streams") or []
+    except (RuntimeError, ValueError) as e:
+        logger.warning(f"ffprobe failed for {file_path}: {e}")
+        return None
+    if not streams or not streams[0].get("height"):
+        return None
+    return streams[0]
+
+
+def _short_side(stream: dict) -> int:
+    """Shorter frame dimension — the "p" in 720p for portrait phone videos too."""
+    return min(stream.get("width") or stream["height"], stream["height"])
+
+
+def _codecs(stream: Optional[dict]) -> str:
+    """RFC 6381 codecs string for our libx264 main-profile + AAC-LC output."""
+    level = (stream or {}).get("level") or 31
+    return f"avc1.4d40{int(level):02x},mp4a.40.2"
+
+
+async def _transcode(file_path: Path, source_url: str):
+    if not file_path.exists():
+        raise RuntimeError("source file missing")
+    await _db.video_renditions.update_one(
+        {"source_url": source_url},
+        {"$set": {"status": "processing", "updated_at": datetime.now(timezone.utc).isoformat()}}
+    )
+
+    out_dir = RENDITIONS_DIR / file_path.stem
+    # Fixed-name sources (walkthrough videos) are re-uploaded in place
+    shutil.rmtree(out_dir, ignore_errors=True)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    source = await _probe_video(file_path)
+    source_height = _short_side(source) if source else 0
+    # Never upscale: only renditions smaller than the source
+    targets = [r for r in RENDITIONS if r["height"] < source_height]
+
+    renditions = []
+    for r in targets:
+        mp4_path = out_dir / f"{r['name']}.mp4"
+        await _run(
+            "ffmpeg", "-y", "-v", "error", "-i", str(file_path),
+            # Scale the shorter side so portrait uploads aren't squashed
+            "-vf", f"scale='if(gt(iw,ih),-2,{r['height']})':'if(gt(iw,ih),{r['height']},-2)'",
+            "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "main",
+            "-b:v", f"{r['video_bitrate']}k", "-maxrate", f"{int(r['video_bitrate'] * 1.5)}k",
+            "-bufsize", f"{r['video_bitrate'] * 2}k",
+            "-c:a", "aac", "-b:a", f"{r['audio_bitrate']}k",
+            "-movflags", "+faststart", str(mp4_path),
+        )
+        # HLS variant is a cheap remux of the MP4 we just encoded
+        hls_dir = out_dir / f"hls_{r['name']}"
+        hls_dir.mkdir(exist_ok=True)
+        await _run(
+            "ffmpeg", "-y", "-v", "error", "-i", str(mp4_path), "-c", "copy",
+            "-f", "hls", "-hls_time", str(HLS_SEGMENT_SECONDS), "-hls_playlist_type", "vod",
+            "-hls_segment_filename", str(hls_dir / "seg_%03d.ts"), str(hls_dir / "index.m3u8"),
+        )
+        encoded = await _probe_video(mp4_path)
+        renditions.append({
+            "name": r["name"],
+            "height": r["height"],
+            "bitrate_kbps": r["video_bitrate"] + r["audio_bitrate"],
+            "url": _url_for(mp4_path),
+            "hls_playlist": f"hls_{r['name']}/index.m3u8",
+            "resolution": f"{encoded['width']}x{encoded['height']}" if encoded else None,
+            "codecs": _codecs(encoded),
+        })
+
+    hls_url = None
+    if renditions:
+        master = ["#EXTM3U", "#EXT-X-VERSION:3"]
+        for r in renditions:
+            attributes = f"BANDWIDTH={r['bitrate_kbps'] * 1000}"
+            resolution = r.pop("resolution")
+            if resolution:
+                attributes += f",RESOLUTION={resolution}"
+            attributes += f',CODECS="{r.pop("codecs")}"'
+            master.append(f"#EXT-X-STREAM-INF:{attributes}")
+            master.append(r.pop("hls_playlist"))
+        master_path = out_dir / "master.m3u8"
+        master_path.write_text("\n".join(master) + "\n")
+        hls_url = _url_for(master_path)
+
+    poster_path = out_dir / "poster.jpg"
+    await _run(
+        "ffmpeg", "-y", "-v", "error", "-ss", "1", "-i", str(file_path),
+        "-frames:v", "1", "-vf", "scale='if(gt(iw,ih),-2,480)':'if(gt(iw,ih),480,-2)'", str(poster_path),
+    )
+
+    payload = {
+        "status": "ready",
+        "source_height": source_height,
+        "renditions": renditions,
+        "hls_url": hls_url,
+        "poster_url": _url_for(poster_path),
+    }
+    now = datetime.now(timezone.utc).isoformat()
+    await _db.video_renditions.update_one(
+        {"source_url": source_url},
+        {"$set": {**payload, "updated_at": now}}
+    )
+    await _db.content_items.update_many(
+        {"content_data.video_url": source_url},
+        {"$set": {"content_data.video_renditions": payload}}
+    )
+    logger.info(f"Transcoded {source_url}: {[r['name'] for r in renditions]}")
+
+
+async def get_renditions(source_url: str) -> Optional[dict]:
+    """Ready renditions for an upload URL, or None."""
+    if not source_url or not source_url.startswith("/api/uploads/videos/"):
+        return None
+    doc = await _db.video_renditions.find_one(
+        {"source_url": source_url, "status": "ready"},
+        {"_id": 0, "status": 1, "source_height": 1, "renditions": 1, "hls_url": 1, "poster_url": 1}
+    )
+    return doc
+
+
+async def get_job(source_url: str) -> Optional[dict]:
+    """Job document (any status) for an upload URL."""
+    return await _db.video_renditions.find_one(
+        {"source_url": source_url}, {"_id": 0, "source_path": 0}
+    )
+
+
+# Effective connection types (Network Information client hints) that should
+# get the smallest rendition regardless of anything else.
+_SLOW_ECT = {"slow-2g", "2g", "3g"}
+
+
+def best_video_url(source_url: str, renditions: Optional[dict], request=None) -> str:
+    """Pick the URL to play for this client.
+
+    - `?video=hls` (or an Accept header that asks for HLS) -> the master playlist
+    - `Save-Data: on` or a slow ECT hint -> the smallest rendition
+    - a `Downlink` hint (Mbps) -> the largest rendition that fits in ~70% of it
+    - otherwise the highest rendition (still far smaller than a raw upload)
+    Falls back to the original upload when nothing has been transcoded.
+    """
+    if not renditions or renditions.get("status") != "ready" or not renditions.get("renditions"):
+        return source_url
+    variants = renditions["renditions"]
+    if request is None:
+        return variants[-1]["url"]
+
+    headers = request.headers
+    if request.query_params.get("video") == "hls" or "mpegurl" in headers.get("accept", "").lower():
+        return renditions.get("hls_url") or variants[-1]["url"]
+    if headers.get("save-data", "").lower() == "on" or headers.get("ect", "").lower() in _SLOW_ECT:
+        return variants[0]["url"]
+    downlink = headers.get("downlink")
+    if downlink:
+        try:
+            budget_kbps = float(downlink) * 1000 * 0.7
+        except ValueError:
+            budget_kbps = None
+        if budget_kbps is not None:
+            fitting = [v for v in variants if v["bitrate_kbps"] <= budget_kbps]
+            return (fitting[-1] if fitting else variants[0])["url"]
+    return variants[-1]["url"]
+
+
+def apply_best_video(item: dict, request) -> dict:
+    """Point a content item's `content_data.video_url` at the best rendition
+    for this client. The original upload stays available as
+    `content_data.original_video_url`."""
+    data = item.get("content_data") or {}
+    renditions = data.get("video_renditions")
+    source_url = data.get("video_url")
+    if not renditions or not source_url:
+        return item
+    best = best_video_url(source_url, renditions, request)
+    if best != source_url:
+        data["original_video_url"] = source_url
+        data["video_url"] = best
+        data["poster_url"] = renditions.get("poster_url")
+    return item
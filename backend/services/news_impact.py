@@ -0,0 +1,145 @@
+"""Applying stock news to prices.
+
+A news item moves prices by `impact` percent, either for one stock
+(`stock_id`) or for every active stock in a category (`category_id`).
+
+  * `apply_news()` first claims the item with a conditional flag flip
+    (`applied` false -> true in one `find_one_and_update`), so two admins —
+    or an admin and the scheduler — can never apply it twice. All target
+    stocks are then moved with one batch of `stock_repository` ticks, each a
+    compare-and-set on the price that was read, so a fluctuation landing in
+    between is never overwritten: stocks that moved are re-read and retried.
+    Daily history and candles follow for the stocks that moved, and the
+    market snapshot is republished. The claim is released only if no stock
+    price was written, so a failed item can be retried without applying
+    twice.
+  * News can instead be scheduled for a fluctuation session
+    (`scheduled_session`, optionally `scheduled_date`); the fluctuation job
+    calls `apply_scheduled()` right after its own tick.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from services import market_snapshot, stock_repository
+
+logger = logging.getLogger(__name__)
+
+SESSIONS = ("opening", "midday", "closing")
+WRITE_ATTEMPTS = 3
+
+
+class NewsAlreadyAppliedError(Exception):
+    pass
+
+
+def impacted_price(current: float, impact: float) -> float:
+    return round(max(1, current * (1 + impact / 100)), 2)
+
+
+async def _targets(db, news: dict) -> List[dict]:
+    if news.get("stock_id"):
+        stock = await stock_repository.get_stock(db, news["stock_id"])
+        return [stock] if stock else []
+    if news.get("category_id"):
+        return await stock_repository.list_stocks(db, {"category_id": news["category_id"], "is_active": True})
+    return []
+
+
+async def apply_news(db, news_id: str, publish: bool = True, source: str = "admin") -> Optional[dict]:
+    """Apply one news item. Returns the claimed news document with its
+    `price_changes`, None if it doesn't exist; raises NewsAlreadyAppliedError."""
+    now = datetime.now(timezone.utc)
+    news = await db.stock_news.find_one_and_update(
+        {"news_id": news_id, "applied": {"$ne": True}},
+        {"$set": {"applied": True, "applied_at": now.isoformat(), "applied_by": source}},
+        projection={"_id": 0},
+    )
+    if news is None:
+        if await db.stock_news.count_documents({"news_id": news_id}, limit=1):
+            raise NewsAlreadyAppliedError(news_id)
+        return None
+
+    impact = news.get("impact", 0) or 0
+    day = now.strftime("%Y-%m-%d")
+    changes = {}
+    landed = []
+    try:
+        stocks = await _targets(db, news)
+        for _ in range(WRITE_ATTEMPTS):
+            if not stocks:
+                break
+            ticks = {
+                stock["stock_id"]: stock_repository.price_tick(
+                    stock["stock_id"], impacted_price(stock["current_price"], impact), day,
+                    stock["current_price"], expect_price=stock["current_price"], last_news_id=news_id
+                )
+                for stock in stocks
+            }
+            error = None
+            try:
+                matched = await stock_repository.write_prices(db, list(ticks.values()))
+            except Exception as e:
+                error, matched = e, None
+            if matched == len(ticks):
+                done = list(ticks)
+            else:
+                # A price moved since it was read, or the write failed part way
+                done = [s["stock_id"] for s in await stock_repository.list_stocks(
+                    db, {"stock_id": {"$in": list(ticks)}, "last_news_id": news_id}
+                )]
+            for stock_id in done:
+                tick = ticks[stock_id]
+                changes[stock_id] = [tick["tick"]["open"], tick["tick"]["price"]]
+                landed.append(tick)
+            if error:
+                raise error
+            missed = [stock_id for stock_id in ticks if stock_id not in done]
+            stocks = await stock_repository.list_stocks(db, {"stock_id": {"$in": missed}}) if missed else []
+        if stocks:
+            logger.warning(f"News {news_id}: {len(stocks)} stocks kept moving and were left unchanged")
+    except Exception:
+        if changes:
+            # Some prices moved: keep the claim, record what was applied
+            await db.stock_news.update_one({"news_id": news_id}, {"$set": {"price_changes": changes}})
+        else:
+            await db.stock_news.update_one(
+                {"news_id": news_id},
+                {"$set": {"applied": False}, "$unset": {"applied_at": "", "applied_by": ""}}
+            )
+        raise
+
+    try:
+        await stock_repository.record_history(db, landed)
+    except Exception as e:
+        logger.error(f"News {news_id}: price history write failed: {e}")
+    await db.stock_news.update_one({"news_id": news_id}, {"$set": {"price_changes": changes}})
+    if publish and changes:
+        await market_snapshot.publish_change(db, f"news:{news_id}")
+    logger.info(f"News {news_id} ({impact:+}%) applied to {len(changes)} stocks by {source}")
+    return {**news, "price_changes": changes}
+
+
+async def apply_scheduled(db, session_name: str) -> int:
+    """Apply the news due at this session; the caller publishes the market
+    change. Returns how many items were applied."""
+    today = market_snapshot.today_ist()
+    due = await db.stock_news.find(
+        {
+            "applied": {"$ne": True},
+            "is_active": {"$ne": False},
+            "scheduled_session": session_name,
+            "$or": [{"scheduled_date": None}, {"scheduled_date": {"$lte": today}}],
+        },
+        {"_id": 0, "news_id": 1}
+    ).sort("created_at", 1).to_list(None)
+    applied = 0
+    for item in due:
+        try:
+            if await apply_news(db, item["news_id"], publish=False, source=f"session:{session_name}"):
+                applied += 1
+        except NewsAlreadyAppliedError:
+            pass
+        except Exception as e:
+            logger.error(f"Scheduled news {item['news_id']} failed: {e}")
+    return applied
@@ -0,0 +1,368 @@
+"""Batched order book for stock trading (optional market mode).
+
+Normally every buy / sell executes immediately (`trade_executor`), which
+concentrates writes into the minutes after the opening bell. With the order
+book enabled (admin setting `stock_order_book` in `site_settings`) trades
+become orders that settle together, the way a real exchange runs its
+opening call auction:
+
+  * `place_order()` reserves what the order needs right away — a buy
+    debits `quantity x limit price` from the investing wallet (the limit
+    defaults to the current price plus `buy_buffer_percent`), a sell takes
+    the shares out of the holding — and queues a `pending` order in
+    `stock_orders`. Reservations can't overdraw, so settlement never has
+    to reject for lack of funds and needs no per-order reads.
+  * `settle()` claims the pending orders in batches and fills them all at
+    the batch price (the current market price): a buy above its limit or a
+    sell below its limit is rejected and its reservation returned. Each
+    batch is four bulk writes — wallet refunds/credits, holding upserts,
+    ledger rows (`trade_executor.write_ledger`) and order statuses — in a
+    transaction where available. It runs after every fluctuation tick and,
+    if `cadence_minutes` is set, from the minute scheduler job
+    (`settle_due()`).
+  * Pending orders can be cancelled by their owner; clients follow the
+    status of their orders with `list_orders()` / `get_order()`.
+"""
+import logging
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from services import classroom_stats, market_snapshot, trade_executor, wallet_sources
+from services.trade_executor import TradeError
+
+logger = logging.getLogger(__name__)
+
+SETTINGS_KEY = "stock_order_book"
+DEFAULT_SETTINGS = {"enabled": False, "cadence_minutes": 0, "buy_buffer_percent": 5}
+SETTINGS_TTL = 30  # seconds
+SETTLE_BATCH = 500
+STATUSES = ("pending", "settling", "filled", "rejected", "cancelled")
+
+_settings: Optional[dict] = None
+_settings_at = 0.0
+_last_settled = 0.0
+
+
+async def ensure_indexes(db):
+    await db.stock_orders.create_index("order_id", unique=True)
+    await db.stock_orders.create_index([("status", 1), ("created_at", 1)])
+    await db.stock_orders.create_index([("user_id", 1), ("created_at", -1)])
+    await db.stock_orders.create_index(
+        [("user_id", 1), ("idempotency_key", 1)], unique=True,
+        partialFilterExpression={"idempotency_key": {"$type": "string"}}
+    )
+
+
+async def get_settings(db) -> dict:
+    global _settings, _settings_at
+    if _settings is None or time.monotonic() - _settings_at > SETTINGS_TTL:
+        stored = await db.site_settings.find_one({"key": SETTINGS_KEY}, {"_id": 0, "key": 0}) or {}
+        _settings = {**DEFAULT_SETTINGS, **{k: stored[k] for k in DEFAULT_SETTINGS if k in stored}}
+        _settings_at = time.monotonic()
+    return _settings
+
+
+async def update_settings(db, changes: dict) -> dict:
+    global _settings
+    values = {}
+    if "enabled" in changes:
+        values["enabled"] = bool(changes["enabled"])
+    for field in ("cadence_minutes", "buy_buffer_percent"):
+        if field in changes:
+            value = changes[field]
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+                raise TradeError(400, f"{field} must be a non-negative number")
+            values[field] = value
+    await db.site_settings.update_one(
+        {"key": SETTINGS_KEY},
+        {"$set": {**values, "key": SETTINGS_KEY, "updated_at": datetime.now(timezone.utc).isoformat()}},
+        upsert=True
+    )
+    _settings = None
+    return await get_settings(db)
+
+
+async def is_enabled(db) -> bool:
+    return (await get_settings(db))["enabled"]
+
+
+async def place_order(db, user_id: str, side: str, stock: dict, quantity,
+                      limit_price=None, idempotency_key: Optional[str] = None) -> dict:
+    """Reserve funds / shares and queue an order for the next settlement."""
+    trade_executor.check_quantity(quantity)
+    if limit_price is not None and (not isinstance(limit_price, (int, float)) or limit_price <= 0):
+        raise TradeError(400, "Limit price must be a positive number")
+    if idempotency_key:
+        existing = await db.stock_orders.find_one({"user_id": user_id, "idempotency_key": idempotency_key}, {"_id": 0})
+        if existing:
+            trade_executor.check_replay(existing, side, stock["stock_id"], quantity)
+            return {**existing, "replayed": True}
+
+    now = datetime.now(timezone.utc).isoformat()
+    order = {
+        "order_id": f"ord_{uuid.uuid4().hex[:12]}",
+        "user_id": user_id,
+        "side": side,
+        "stock_id": stock["stock_id"],
+        "stock_name": stock.get("name", stock["stock_id"]),
+        "quantity": quantity,
+        "quoted_price": stock["current_price"],
+        "limit_price": limit_price,
+        "status": "pending",
+        "created_at": now,
+    }
+    if idempotency_key:
+        order["idempotency_key"] = idempotency_key
+
+    if side == "buy":
+        if limit_price is None:
+            buffer = (await get_settings(db))["buy_buffer_percent"]
+            order["limit_price"] = round(stock["current_price"] * (1 + buffer / 100), 2)
+        order["reserved"] = round(order["limit_price"] * quantity, 2)
+        debited = await wallet_sources.update_wallet(
+            db,
+            {"user_id": user_id, "account_type": "investing", "balance": {"$gte": order["reserved"]}},
+            {"$inc": {"balance": -order["reserved"]}}
+        )
+        if not debited.modified_count:
+            raise TradeError(400, f"Insufficient balance in investing account (₹{order['reserved']} is held until the order settles)")
+    else:
+        taken = await trade_executor.take_shares(db, user_id, stock["stock_id"], quantity, now)
+        if taken is None:
+            raise TradeError(400, "Insufficient shares")
+        order["cost_basis"] = taken[0]
+
+    try:
+        await db.stock_orders.insert_one(order)
+    except DuplicateKeyError:
+        # Same idempotency key placed concurrently: keep the first order
+        await _release(db, [order])
+        existing = await db.stock_orders.find_one({"user_id": user_id, "idempotency_key": idempotency_key}, {"_id": 0})
+        return {**existing, "replayed": True}
+    except Exception:
+        await _release(db, [order])
+        raise
+    order.pop("_id", None)
+    classroom_stats.invalidate_student(user_id)
+    return order
+
+
+def _release_ops(order: dict, now: str, wallets: dict, holdings: list):
+    """Give back what an unfilled order reserved."""
+    if order["side"] == "buy":
+        wallets[order["user_id"]] += order["reserved"]
+    else:
+        holdings.append(trade_executor.holding_inc(
+            order["user_id"], order["stock_id"], order["quantity"], order.get("cost_basis", 0), now
+        ))
+
+
+async def _write(db, wallets: dict, holdings: list, session=None):
+    wallet_ops = [
+        UpdateOne({"user_id": user_id, "account_type": "investing"}, {"$inc": {"balance": round(amount, 2)}})
+        for user_id, amount in wallets.items() if amount
+    ]
+    if wallet_ops:
+        await db.wallet_accounts.bulk_write(wallet_ops, ordered=False, session=session)
+        classroom_stats.invalidate_student(*wallets)
+    if holdings:
+        await db.stock_holdings.bulk_write(holdings, ordered=False, session=session)
+
+
+async def _release(db, orders: List[dict]):
+    now = datetime.now(timezone.utc).isoformat()
+    wallets, holdings = defaultdict(float), []
+    for order in orders:
+        _release_ops(order, now, wallets, holdings)
+    await _write(db, wallets, holdings)
+
+
+async def cancel_order(db, user_id: str, order_id: str) -> Optional[dict]:
+    """Cancel a pending order and release its reservation. Returns None if
+    the order doesn't exist; raises TradeError once it is settling/settled."""
+    order = await db.stock_orders.find_one_and_update(
+        {"order_id": order_id, "user_id": user_id, "status": "pending"},
+        {"$set": {"status": "cancelled", "settled_at": datetime.now(timezone.utc).isoformat()}},
+        projection={"_id": 0},
+    )
+    if order is None:
+        existing = await db.stock_orders.find_one({"order_id": order_id, "user_id": user_id}, {"_id": 0, "status": 1})
+        if existing is None:
+            return None
+        raise TradeError(409, f"Order is already {existing['status']}")
+    await _release(db, [order])
+    classroom_stats.invalidate_student(user_id)
+    return {**order, "status": "cancelled"}
+
+
+async def get_order(db, user_id: str, order_id: str) -> Optional[dict]:
+    return await db.stock_orders.find_one({"order_id": order_id, "user_id": user_id}, {"_id": 0})
+
+
+async def list_orders(db, user_id: str, status: Optional[str] = None, limit: int = 50) -> List[dict]:
+    query = {"user_id": user_id}
+    if status:
+        query["status"] = status
+    return await db.stock_orders.find(query, {"_id": 0}).sort("created_at", -1).to_list(limit)
+
+
+def _fill(order: dict, price: Optional[float]) -> Optional[str]:
+    """Why `order` can't fill at `price`, or None if it can."""
+    if price is None:
+        return "Stock is no longer listed"
+    if order["side"] == "buy" and price > order["limit_price"]:
+        return f"Price ₹{price} rose above your limit of ₹{order['limit_price']}"
+    if order["side"] == "sell" and order.get("limit_price") and price < order["limit_price"]:
+        return f"Price ₹{price} fell below your limit of ₹{order['limit_price']}"
+    return None
+
+
+def settle_batch(orders: List[dict], prices: dict, batch_id: str, now: str) -> dict:
+    """Fill or reject a batch of orders in memory; returns the writes."""
+    wallets, holdings, trades, updates = defaultdict(float), [], [], []
+    sellers = set()
+    volume = defaultdict(lambda: {"price": None, "bought": 0, "sold": 0})
+    for order in orders:
+        price = prices.get(order["stock_id"])
+        reason = _fill(order, price)
+        if reason:
+            _release_ops(order, now, wallets, holdings)
+            updates.append(UpdateOne(
+                {"order_id": order["order_id"], "batch_id": batch_id},
+                {"$set": {"status": "rejected", "reason": reason, "settled_at": now}}
+            ))
+            continue
+
+        total = round(price * order["quantity"], 2)
+        trade = {
+            "trade_id": f"trade_{uuid.uuid4().hex[:12]}",
+            "order_id": order["order_id"],
+            "user_id": order["user_id"],
+            "side": order["side"],
+            "stock_id": order["stock_id"],
+            "stock_name": order["stock_name"],
+            "quantity": order["quantity"],
+            "price": price,
+            "total": total,
+            "created_at": now,
+        }
+        fill = {"status": "filled", "fill_price": price, "total": total, "trade_id": trade["trade_id"], "settled_at": now}
+        stats = volume[order["stock_id"]]
+        stats["price"] = price
+        if order["side"] == "buy":
+            wallets[order["user_id"]] += order["reserved"] - total
+            holdings.append(trade_executor.holding_inc(order["user_id"], order["stock_id"], order["quantity"], total, now))
+            stats["bought"] += order["quantity"]
+        else:
+            wallets[order["user_id"]] += total
+            sellers.add(order["user_id"])
+            trade["profit"] = fill["profit"] = round(total - order.get("cost_basis", 0), 2)
+            stats["sold"] += order["quantity"]
+        trades.append(trade)
+        updates.append(UpdateOne({"order_id": order["order_id"], "batch_id": batch_id}, {"$set": fill}))
+
+    for stats in volume.values():
+        # Shares that changed hands between classmates rather than with the market
+        stats["crossed"] = min(stats["bought"], stats["sold"])
+    return {
+        "wallets": wallets, "holdings": holdings, "trades": trades, "updates": updates,
+        "sellers": sellers, "volume": dict(volume),
+    }
+
+
+async def _apply(db, result: dict, session=None):
+    await _write(db, result["wallets"], result["holdings"], session)
+    if result["sellers"]:
+        await db.stock_holdings.delete_many(
+            {"user_id": {"$in": list(result["sellers"])}, "quantity": {"$lte": 0}}, session=session
+        )
+    await trade_executor.write_ledger(db, result["trades"], session)
+    if result["updates"]:
+        await db.stock_orders.bulk_write(result["updates"], ordered=False, session=session)
+
+
+async def _settle_one(db, reason: str) -> Optional[dict]:
+    pending = await db.stock_orders.find(
+        {"status": "pending"}, {"_id": 0, "order_id": 1}
+    ).sort("created_at", 1).to_list(SETTLE_BATCH)
+    if not pending:
+        return None
+    batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+    await db.stock_orders.update_many(
+        {"order_id": {"$in": [o["order_id"] for o in pending]}, "status": "pending"},
+        {"$set": {"status": "settling", "batch_id": batch_id}}
+    )
+    # Orders another worker claimed (or their owners cancelled) drop out here
+    orders = await db.stock_orders.find({"batch_id": batch_id}, {"_id": 0}).sort("created_at", 1).to_list(None)
+    if not orders:
+        return {"batch_id": batch_id, "orders": 0, "filled": 0, "rejected": 0}
+
+    snapshot = await market_snapshot.get_snapshot(db)
+    prices = {sid: stock.get("current_price") for sid, stock in snapshot.by_id.items()}
+    now = datetime.now(timezone.utc).isoformat()
+    result = settle_batch(orders, prices, batch_id, now)
+
+    transactional = await trade_executor.supports_transactions(db)
+    try:
+        if transactional:
+            async with await db.client.start_session() as session:
+                await session.with_transaction(lambda s: _apply(db, result, s))
+        else:
+            await _apply(db, result)
+    except Exception:
+        if transactional:
+            # Nothing was written; the orders go back in the queue
+            await db.stock_orders.update_many(
+                {"batch_id": batch_id, "status": "settling"},
+                {"$set": {"status": "pending"}, "$unset": {"batch_id": ""}}
+            )
+        # Otherwise part of the batch may be written: the orders stay
+        # `settling` (never settled twice) for an admin to look at
+        raise
+    classroom_stats.invalidate_student(*{o["user_id"] for o in orders})
+
+    summary = {
+        "batch_id": batch_id,
+        "reason": reason,
+        "orders": len(orders),
+        "filled": len(result["trades"]),
+        "rejected": len(orders) - len(result["trades"]),
+        "stocks": result["volume"],
+        "settled_at": now,
+    }
+    await db.stock_order_batches.insert_one(dict(summary))
+    return summary
+
+
+async def settle(db, reason: str = "manual") -> dict:
+    """Settle every pending order. Returns totals over all batches."""
+    global _last_settled
+    _last_settled = time.monotonic()
+    totals = {"batches": 0, "orders": 0, "filled": 0, "rejected": 0}
+    try:
+        while True:
+            summary = await _settle_one(db, reason)
+            if summary is None:
+                break
+            totals["batches"] += 1
+            for field in ("orders", "filled", "rejected"):
+                totals[field] += summary[field]
+    except Exception as e:
+        logger.error(f"Order settlement ({reason}) failed: {e}")
+        totals["error"] = str(e)
+    if totals["orders"]:
+        logger.info(f"Order settlement ({reason}): {totals['filled']} filled, {totals['rejected']} rejected")
+    return totals
+
+
+async def settle_due(db):
+    """Minute scheduler hook: settle if the configured cadence has elapsed."""
+    cadence = (await get_settings(db))["cadence_minutes"]
+    if cadence and time.monotonic() - _last_settled >= cadence * 60 - 1:
+        await settle(db, "cadence")
@@ -0,0 +1,167 @@
+"""Payment gateway adapter (Razorpay).
+
+The Razorpay SDK is synchronous (`requests` under the hood), so calling it
+from a route blocks the event loop for the whole gateway round trip. This
+module talks to the Razorpay REST API through one pooled `httpx.AsyncClient`
+with timeouts and retries instead. Order creation isn't idempotent, so it is
+only retried when the request provably never reached Razorpay (connect
+failures).
+
+`get_gateway()` returns the configured gateway:
+
+  * RazorpayGateway — when RAZORPAY_KEY_ID / RAZORPAY_KEY_SECRET are set
+  * FakeGateway     — when PAYMENT_GATEWAY=fake (local dev & tests); orders
+                      are kept in memory and `sign_payment()` produces valid
+                      checkout / webhook signatures
+  * None            — payments not configured
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import uuid
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+RAZORPAY_API = "https://api.razorpay.com/v1"
+REQUEST_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5  # seconds, doubled per attempt
+
+
+class PaymentGatewayError(Exception):
+    """Gateway rejected the request or stayed unreachable after retries."""
+
+
+def _hmac_sha256(secret: str, message: bytes) -> str:
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+class RazorpayGateway:
+    name = "razorpay"
+
+    def __init__(self, key_id: str, key_secret: str, webhook_secret: Optional[str] = None):
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.webhook_secret = webhook_secret
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=RAZORPAY_API,
+                auth=(self.key_id, self.key_secret),
+                timeout=REQUEST_TIMEOUT,
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+            )
+        return self._client
+
+    async def _post(self, path: str, payload: dict, idempotent: bool = True) -> dict:
+        """POST with retries. Non-idempotent calls are retried only if the
+        connection was never established; a timeout or 5xx after sending may
+        already have taken effect."""
+        last_error = None
+        for attempt in range(MAX_RETRIES):
+            try:
+                response = await self._http().post(path, json=payload)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                last_error = e
+            except httpx.TransportError as e:
+                if not idempotent:
+                    raise PaymentGatewayError(str(e))
+                last_error = e
+            else:
+                if response.status_code < 500:
+                    if response.status_code >= 400:
+                        try:
+                            detail = response.json().get("error", {}).get("description") or response.text
+                        except ValueError:
+                            detail = response.text
+                        raise PaymentGatewayError(detail)
+                    try:
+                        return response.json()
+                    except ValueError:
+                        raise PaymentGatewayError(f"gateway returned a non-JSON {response.status_code} response")
+                last_error = PaymentGatewayError(f"gateway returned {response.status_code}")
+                if not idempotent:
+                    raise last_error
+            await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt))
+        raise PaymentGatewayError(str(last_error))
+
+    async def create_order(self, amount_paise: int, receipt: str, notes: dict) -> dict:
+        return await self._post("/orders", {
+            "amount": amount_paise,
+            "currency": "INR",
+            "receipt": receipt,
+            "payment_capture": 1,
+            "notes": notes,
+        }, idempotent=False)
+
+    def verify_payment_signature(self, order_id: str, payment_id: str, signature: str) -> bool:
+        expected = _hmac_sha256(self.key_secret, f"{order_id}|{payment_id}".encode())
+        return hmac.compare_digest(expected, signature or "")
+
+    def verify_webhook_signature(self, body: bytes, signature: str) -> bool:
+        if not self.webhook_secret:
+            return False
+        return hmac.compare_digest(_hmac_sha256(self.webhook_secret, body), signature or "")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class FakeGateway(RazorpayGateway):
+    """In-memory stand-in with the same interface. Signatures use fixed test
+    secrets so tests can produce valid ones via `sign_payment` / `sign_webhook`."""
+    name = "fake"
+
+    def __init__(self):
+        super().__init__("rzp_test_fake", "fake_secret", webhook_secret="fake_webhook_secret")
+        self.orders = {}
+
+    async def create_order(self, amount_paise: int, receipt: str, notes: dict) -> dict:
+        order = {
+            "id": f"order_fake{uuid.uuid4().hex[:12]}",
+            "amount": amount_paise,
+            "currency": "INR",
+            "receipt": receipt,
+            "notes": notes,
+            "status": "created",
+        }
+        self.orders[order["id"]] = order
+        return order
+
+    def sign_payment(self, order_id: str, payment_id: str) -> str:
+        return _hmac_sha256(self.key_secret, f"{order_id}|{payment_id}".encode())
+
+    def sign_webhook(self, body: bytes) -> str:
+        return _hmac_sha256(self.webhook_secret, body)
+
+
+_gateway = None
+
+
+def get_gateway():
+    """Configured gateway singleton (None when payments aren't configured)."""
+    global _gateway
+    if _gateway is None:
+        if os.environ.get("PAYMENT_GATEWAY") == "fake":
+            _gateway = FakeGateway()
+        elif os.environ.get("RAZORPAY_KEY_ID") and os.environ.get("RAZORPAY_KEY_SECRET"):
+            _gateway = RazorpayGateway(
+                os.environ["RAZORPAY_KEY_ID"],
+                os.environ["RAZORPAY_KEY_SECRET"],
+                webhook_secret=os.environ.get("RAZORPAY_WEBHOOK_SECRET"),
+            )
+    return _gateway
+
+
+async def close_gateway():
+    if _gateway is not None:
+        await _gateway.close()
@@ -0,0 +1,105 @@
+"""Stock portfolio valuation and daily portfolio snapshots.
+
+Portfolios were valued per request with a stock lookup per holding, the
+teacher / parent insights read a holdings collection (`user_stock_holdings`)
+that trading no longer writes, and nothing ever wrote the portfolio history.
+
+  * `valuate()` values the `stock_holdings` of many users (or everyone) in
+    one NumPy pass against the market snapshot: holdings become arrays and
+    per-user totals are `bincount`s over the user index.
+  * `snapshot_all()` runs after every fluctuation session and upserts one
+    `portfolio_snapshots` document per user and IST trading day with a
+    single `bulk_write` (the last session of the day wins; the first
+    valuation is kept as `opening_value`).
+  * `history()` serves the stored snapshots.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from pymongo import UpdateOne
+
+from services import market_snapshot
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_BATCH = 1000
+HOLDING_FIELDS = {"_id": 0, "user_id": 1, "stock_id": 1, "quantity": 1, "total_invested": 1}
+EMPTY = {"total_value": 0, "total_invested": 0, "profit_loss": 0, "profit_loss_percent": 0, "holdings_count": 0}
+
+
+def valuate_holdings(holdings: List[dict], prices: Dict[str, float]) -> Dict[str, dict]:
+    """user_id -> totals for a list of holdings, given current prices."""
+    if not holdings:
+        return {}
+    users, user_idx = np.unique([h["user_id"] for h in holdings], return_inverse=True)
+    stocks, stock_idx = np.unique([h["stock_id"] for h in holdings], return_inverse=True)
+    stock_price = np.array([prices.get(sid, 0) for sid in stocks], dtype=np.float64)
+    quantity = np.array([h.get("quantity") or 0 for h in holdings], dtype=np.float64)
+    invested = np.array([h.get("total_invested") or 0 for h in holdings], dtype=np.float64)
+
+    n = len(users)
+    value = np.bincount(user_idx, weights=quantity * stock_price[stock_idx], minlength=n)
+    cost = np.bincount(user_idx, weights=invested, minlength=n)
+    count = np.bincount(user_idx, weights=(quantity > 0).astype(np.float64), minlength=n)
+    profit = value - cost
+    percent = np.divide(profit * 100, cost, out=np.zeros(n), where=cost > 0)
+
+    return {
+        user_id: {
+            "total_value": round(float(value[i]), 2),
+            "total_invested": round(float(cost[i]), 2),
+            "profit_loss": round(float(profit[i]), 2),
+            "profit_loss_percent": round(float(percent[i]), 2),
+            "holdings_count": int(count[i]),
+        }
+        for i, user_id in enumerate(users.tolist())
+    }
+
+
+async def valuate(db, user_ids: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+    """Current portfolio totals per user (all users with holdings when
+    `user_ids` is None). Users without holdings are absent — use EMPTY."""
+    query = {} if user_ids is None else {"user_id": {"$in": list(user_ids)}}
+    holdings = await db.stock_holdings.find(query, HOLDING_FIELDS).to_list(None)
+    market = await market_snapshot.get_snapshot(db)
+    prices = {sid: stock.get("current_price", 0) for sid, stock in market.by_id.items()}
+    return valuate_holdings(holdings, prices)
+
+
+async def ensure_indexes(db):
+    await db.portfolio_snapshots.create_index([("user_id", 1), ("date", 1)], unique=True)
+
+
+async def snapshot_all(db, session_name: str = ""):
+    """Value every portfolio and upsert today's snapshot documents."""
+    try:
+        valuations = await valuate(db)
+        date = market_snapshot.today_ist()
+        now = datetime.now(timezone.utc).isoformat()
+        ops = [
+            UpdateOne(
+                {"user_id": user_id, "date": date},
+                {
+                    "$set": {**totals, "session": session_name, "updated_at": now},
+                    "$setOnInsert": {"opening_value": totals["total_value"], "created_at": now},
+                },
+                upsert=True
+            )
+            for user_id, totals in valuations.items()
+        ]
+        for start in range(0, len(ops), SNAPSHOT_BATCH):
+            await db.portfolio_snapshots.bulk_write(ops[start:start + SNAPSHOT_BATCH], ordered=False)
+        logger.info(f"Portfolio snapshots ({session_name or 'manual'}): {len(ops)} users valued")
+    except Exception as e:
+        logger.error(f"Portfolio snapshot run failed: {e}")
+
+
+async def history(db, user_id: str, days: int = 30) -> List[dict]:
+    """Daily snapshots for the last `days` days, oldest first."""
+    since = (datetime.now(market_snapshot.IST) - timedelta(days=days)).strftime("%Y-%m-%d")
+    return await db.portfolio_snapshots.find(
+        {"user_id": user_id, "date": {"$gt": since}},
+        {"_id": 0}
+    ).sort("date", 1).to_list(days + 1)
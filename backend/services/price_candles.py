@@ -0,0 +1,257 @@
+"""OHLC candle store and downsampled stock charts.
+
+Price data used to live in three places: the embedded `price_history` on
+each stock (capped at 30 entries), daily `stock_price_history` rows and the
+old `price_history` collection, so "90d" / "all" charts showed whatever
+happened to be there. Now every price change written by
+`stock_repository.apply_ticks()` also lands here:
+
+  * `stock_ticks` — one document per tick (`ts`, `stock_id`, `price`). This
+    is a MongoDB time-series collection when the server supports it (5.0+),
+    otherwise a regular collection with a (stock_id, ts) index.
+  * `stock_candles` — rolled-up OHLC per stock and interval ("1d", "1w"),
+    keyed by `period_start` (YYYY-MM-DD, Monday for weeks) and maintained
+    with one upsert per tick and interval ($setOnInsert open, $max/$min,
+    $set close), batched in one `bulk_write` per fluctuation session.
+
+`chart()` picks a source by period length (ticks, daily or weekly candles)
+and downsamples the closes with Largest-Triangle-Three-Buckets, so the
+payload has at most `points` entries however long the history is.
+
+`ensure_candle_store()` backfills the candles from `stock_price_history`
+once (recorded in `migrations`), for the days before each stock's first
+live candle.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List
+
+import numpy as np
+from pymongo import UpdateOne
+from pymongo.errors import CollectionInvalid, DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+TICK_RETENTION_DAYS = 400
+CHART_POINTS = 60
+MAX_CHART_POINTS = 200
+INTERVALS = ("1d", "1w")
+# period -> days covered (None = all history)
+PERIODS = {"1d": 1, "5d": 5, "7d": 7, "30d": 30, "90d": 90, "1y": 365, "all": None}
+TICKS_UP_TO_DAYS = 5
+DAILY_UP_TO_DAYS = 180
+BACKFILL_BATCH = 500
+MIGRATION_ID = "stock_candles_backfill"
+
+
+def period_start(day: str, interval: str) -> str:
+    if interval == "1w":
+        d = datetime.strptime(day, "%Y-%m-%d")
+        return (d - timedelta(days=d.weekday())).strftime("%Y-%m-%d")
+    return day
+
+
+def nearest_period(days: int) -> str:
+    """The PERIODS key closest to `days` (for clients that pass a day
+    count); beyond a year that is "all"."""
+    if days > PERIODS["1y"]:
+        return "all"
+    finite = {p: d for p, d in PERIODS.items() if d is not None}
+    return min(finite, key=lambda p: abs(finite[p] - days))
+
+
+def candle_ops(stock_id: str, day: str, open_price: float, high: float, low: float,
+               close: float, now: str, ticks: int = 1) -> List[UpdateOne]:
+    """Upserts folding one tick (or a day's OHLC) into each interval."""
+    return [
+        UpdateOne(
+            {"stock_id": stock_id, "interval": interval, "period_start": period_start(day, interval)},
+            {
+                "$setOnInsert": {"open": open_price},
+                "$max": {"high": high},
+                "$min": {"low": low},
+                "$set": {"close": close, "updated_at": now},
+                "$inc": {"ticks": ticks},
+            },
+            upsert=True
+        )
+        for interval in INTERVALS
+    ]
+
+
+async def record_ticks(db, ticks: Iterable[dict]):
+    """Store ticks ({"stock_id", "price", "open", "day", "ts"}) and fold
+    them into the candles."""
+    ticks = list(ticks)
+    if not ticks:
+        return
+    try:
+        now = datetime.now(timezone.utc).isoformat()
+        ops = []
+        for t in ticks:
+            ops.extend(candle_ops(
+                t["stock_id"], t["day"], t["open"],
+                max(t["open"], t["price"]), min(t["open"], t["price"]), t["price"], now
+            ))
+        await db.stock_ticks.insert_many(
+            [{"ts": t["ts"], "stock_id": t["stock_id"], "price": t["price"]} for t in ticks],
+            ordered=False
+        )
+        await db.stock_candles.bulk_write(ops, ordered=False)
+    except Exception as e:
+        logger.error(f"Recording {len(ticks)} price ticks failed: {e}")
+
+
+async def ensure_candle_store(db):
+    """Create the tick collection (time-series when available) and candle
+    index, and backfill candles from `stock_price_history` once."""
+    try:
+        await db.create_collection(
+            "stock_ticks",
+            timeseries={"timeField": "ts", "metaField": "stock_id", "granularity": "hours"},
+            expireAfterSeconds=TICK_RETENTION_DAYS * 86400,
+        )
+        logger.info("Created stock_ticks time-series collection")
+    except CollectionInvalid:
+        pass
+    except OperationFailure as e:
+        if e.code != 48:  # NamespaceExists
+            logger.warning(f"Time-series collections unavailable ({e}); using a regular stock_ticks collection")
+            await db.stock_ticks.create_index([("stock_id", 1), ("ts", 1)])
+            await db.stock_ticks.create_index("ts", expireAfterSeconds=TICK_RETENTION_DAYS * 86400)
+    await db.stock_candles.create_index(
+        [("stock_id", 1), ("interval", 1), ("period_start", 1)], unique=True
+    )
+    try:
+        # The marker is claimed atomically, so one worker runs the backfill
+        await db.migrations.insert_one({
+            "_id": MIGRATION_ID, "status": "running",
+            "started_at": datetime.now(timezone.utc).isoformat(),
+        })
+    except DuplicateKeyError:
+        return
+
+    ops = []
+    written = 0
+    now = datetime.now(timezone.utc).isoformat()
+    try:
+        # Live ticks may already have started candles: only days before a
+        # stock's first live candle are backfilled
+        first_live = {}
+        async for row in db.stock_candles.aggregate([
+            # Backfilled candles have ticks 0, so a re-run sees the same cutoffs
+            {"$match": {"interval": "1d", "ticks": {"$gt": 0}}},
+            {"$group": {"_id": "$stock_id", "first": {"$min": "$period_start"}}},
+        ]):
+            first_live[row["_id"]] = row["first"]
+
+        # Older simulate-day rows used open/high/low/close instead of *_price
+        async for row in db.stock_price_history.find({}, {"_id": 0}).sort("date", 1):
+            close = row.get("close_price", row.get("close"))
+            if not row.get("stock_id") or not row.get("date") or close is None:
+                continue
+            day = row["date"][:10]
+            cutoff = first_live.get(row["stock_id"])
+            if cutoff and day >= cutoff:
+                continue
+            open_price = row.get("open_price", row.get("open", close))
+            high = row.get("high_price", row.get("high", max(open_price, close)))
+            low = row.get("low_price", row.get("low", min(open_price, close)))
+            day_ops = candle_ops(row["stock_id"], day, open_price, high, low, close, now, ticks=0)
+            if cutoff and period_start(day, "1w") == period_start(cutoff, "1w"):
+                # The live weekly candle already has this week's open and
+                # (later) close; only widen its range
+                day_ops[INTERVALS.index("1w")] = UpdateOne(
+                    {"stock_id": row["stock_id"], "interval": "1w", "period_start": period_start(day, "1w")},
+                    {"$max": {"high": high}, "$min": {"low": low}}
+                )
+            ops.extend(day_ops)
+            if len(ops) >= BACKFILL_BATCH:
+                await db.stock_candles.bulk_write(ops)
+                written += len(ops)
+                ops = []
+        if ops:
+            await db.stock_candles.bulk_write(ops)
+            written += len(ops)
+        await db.migrations.update_one(
+            {"_id": MIGRATION_ID},
+            {"$set": {"status": "done", "completed_at": datetime.now(timezone.utc).isoformat(), "candle_updates": written}}
+        )
+        if written:
+            logger.info(f"Candle store backfilled from stock_price_history: {written} candle updates")
+    except Exception as e:
+        # Re-running replays the same history rows into the same candles
+        await db.migrations.delete_one({"_id": MIGRATION_ID})
+        logger.error(f"Candle backfill failed: {e}")
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the points kept by Largest-Triangle-Three-Buckets (first
+    and last always kept, one point per bucket in between)."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    every = (n - 2) / (threshold - 2)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        nxt_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:nxt_end].mean()
+        avg_y = y[end:nxt_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+
+def _downsample(points: List[dict], limit: int) -> List[dict]:
+    if len(points) <= limit:
+        return points
+    x = np.arange(len(points), dtype=np.float64)
+    y = np.fromiter((p["c"] for p in points), dtype=np.float64, count=len(points))
+    return [points[i] for i in lttb(x, y, limit)]
+
+
+async def chart(db, stock_id: str, period: str = "30d", points: int = CHART_POINTS) -> dict:
+    """At most `points` OHLC points ({"t", "o", "h", "l", "c"}) covering
+    `period` (a key of PERIODS)."""
+    days = PERIODS[period]
+    points = max(3, min(points, MAX_CHART_POINTS))
+    now = datetime.now(timezone.utc)
+
+    if days is not None and days <= TICKS_UP_TO_DAYS:
+        interval = "tick"
+        ticks = await db.stock_ticks.find(
+            {"stock_id": stock_id, "ts": {"$gte": now - timedelta(days=days)}},
+            {"_id": 0, "ts": 1, "price": 1}
+        ).sort("ts", 1).to_list(None)
+        series = [
+            {"t": t["ts"].replace(tzinfo=timezone.utc).isoformat(), "o": t["price"],
+             "h": t["price"], "l": t["price"], "c": t["price"]}
+            for t in ticks
+        ]
+    else:
+        interval = "1d" if days is not None and days <= DAILY_UP_TO_DAYS else "1w"
+        query: Dict = {"stock_id": stock_id, "interval": interval}
+        if days is not None:
+            query["period_start"] = {"$gte": period_start((now - timedelta(days=days)).strftime("%Y-%m-%d"), interval)}
+        candles = await db.stock_candles.find(
+            query, {"_id": 0, "period_start": 1, "open": 1, "high": 1, "low": 1, "close": 1}
+        ).sort("period_start", 1).to_list(None)
+        series = [
+            {"t": c["period_start"], "o": c["open"], "h": c["high"], "l": c["low"], "c": c["close"]}
+            for c in candles
+        ]
+
+    return {
+        "stock_id": stock_id,
+        "period": period,
+        "interval": interval,
+        "total_points": len(series),
+        "data": _downsample(series, points),
+    }
@@ -0,0 +1,154 @@
+"""Live price push for the market screens.
+
+Market tabs used to poll `/stocks/list`, `/stocks/portfolio` and
+`/stocks/market-status` to notice the three daily ticks and admin news.
+Instead they can hold one server-sent-events stream (`/stocks/stream`):
+
+  * Whenever this worker swaps in a newer market snapshot, the change is
+    diffed against the previous one and a compact delta is fanned out to
+    every local subscriber queue:
+
+        {"v": <version>, "at": <iso time>,
+         "p": {stock_id: [price, daily_change_percent], ...},
+         "removed": [stock_id, ...]}
+
+  * Other workers learn about a change from a change stream on
+    `market_state` (replica sets), or — on a standalone server, where
+    change streams are unavailable — by checking the version every
+    POLL_INTERVAL seconds, only while they have subscribers.
+
+Deltas carry absolute prices, so slow clients never block the fan-out: a
+full queue folds its oldest message into the new one instead of growing.
+Each stream starts with a `hello` event holding every price.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Optional, Set
+
+from pymongo.errors import OperationFailure
+
+from services import market_snapshot
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 16
+POLL_INTERVAL = 5  # seconds, only without change streams
+HEARTBEAT_INTERVAL = 25  # seconds
+
+_subscribers: Set[asyncio.Queue] = set()
+_watcher: Optional[asyncio.Task] = None
+
+
+def price_map(snapshot: market_snapshot.MarketSnapshot) -> dict:
+    return {
+        sid: [stock.get("current_price", 0), snapshot.stats[sid].get("daily_change_percent", 0)]
+        for sid, stock in snapshot.by_id.items()
+    }
+
+
+def price_delta(old: market_snapshot.MarketSnapshot, new: market_snapshot.MarketSnapshot) -> Optional[dict]:
+    """Delta message between two snapshots, or None if no price changed."""
+    before, after = price_map(old), price_map(new)
+    changed = {sid: value for sid, value in after.items() if before.get(sid) != value}
+    removed = [sid for sid in before if sid not in after]
+    if not changed and not removed:
+        return None
+    message = {"v": new.version, "at": new.as_of, "p": changed}
+    if removed:
+        message["removed"] = removed
+    return message
+
+
+def _fold(older: dict, newer: dict) -> dict:
+    merged = {**newer, "p": {**older["p"], **newer["p"]}}
+    removed = set(older.get("removed", [])) - set(newer["p"]) | set(newer.get("removed", []))
+    for sid in removed:
+        merged["p"].pop(sid, None)
+    if removed:
+        merged["removed"] = sorted(removed)
+    return merged
+
+
+def publish(message: dict):
+    for queue in list(_subscribers):
+        item = message
+        if queue.full():
+            item = _fold(queue.get_nowait(), message)
+        queue.put_nowait(item)
+
+
+def _on_snapshot(old, new):
+    if old is None or not _subscribers:
+        return
+    message = price_delta(old, new)
+    if message:
+        publish(message)
+
+
+market_snapshot.add_listener(_on_snapshot)
+
+
+def subscribe() -> asyncio.Queue:
+    queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    _subscribers.add(queue)
+    return queue
+
+
+def unsubscribe(queue: asyncio.Queue):
+    _subscribers.discard(queue)
+
+
+def subscriber_count() -> int:
+    return len(_subscribers)
+
+
+async def hello(db) -> dict:
+    """First event of a stream: the full current price list."""
+    snapshot = await market_snapshot.get_snapshot(db)
+    return {"v": snapshot.version, "at": datetime.now(timezone.utc).isoformat(), "p": price_map(snapshot)}
+
+
+async def _watch_changes(db):
+    pipeline = [{"$match": {"documentKey._id": market_snapshot.STATE_ID}}]
+    async with db.market_state.watch(pipeline) as stream:
+        logger.info("Price feed following market_state change stream")
+        async for _ in stream:
+            await market_snapshot.refresh(db)
+
+
+async def _poll_versions(db):
+    logger.info(f"Price feed polling market_state every {POLL_INTERVAL}s (no change streams)")
+    while True:
+        await asyncio.sleep(POLL_INTERVAL)
+        if _subscribers:
+            try:
+                await market_snapshot.refresh(db)
+            except Exception as e:
+                logger.error(f"Price feed version check failed: {e}")
+
+
+async def _run(db):
+    try:
+        await _watch_changes(db)
+    except asyncio.CancelledError:
+        raise
+    except OperationFailure as e:
+        # Standalone servers don't support change streams
+        logger.info(f"Change streams unavailable ({e.code}); falling back to version polling")
+    except Exception as e:
+        logger.error(f"Price feed change stream stopped: {e}")
+    await _poll_versions(db)
+
+
+def start(db):
+    global _watcher
+    if _watcher is None or _watcher.done():
+        _watcher = asyncio.create_task(_run(db))
+
+
+async def stop():
+    global _watcher
+    if _watcher:
+        _watcher.cancel()
+        _watcher = None
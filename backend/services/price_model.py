@@ -0,0 +1,93 @@
+"""Stock price fluctuation models.
+
+The live jobs move prices by two different rules, kept as they are:
+
+  * "session" — each of the three daily fluctuation sessions:
+    `uniform(±volatility/3)` (volatility defaulting to 0.05), with only a
+    ₹1 floor; `trend` and the stock's price band are ignored;
+  * "gauss"   — the admin "simulate fluctuation" button:
+    `gauss(trend, volatility)` (volatility defaulting to 0.1), clamped to
+    `[min_price, max_price]` (defaulting to ₹1 and ₹1000).
+
+"session_band" is a candidate rule for the sessions that is not used live:
+`uniform(±volatility/3) + trend/3`, clamped to `[max(1, min_price),
+max_price]` (unbounded above without a `max_price`). The backtest
+(`market_backtest`) runs any of them, so the candidate can be compared with
+the rule in production before anyone switches.
+
+`step()` works on NumPy arrays (one row per simulated path in the
+backtest); `next_prices()` is the one-path helper the live jobs use.
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+
+MODELS = ("session", "gauss", "session_band")
+SESSION_MODELS = ("session", "session_band")
+SESSIONS_PER_DAY = 3
+# Volatility assumed when a stock has none (each live path's default)
+DEFAULT_VOLATILITY = {"session": 0.05, "gauss": 0.1, "session_band": 0.05}
+PRICE_FLOOR = 1.0
+GAUSS_MAX_PRICE = 1000.0
+
+_rng = np.random.default_rng()
+
+
+def _check(model: str):
+    if model not in MODELS:
+        raise ValueError(f"Unknown price model {model!r} (use one of {', '.join(MODELS)})")
+
+
+def params(stocks: List[dict], model: str = "session") -> Dict[str, np.ndarray]:
+    """Per-stock model parameters as arrays."""
+    _check(model)
+
+    def column(field, default):
+        return np.array([s.get(field) if s.get(field) is not None else default for s in stocks], dtype=np.float64)
+
+    n = len(stocks)
+    if model == "session":
+        floor, cap = np.full(n, PRICE_FLOOR), np.full(n, np.inf)
+    elif model == "gauss":
+        floor, cap = column("min_price", PRICE_FLOOR), column("max_price", GAUSS_MAX_PRICE)
+    else:
+        floor, cap = np.maximum(column("min_price", PRICE_FLOOR), PRICE_FLOOR), column("max_price", np.inf)
+    return {
+        "volatility": column("volatility", DEFAULT_VOLATILITY[model]),
+        "trend": column("trend", 0.0),
+        "floor": floor,
+        "cap": cap,
+    }
+
+
+def step(prices: np.ndarray, p: Dict[str, np.ndarray], model: str = "session",
+         rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """Move `prices` (shape (..., n_stocks)) by one fluctuation."""
+    _check(model)
+    rng = rng or _rng
+    if model == "gauss":
+        change = rng.standard_normal(prices.shape) * p["volatility"] + p["trend"]
+    else:
+        change = rng.uniform(-1.0, 1.0, prices.shape) * (p["volatility"] / SESSIONS_PER_DAY)
+        if model == "session_band":
+            change = change + p["trend"] / SESSIONS_PER_DAY
+    # Cap first, then floor: a floor above the cap wins, as in the admin rule
+    return np.round(np.maximum(np.minimum(prices * (1 + change), p["cap"]), p["floor"]), 2)
+
+
+def current_prices(stocks: List[dict], model: str = "session") -> np.ndarray:
+    """Starting prices; the sessions fall back to `base_price`, the admin
+    rule straight to ₹10."""
+    def price(s):
+        fallback = 10 if model == "gauss" else s.get("base_price", 10)
+        value = s.get("current_price", fallback)
+        return 10 if value is None else value
+
+    return np.array([price(s) for s in stocks], dtype=np.float64)
+
+
+def next_prices(stocks: List[dict], model: str = "session") -> List[float]:
+    """New price for every stock after one fluctuation."""
+    if not stocks:
+        return []
+    return step(current_prices(stocks, model), params(stocks, model), model).tolist()
@@ -0,0 +1,231 @@
+"""In-process search index for the teacher repository.
+
+Teachers browse `teacher_repository` while building quests; the route used
+to load every matching document and filter with unanchored regexes over
+title and description. The collection is small (hundreds to low thousands
+of items, growing weekly), so an in-memory inverted index is both faster
+and able to rank:
+
+  * title, tags and description are tokenized into a term -> {item: weight}
+    posting map (title 3x, tags 2x, description 1x), scored tf-idf style;
+  * tokens are Unicode word runs (`\\w+`, casefolded), so Hindi and other
+    non-Latin titles index and search like English ones;
+  * the last query token also matches as a prefix, so results update
+    sensibly while the teacher is still typing, and a token with no exact
+    or prefix hit falls back to terms containing it (the old regex search
+    found partial words anywhere in a title);
+  * results are ordered by (score desc, created_at desc, item_id) and paged
+    with an opaque keyset cursor over that ordering;
+  * facet counts by topic, grade and file type are computed over the
+    filtered results, each ignoring its own filter.
+
+The built index is cached per worker by `snapshot_cache.SnapshotCache`
+and dropped by `invalidate()` after repository writes.
+"""
+import base64
+import bisect
+import json
+import math
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from services.snapshot_cache import SnapshotCache
+
+REBUILD_TTL = 120  # seconds
+FIELD_WEIGHTS = {"title": 3.0, "tags": 2.0, "description": 1.0}
+GRADES = range(0, 6)  # K=0, 1-5
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall((text or "").casefold())
+
+
+def encode_cursor(key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Optional[tuple]:
+    try:
+        score, created_at, item_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (float(score), str(created_at), str(item_id))
+    except (ValueError, TypeError):
+        return None
+
+
+def _grade_matches(item: dict, grade: Optional[int]) -> bool:
+    if not grade:
+        # Grade 0 / missing means "no grade filter" (matches the old route)
+        return True
+    return _covers_grade(item, grade)
+
+
+def _covers_grade(item: dict, grade: int) -> bool:
+    try:
+        return item.get("min_grade", 0) <= grade <= item.get("max_grade", 5)
+    except TypeError:
+        return False
+
+
+def _visible_to_school(item: dict, school_id: Optional[str]) -> bool:
+    if not school_id:
+        return True
+    visibility = item.get("school_visibility")
+    return visibility in (None, "all") or school_id in (item.get("visible_to_schools") or [])
+
+
+class RepositoryIndex:
+    """Immutable snapshot of the active repository items."""
+
+    def __init__(self, items: List[dict]):
+        self.items = items
+        self.by_id = {item["item_id"]: item for item in items}
+        postings: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        for item in items:
+            fields = {
+                "title": item.get("title"),
+                "tags": " ".join(t for t in (item.get("tags") or []) if isinstance(t, str)),
+                "description": item.get("description"),
+            }
+            for field, text in fields.items():
+                for token in tokenize(text):
+                    postings[token][item["item_id"]] += FIELD_WEIGHTS[field]
+        self.postings = {t: dict(p) for t, p in postings.items()}
+        self.terms = sorted(self.postings)
+
+    def _idf(self, term: str) -> float:
+        return math.log(1 + len(self.items) / (1 + len(self.postings.get(term, ()))))
+
+    def score(self, query: str) -> Dict[str, float]:
+        """item_id -> relevance. Every token must match (AND); the last
+        token may match as a prefix, and any token without an exact or
+        prefix hit matches terms containing it."""
+        tokens = tokenize(query)
+        if not tokens:
+            return {}
+        scores: Optional[Dict[str, float]] = None
+        for i, token in enumerate(tokens):
+            matched_terms = [token] if token in self.postings else []
+            if i == len(tokens) - 1:
+                start = bisect.bisect_left(self.terms, token)
+                matched_terms = []
+                for term in self.terms[start:]:
+                    if not term.startswith(token):
+                        break
+                    matched_terms.append(term)
+            if not matched_terms:
+                matched_terms = [term for term in self.terms if token in term]
+            token_scores: Dict[str, float] = defaultdict(float)
+            for term in matched_terms:
+                # Exact token hits outrank prefix completions and substrings
+                boost = 1.0 if term == token else 0.5 if term.startswith(token) else 0.25
+                idf = self._idf(term)
+                for item_id, weight in self.postings[term].items():
+                    token_scores[item_id] += boost * weight * idf
+            if scores is None:
+                scores = dict(token_scores)
+            else:
+                scores = {k: v + token_scores[k] for k, v in scores.items() if k in token_scores}
+            if not scores:
+                return {}
+        return scores or {}
+
+    def search(
+        self,
+        search: Optional[str] = None,
+        topic_id: Optional[str] = None,
+        subtopic_id: Optional[str] = None,
+        grade: Optional[int] = None,
+        file_type: Optional[str] = None,
+        school_id: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> dict:
+        """Filtered, ranked page plus facets. Items are the shared snapshot
+        dicts — copy before mutating."""
+        if search and search.strip():
+            scores = self.score(search)
+            candidates = [self.by_id[i] for i in scores]
+        else:
+            scores = {}
+            candidates = self.items
+        candidates = [item for item in candidates if _visible_to_school(item, school_id)]
+
+        filters = {
+            "topic": lambda item: not topic_id or item.get("topic_id") == topic_id,
+            "subtopic": lambda item: not subtopic_id or item.get("subtopic_id") == subtopic_id,
+            "grade": lambda item: _grade_matches(item, grade),
+            "file_type": lambda item: not file_type or item.get("file_type") == file_type,
+        }
+
+        def passes(item, skip=None):
+            return all(check(item) for name, check in filters.items() if name != skip)
+
+        results = [item for item in candidates if passes(item)]
+
+        def rank(item):
+            return round(scores.get(item["item_id"], 0.0), 6)
+
+        def comes_after(item, key):
+            # Position in the (score desc, created_at desc, item_id asc) order
+            score, created_at, item_id = key
+            if rank(item) != score:
+                return rank(item) < score
+            item_created = item.get("created_at") or ""
+            if item_created != created_at:
+                return item_created < created_at
+            return item["item_id"] > item_id
+
+        # Stable sorts, least significant key first
+        results.sort(key=lambda item: item["item_id"])
+        results.sort(key=lambda item: item.get("created_at") or "", reverse=True)
+        results.sort(key=rank, reverse=True)
+
+        after = decode_cursor(cursor) if cursor else None
+        if after is not None:
+            results_after = [item for item in results if comes_after(item, after)]
+        else:
+            results_after = results
+        page = results_after[:limit] if limit else results_after
+        next_cursor = None
+        if limit and len(results_after) > limit:
+            last = page[-1]
+            next_cursor = encode_cursor((rank(last), last.get("created_at") or "", last["item_id"]))
+
+        facets = {"topics": defaultdict(int), "grades": defaultdict(int), "file_types": defaultdict(int)}
+        for item in candidates:
+            if passes(item, skip="topic") and filters["subtopic"](item):
+                facets["topics"][item.get("topic_id") or ""] += 1
+            if passes(item, skip="grade"):
+                for g in GRADES:
+                    if _covers_grade(item, g):
+                        facets["grades"][str(g)] += 1
+            if passes(item, skip="file_type"):
+                facets["file_types"][item.get("file_type") or ""] += 1
+
+        return {
+            "items": page,
+            "total": len(results),
+            "next_cursor": next_cursor,
+            "scores": {item["item_id"]: scores[item["item_id"]] for item in page if item["item_id"] in scores},
+            "facets": {name: dict(counts) for name, counts in facets.items()},
+        }
+
+
+async def _build(db) -> RepositoryIndex:
+    items = await db.teacher_repository.find({"is_active": True}, {"_id": 0}).to_list(None)
+    return RepositoryIndex(items)
+
+
+_cache = SnapshotCache(_build, REBUILD_TTL)
+
+
+def invalidate():
+    """Mark the index stale; call after any teacher_repository write."""
+    _cache.invalidate()
+
+
+async def get_index(db) -> RepositoryIndex:
+    return await _cache.get(db)
@@ -0,0 +1,40 @@
+"""Per-process cache for an in-memory snapshot built from Mongo.
+
+Used by the search indexes (glossary, teacher repository): the snapshot is
+rebuilt on the next read after `invalidate()` (called by this worker's
+writes) or once it is older than `ttl` seconds, which is how writes made
+through another worker process get picked up. Concurrent readers of a
+stale snapshot share a single rebuild.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+
+class SnapshotCache:
+    def __init__(self, build: Callable[[Any], Awaitable[Any]], ttl: float):
+        self.build = build
+        self.ttl = ttl
+        self._value: Optional[Any] = None
+        self._built_at = 0.0
+        self._dirty = True
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return self._value is not None and not self._dirty and time.monotonic() - self._built_at < self.ttl
+
+    def invalidate(self):
+        """Mark the snapshot stale; the next `get()` rebuilds it."""
+        self._dirty = True
+
+    async def get(self, db):
+        if self._fresh():
+            return self._value
+        async with self._lock:
+            if not self._fresh():
+                # Cleared before the build so a write landing mid-build
+                # marks the new snapshot stale again
+                self._dirty = False
+                self._value = await self.build(db)
+                self._built_at = time.monotonic()
+        return self._value
@@ -0,0 +1,326 @@
+"""Static serving for /api/uploads.
+
+Wraps Starlette's StaticFiles with the bits activity pages need:
+
+  * Cache-Control — uuid/hash-named uploads never change after they are written
+    (every upload handler mints a fresh name), so they are served as immutable.
+    Fixed names such as `walkthrough_child.mp4` are overwritten in place and
+    must revalidate.
+  * Precompressed siblings — text assets (HTML/JS/CSS/SVG/JSON) get `.gz`
+    (and `.br` when the optional `brotli` package is installed) written next to
+    them at upload time; the matching sibling is served per Accept-Encoding.
+  * Range requests — single `bytes=` ranges are answered with 206 so video
+    seeking doesn't re-download the file.
+  * Image derivatives — `?size=<width>` on an image serves a resized
+    WebP/AVIF copy (services/image_derivatives.py).
+  * Stat cache — lookups are memoised in-process so ETag/Last-Modified (and
+    sibling probing) don't cost several os.stat calls per asset.
+"""
+import gzip
+import logging
+import mimetypes
+import os
+import re
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+from pathlib import Path
+from typing import Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers, QueryParams
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+from services import image_derivatives
+
+try:
+    import brotli
+except ImportError:  # optional — gzip alone still covers every browser
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Extensions worth precompressing. Images/video/audio are already compressed.
+COMPRESSIBLE_EXTENSIONS = {".html", ".htm", ".js", ".mjs", ".css", ".svg", ".json", ".txt", ".xml"}
+# Below this size the encoding overhead outweighs the savings.
+MIN_COMPRESS_SIZE = 512
+
+# uuid4().hex[:12] / [:16] names, optionally with a short prefix (img_, badge_, goal_, vid_...)
+_HASHED_NAME_RE = re.compile(r"^(?:[a-z]+_)?[0-9a-f]{12,64}$")
+
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+STAT_CACHE_SIZE = 4096
+STAT_CACHE_TTL = 30  # seconds, for mutable (fixed-name) files and misses
+IMMUTABLE_STAT_TTL = 300  # seconds; content-hashed files can still be deleted
+
+
+def is_immutable_upload(rel_path: str) -> bool:
+    """True when the upload at `rel_path` (relative to UPLOADS_DIR) can never
+    change: the file itself has a hashed name, or it lives inside a folder
+    whose name is a uuid (activity bundles, video renditions) — those folders
+    are never edited in place."""
+    parts = Path(rel_path).parts
+    if not parts:
+        return False
+    if any(_HASHED_NAME_RE.match(part) for part in parts[1:-1]):
+        return True
+    stem = Path(parts[-1]).stem
+    return bool(_HASHED_NAME_RE.match(stem))
+
+
+def _compress_one(path: Path) -> int:
+    """Write .gz/.br siblings for a single file if missing or stale. Returns
+    the number of siblings written."""
+    if path.suffix.lower() not in COMPRESSIBLE_EXTENSIONS:
+        return 0
+    try:
+        src_stat = path.stat()
+    except FileNotFoundError:
+        return 0
+    if src_stat.st_size < MIN_COMPRESS_SIZE:
+        return 0
+
+    encoders = [(".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        encoders.append((".br", lambda data: brotli.compress(data, quality=11)))
+
+    written = 0
+    data = None
+    for suffix, encode in encoders:
+        sibling = path.with_name(path.name + suffix)
+        if sibling.exists() and sibling.stat().st_mtime >= src_stat.st_mtime:
+            continue
+        if data is None:
+            data = path.read_bytes()
+        encoded = encode(data)
+        if len(encoded) >= len(data):
+            continue
+        tmp = sibling.with_name(sibling.name + ".tmp")
+        tmp.write_bytes(encoded)
+        os.replace(tmp, sibling)
+        written += 1
+    return written
+
+
+def precompress_file(path) -> int:
+    """Generate precompressed siblings for one uploaded file."""
+    written = _compress_one(Path(path))
+    invalidate(path)
+    return written
+
+
+def precompress_tree(root) -> int:
+    """Generate precompressed siblings for every compressible file under
+    `root` (an extracted activity folder, or the whole activities dir when
+    backfilling). Safe to re-run: fresh siblings are skipped."""
+    root = Path(root)
+    written = 0
+    for path in root.rglob("*"):
+        if path.is_file():
+            try:
+                written += _compress_one(path)
+            except OSError as e:
+                logger.warning(f"Precompress failed for {path}: {e}")
+    invalidate(root)
+    return written
+
+
+# ============== STAT CACHE ==============
+# full_path -> (cached_at, stat_result | None)
+_stat_cache: "OrderedDict[str, Tuple[float, Optional[os.stat_result]]]" = OrderedDict()
+
+
+def invalidate(path=None):
+    """Drop cached stat results for `path` (and anything beneath it), or
+    everything when `path` is None. Upload handlers call this after writing."""
+    if path is None:
+        _stat_cache.clear()
+        return
+    prefix = os.path.realpath(str(path))
+    for key in [k for k in _stat_cache if k == prefix or k.startswith(prefix + os.sep)
+                or k.startswith(prefix + ".")]:
+        _stat_cache.pop(key, None)
+
+
+def _cached_stat(full_path: str, immutable: bool) -> Optional[os.stat_result]:
+    now = time.monotonic()
+    hit = _stat_cache.get(full_path)
+    if hit is not None:
+        cached_at, result = hit
+        # Immutable files never change, so a positive hit lives longer; it
+        # still expires so a deleted upload turns into a 404.
+        ttl = IMMUTABLE_STAT_TTL if immutable and result is not None else STAT_CACHE_TTL
+        if now - cached_at < ttl:
+            _stat_cache.move_to_end(full_path)
+            return result
+    try:
+        result = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        result = None
+    _stat_cache[full_path] = (now, result)
+    if len(_stat_cache) > STAT_CACHE_SIZE:
+        _stat_cache.popitem(last=False)
+    return result
+
+
+# ============== RESPONSES ==============
+
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single `bytes=` range into inclusive (start, end). Returns None
+    for anything we don't serve partially (multi-range, other units), which
+    falls back to a full 200 response, as does a syntactically invalid range
+    (RFC 9110 says to ignore it). Raises 416 for unsatisfiable ranges."""
+    units, _, spec = range_header.partition("=")
+    if units.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_s, _, end_s = spec.strip().partition("-")
+    try:
+        if start_s == "":
+            # Suffix range: last N bytes
+            length = int(end_s)
+            if length <= 0:
+                raise ValueError
+            start, end = max(0, size - length), size - 1
+        else:
+            start = int(start_s)
+            end = int(end_s) if end_s else size - 1
+            if start < 0 or (end_s and end < start):
+                return None
+            end = min(end, size - 1)
+    except ValueError:
+        return None
+    if start >= size:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+class RangeFileResponse(FileResponse):
+    """FileResponse that streams only [start, end] of the file with a 206."""
+
+    def __init__(self, path, start: int, end: int, size: int, **kwargs):
+        super().__init__(path, status_code=206, **kwargs)
+        self.start = start
+        self.end = end
+        self.headers["content-length"] = str(end - start + 1)
+        self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class UploadsStaticFiles(StaticFiles):
+    """StaticFiles for the uploads directory — see module docstring."""
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        # `?size=<width>` on an image -> resized WebP/AVIF derivative when the
+        # client accepts one (see services/image_derivatives.py)
+        size = QueryParams(scope.get("query_string", b"")).get("size")
+        if size and scope["method"] in ("GET", "HEAD") and image_derivatives.is_derivable(path):
+            fmt = image_derivatives.pick_format(Headers(scope=scope).get("accept", ""))
+            try:
+                width = image_derivatives.snap_width(int(size))
+            except ValueError:
+                width = None
+            if fmt and width:
+                full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+                if stat_result is not None:
+                    derived = await anyio.to_thread.run_sync(
+                        image_derivatives.ensure_derivative, full_path, width, fmt
+                    )
+                    if derived is not None:
+                        derived_stat = _cached_stat(str(derived), immutable=False)
+                        if derived_stat is not None:
+                            response = self.file_response(str(derived), derived_stat, scope)
+                            response.headers["vary"] = "Accept"
+                            return response
+        return await super().get_response(path, scope)
+
+    def lookup_path(self, path: str) -> Tuple[str, Optional[os.stat_result]]:
+        for directory in self.all_directories:
+            root = os.path.realpath(directory)
+            full_path = os.path.realpath(os.path.join(root, path))
+            if os.path.commonpath([full_path, root]) != root:
+                continue
+            result = _cached_stat(full_path, is_immutable_upload(path))
+            if result is not None:
+                return full_path, result
+        return "", None
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope,
+                      status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        rel_path = os.path.relpath(full_path, os.path.realpath(str(self.directory)))
+        immutable = is_immutable_upload(rel_path)
+
+        headers = {
+            "cache-control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+            "accept-ranges": "bytes",
+        }
+
+        # Serve a precompressed sibling when the client accepts it. ETag and
+        # Last-Modified still describe the original so validators stay stable.
+        serve_path, serve_stat = full_path, stat_result
+        if Path(full_path).suffix.lower() in COMPRESSIBLE_EXTENSIONS:
+            headers["vary"] = "Accept-Encoding"
+            accepted = request_headers.get("accept-encoding", "")
+            for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+                if encoding not in accepted:
+                    continue
+                sibling_stat = _cached_stat(full_path + suffix, immutable)
+                if sibling_stat is not None and sibling_stat.st_mtime >= stat_result.st_mtime:
+                    serve_path, serve_stat = full_path + suffix, sibling_stat
+                    headers["content-encoding"] = encoding
+                    break
+
+        response = FileResponse(
+            serve_path,
+            status_code=status_code,
+            headers=headers,
+            media_type=mimetypes.guess_type(full_path)[0] or "text/plain",
+            stat_result=serve_stat,
+        )
+        # Validators from the original file, not the sibling
+        response.headers["last-modified"] = formatdate(stat_result.st_mtime, usegmt=True)
+        response.headers["etag"] = _etag(stat_result, headers.get("content-encoding"))
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        range_header = request_headers.get("range")
+        if range_header and status_code == 200 and "content-encoding" not in headers:
+            if_range = request_headers.get("if-range")
+            if if_range is None or if_range == response.headers["etag"]:
+                byte_range = _parse_range(range_header, stat_result.st_size)
+                if byte_range is not None:
+                    start, end = byte_range
+                    return RangeFileResponse(
+                        full_path, start, end, stat_result.st_size,
+                        headers={k: v for k, v in response.headers.items()
+                                 if k not in ("content-length",)},
+                        media_type=response.media_type,
+                    )
+        return response
+
+
+def _etag(stat_result: os.stat_result, encoding: Optional[str] = None) -> str:
+    base = f"{int(stat_result.st_mtime_ns)}-{stat_result.st_size:x}"
+    return f'"{base}-{encoding}"' if encoding else f'"{base}"'
@@ -0,0 +1,231 @@
+"""Stock catalogue and price writes.
+
+Stocks used to live in up to three collections: `investment_stocks` (the
+admin CRUD screens and the fluctuation job), `admin_stocks` (older seed
+data, still read as a fallback by the buy/sell routes and mirrored on every
+price tick) and `stocks` (read by the teacher and parent insights, never
+written). Every price change cost two writes and every lookup up to two
+reads, and the copies could drift apart.
+
+`investment_stocks` is now the only collection written to. `migrate()`
+runs once at startup: it copies stocks that only exist in a legacy
+collection into it (never overwriting a canonical document), adds a unique
+index on `stock_id` and records completion in `market_state`. Until that
+record exists, reads fall back to the legacy collections and copy any stock
+found there into the canonical one, so writes made right after still land.
+
+Price changes go through `price_tick()` / `apply_ticks()`: one update per
+stock (current price plus the embedded `price_history`, last 30 entries),
+one upsert of the day's `stock_price_history` row and the tick/candle
+writes in `price_candles`, batched with `bulk_write` when several stocks
+move at once. A tick built with `expect_price` only moves the stock if its
+price is still the one read (compare-and-set); such callers write the stock
+updates with `write_prices()` and then `record_history()` for the ones that
+landed.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+from services import price_candles
+
+logger = logging.getLogger(__name__)
+
+LEGACY_COLLECTIONS = ("admin_stocks", "stocks")
+MIGRATION_ID = "stock_collections_migrated"
+HISTORY_KEEP = 30
+MIGRATION_BATCH = 500
+
+_migrated = False
+
+
+def _canonical(db):
+    return db.investment_stocks
+
+
+async def _is_migrated(db) -> bool:
+    global _migrated
+    if not _migrated:
+        _migrated = bool(await db.market_state.find_one({"_id": MIGRATION_ID}, {"_id": 1}))
+    return _migrated
+
+
+async def migrate(db):
+    """One-shot copy of legacy-only stocks into `investment_stocks`."""
+    global _migrated
+    try:
+        if await _is_migrated(db):
+            return
+        copied = 0
+        for name in LEGACY_COLLECTIONS:
+            ops = []
+            async for stock in db[name].find({"stock_id": {"$exists": True}}, {"_id": 0}):
+                ops.append(_adopt(stock, name))
+                if len(ops) >= MIGRATION_BATCH:
+                    copied += (await _canonical(db).bulk_write(ops, ordered=False)).upserted_count
+                    ops = []
+            if ops:
+                copied += (await _canonical(db).bulk_write(ops, ordered=False)).upserted_count
+        await db.market_state.update_one(
+            {"_id": MIGRATION_ID},
+            {"$set": {"completed_at": datetime.now(timezone.utc).isoformat(), "copied": copied}},
+            upsert=True
+        )
+        _migrated = True
+        logger.info(f"Stock collections migrated: {copied} legacy stocks copied to investment_stocks")
+    except Exception as e:
+        logger.error(f"Stock collection migration failed: {e}")
+    try:
+        await _canonical(db).create_index("stock_id", unique=True)
+    except Exception as e:
+        logger.error(f"Unique stock_id index on investment_stocks failed: {e}")
+
+
+def _adopt(stock: dict, source: str) -> UpdateOne:
+    # Read-repair: copy a legacy-only stock into the canonical collection so
+    # the caller's price write lands on it
+    return UpdateOne(
+        {"stock_id": stock["stock_id"]},
+        {"$setOnInsert": {**stock, "migrated_from": source}},
+        upsert=True
+    )
+
+
+async def _legacy_find(db, query: dict) -> Optional[dict]:
+    for name in LEGACY_COLLECTIONS:
+        stock = await db[name].find_one(query, {"_id": 0})
+        if stock:
+            await _canonical(db).bulk_write([_adopt(stock, name)])
+            return stock
+    return None
+
+
+async def get_stock(db, stock_id: str, active_only: bool = False) -> Optional[dict]:
+    query = {"stock_id": stock_id}
+    if active_only:
+        query["is_active"] = True
+    stock = await _canonical(db).find_one(query, {"_id": 0})
+    if stock is None and not await _is_migrated(db):
+        stock = await _legacy_find(db, query)
+    return stock
+
+
+async def list_stocks(db, query: Optional[dict] = None) -> List[dict]:
+    """Stocks matching `query` (canonical documents win over legacy ones)."""
+    query = query or {}
+    stocks = await _canonical(db).find(query, {"_id": 0}).to_list(None)
+    if await _is_migrated(db):
+        return stocks
+    seen = {s["stock_id"] for s in stocks}
+    legacy = await asyncio.gather(*(db[name].find(query, {"_id": 0}).to_list(None)
+                                    for name in LEGACY_COLLECTIONS))
+    adopted = []
+    for name, docs in zip(LEGACY_COLLECTIONS, legacy):
+        for stock in docs:
+            if stock.get("stock_id") and stock["stock_id"] not in seen:
+                seen.add(stock["stock_id"])
+                stocks.append(stock)
+                adopted.append(_adopt(stock, name))
+    if adopted:
+        await _canonical(db).bulk_write(adopted, ordered=False)
+    return stocks
+
+
+async def create_stock(db, stock: dict):
+    await _canonical(db).insert_one(stock)
+
+
+async def update_stock(db, stock_id: str, fields: dict):
+    await _canonical(db).update_one({"stock_id": stock_id}, {"$set": fields})
+
+
+async def delete_stock(db, stock_id: str):
+    await _canonical(db).delete_one({"stock_id": stock_id})
+    if not await _is_migrated(db):
+        for name in LEGACY_COLLECTIONS:
+            await db[name].delete_one({"stock_id": stock_id})
+
+
+def price_tick(stock_id: str, new_price: float, day: str, open_price: Optional[float] = None,
+               expect_price: Optional[float] = None, **fields) -> dict:
+    """The writes for one price change: {"stock": ..., "history": ...,
+    "tick": ...} (the last is what `price_candles` records).
+
+    `open_price` seeds the day's history row when it is the first tick of
+    `day` (defaults to the new price); with `expect_price` the stock update
+    only matches while `current_price` still equals it; extra `fields` are
+    $set on the stock.
+    """
+    at = datetime.now(timezone.utc)
+    now = at.isoformat()
+    opening = new_price if open_price is None else open_price
+    entry = {"date": day, "price": new_price, "close_price": new_price, "timestamp": now}
+    match = {"stock_id": stock_id}
+    if expect_price is not None:
+        match["current_price"] = expect_price
+    return {
+        "stock": UpdateOne(
+            match,
+            {
+                "$set": {"current_price": new_price, "last_price_update": now, **fields},
+                "$push": {"price_history": {"$each": [entry], "$slice": -HISTORY_KEEP}},
+            }
+        ),
+        "history": UpdateOne(
+            {"stock_id": stock_id, "date": day},
+            {
+                "$set": {"close_price": new_price, "last_update": now},
+                "$max": {"high_price": max(new_price, opening)},
+                "$min": {"low_price": min(new_price, opening)},
+                "$setOnInsert": {
+                    "history_id": f"hist_{uuid.uuid4().hex[:12]}",
+                    "stock_id": stock_id,
+                    "open_price": opening,
+                    "date": day,
+                    "created_at": now,
+                },
+            },
+            upsert=True
+        ),
+        "tick": {"stock_id": stock_id, "price": new_price, "open": opening, "day": day, "ts": at},
+    }
+
+
+async def apply_ticks(db, ticks: Iterable[dict]) -> int:
+    """Write a batch of `price_tick()`s; returns the number of stocks updated."""
+    ticks = list(ticks)
+    if not ticks:
+        return 0
+    result, _, _ = await asyncio.gather(
+        _canonical(db).bulk_write([t["stock"] for t in ticks], ordered=False),
+        db.stock_price_history.bulk_write([t["history"] for t in ticks], ordered=False),
+        price_candles.record_ticks(db, [t["tick"] for t in ticks]),
+    )
+    return result.matched_count
+
+
+async def write_prices(db, ticks: List[dict]) -> int:
+    """Only the stock updates of `ticks`; returns how many matched."""
+    if not ticks:
+        return 0
+    return (await _canonical(db).bulk_write([t["stock"] for t in ticks], ordered=False)).matched_count
+
+
+async def record_history(db, ticks: List[dict]):
+    """The history-row and candle writes of `ticks` whose stock updates
+    have landed."""
+    if not ticks:
+        return
+    await asyncio.gather(
+        db.stock_price_history.bulk_write([t["history"] for t in ticks], ordered=False),
+        price_candles.record_ticks(db, [t["tick"] for t in ticks]),
+    )
+
+
+async def set_price(db, stock_id: str, new_price: float, day: str,
+                    open_price: Optional[float] = None, **fields) -> int:
+    return await apply_ticks(db, [price_tick(stock_id, new_price, day, open_price, **fields)])
@@ -0,0 +1,303 @@
+"""Stock trade execution.
+
+Buying or selling used to take about six sequential round trips (wallet
+read, wallet $inc, holding read, holding insert/update, two ledger inserts)
+with nothing stopping a double-submit from trading twice. A trade is now:
+
+  * buy:  a conditional wallet debit (`balance >= total` in the filter),
+          then one `$inc` upsert of the holding on its unique
+          (user_id, stock_id) key;
+  * sell: one conditional holding decrement (`quantity >= n` in the
+          filter, cost basis reduced pro rata), then the wallet credit;
+  * the `stock_transactions` and wallet `transactions` ledger rows, written
+    with `insert_many` (`write_ledger()` is shared with batch settlement).
+
+The writes run in a multi-document transaction on replica sets. On a
+standalone server, a failed holding write refunds the wallet debit (and a
+failed credit restores the sold shares).
+
+Clients may send an idempotency key (`Idempotency-Key` header or
+`idempotency_key` in the body). The first request with a key claims it in
+`trade_requests` and stores the result; repeats get the stored result
+back (or 409 while the first is still running) instead of trading again;
+reusing a key for a different side, stock or quantity is a 422.
+A pending claim older than CLAIM_STALE_AFTER was left by a worker that died
+mid-trade; the next request with that key takes it over.
+"""
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from services import classroom_stats, wallet_sources
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL = 24 * 3600  # seconds
+CLAIM_STALE_AFTER = 60  # seconds
+
+_transactions: Optional[bool] = None
+
+
+class TradeError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+async def ensure_indexes(db):
+    try:
+        await db.stock_holdings.create_index([("user_id", 1), ("stock_id", 1)], unique=True)
+    except Exception as e:
+        logger.error(f"Unique (user_id, stock_id) index on stock_holdings failed: {e}")
+    await db.trade_requests.create_index([("user_id", 1), ("idempotency_key", 1)], unique=True)
+    # TTL indexes need a BSON date, hence `claimed` next to the ISO created_at
+    await db.trade_requests.create_index("claimed", expireAfterSeconds=IDEMPOTENCY_TTL)
+
+
+async def supports_transactions(db) -> bool:
+    global _transactions
+    if _transactions is None:
+        try:
+            hello = await db.client.admin.command("hello")
+            _transactions = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception:
+            _transactions = False
+    return _transactions
+
+
+def ledger_rows(trade: dict) -> Dict[str, List[dict]]:
+    """stock_transactions + wallet transactions rows for one trade."""
+    buy = trade["side"] == "buy"
+    return {
+        "stock_transactions": [{
+            "transaction_id": f"stx_{uuid.uuid4().hex[:12]}",
+            "trade_id": trade["trade_id"],
+            "user_id": trade["user_id"],
+            "stock_id": trade["stock_id"],
+            "stock_name": trade["stock_name"],
+            "type": trade["side"],
+            "quantity": trade["quantity"],
+            "price": trade["price"],
+            "total": trade["total"],
+            "created_at": trade["created_at"],
+        }],
+        "transactions": [{
+            "transaction_id": f"tx_{uuid.uuid4().hex[:12]}",
+            "trade_id": trade["trade_id"],
+            "user_id": trade["user_id"],
+            "transaction_type": "stock_buy" if buy else "stock_sale",
+            "amount": -trade["total"] if buy else trade["total"],
+            "profit": trade.get("profit"),
+            "description": f"{'Bought' if buy else 'Sold'} {trade['quantity']} shares of {trade['stock_name']}",
+            "created_at": trade["created_at"],
+        }],
+    }
+
+
+async def write_ledger(db, trades: List[dict], session=None):
+    rows: Dict[str, List[dict]] = {"stock_transactions": [], "transactions": []}
+    for trade in trades:
+        for collection, docs in ledger_rows(trade).items():
+            rows[collection].extend(docs)
+    for collection, docs in rows.items():
+        if docs:
+            await db[collection].insert_many(docs, ordered=False, session=session)
+
+
+async def _ledger(db, trade: dict, session):
+    if session is not None:
+        await write_ledger(db, [trade], session)
+        return
+    # Without a transaction the money has already moved; a missing ledger
+    # row is logged rather than undoing the trade
+    try:
+        await write_ledger(db, [trade])
+    except Exception as e:
+        logger.error(f"Ledger rows for trade {trade['trade_id']} failed: {e}")
+
+
+async def _buy(db, trade: dict, session) -> dict:
+    debited = await wallet_sources.update_wallet(
+        db,
+        {"user_id": trade["user_id"], "account_type": "investing", "balance": {"$gte": trade["total"]}},
+        {"$inc": {"balance": -trade["total"]}},
+        session=session
+    )
+    if not debited.modified_count:
+        raise TradeError(400, "Insufficient balance in investing account")
+    try:
+        await db.stock_holdings.bulk_write(
+            [holding_inc(trade["user_id"], trade["stock_id"], trade["quantity"], trade["total"], trade["created_at"])],
+            session=session
+        )
+    except Exception:
+        if session is None:
+            await wallet_sources.update_wallet(
+                db,
+                {"user_id": trade["user_id"], "account_type": "investing"},
+                {"$inc": {"balance": trade["total"]}}
+            )
+        raise
+    await _ledger(db, trade, session)
+    return trade
+
+
+async def take_shares(db, user_id: str, stock_id: str, quantity: int, now: str,
+                      session=None) -> Optional[tuple]:
+    """Conditionally remove `quantity` shares (and their pro-rata cost basis)
+    from a holding. Returns (cost_basis, emptied) or None if too few shares."""
+    before = await db.stock_holdings.find_one_and_update(
+        {"user_id": user_id, "stock_id": stock_id, "quantity": {"$gte": quantity}},
+        [{"$set": {
+            "total_invested": {"$subtract": [
+                {"$ifNull": ["$total_invested", 0]},
+                {"$multiply": [{"$ifNull": ["$total_invested", 0]}, {"$divide": [quantity, "$quantity"]}]},
+            ]},
+            "quantity": {"$subtract": ["$quantity", quantity]},
+            "updated_at": now,
+        }}],
+        return_document=ReturnDocument.BEFORE,
+        session=session
+    )
+    if before is None:
+        return None
+    return (before.get("total_invested") or 0) * quantity / before["quantity"], before["quantity"] == quantity
+
+
+def holding_inc(user_id: str, stock_id: str, quantity: int, invested: float, now: str) -> UpdateOne:
+    """Upsert adding shares (bought, or returned after a cancelled sale)."""
+    return UpdateOne(
+        {"user_id": user_id, "stock_id": stock_id},
+        {
+            "$inc": {"quantity": quantity, "total_invested": invested},
+            "$set": {"updated_at": now},
+            "$setOnInsert": {"holding_id": f"hold_{uuid.uuid4().hex[:12]}", "created_at": now},
+        },
+        upsert=True
+    )
+
+
+async def _sell(db, trade: dict, session) -> dict:
+    quantity = trade["quantity"]
+    taken = await take_shares(db, trade["user_id"], trade["stock_id"], quantity, trade["created_at"], session)
+    if taken is None:
+        raise TradeError(400, "Insufficient shares")
+    cost_basis, emptied = taken
+    trade["profit"] = round(trade["total"] - cost_basis, 2)
+    try:
+        await wallet_sources.update_wallet(
+            db,
+            {"user_id": trade["user_id"], "account_type": "investing"},
+            {"$inc": {"balance": trade["total"]}},
+            session=session
+        )
+    except Exception:
+        if session is None:
+            await db.stock_holdings.update_one(
+                {"user_id": trade["user_id"], "stock_id": trade["stock_id"]},
+                {"$inc": {"quantity": quantity, "total_invested": cost_basis}}
+            )
+        raise
+    if emptied:
+        await db.stock_holdings.delete_one(
+            {"user_id": trade["user_id"], "stock_id": trade["stock_id"], "quantity": {"$lte": 0}},
+            session=session
+        )
+    await _ledger(db, trade, session)
+    return trade
+
+
+async def _run(db, trade: dict) -> dict:
+    step = _buy if trade["side"] == "buy" else _sell
+    if not await supports_transactions(db):
+        return await step(db, trade, None)
+    async with await db.client.start_session() as session:
+        return await session.with_transaction(lambda s: step(db, dict(trade), s))
+
+
+def check_replay(previous: dict, side: str, stock_id: str, quantity):
+    """A key seen before must come back with the same trade (claims made
+    before side/stock/quantity were recorded are not checked)."""
+    if "side" in previous and (previous.get("side"), previous.get("stock_id"), previous.get("quantity")) != (side, stock_id, quantity):
+        raise TradeError(422, "This idempotency key was already used for a different trade")
+
+
+async def _claim(db, user_id: str, key: str, side: str, stock_id: str, quantity: int) -> Optional[dict]:
+    """Claim an idempotency key; returns the stored result of an earlier
+    request with the same key, or None if this request owns it."""
+    now = datetime.now(timezone.utc)
+    try:
+        await db.trade_requests.insert_one({
+            "user_id": user_id, "idempotency_key": key, "status": "pending",
+            "side": side, "stock_id": stock_id, "quantity": quantity,
+            "claimed": now, "created_at": now.isoformat(),
+        })
+        return None
+    except DuplicateKeyError:
+        previous = await db.trade_requests.find_one({"user_id": user_id, "idempotency_key": key}, {"_id": 0})
+        if previous and previous.get("status") == "done":
+            check_replay(previous["result"], side, stock_id, quantity)
+            return {**previous["result"], "replayed": True}
+        if previous:
+            check_replay(previous, side, stock_id, quantity)
+        taken = await db.trade_requests.update_one(
+            {"user_id": user_id, "idempotency_key": key, "status": "pending",
+             "claimed": {"$lt": now - timedelta(seconds=CLAIM_STALE_AFTER)}},
+            {"$set": {"claimed": now, "created_at": now.isoformat()}}
+        )
+        if taken.modified_count:
+            logger.warning(f"Took over stale trade claim {key} for {user_id}")
+            return None
+        raise TradeError(409, "This trade is already being processed")
+
+
+def check_quantity(quantity):
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+        raise TradeError(400, "Quantity must be a positive whole number")
+
+
+async def execute(db, user_id: str, side: str, stock: dict, quantity,
+                  idempotency_key: Optional[str] = None) -> dict:
+    """Buy or sell `quantity` shares of `stock` at its current price."""
+    check_quantity(quantity)
+    key = idempotency_key
+    if key:
+        previous = await _claim(db, user_id, key, side, stock["stock_id"], quantity)
+        if previous:
+            return previous
+
+    price = stock["current_price"]
+    trade = {
+        "trade_id": f"trade_{uuid.uuid4().hex[:12]}",
+        "user_id": user_id,
+        "side": side,
+        "stock_id": stock["stock_id"],
+        "stock_name": stock.get("name", stock["stock_id"]),
+        "quantity": quantity,
+        "price": price,
+        "total": round(price * quantity, 2),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    try:
+        trade = await _run(db, trade)
+    except Exception:
+        if key:
+            await db.trade_requests.delete_one({"user_id": user_id, "idempotency_key": key})
+        raise
+    if key:
+        await db.trade_requests.update_one(
+            {"user_id": user_id, "idempotency_key": key},
+            {"$set": {"status": "done", "result": trade}}
+        )
+    classroom_stats.invalidate_student(user_id)
+    return trade
+
+
+def idempotency_key(request, body: dict) -> Optional[str]:
+    key = request.headers.get("Idempotency-Key") or body.get("idempotency_key")
+    return str(key)[:100] if key else None
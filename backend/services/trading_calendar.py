@@ -0,0 +1,186 @@
+"""Trading calendar for the stock market (and the garden produce market's
+hours).
+
+Market hours used to be re-derived on every call in three places (server,
+stocks and garden routes), each building a pytz IST datetime, and the
+scheduler hard-coded the IST fluctuation times as UTC cron hours.
+
+Here the boundaries of a trading day — open, close and the three
+fluctuation sessions, as UTC timestamps — are computed once per IST date
+and cached, so `is_open()`, `session_id()` and `seconds_until_next_event()`
+are a couple of float comparisons. Days listed as holidays (admin setting
+`trading_calendar` in `site_settings`) have no sessions: the market stays
+closed and the fluctuation jobs skip them. The garden produce market
+keeps the same hours but ignores the holidays (`within_hours()`).
+
+`session_triggers()` gives the scheduler IST cron triggers for the
+fluctuation sessions. Holidays are loaded by `load()` at startup, after an
+admin edit, and hourly on every worker.
+"""
+import logging
+import time
+from datetime import date, datetime, time as clock, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import pytz
+from apscheduler.triggers.cron import CronTrigger
+
+logger = logging.getLogger(__name__)
+
+IST = pytz.timezone('Asia/Kolkata')
+OPEN_TIME = clock(7, 0)
+CLOSE_TIME = clock(17, 0)
+# Price fluctuation sessions (IST)
+SESSIONS = {"opening": clock(7, 15), "midday": clock(12, 0), "closing": clock(16, 30)}
+SETTINGS_KEY = "trading_calendar"
+
+_holidays: Dict[str, str] = {}
+_today: Optional["TradingDay"] = None
+
+
+def _at(day: date, at: clock) -> float:
+    return IST.localize(datetime.combine(day, at)).timestamp()
+
+
+class TradingDay:
+    """Boundaries of one IST calendar date, as UTC timestamps."""
+
+    def __init__(self, day: date, holiday: Optional[str] = None):
+        self.date = day.isoformat()
+        self.holiday = holiday
+        self.starts = _at(day, clock(0, 0))
+        self.ends = _at(day + timedelta(days=1), clock(0, 0))
+        self.is_trading_day = holiday is None
+        self.open_at = _at(day, OPEN_TIME)
+        self.close_at = _at(day, CLOSE_TIME)
+        self.sessions = {name: _at(day, at) for name, at in SESSIONS.items()} if self.is_trading_day else {}
+
+    def is_open(self, ts: float) -> bool:
+        return self.is_trading_day and self.within_hours(ts)
+
+    def within_hours(self, ts: float) -> bool:
+        return self.open_at <= ts < self.close_at
+
+
+def _day(day: date) -> TradingDay:
+    return TradingDay(day, _holidays.get(day.isoformat()))
+
+
+def today(now: Optional[float] = None) -> TradingDay:
+    """The (cached) trading day containing `now` (a UTC timestamp)."""
+    global _today
+    ts = time.time() if now is None else now
+    if _today is None or not _today.starts <= ts < _today.ends:
+        day = _day(datetime.fromtimestamp(ts, IST).date())
+        if now is not None:
+            return day
+        _today = day
+    return _today
+
+
+def today_ist() -> str:
+    return today().date
+
+
+def is_open(now: Optional[float] = None) -> bool:
+    ts = time.time() if now is None else now
+    return today(ts).is_open(ts)
+
+
+def within_hours(now: Optional[float] = None) -> bool:
+    """Between the daily open and close, holiday or not."""
+    ts = time.time() if now is None else now
+    return today(ts).within_hours(ts)
+
+
+def session_id(now: Optional[float] = None) -> Optional[str]:
+    """Identifier of the trading session in progress (its IST date), or
+    None while the market is closed."""
+    ts = time.time() if now is None else now
+    day = today(ts)
+    return day.date if day.is_open(ts) else None
+
+
+def next_event(now: Optional[float] = None) -> Tuple[str, float]:
+    """("open" | "close", timestamp) of the next market open or close."""
+    ts = time.time() if now is None else now
+    day = today(ts)
+    for _ in range(367):
+        if day.is_trading_day:
+            if ts < day.open_at:
+                return "open", day.open_at
+            if ts < day.close_at:
+                return "close", day.close_at
+        day = _day(date.fromisoformat(day.date) + timedelta(days=1))
+    raise RuntimeError("No trading day within a year - check the holiday list")
+
+
+def seconds_until_next_event(now: Optional[float] = None) -> float:
+    ts = time.time() if now is None else now
+    return max(0.0, next_event(ts)[1] - ts)
+
+
+def status(now: Optional[float] = None) -> dict:
+    """Market status as served by /stocks/market-status."""
+    ts = time.time() if now is None else now
+    day = today(ts)
+    event, at = next_event(ts)
+    return {
+        "is_open": day.is_open(ts),
+        "session_id": day.date if day.is_open(ts) else None,
+        "current_time": datetime.fromtimestamp(ts, IST).strftime("%H:%M"),
+        "open_time": OPEN_TIME.strftime("%H:%M"),
+        "close_time": CLOSE_TIME.strftime("%H:%M"),
+        "timezone": "IST",
+        "holiday": day.holiday,
+        "next_event": event,
+        "next_event_at": datetime.fromtimestamp(at, timezone.utc).isoformat(),
+        "seconds_until_next_event": int(at - ts),
+    }
+
+
+def session_triggers() -> Dict[str, CronTrigger]:
+    """Scheduler triggers for the fluctuation sessions, in IST."""
+    return {name: CronTrigger(hour=at.hour, minute=at.minute, timezone=IST) for name, at in SESSIONS.items()}
+
+
+def is_trading_day(now: Optional[float] = None) -> bool:
+    return today(now).is_trading_day
+
+
+def _set_holidays(entries: List[dict]):
+    global _holidays, _today
+    _holidays = {h["date"]: h.get("name") or "Market holiday" for h in entries if h.get("date")}
+    _today = None
+
+
+async def load(db):
+    """(Re)load the admin holiday list."""
+    try:
+        settings = await db.site_settings.find_one({"key": SETTINGS_KEY}, {"_id": 0}) or {}
+        _set_holidays(settings.get("holidays", []))
+    except Exception as e:
+        logger.error(f"Loading trading calendar failed: {e}")
+
+
+def holidays() -> List[dict]:
+    return [{"date": d, "name": name} for d, name in sorted(_holidays.items())]
+
+
+async def set_holidays(db, entries: List[dict]) -> List[dict]:
+    """Replace the holiday list; raises ValueError on a malformed entry."""
+    cleaned = []
+    for entry in entries:
+        day = entry.get("date") if isinstance(entry, dict) else None
+        try:
+            date.fromisoformat(day)
+        except (TypeError, ValueError):
+            raise ValueError(f"Holiday dates must be YYYY-MM-DD (got {day!r})")
+        cleaned.append({"date": day, "name": (entry.get("name") or "").strip() or "Market holiday"})
+    await db.site_settings.update_one(
+        {"key": SETTINGS_KEY},
+        {"$set": {"key": SETTINGS_KEY, "holidays": cleaned, "updated_at": datetime.now(timezone.utc).isoformat()}},
+        upsert=True
+    )
+    _set_holidays(cleaned)
+    return holidays()
@@ -0,0 +1,110 @@
+"""Admin user directory queries.
+
+One aggregation pipeline serves both the paginated directory and the CSV
+export: filter users server-side, join the maintained subscription
+entitlement (see services.entitlements) and the school name, and project
+only the list columns — never password hashes or session data.
+
+Pagination is keyset on `_id` (newest first), which stays correct while
+users are being created, unlike skip/limit.
+"""
+import re
+from datetime import datetime, timezone
+from typing import Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# Columns the admin user list renders
+LIST_FIELDS = (
+    "user_id", "name", "email", "username", "role", "grade", "school_id", "phone",
+    "picture", "is_test_user", "created_at", "last_login_at",
+)
+DERIVED_FIELDS = ("school_name", "subscription_status", "subscription_end_date",
+                  "subscription_granted_by_admin", "test_mode")
+CSV_COLUMNS = LIST_FIELDS[:6] + ("school_name",) + LIST_FIELDS[6:] + DERIVED_FIELDS[1:]
+
+SUBSCRIPTION_STATUSES = ("active", "expired", "inactive")
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[ObjectId]:
+    if not cursor:
+        return None
+    try:
+        return ObjectId(cursor)
+    except (InvalidId, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def build_pipeline(
+    role: Optional[str] = None,
+    school_id: Optional[str] = None,
+    grade: Optional[int] = None,
+    subscription_status: Optional[str] = None,
+    test_mode: Optional[bool] = None,
+    search: Optional[str] = None,
+    after: Optional[ObjectId] = None,
+    limit: Optional[int] = None,
+) -> list:
+    """Aggregation over `users` yielding directory rows (plus `_id` for the
+    cursor), newest first."""
+    match = {}
+    if role:
+        match["role"] = role
+    if school_id:
+        match["school_id"] = school_id
+    if grade is not None:
+        match["grade"] = grade
+    if search and search.strip():
+        # Anchored prefix match on the identifying fields
+        prefix = {"$regex": f"^{re.escape(search.strip())}", "$options": "i"}
+        match["$or"] = [{"name": prefix}, {"email": prefix}, {"username": prefix}]
+    if after is not None:
+        match["_id"] = {"$lt": after}
+
+    now_iso = datetime.now(timezone.utc).isoformat()
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"_id": -1}},
+        {"$project": {"_id": 1, **{f: 1 for f in LIST_FIELDS}}},
+        # Entitlements are keyed by email for adults and user_id for
+        # email-less children (same rule as the admin subscription grant)
+        {"$addFields": {"_sub_key": {"$cond": [
+            {"$gt": [{"$strLenCP": {"$ifNull": ["$email", ""]}}, 0]},
+            {"$concat": ["email:", {"$toLower": {"$trim": {"input": "$email"}}}]},
+            {"$concat": ["user:", {"$ifNull": ["$user_id", ""]}]},
+        ]}}},
+        {"$lookup": {"from": "entitlements", "localField": "_sub_key", "foreignField": "key", "as": "_ent"}},
+        {"$addFields": {"_ent": {"$arrayElemAt": ["$_ent", 0]}}},
+        {"$addFields": {
+            "subscription_status": {"$cond": [
+                {"$not": ["$_ent"]}, "inactive",
+                {"$cond": [{"$gt": ["$_ent.end_date", now_iso]}, "active", "expired"]},
+            ]},
+            "subscription_end_date": "$_ent.end_date",
+            "subscription_granted_by_admin": {"$ifNull": ["$_ent.granted_by_admin", False]},
+        }},
+        # Test mode: explicit flag, or an active 1-day trial — also while a
+        # longer plan is the best entitlement (same rule as
+        # entitlements.is_on_trial)
+        {"$addFields": {"test_mode": {"$or": [
+            {"$eq": ["$is_test_user", True]},
+            {"$gt": [{"$ifNull": ["$_ent.trial_end_date", ""]}, now_iso]},
+            {"$and": [{"$eq": ["$subscription_status", "active"]}, {"$eq": ["$_ent.is_trial", True]}]},
+        ]}}},
+    ]
+    post_match = {}
+    if subscription_status:
+        post_match["subscription_status"] = subscription_status
+    if test_mode is not None:
+        post_match["test_mode"] = test_mode
+    if post_match:
+        pipeline.append({"$match": post_match})
+    if limit:
+        pipeline.append({"$limit": limit})
+    pipeline += [
+        {"$lookup": {"from": "schools", "localField": "school_id", "foreignField": "school_id", "as": "_school"}},
+        {"$addFields": {"school_name": {"$arrayElemAt": ["$_school.name", 0]}}},
+        {"$project": {"_school": 0, "_ent": 0, "_sub_key": 0}},
+    ]
+    return pipeline
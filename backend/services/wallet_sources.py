@@ -7,7 +7,11 @@ Two ledgers coexist:
     penalties, gifts, allowance, parent-assigned chores, jobs). NEVER touches the wallet
     balance — only stores transactions tagged with wallet_source='my_wallet' and
     settlement_status='pending' until the parent marks them paid.
+
+Balance writes go through `update_wallet()`, which also drops the cached
+classroom stats of the child whose balance moved.
 """
+from services import classroom_stats
 
 # Authoritative classification map. Anything not listed defaults to 'coinquest'.
 MY_WALLET_TX_TYPES = {
@@ -29,3 +33,12 @@ MY_WALLET_TX_TYPES = {
 def classify_source(transaction_type: str) -> str:
     """Return 'my_wallet' for any parent-originated transaction type, else 'coinquest'."""
     return "my_wallet" if transaction_type in MY_WALLET_TX_TYPES else "coinquest"
+
+
+async def update_wallet(db, query: dict, update: dict, **kwargs):
+    """`wallet_accounts.update_one` for a balance change; invalidates the
+    owner's cached classroom stats (leaderboards include balances)."""
+    result = await db.wallet_accounts.update_one(query, update, **kwargs)
+    if query.get("user_id"):
+        classroom_stats.invalidate_student(query["user_id"])
+    return result
@@ -0,0 +1,144 @@
+"""Word of the Day calendar.
+
+Each grade (K=0 .. 5, plus "all" for viewers without a grade) gets a
+rotating calendar in `word_of_day_calendar`, one small doc per grade:
+
+    {"grade": 3 | "all", "cycle": 4, "remaining": [word_id, ...],
+     "days": {"2026-10-18": word_id, ...}, "updated_at": ...}
+
+`remaining` is the shuffled, not-yet-shown part of the current cycle, so no
+word repeats until the grade's whole pool has been used. A daily scheduler
+job (`extend_calendars`) keeps CALENDAR_DAYS_AHEAD days filled in; the
+endpoint reads through an in-memory cache keyed by (date, grade).
+"""
+import logging
+import random
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+GRADES = range(0, 6)  # K=0, 1-5
+ALL_GRADES = "all"
+CALENDAR_DAYS_AHEAD = 7
+CALENDAR_DAYS_KEPT = 2  # past days kept so late-timezone clients still resolve
+
+GradeKey = Union[int, str]
+_cache: Dict[Tuple[str, GradeKey], Optional[dict]] = {}
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def _grade_key(grade: Optional[int]) -> GradeKey:
+    """Calendar key for a requested grade. Grades come from the query string,
+    so anything outside K-5 is clamped rather than getting its own calendar."""
+    if grade is None:
+        return ALL_GRADES
+    try:
+        grade = int(grade)
+    except (TypeError, ValueError):
+        return ALL_GRADES
+    return min(max(grade, GRADES.start), GRADES.stop - 1)
+
+
+async def _eligible_word_ids(db, grade: GradeKey) -> list:
+    # Word of the Day never picks a draft word
+    query = {"is_published": {"$ne": False}}
+    if grade != ALL_GRADES:
+        query["min_grade"] = {"$lte": grade}
+        query["max_grade"] = {"$gte": grade}
+    docs = await db.glossary_words.find(query, {"_id": 0, "word_id": 1}).sort("word_id", 1).to_list(None)
+    return [d["word_id"] for d in docs]
+
+
+async def extend_calendar(db, grade: GradeKey, days_ahead: int = CALENDAR_DAYS_AHEAD) -> dict:
+    """Fill this grade's calendar from today through `days_ahead` days and
+    drop days older than CALENDAR_DAYS_KEPT. Already-assigned days are kept
+    as long as their word is still eligible."""
+    eligible = await _eligible_word_ids(db, grade)
+    eligible_set = set(eligible)
+    cal = await db.word_of_day_calendar.find_one({"grade": grade}, {"_id": 0}) or {
+        "grade": grade, "cycle": 0, "remaining": [], "days": {}
+    }
+    today = datetime.now(timezone.utc).date()
+    oldest = (today - timedelta(days=CALENDAR_DAYS_KEPT)).isoformat()
+    days = {d: w for d, w in cal["days"].items() if d >= oldest and w in eligible_set}
+    remaining = [w for w in cal["remaining"] if w in eligible_set]
+    cycle = cal["cycle"]
+
+    if eligible:
+        for offset in range(days_ahead + 1):
+            date = (today + timedelta(days=offset)).isoformat()
+            if date in days:
+                continue
+            if not remaining:
+                cycle += 1
+                # Seeded per (grade, cycle) on a private Random instance so
+                # rebuilds are reproducible without touching global state
+                remaining = list(eligible)
+                random.Random(f"{grade}:{cycle}").shuffle(remaining)
+                # Don't open a new cycle with a word shown in the last few days
+                recent = set(days.values())
+                if len(remaining) > len(recent):
+                    remaining.sort(key=lambda w: w in recent)
+            days[date] = remaining.pop(0)
+
+    cal = {
+        "grade": grade,
+        "cycle": cycle,
+        "remaining": remaining,
+        "days": days,
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    }
+    await db.word_of_day_calendar.replace_one({"grade": grade}, cal, upsert=True)
+    # Drop cached picks for this grade so the new calendar is served
+    for key in [k for k in _cache if k[1] == grade]:
+        del _cache[key]
+    return cal
+
+
+async def extend_calendars(db):
+    """Scheduler job: extend every grade's calendar."""
+    for grade in [ALL_GRADES, *GRADES]:
+        try:
+            await extend_calendar(db, grade)
+        except Exception as e:
+            logger.error(f"Word of the day calendar for grade {grade} failed: {e}")
+    logger.info("Word of the day calendars extended")
+
+
+async def get_word_of_day(db, grade: Optional[int] = None) -> Optional[dict]:
+    """Today's word for `grade` (global fields; caller applies grade
+    overrides on a copy). Cached in-process per (date, grade)."""
+    key = (_today(), _grade_key(grade))
+    if key in _cache:
+        return _cache[key]
+
+    cal = await db.word_of_day_calendar.find_one({"grade": key[1]}, {"_id": 0, "days": 1})
+    word_id = (cal or {}).get("days", {}).get(key[0])
+    word = None
+    if word_id:
+        word = await db.glossary_words.find_one(
+            {"word_id": word_id, "is_published": {"$ne": False}}, {"_id": 0}
+        )
+    if word is None:
+        # Calendar not built yet (fresh deploy, new grade) or today's word was
+        # deleted / unpublished since — extend it now and retry once
+        cal = await extend_calendar(db, key[1])
+        word_id = cal["days"].get(key[0])
+        if word_id:
+            word = await db.glossary_words.find_one({"word_id": word_id}, {"_id": 0})
+
+    _cache[key] = word
+    # Yesterday's entries are never read again
+    for stale in [k for k in _cache if k[0] != key[0]]:
+        del _cache[stale]
+    return word
+
+
+def invalidate():
+    """Forget cached picks; call after glossary writes that could unpublish
+    or delete today's word."""
+    _cache.clear()
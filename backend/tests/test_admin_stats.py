@@ -0,0 +1,48 @@
+"""
+Test suite for admin platform statistics
+Tests: GET /api/admin/stats - same shape as before, served from the stats service
+       GET /api/admin/stats/history - daily snapshots for growth charts
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+ADMIN_EMAIL = "admin@learnersplanet.com"
+ADMIN_PASSWORD = "finlit@2026"
+
+
+@pytest.fixture(scope="module")
+def admin_session():
+    session = requests.Session()
+    response = session.post(f"{BASE_URL}/api/auth/admin-login", json={
+        "email": ADMIN_EMAIL,
+        "password": ADMIN_PASSWORD
+    })
+    assert response.status_code == 200, f"Admin login failed: {response.text}"
+    return session
+
+
+class TestAdminStats:
+
+    def test_stats_shape(self, admin_session):
+        response = admin_session.get(f"{BASE_URL}/api/admin/stats")
+        assert response.status_code == 200
+        stats = response.json()
+        for section in ("users", "content", "legacy_content", "store", "investments"):
+            assert isinstance(stats[section], dict)
+        assert set(stats["users"]) == {"total", "children", "parents", "teachers", "admins", "schools"}
+        assert stats["users"]["admins"] >= 1
+        assert stats["users"]["total"] >= sum(v for k, v in stats["users"].items() if k != "total")
+        print(f"✅ Stats: {stats['users']['total']} users")
+
+    def test_history_returns_sorted_snapshots(self, admin_session):
+        response = admin_session.get(f"{BASE_URL}/api/admin/stats/history", params={"days": 30})
+        assert response.status_code == 200
+        dates = [s["date"] for s in response.json()["snapshots"]]
+        assert dates == sorted(dates)
+
+    def test_history_rejects_bad_range(self, admin_session):
+        response = admin_session.get(f"{BASE_URL}/api/admin/stats/history", params={"days": 0})
+        assert response.status_code == 400
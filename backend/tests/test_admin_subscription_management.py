@@ -211,7 +211,26 @@ class TestAdminSubscriptionManagement:
         assert test_user is not None
         assert test_user["subscription_status"] == "inactive", f"Expected 'inactive', got: {test_user.get('subscription_status')}"
         print("✓ Deactivated user shows subscription_status = 'inactive'")
-    
+
+    def test_check_access_follows_grant_and_revoke(self):
+        """Test that /subscriptions/check-access reflects admin grants/revokes immediately"""
+        self.session.put(f"{BASE_URL}/api/admin/users/{self.test_user_id}/subscription", json={
+            "status": "active",
+            "duration": "1_week"
+        })
+        resp = self.session.get(f"{BASE_URL}/api/subscriptions/check-access/{self.test_email}")
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["has_access"] is True, f"Expected access after grant, got: {data}"
+        assert data["plan_type"] == "admin_granted"
+
+        self.session.put(f"{BASE_URL}/api/admin/users/{self.test_user_id}/subscription", json={
+            "status": "inactive"
+        })
+        resp = self.session.get(f"{BASE_URL}/api/subscriptions/check-access/{self.test_email}")
+        assert resp.json()["has_access"] is False, "Access should be gone after revoke"
+        print("✓ check-access follows admin grant and revoke")
+
     # ============== Edge Cases ==============
     
     def test_subscription_user_not_found(self):
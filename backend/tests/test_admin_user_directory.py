@@ -0,0 +1,117 @@
+"""
+Test suite for the admin user directory
+Tests: GET /api/admin/users/directory - keyset pagination, filters, projection
+       GET /api/admin/users/export.csv - streamed CSV export
+"""
+import csv
+import io
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import requests
+import os
+from pymongo import MongoClient
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+ADMIN_EMAIL = "admin@learnersplanet.com"
+ADMIN_PASSWORD = "finlit@2026"
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.environ.get("DB_NAME", "test_database")
+
+
+@pytest.fixture(scope="module")
+def admin_session():
+    session = requests.Session()
+    response = session.post(f"{BASE_URL}/api/auth/admin-login", json={
+        "email": ADMIN_EMAIL,
+        "password": ADMIN_PASSWORD
+    })
+    assert response.status_code == 200, f"Admin login failed: {response.text}"
+    return session
+
+
+class TestUserDirectory:
+
+    def test_pages_do_not_overlap(self, admin_session):
+        first = admin_session.get(f"{BASE_URL}/api/admin/users/directory", params={"limit": 5}).json()
+        assert len(first["users"]) <= 5
+        if not first["next_cursor"]:
+            pytest.skip("Not enough users for a second page")
+        second = admin_session.get(f"{BASE_URL}/api/admin/users/directory",
+                                   params={"limit": 5, "cursor": first["next_cursor"]}).json()
+        first_ids = {u["user_id"] for u in first["users"]}
+        assert not first_ids & {u["user_id"] for u in second["users"]}
+        print(f"✅ Two directory pages, {len(first_ids)} + {len(second['users'])} distinct users")
+
+    def test_rows_never_include_password_hash(self, admin_session):
+        response = admin_session.get(f"{BASE_URL}/api/admin/users/directory", params={"limit": 50})
+        assert response.status_code == 200
+        for user in response.json()["users"]:
+            assert "password_hash" not in user
+            assert "_id" not in user
+            assert user["subscription_status"] in ("active", "expired", "inactive")
+
+    def test_role_and_status_filters(self, admin_session):
+        response = admin_session.get(f"{BASE_URL}/api/admin/users/directory",
+                                     params={"role": "child", "subscription_status": "inactive", "limit": 50})
+        assert response.status_code == 200
+        for user in response.json()["users"]:
+            assert user["role"] == "child"
+            assert user["subscription_status"] == "inactive"
+
+    def test_prefix_search(self, admin_session):
+        response = admin_session.get(f"{BASE_URL}/api/admin/users/directory", params={"search": "admin@learners"})
+        assert response.status_code == 200
+        emails = [u.get("email") for u in response.json()["users"]]
+        assert ADMIN_EMAIL in emails
+
+    def test_invalid_cursor_and_status(self, admin_session):
+        assert admin_session.get(f"{BASE_URL}/api/admin/users/directory",
+                                 params={"cursor": "nope"}).status_code == 400
+        assert admin_session.get(f"{BASE_URL}/api/admin/users/directory",
+                                 params={"subscription_status": "maybe"}).status_code == 400
+
+    def test_csv_export(self, admin_session):
+        response = admin_session.get(f"{BASE_URL}/api/admin/users/export.csv", params={"role": "admin"})
+        assert response.status_code == 200
+        assert response.headers["Content-Type"].startswith("text/csv")
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert rows and all(r["role"] == "admin" for r in rows)
+        assert "password_hash" not in rows[0]
+        print(f"✅ CSV export returned {len(rows)} admin rows")
+
+    def test_trial_alongside_longer_plan_is_test_mode(self, admin_session):
+        """A running 1-day trial puts the user in test mode even when a
+        longer plan is their best entitlement (entitlements.is_on_trial)"""
+        email = f"test_dir_trial_{uuid.uuid4().hex[:8]}@test.com"
+        created = admin_session.post(f"{BASE_URL}/api/admin/users", json={
+            "name": "TEST_DirTrial", "email": email, "password": "testpass123", "role": "parent"
+        })
+        assert created.status_code in (200, 201), created.text
+        user_id = created.json().get("user_id")
+        db = MongoClient(MONGO_URL)[DB_NAME]
+        now = datetime.now(timezone.utc)
+        key = f"email:{email}"
+        db.entitlements.insert_one({
+            "key": key, "duration": "1_month", "is_trial": False, "granted_by_admin": True,
+            "end_date": (now + timedelta(days=30)).isoformat(),
+            "trial_end_date": (now + timedelta(days=1)).isoformat(),
+        })
+        try:
+            rows = admin_session.get(f"{BASE_URL}/api/admin/users/directory", params={"search": email}).json()["users"]
+            assert [r["test_mode"] for r in rows] == [True]
+            assert rows[0]["subscription_status"] == "active"
+            filtered = admin_session.get(f"{BASE_URL}/api/admin/users/directory",
+                                         params={"search": email, "test_mode": "true"}).json()["users"]
+            assert [r["email"] for r in filtered] == [email]
+            print("✅ Trial plus a longer plan shows as test mode")
+        finally:
+            db.entitlements.delete_one({"key": key})
+            if user_id:
+                admin_session.delete(f"{BASE_URL}/api/admin/users/{user_id}")
+
+    def test_directory_requires_admin(self):
+        response = requests.get(f"{BASE_URL}/api/admin/users/directory")
+        assert response.status_code in (401, 403)
@@ -241,6 +241,24 @@ class TestChildClassmates:
             print(f"   Lessons: {classmate['lessons_completed']}, Badges: {classmate['badges']}")
             print(f"   Investment Performance: {classmate['investment_performance']}")
 
+    def test_02_classmates_leaderboards(self, child_session):
+        """Leaderboards rank the whole class, including the child"""
+        response = child_session.get(f"{BASE_URL}/api/child/classmates")
+        assert response.status_code == 200
+        data = response.json()
+        lessons = [c["lessons_completed"] for c in data["classmates"]]
+        assert lessons == sorted(lessons, reverse=True)
+        assert CHILD_ID not in [c["user_id"] for c in data["classmates"]]
+        
+        for board in ("balance", "lessons", "badges"):
+            rows = data["leaderboards"][board]
+            values = [r["value"] for r in rows]
+            assert values == sorted(values, reverse=True), f"{board} leaderboard not ordered"
+            assert [r["rank"] for r in rows] == list(range(1, len(rows) + 1))
+            if data["classroom"]:
+                assert sum(r["is_me"] for r in rows) == 1
+        print(f"✅ Leaderboards: {len(data['leaderboards']['lessons'])} students ranked")
+
 
 class TestQuestWithQuestions:
     """Test quest submission with questions - can only attempt once, shows correct answers"""
@@ -474,6 +492,24 @@ class TestParentChildInsights:
         print(f"   Investment Type: {data['investment_type']}")
         print(f"   Lessons Completed: {data['learning']['lessons_completed']}")
 
+    def test_02_learning_matches_dashboard(self, parent_session):
+        """Insights learning block agrees with the parent dashboard card"""
+        insights = parent_session.get(f"{BASE_URL}/api/parent/children/{CHILD_ID}/insights").json()
+        learning = insights["learning"]
+        for key in ("lessons_completed", "total_lessons", "topics_completed", "total_topics",
+                    "subtopics_completed", "total_subtopics", "current_streak", "longest_streak"):
+            assert key in learning, f"Missing learning.{key}"
+        assert learning["topics_completed"] <= learning["total_topics"]
+        assert learning["subtopics_completed"] <= learning["total_subtopics"]
+        
+        dashboard = parent_session.get(f"{BASE_URL}/api/parent/dashboard")
+        assert dashboard.status_code == 200
+        card = next((c for c in dashboard.json()["children"] if c["user_id"] == CHILD_ID), None)
+        assert card is not None, "Child missing from parent dashboard"
+        assert card["lessons_completed"] == learning["lessons_completed"]
+        assert card["total_lessons"] == learning["total_lessons"]
+        print(f"✅ Dashboard and insights agree: {card['lessons_completed']}/{card['total_lessons']} lessons")
+
 
 class TestTeacherStudentInsights:
     """Test teacher can view student insights"""
@@ -501,6 +537,17 @@ class TestTeacherStudentInsights:
         print(f"   Student: {data['student']['name']}")
         print(f"   Total Balance: {data['wallet']['total_balance']}")
 
+    def test_02_teacher_and_parent_learning_agree(self, teacher_session, parent_session):
+        """Teacher and parent insights use the same topic-completion rules"""
+        teacher_data = teacher_session.get(
+            f"{BASE_URL}/api/teacher/classrooms/{CLASSROOM_ID}/student-insights/{CHILD_ID}"
+        ).json()
+        parent_data = parent_session.get(f"{BASE_URL}/api/parent/children/{CHILD_ID}/insights").json()
+        for key in ("lessons_completed", "total_topics", "topics_completed",
+                    "total_subtopics", "subtopics_completed"):
+            assert teacher_data["learning"][key] == parent_data["learning"][key], key
+        print("✅ Teacher and parent learning summaries agree")
+
 
 # Cleanup test data
 class TestCleanup:
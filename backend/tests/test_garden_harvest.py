@@ -2,7 +2,8 @@
 
 Setup: insert a QA plot for child classmate_g1 (user_id 50604e17-3caa-44d4-9815-1fea21d8a58b)
 with plant Sunflower (plant_0eb737e556d3), planted 3 days ago, status 'water_needed'.
-GET /api/garden/farm must return that plot with status 'ready' and growth_progress 100.
+GET /api/garden/farm must return that plot with status 'ready' and growth_progress 100,
+without writing it back, and harvesting it must succeed.
 """
 import os
 import asyncio
@@ -117,12 +118,12 @@ def test_fully_grown_plot_returns_ready(seeded_plot, session):
     assert qa["growth_progress"] == 100
 
 
-def test_ready_plot_persisted_ready(seeded_plot, session, db, event_loop):
-    # Called GET already in previous test -> should have persisted
+def test_farm_read_does_not_write(seeded_plot, session, db, event_loop):
+    # GET computes state on read; the garden sweeper job persists transitions
     async def check():
         return await db.farm_plots.find_one({"plot_id": QA_PLOT_ID}, {"_id": 0})
     doc = event_loop.run_until_complete(check())
-    assert doc["status"] == "ready"
+    assert doc["status"] == "water_needed"
 
 
 def test_harvest_ready_plot(seeded_plot, session, db, event_loop):
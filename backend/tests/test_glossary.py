@@ -66,7 +66,20 @@ class TestGlossaryPublicEndpoints:
         # Verify search matches term
         found_budget = any(w["term"].lower() == "budget" for w in data["words"])
         assert found_budget, "Budget word should be found in search results"
-        
+
+    def test_get_glossary_words_search_prefix_and_typo(self, admin_client):
+        """GET /api/glossary/words?search=... - Prefix and typo-tolerant matching"""
+        for query in ("bud", "BUDG", "bugdet"):
+            response = admin_client.get(f"{BASE_URL}/api/glossary/words", params={"search": query})
+            assert response.status_code == 200
+            terms = [w["term"].lower() for w in response.json()["words"]]
+            assert "budget" in terms, f"Budget should match search '{query}', got {terms}"
+
+    def test_get_glossary_words_search_regex_chars_are_literal(self, admin_client):
+        """GET /api/glossary/words?search=( - Special characters don't error"""
+        response = admin_client.get(f"{BASE_URL}/api/glossary/words", params={"search": "(["})
+        assert response.status_code == 200
+
     def test_get_glossary_words_letter_filter(self, admin_client):
         """GET /api/glossary/words?letter=B - Letter filter"""
         response = admin_client.get(f"{BASE_URL}/api/glossary/words?letter=B")
@@ -120,6 +133,16 @@ class TestGlossaryPublicEndpoints:
             assert "meaning" in word
             assert "word_id" in word
 
+    def test_word_of_day_stable_per_grade(self, admin_client):
+        """GET /api/glossary/word-of-day?grade=N - Same word for the whole day, published only"""
+        for grade in (0, 3, 5):
+            first = admin_client.get(f"{BASE_URL}/api/glossary/word-of-day", params={"grade": grade}).json()
+            second = admin_client.get(f"{BASE_URL}/api/glossary/word-of-day", params={"grade": grade}).json()
+            if first:
+                assert first["word_id"] == second["word_id"]
+                assert first.get("is_published") is not False
+                assert first["min_grade"] <= grade <= first["max_grade"]
+
 
 class TestGlossaryAdminEndpoints:
     """Test admin-only glossary endpoints"""
@@ -267,6 +290,60 @@ class TestGlossaryAdminEndpoints:
         assert response.status_code == 404
 
 
+class TestGlossaryBulkImport:
+    """POST /api/admin/glossary/bulk-import - JSON, NDJSON and CSV bodies with per-row results"""
+
+    def _cleanup(self, admin_client, terms):
+        words = admin_client.get(f"{BASE_URL}/api/admin/glossary/words",
+                                 params={"search": TEST_PREFIX, "limit": 500}).json()["words"]
+        for w in words:
+            if w["term"] in terms:
+                admin_client.delete(f"{BASE_URL}/api/admin/glossary/words/{w['word_id']}")
+
+    def test_bulk_import_json_reports_each_row(self, admin_client):
+        term = f"{TEST_PREFIX}Bulk_{uuid.uuid4().hex[:6]}"
+        response = admin_client.post(f"{BASE_URL}/api/admin/glossary/bulk-import", json={"words": [
+            {"term": term, "meaning": "first"},
+            {"term": f"  {term.upper()} ", "meaning": "same term, different case"},
+            {"term": "", "meaning": "no term"},
+        ]})
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert [r["status"] for r in data["results"]] == ["imported", "duplicate", "invalid"]
+        assert (data["imported"], data["duplicates"], data["invalid"]) == (1, 1, 1)
+        self._cleanup(admin_client, {term})
+
+    def test_bulk_import_csv_stream(self, admin_client):
+        term = f"{TEST_PREFIX}Csv_{uuid.uuid4().hex[:6]}"
+        body = f'term,meaning,examples,min_grade,max_grade\n{term},"Saved, then spent",a|b,1,4\n{term},dup,,0,5\n'
+        response = admin_client.post(
+            f"{BASE_URL}/api/admin/glossary/bulk-import",
+            data=body.encode(), headers={"Content-Type": "text/csv"}
+        )
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["imported"] == 1 and data["duplicates"] == 1
+
+        # Re-importing is a no-op: the row is now a duplicate of the stored word
+        again = admin_client.post(
+            f"{BASE_URL}/api/admin/glossary/bulk-import",
+            data=body.encode(), headers={"Content-Type": "text/csv"}
+        ).json()
+        assert again["imported"] == 0
+        self._cleanup(admin_client, {term})
+
+    def test_bulk_import_ndjson_stream(self, admin_client):
+        term = f"{TEST_PREFIX}Nd_{uuid.uuid4().hex[:6]}"
+        body = f'{{"term": "{term}", "meaning": "x"}}\nnot json\n'
+        response = admin_client.post(
+            f"{BASE_URL}/api/admin/glossary/bulk-import",
+            data=body.encode(), headers={"Content-Type": "application/x-ndjson"}
+        )
+        assert response.status_code == 200, response.text
+        assert [r["status"] for r in response.json()["results"]] == ["imported", "invalid"]
+        self._cleanup(admin_client, {term})
+
+
 class TestGlossaryAdminAuth:
     """Test that admin endpoints require admin role"""
     
@@ -0,0 +1,51 @@
+"""
+Test suite for image derivatives
+Tests: POST /api/upload/store-image writes resized WebP derivatives
+       GET /api/uploads/...?size=N serves the snapped-width derivative
+"""
+import io
+import requests
+import os
+from PIL import Image
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+def _png(width=1600, height=1200):
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), (30, 160, 90)).save(buf, format="PNG")
+    buf.seek(0)
+    return buf
+
+
+class TestImageDerivatives:
+
+    def _upload_store_image(self):
+        response = requests.post(
+            f"{BASE_URL}/api/upload/store-image",
+            files={"file": ("item.png", _png(), "image/png")}
+        )
+        assert response.status_code == 200, response.text
+        return response.json()["url"]
+
+    def test_size_param_serves_resized_webp(self):
+        url = self._upload_store_image()
+        response = requests.get(f"{BASE_URL}{url}", params={"size": 100}, headers={"Accept": "image/webp"})
+        assert response.status_code == 200
+        assert response.headers["Content-Type"] == "image/webp"
+        img = Image.open(io.BytesIO(response.content))
+        assert img.width == 128  # snapped up to the nearest configured width
+        print(f"✅ ?size=100 served a {img.width}px WebP ({len(response.content)} bytes)")
+
+    def test_without_webp_accept_original_is_served(self):
+        url = self._upload_store_image()
+        response = requests.get(f"{BASE_URL}{url}", params={"size": 256}, headers={"Accept": "image/png"})
+        assert response.status_code == 200
+        assert response.headers["Content-Type"] == "image/png"
+        assert Image.open(io.BytesIO(response.content)).width == 1600
+
+    def test_no_size_param_serves_original(self):
+        url = self._upload_store_image()
+        response = requests.get(f"{BASE_URL}{url}", headers={"Accept": "image/webp"})
+        assert response.status_code == 200
+        assert response.headers["Content-Type"] == "image/png"
@@ -6,6 +6,7 @@ import pytest
 import requests
 import os
 import time
+import uuid
 
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://gamified-learn-hub-1.preview.emergentagent.com').rstrip('/')
 
@@ -221,6 +222,38 @@ class TestStockDetail:
         assert response.status_code == 404, f"Expected 404, got {response.status_code}"
         print("✅ Non-existent stock correctly returns 404")
 
+    def test_stock_chart_downsampled(self):
+        """Chart payloads are capped at the requested number of points"""
+        headers = {"Authorization": f"Bearer {GRADE3_SESSION}"}
+        stock_id = requests.get(f"{BASE_URL}/api/stocks/list", headers=headers).json()[0]["stock_id"]
+
+        for period in ("7d", "90d", "all"):
+            response = requests.get(f"{BASE_URL}/api/stocks/{stock_id}/chart?period={period}&points=20",
+                                    headers=headers)
+            assert response.status_code == 200, f"Chart failed for {period}: {response.text}"
+            chart = response.json()
+            assert chart["period"] == period
+            assert len(chart["data"]) <= 20
+            assert all({"t", "o", "h", "l", "c"} <= set(p) for p in chart["data"])
+            print(f"✅ {period} chart: {len(chart['data'])} of {chart['total_points']} {chart['interval']} points")
+
+        response = requests.get(f"{BASE_URL}/api/stocks/{stock_id}/chart?period=2h", headers=headers)
+        assert response.status_code == 400
+
+    def test_price_stream_hello(self):
+        """The SSE price stream opens with the full price list"""
+        import json
+        with requests.get(f"{BASE_URL}/api/stocks/stream", stream=True, timeout=10,
+                          headers={"Authorization": f"Bearer {GRADE3_SESSION}"}) as response:
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/event-stream")
+            lines = response.iter_lines(decode_unicode=True)
+            assert next(lines) == "event: hello"
+            hello = json.loads(next(lines)[len("data: "):])
+        assert "v" in hello and "is_open" in hello
+        assert all(len(value) == 2 for value in hello["p"].values())
+        print(f"✅ Price stream hello: {len(hello['p'])} prices at v{hello['v']}")
+
 
 class TestBuyStock:
     """Test buying stocks"""
@@ -280,6 +313,35 @@ class TestBuyStock:
         
         return stock
     
+    def test_buy_idempotency_key_trades_once(self):
+        """Retrying a buy with the same Idempotency-Key replays the first trade"""
+        stock = requests.get(
+            f"{BASE_URL}/api/stocks/list",
+            headers={"Authorization": f"Bearer {GRADE3_SESSION}"}
+        ).json()[0]
+        headers = {
+            "Authorization": f"Bearer {GRADE3_SESSION}",
+            "Idempotency-Key": f"test_{uuid.uuid4().hex[:12]}"
+        }
+        payload = {"stock_id": stock["stock_id"], "quantity": 1}
+        
+        first = requests.post(f"{BASE_URL}/api/stocks/buy", headers=headers, json=payload)
+        if first.status_code == 400 and "Market is closed" in first.text:
+            pytest.skip("Market is closed")
+        assert first.status_code == 200, f"Buy failed: {first.text}"
+        
+        second = requests.post(f"{BASE_URL}/api/stocks/buy", headers=headers, json=payload)
+        assert second.status_code == 200
+        assert second.json()["trade_id"] == first.json()["trade_id"]
+        assert second.json().get("replayed") is True
+        assert second.json()["message"] == first.json()["message"]
+        
+        # Same key, different quantity: rejected rather than reported as a new trade
+        changed = requests.post(f"{BASE_URL}/api/stocks/buy", headers=headers, json={**payload, "quantity": 2})
+        assert changed.status_code == 422, f"Expected 422, got {changed.status_code}: {changed.text}"
+        
+        print(f"✅ Repeated buy replayed trade {first.json()['trade_id']}")
+    
     def test_buy_insufficient_funds(self):
         """Test buy with insufficient funds fails"""
         # Get a stock
@@ -436,9 +498,23 @@ class TestPortfolio:
             assert "stock_id" in holding
             assert "quantity" in holding
             assert "current_value" in holding or "current_price" in holding
-        
+
         return portfolio
 
+    def test_portfolio_history_snapshots(self):
+        """Portfolio history is one snapshot per day, oldest first"""
+        response = requests.get(
+            f"{BASE_URL}/api/stocks/portfolio/history?days=30",
+            headers={"Authorization": f"Bearer {GRADE3_SESSION}"}
+        )
+        assert response.status_code == 200, f"Failed to get portfolio history: {response.text}"
+        snapshots = response.json()
+        dates = [s["date"] for s in snapshots]
+        assert dates == sorted(set(dates))
+        for snapshot in snapshots:
+            assert {"total_value", "total_invested", "profit_loss", "holdings_count"} <= set(snapshot)
+        print(f"✅ Portfolio history: {len(snapshots)} daily snapshots")
+
 
 class TestMarketStatus:
     """Test market status endpoint"""
@@ -456,6 +532,8 @@ class TestMarketStatus:
         assert "current_time" in status
         assert "open_time" in status
         assert "close_time" in status
+        assert status["next_event"] in ("open", "close")
+        assert status["seconds_until_next_event"] >= 0
         
         print(f"✅ Market Status:")
         print(f"   Is Open: {status['is_open']}")
@@ -517,7 +595,50 @@ class TestAdminStockManagement:
         print(f"   Cleaned up test stock")
         
         return data
-    
+
+    def test_admin_price_edit_visible_in_listing(self):
+        """Admin price edits refresh the market snapshot immediately"""
+        admin = {"Authorization": f"Bearer {ADMIN_SESSION}"}
+        child = {"Authorization": f"Bearer {GRADE3_SESSION}"}
+        created = requests.post(f"{BASE_URL}/api/admin/investments/stocks", headers=admin, json={
+            "name": "TEST_Snapshot Co", "symbol": "TSNP", "current_price": 40.0,
+            "min_grade": 3, "max_grade": 5
+        }).json()
+        stock_id = created["stock_id"]
+        try:
+            listed = {s["stock_id"]: s for s in requests.get(f"{BASE_URL}/api/stocks/list", headers=child).json()}
+            assert listed[stock_id]["current_price"] == 40.0
+            assert "opening_price" in listed[stock_id] and "daily_change" in listed[stock_id]
+            
+            requests.put(f"{BASE_URL}/api/admin/investments/stocks/{stock_id}", headers=admin,
+                         json={"current_price": 44.0})
+            detail = requests.get(f"{BASE_URL}/api/stocks/{stock_id}", headers=child).json()
+            assert detail["current_price"] == 44.0
+            print("✅ Price edit visible in listing and detail right away")
+        finally:
+            requests.delete(f"{BASE_URL}/api/admin/investments/stocks/{stock_id}", headers=admin)
+
+    def test_simulated_price_recorded_once(self):
+        """A simulated tick updates the stock and today's history row together"""
+        admin = {"Authorization": f"Bearer {ADMIN_SESSION}"}
+        child = {"Authorization": f"Bearer {GRADE3_SESSION}"}
+        response = requests.post(f"{BASE_URL}/api/admin/investments/simulate-fluctuation", headers=admin)
+        assert response.status_code == 200
+
+        stocks = requests.get(f"{BASE_URL}/api/admin/investments/stocks", headers=admin).json()
+        assert len({s["stock_id"] for s in stocks}) == len(stocks)
+        stock = next((s for s in stocks if s.get("is_active")), None)
+        if not stock:
+            pytest.skip("No active stocks")
+        detail = requests.get(f"{BASE_URL}/api/stocks/{stock['stock_id']}", headers=child).json()
+        assert detail["current_price"] == stock["current_price"]
+
+        history = requests.get(f"{BASE_URL}/api/admin/investments/stocks/{stock['stock_id']}/history",
+                               headers=admin).json()
+        assert history[-1]["close_price"] == stock["current_price"]
+        assert history[-1]["low_price"] <= stock["current_price"] <= history[-1]["high_price"]
+        print("✅ Simulated tick written once: stock, detail and daily history agree")
+
     def test_admin_get_stock_categories(self):
         """Admin can get stock categories"""
         response = requests.get(
@@ -601,9 +722,96 @@ class TestAdminStockManagement:
         )
         assert delete_response.status_code == 200
         print(f"   Cleaned up test news")
-        
+
         return data
 
+    def test_admin_apply_news_once(self):
+        """News impact applies exactly once"""
+        admin = {"Authorization": f"Bearer {ADMIN_SESSION}"}
+        stock_id = requests.post(f"{BASE_URL}/api/admin/investments/stocks", headers=admin, json={
+            "name": "TEST_News Co", "symbol": "TNWS", "current_price": 50.0
+        }).json()["stock_id"]
+        news_id = requests.post(f"{BASE_URL}/api/admin/stock-news", headers=admin, json={
+            "title": "TEST_Good news", "stock_id": stock_id, "impact": 10
+        }).json()["news_id"]
+        try:
+            response = requests.post(f"{BASE_URL}/api/admin/stock-news/{news_id}/apply", headers=admin)
+            assert response.status_code == 200
+            assert response.json()["price_changes"][stock_id] == [50.0, 55.0]
+
+            again = requests.post(f"{BASE_URL}/api/admin/stock-news/{news_id}/apply", headers=admin)
+            assert again.status_code == 409
+            stocks = requests.get(f"{BASE_URL}/api/admin/investments/stocks", headers=admin).json()
+            assert next(s for s in stocks if s["stock_id"] == stock_id)["current_price"] == 55.0
+            print("✅ News applied once (+10%), second apply rejected")
+        finally:
+            requests.delete(f"{BASE_URL}/api/admin/stock-news/{news_id}", headers=admin)
+            requests.delete(f"{BASE_URL}/api/admin/investments/stocks/{stock_id}", headers=admin)
+
+    def test_admin_schedule_news_validation(self):
+        """Scheduled news must name a fluctuation session"""
+        response = requests.post(f"{BASE_URL}/api/admin/stock-news",
+                                 headers={"Authorization": f"Bearer {ADMIN_SESSION}"},
+                                 json={"title": "TEST_Bad schedule", "impact": 5, "scheduled_session": "lunch"})
+        assert response.status_code == 400
+    
+    def test_admin_order_book_settings(self):
+        """Order-book settings are readable and reject a negative cadence"""
+        response = requests.get(f"{BASE_URL}/api/admin/stock-order-book",
+                                headers={"Authorization": f"Bearer {ADMIN_SESSION}"})
+        assert response.status_code == 200
+        assert {"enabled", "cadence_minutes", "pending_orders"} <= set(response.json())
+        
+        response = requests.put(f"{BASE_URL}/api/admin/stock-order-book",
+                                headers={"Authorization": f"Bearer {ADMIN_SESSION}"},
+                                json={"cadence_minutes": -1})
+        assert response.status_code == 400
+        print("✅ Order book settings validated")
+    
+    def test_admin_market_holidays_validation(self):
+        """Holiday dates must be YYYY-MM-DD"""
+        response = requests.get(f"{BASE_URL}/api/admin/trading-calendar",
+                                headers={"Authorization": f"Bearer {ADMIN_SESSION}"})
+        assert response.status_code == 200
+        assert "holidays" in response.json()
+        
+        response = requests.put(f"{BASE_URL}/api/admin/trading-calendar/holidays",
+                                headers={"Authorization": f"Bearer {ADMIN_SESSION}"},
+                                json={"holidays": [{"date": "next friday", "name": "TEST_Holiday"}]})
+        assert response.status_code == 400
+        print("✅ Market holiday list validated")
+    
+    def test_admin_backtest(self):
+        """Backtest replays simulated days without touching prices"""
+        headers = {"Authorization": f"Bearer {ADMIN_SESSION}"}
+        before = requests.get(f"{BASE_URL}/api/admin/investments/stocks", headers=headers).json()
+        
+        response = requests.post(f"{BASE_URL}/api/admin/investments/backtest", headers=headers,
+                                 json={"days": 5, "paths": 20, "users": 50, "model": "gauss", "seed": 1})
+        assert response.status_code == 200, f"Backtest failed: {response.text}"
+        report = response.json()
+        assert report["ticks"] == 5
+        assert len(report["portfolio_drift_pct"]) == 5
+        assert {"price_step", "tick_ops", "valuation"} <= set(report["timing"])
+        
+        after = requests.get(f"{BASE_URL}/api/admin/investments/stocks", headers=headers).json()
+        assert {s["stock_id"]: s["current_price"] for s in before} == {s["stock_id"]: s["current_price"] for s in after}
+        
+        # The candidate session rule runs three ticks a day, like the live sessions
+        response = requests.post(f"{BASE_URL}/api/admin/investments/backtest", headers=headers,
+                                 json={"days": 5, "paths": 20, "users": 50, "model": "session_band", "seed": 1})
+        assert response.status_code == 200, f"Backtest failed: {response.text}"
+        assert response.json()["ticks"] == 15
+        
+        response = requests.post(f"{BASE_URL}/api/admin/investments/backtest", headers=headers,
+                                 json={"model": "coin-flip"})
+        assert response.status_code == 400
+        # Long runs are CLI-only
+        response = requests.post(f"{BASE_URL}/api/admin/investments/backtest", headers=headers,
+                                 json={"days": 365, "paths": 1000, "users": 5000})
+        assert response.status_code == 400
+        print(f"✅ Backtest over {len(report['stocks'])} stocks: {report['timing']['price_step']['mean_ms']}ms per step")
+
 
 class TestNotifications:
     """Test notifications for quests/chores/rewards"""
@@ -699,6 +907,22 @@ class TestStockTransactions:
             print(f"   - {tx.get('type', 'unknown')}: {tx.get('quantity', 0)} shares of {tx.get('stock_name', 'unknown')} @ ₹{tx.get('price', 0)}")
         
         return transactions
+    
+    def test_get_stock_orders(self):
+        """Order status list (order-book mode) is available to students"""
+        response = requests.get(
+            f"{BASE_URL}/api/stocks/orders",
+            headers={"Authorization": f"Bearer {GRADE3_SESSION}"}
+        )
+        assert response.status_code == 200
+        assert isinstance(response.json(), list)
+        
+        response = requests.get(
+            f"{BASE_URL}/api/stocks/orders/ord_doesnotexist",
+            headers={"Authorization": f"Bearer {GRADE3_SESSION}"}
+        )
+        assert response.status_code == 404
+        print("✅ Order status endpoints respond")
 
 
 if __name__ == "__main__":
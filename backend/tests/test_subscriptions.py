@@ -6,6 +6,7 @@ import pytest
 import requests
 import os
 import uuid
+import json
 
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://gamified-learn-hub-1.preview.emergentagent.com')
 
@@ -303,5 +304,45 @@ class TestAdminUnauthorizedAccess:
         print(f"Admin list correctly rejected unauthorized access with {response.status_code}")
 
 
+class TestPaymentWebhook:
+    """Test the Razorpay webhook activation path"""
+    
+    def test_webhook_rejects_bad_signature(self, api_client):
+        """POST /api/subscriptions/webhook - returns 400 when the signature doesn't match"""
+        response = api_client.post(
+            f"{BASE_URL}/api/subscriptions/webhook",
+            data=json.dumps({"event": "payment.captured"}),
+            headers={"X-Razorpay-Signature": "not_a_signature"}
+        )
+        assert response.status_code == 400, f"Expected 400, got {response.status_code}"
+    
+    @pytest.mark.skipif(os.environ.get("PAYMENT_GATEWAY") != "fake", reason="needs server running with PAYMENT_GATEWAY=fake")
+    def test_webhook_activates_once(self, api_client):
+        """Webhook activates a pending subscription; replaying it is a no-op"""
+        from services.payments import FakeGateway
+        fake = FakeGateway()
+        email = f"webhook_{uuid.uuid4().hex[:8]}@example.com"
+        order = api_client.post(f"{BASE_URL}/api/subscriptions/create-order", json={
+            "plan_type": "single_parent", "duration": "1_month", "num_children": 1,
+            "subscriber_name": "Webhook Test", "subscriber_email": email, "subscriber_phone": "9999999999"
+        })
+        assert order.status_code == 200, order.text
+        order_id = order.json()["order_id"]
+        
+        body = json.dumps({
+            "event": "payment.captured",
+            "payload": {"payment": {"entity": {"id": f"pay_{uuid.uuid4().hex[:12]}", "order_id": order_id}}}
+        }).encode()
+        headers = {"X-Razorpay-Signature": fake.sign_webhook(body), "X-Razorpay-Event-Id": f"evt_{uuid.uuid4().hex[:12]}"}
+        
+        first = api_client.post(f"{BASE_URL}/api/subscriptions/webhook", data=body, headers=headers)
+        assert first.status_code == 200 and first.json()["status"] == "activated", first.text
+        replay = api_client.post(f"{BASE_URL}/api/subscriptions/webhook", data=body, headers=headers)
+        assert replay.json()["status"] == "duplicate"
+        
+        access = api_client.get(f"{BASE_URL}/api/subscriptions/check-access/{email}").json()
+        assert access["has_access"] is True
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
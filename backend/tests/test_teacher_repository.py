@@ -430,6 +430,39 @@ class TestTeacherRepository:
         data = response.json()
         assert "subtopics" in data, "Response should contain 'subtopics'"
         print(f"✅ Teacher subtopics access successful: {len(data.get('subtopics', []))} subtopics")
+    
+    def test_teacher_repository_cursor_pagination(self):
+        """Test limit/next_cursor pages through the same items as the unpaged list"""
+        full = self.session.get(f"{BASE_URL}/api/teacher/repository").json()
+        assert "facets" in full, "Response should contain 'facets'"
+        assert set(full["facets"]) == {"topics", "grades", "file_types"}
+        
+        seen = []
+        cursor = None
+        while True:
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            page = self.session.get(f"{BASE_URL}/api/teacher/repository", params=params).json()
+            assert len(page["items"]) <= 2
+            seen.extend(item["item_id"] for item in page["items"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        assert seen == [item["item_id"] for item in full["items"]], "Pages should match the full ordering"
+        print(f"✅ Cursor pagination returned {len(seen)} items in order")
+    
+    def test_teacher_repository_search_ranks_title_matches(self):
+        """Test search matches by word prefix and only returns matching items"""
+        response = self.session.get(f"{BASE_URL}/api/teacher/repository", params={"search": "TEST_CRUD"})
+        assert response.status_code == 200
+        for item in response.json()["items"]:
+            text = " ".join([item.get("title", ""), item.get("description", ""), " ".join(item.get("tags", []))]).lower()
+            assert "test" in text and "crud" in text
+    
+    def test_teacher_repository_invalid_limit(self):
+        response = self.session.get(f"{BASE_URL}/api/teacher/repository", params={"limit": 0})
+        assert response.status_code == 400
 
 
 if __name__ == "__main__":
@@ -0,0 +1,74 @@
+"""
+Test suite for /api/uploads static serving
+Tests: immutable Cache-Control for uuid-named uploads, precompressed (.gz)
+       activity HTML, ETag revalidation and byte-range requests for videos
+"""
+import io
+import zipfile
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+def _upload_activity_zip():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("index.html", "<html><body>" + ("Save a coin! " * 400) + "</body></html>")
+    buf.seek(0)
+    response = requests.post(
+        f"{BASE_URL}/api/upload/activity",
+        files={"file": ("activity.zip", buf, "application/zip")}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["url"]
+
+
+def _upload_video(payload: bytes):
+    response = requests.post(
+        f"{BASE_URL}/api/upload/video",
+        files={"file": ("clip.mp4", io.BytesIO(payload), "video/mp4")}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["url"]
+
+
+class TestUploadsCaching:
+    """Cache headers and precompressed siblings"""
+
+    def test_activity_html_is_immutable_and_gzipped(self):
+        url = _upload_activity_zip()
+        response = requests.get(f"{BASE_URL}{url}", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert "immutable" in response.headers.get("Cache-Control", "")
+        assert response.headers.get("Content-Encoding") == "gzip"
+        assert "Save a coin!" in response.text
+        print(f"✅ Activity served gzipped with {response.headers['Cache-Control']}")
+
+    def test_etag_revalidation_returns_304(self):
+        url = _upload_activity_zip()
+        first = requests.get(f"{BASE_URL}{url}")
+        etag = first.headers.get("ETag")
+        assert etag
+        second = requests.get(f"{BASE_URL}{url}", headers={"If-None-Match": etag})
+        assert second.status_code == 304
+        print("✅ If-None-Match revalidation returns 304")
+
+
+class TestUploadsRangeRequests:
+    """Byte-range support for video seeking"""
+
+    def test_range_request_returns_partial_content(self):
+        payload = bytes(range(256)) * 64
+        url = _upload_video(payload)
+        response = requests.get(f"{BASE_URL}{url}", headers={"Range": "bytes=100-199"})
+        assert response.status_code == 206
+        assert response.headers.get("Content-Range") == f"bytes 100-199/{len(payload)}"
+        assert response.content == payload[100:200]
+        print("✅ Range request served 206 with the requested slice")
+
+    def test_unsatisfiable_range_returns_416(self):
+        url = _upload_video(b"x" * 1024)
+        response = requests.get(f"{BASE_URL}{url}", headers={"Range": "bytes=5000-"})
+        assert response.status_code == 416
+        print("✅ Out-of-bounds range rejected with 416")
@@ -0,0 +1,60 @@
+"""
+Test suite for background video transcoding
+Tests: POST /api/upload/video reports a transcode status
+       GET /api/upload/video-renditions returns the job for an uploaded video
+       GET /api/admin/settings/walkthrough-video exposes a playback_url
+"""
+import io
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestVideoRenditions:
+    """Upload -> transcode job bookkeeping"""
+
+    def _upload(self):
+        response = requests.post(
+            f"{BASE_URL}/api/upload/video",
+            files={"file": ("lesson.mp4", io.BytesIO(b"\x00" * 2048), "video/mp4")}
+        )
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    def test_upload_reports_transcode_status(self):
+        data = self._upload()
+        assert data["url"].startswith("/api/uploads/videos/")
+        # "unavailable" when ffmpeg isn't installed on the server
+        assert data["transcode_status"] in ("queued", "unavailable")
+        print(f"✅ Video upload transcode_status={data['transcode_status']}")
+
+    def test_renditions_job_lookup(self):
+        data = self._upload()
+        response = requests.get(f"{BASE_URL}/api/upload/video-renditions", params={"url": data["url"]})
+        if data["transcode_status"] == "unavailable":
+            assert response.status_code == 404
+        else:
+            assert response.status_code == 200
+            job = response.json()
+            assert job["source_url"] == data["url"]
+            assert job["status"] in ("queued", "processing", "ready", "failed")
+        print("✅ Renditions job lookup consistent with upload status")
+
+    def test_unknown_video_has_no_job(self):
+        response = requests.get(
+            f"{BASE_URL}/api/upload/video-renditions",
+            params={"url": "/api/uploads/videos/does_not_exist.mp4"}
+        )
+        assert response.status_code == 404
+
+
+class TestWalkthroughPlayback:
+    def test_walkthrough_exposes_playback_url(self):
+        response = requests.get(f"{BASE_URL}/api/admin/settings/walkthrough-video")
+        assert response.status_code == 200
+        for user_type in ("child", "parent", "teacher"):
+            entry = response.json()[user_type]
+            if entry.get("url"):
+                assert entry.get("playback_url")
+        print("✅ Walkthrough videos expose playback_url")
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import BackButton from '@/components/BackButton';
 import axios from 'axios';
 import { API } from '@/App';
@@ -50,13 +50,52 @@ export default function StockMarketPage({ user }) {
   const [wallet, setWallet] = useState(null);
   const [showTransfer, setShowTransfer] = useState(false);
   const [transferData, setTransferData] = useState({ from_account: 'spending', to_account: 'investing', amount: '' });
+  // Idempotency key of the buy/sell being submitted: a double click or a retry
+  // after a dropped response reuses it, so the trade only executes once
+  const tradeKey = useRef(null);
+
+  const portfolioRef = useRef(portfolio);
+  portfolioRef.current = portfolio;
 
   useEffect(() => {
     fetchData();
-    const interval = setInterval(fetchData, 30000); // Refresh every 30s
-    return () => clearInterval(interval);
+    // Prices are pushed over SSE instead of polling every 30s
+    const source = new EventSource(`${API}/stocks/stream`, { withCredentials: true });
+    source.addEventListener('prices', (event) => {
+      const delta = JSON.parse(event.data);
+      setStocks(prev => prev.map(s => delta.p[s.stock_id]
+        ? { ...s, current_price: delta.p[s.stock_id][0], daily_change_percent: delta.p[s.stock_id][1] }
+        : s));
+      fetchPortfolio(Object.keys(delta.p));
+    });
+    source.addEventListener('status', (event) => {
+      const { is_open } = JSON.parse(event.data);
+      setMarketStatus(prev => ({ ...prev, is_open }));
+    });
+    // Stream refused (e.g. header-only session, no cookie): fall back to polling
+    let interval = null;
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED && !interval) {
+        interval = setInterval(fetchData, 30000);
+      }
+    };
+    return () => {
+      source.close();
+      if (interval) clearInterval(interval);
+    };
   }, []);
 
+  const fetchPortfolio = async (changedIds) => {
+    const held = portfolioRef.current.holdings || [];
+    if (changedIds && !held.some(h => changedIds.includes(h.stock_id))) return;
+    try {
+      const res = await axios.get(`${API}/stocks/portfolio`);
+      setPortfolio(res.data || { holdings: [], total_invested: 0, total_current_value: 0, total_profit_loss: 0 });
+    } catch (error) {
+      console.error('Failed to refresh portfolio:', error);
+    }
+  };
+
   const fetchData = async () => {
     try {
       const [statusRes, categoriesRes, stocksRes, portfolioRes, newsRes, walletRes] = await Promise.all([
@@ -102,14 +141,30 @@ export default function StockMarketPage({ user }) {
     }
   };
 
+  const newTradeKey = () =>
+    window.crypto?.randomUUID?.() || `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
+  const submitTrade = async (side, quantity) => {
+    if (!tradeKey.current) tradeKey.current = newTradeKey();
+    try {
+      return await axios.post(`${API}/stocks/${side}`, {
+        stock_id: selectedStock.stock_id,
+        quantity
+      }, { headers: { 'Idempotency-Key': tradeKey.current } });
+    } catch (error) {
+      // Keep the key while the trade may have gone through: response lost,
+      // or 409 because an earlier click with this key is still running
+      if (error.response && error.response.status !== 409) tradeKey.current = null;
+      throw error;
+    }
+  };
+
   const handleBuy = async () => {
     if (!selectedStock || buyQuantity < 1) return;
     
     try {
-      const res = await axios.post(`${API}/stocks/buy`, {
-        stock_id: selectedStock.stock_id,
-        quantity: buyQuantity
-      });
+      const res = await submitTrade('buy', buyQuantity);
+      tradeKey.current = null;
       toast.success(res.data.message);
       setShowBuyDialog(false);
       setBuyQuantity(1);
@@ -123,10 +178,8 @@ export default function StockMarketPage({ user }) {
     if (!selectedStock || sellQuantity < 1) return;
     
     try {
-      const res = await axios.post(`${API}/stocks/sell`, {
-        stock_id: selectedStock.stock_id,
-        quantity: sellQuantity
-      });
+      const res = await submitTrade('sell', sellQuantity);
+      tradeKey.current = null;
       toast.success(res.data.message);
       setShowSellDialog(false);
       setSellQuantity(1);
@@ -217,7 +270,9 @@ export default function StockMarketPage({ user }) {
               </div>
               <p className="text-xs text-gray-500 mt-1">
                 <Clock className="w-3 h-3 inline mr-1" />
-                Trading Hours: 7:00 AM - 5:00 PM IST
+                {marketStatus.holiday
+                  ? `Holiday today: ${marketStatus.holiday}`
+                  : `Trading Hours: ${marketStatus.open_time || '07:00'} - ${marketStatus.close_time || '17:00'} IST`}
               </p>
             </div>
             
@@ -753,7 +808,7 @@ export default function StockMarketPage({ user }) {
       </Dialog>
 
       {/* Buy Dialog */}
-      <Dialog open={showBuyDialog} onOpenChange={setShowBuyDialog}>
+      <Dialog open={showBuyDialog} onOpenChange={(open) => { setShowBuyDialog(open); if (!open) tradeKey.current = null; }}>
         <DialogContent className="bg-[#1F2937] border-gray-700 text-white">
           <DialogHeader>
             <DialogTitle className="text-[#10B981]">Buy {selectedStock?.ticker}</DialogTitle>
@@ -804,7 +859,7 @@ export default function StockMarketPage({ user }) {
       </Dialog>
 
       {/* Sell Dialog */}
-      <Dialog open={showSellDialog} onOpenChange={setShowSellDialog}>
+      <Dialog open={showSellDialog} onOpenChange={(open) => { setShowSellDialog(open); if (!open) tradeKey.current = null; }}>
         <DialogContent className="bg-[#1F2937] border-gray-700 text-white">
           <DialogHeader>
             <DialogTitle className="text-red-400">Sell {selectedStock?.ticker}</DialogTitle>